@@ -370,8 +370,13 @@ def get_config() -> AggregatedConfig:  # noqa: D401
 
 
 def clear_config_cache() -> None:
-    """Clear cached config (primarily for tests)."""
+    """Clear cached config (primarily for tests).
+
+    Also drops histogram settings pushed from the previous config; the
+    next app startup pushes them again.
+    """
     get_config.cache_clear()
+    metrics.configure_histograms()
 
 
 def as_dict() -> Dict[str, Any]:
@@ -1,7 +1,7 @@
 """Core/system schemas: system, embeddings, storage, emotion, reflection."""
 from __future__ import annotations
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class EmbeddingConfig(BaseModel):
@@ -43,8 +43,22 @@ class StoragePathsConfig(BaseModel):
     data: str = "data"
 
 
+class JournalConfig(BaseModel):
+    enabled: bool = False
+    dir: str = "journal"  # under storage.paths.data
+    encoding: str = Field("jsonl", pattern="^(jsonl|lp)$")
+    segment_max_mb: float = Field(64.0, gt=0)
+    segment_max_s: float = Field(3600.0, gt=0)
+    max_segments: int = Field(48, ge=1)
+    batch_max: int = Field(512, ge=1)
+    flush_interval_ms: float = Field(200.0, gt=0)
+    queue_size: int = Field(65536, ge=1)
+    index_every: int = Field(64, ge=1)
+
+
 class StorageConfig(BaseModel):
     paths: StoragePathsConfig = StoragePathsConfig()
+    journal: JournalConfig = JournalConfig()
 
 
 class SystemConfig(BaseModel):
@@ -84,8 +84,8 @@ class LLMConfig(BaseModel):
         )
     )
     optional_models: Dict[str, OptionalMoEConfig] = Field(default_factory=dict)
-    # Threshold (GB) above which a model is considered "heavy" and triggers
-    # auto-unload of previously loaded heavy models on switch.
+    # Deprecated: ignored since model residency is budget-based (see
+    # ``residency``); kept so existing configs still validate.
     heavy_model_vram_threshold_gb: float = 10.0
     skip_checksum: bool = False
     load_timeout_ms: int = 15000
@@ -134,9 +134,14 @@ class LLMConfig(BaseModel):
                 "max_tokens": 256,
                 "drop_from_history": True,
                 "ratio_alert_threshold": 0.45,
+                # hard: stop analysis decode at the preset budget and
+                # resume in the final channel; soft: drop excess tokens
+                "budget_mode": "hard",
             },
             "ngram": {"n": 3, "window": 128},
             "collapse": {"whitespace": True},
+            # Parse Harmony by special-token ids when the model exposes them
+            "token_ids": True,
         }
     )
     # Harmony prompt (Phase 3) feature flag & tags
@@ -186,6 +191,140 @@ class LLMConfig(BaseModel):
             },
         }
     )
+    # Per-session KV state pool (llama.cpp save/load_state snapshots)
+    kv_cache: Dict[str, object] = Field(
+        default_factory=lambda: {
+            "enabled": True,
+            "ram_budget_mb": 2048,
+            "disk_enabled": True,
+            "disk_budget_mb": 8192,
+            "min_prefix_tokens": 32,
+        }
+    )
+    # Decode scheduler (one decode loop owner per loaded provider)
+    scheduler: Dict[str, object] = Field(
+        default_factory=lambda: {
+            "enabled": True,
+            "max_active_sequences": 4,
+            "async_buffer": 32,
+        }
+    )
+    # Degenerate-loop detector (rolling n-gram hashes + periodic suffix)
+    repetition: Dict[str, object] = Field(
+        default_factory=lambda: {
+            "enabled": True,
+            "window": 512,
+            "ngram": 16,
+            "ngram_repeats": 4,
+            "max_period": 64,
+            "min_repeats": 4,
+            "min_span_tokens": 48,
+        }
+    )
+    # Token counting (tokenizer cache + calibrated fallback estimator)
+    token_count: Dict[str, object] = Field(
+        default_factory=lambda: {
+            "cache_entries": 8192,
+            "chars_per_token": 4.0,
+            "cyrillic_chars_per_token": 2.5,
+            "calibration_alpha": 0.2,
+        }
+    )
+    # Background history compaction (rolling summary, lightweight model)
+    compaction: Dict[str, object] = Field(
+        default_factory=lambda: {
+            "enabled": True,
+            "load_model": False,
+            "max_summary_tokens": 256,
+            "max_pending": 64,
+            "cache_entries": 256,
+        }
+    )
+    # Model file integrity (verification cache, sampled chunk checks)
+    integrity: Dict[str, object] = Field(
+        default_factory=lambda: {
+            "mode": "sampled",
+            "cache_enabled": True,
+            "min_size_mb": 256,
+            "chunk_mb": 64,
+            "sample_chunks": 4,
+            "workers": 4,
+            "background_full": True,
+        }
+    )
+    # Model residency under a memory budget (footprint, LRU/priority evict)
+    residency: Dict[str, object] = Field(
+        default_factory=lambda: {
+            "enabled": True,
+            "budget_gb": 0,
+            "ram_fraction": 0.8,
+            "pinned_roles": ["primary"],
+            "priorities": {
+                "judge": 0,
+                "planner": 0,
+                "lightweight": 1,
+                "secondary": 1,
+            },
+            "kv_type_bytes": 2,
+            "kv_bytes_per_token": 131072,
+            "overhead_mb": 256,
+            "handout_grace_s": 10.0,
+        }
+    )
+    # Startup warm pool (preload, page prefetch, warm-up decode, prefill)
+    warmup: Dict[str, object] = Field(
+        default_factory=lambda: {
+            "enabled": True,
+            "preload_optional": False,
+            "prefetch": "startup",
+            "prefetch_skip_after_unload_s": 600,
+            "decode_tokens": 4,
+            "prefill_prefix": True,
+            "reasoning_mode": "medium",
+        }
+    )
+    # Speculative decoding (draft model / prompt lookup, per-request opt-in)
+    speculative: Dict[str, object] = Field(
+        default_factory=lambda: {
+            "enabled": False,
+            "target_roles": ["primary"],
+            "default_mode": "off",
+            "k": 4,
+            "ngram_min": 1,
+            "ngram_max": 3,
+            "draft_model": "",
+            "load_draft": False,
+            "draft_context": 2048,
+        }
+    )
+    # Admission control: per-model concurrency + fair bounded wait queue
+    admission: Dict[str, object] = Field(
+        default_factory=lambda: {
+            "enabled": True,
+            "max_concurrent": 4,
+            "max_queue": 16,
+            "queue_timeout_s": 30.0,
+            "retry_after_s": 2,
+            "per_model": {},
+        }
+    )
+    # Resumable /generate streams (per-request SSE frame ring buffer)
+    stream_resume: Dict[str, object] = Field(
+        default_factory=lambda: {
+            "enabled": True,
+            "buffer_frames": 2048,
+            "ttl_s": 300.0,
+            "detach_grace_s": 2.0,
+        }
+    )
+    chunk_events: Dict[str, object] = Field(
+        default_factory=lambda: {
+            "mode": "per_token",
+            "batch_tokens": 16,
+            "batch_ms": 100.0,
+            "sample_every": 10,
+        }
+    )
     # Global stop sequences (legacy compatibility; empty by default)
     stop: list[str] = Field(default_factory=list)
     # Dev/test fake provider toggle (legacy compatibility)
@@ -1,6 +1,8 @@
 """Observability schemas (metrics + logging) extracted for modularity."""
 from __future__ import annotations
 
+from typing import Dict
+
 from pydantic import BaseModel, Field
 
 
@@ -8,8 +10,34 @@ class MetricsExportConfig(BaseModel):
     prometheus_port: int = 9090
 
 
+class EventBusConfig(BaseModel):
+    mode: str = Field("sync", pattern="^(sync|async)$")
+    queue_size: int = Field(8192, ge=1)
+    dispatchers: int = Field(1, ge=1)
+    overflow: str = Field("drop", pattern="^(drop|sample|block)$")
+    overflow_by_event: Dict[str, str] = Field(
+        default_factory=lambda: {
+            "GenerationChunk": "sample",
+            "GenerationCompleted": "block",
+            "GenerationFailed": "block",
+            "GenerationCancelled": "block",
+        }
+    )
+    sample_every: int = Field(10, ge=1)
+    sample_watermark: float = Field(0.5, ge=0.0, le=1.0)
+    block_timeout_ms: int = Field(50, ge=0)
+
+
+class HistogramConfig(BaseModel):
+    sub_buckets: int = Field(16, ge=1, le=1024)
+    window_s: float = Field(0.0, ge=0.0)
+    window_slices: int = Field(5, ge=1)
+
+
 class MetricsConfig(BaseModel):
     export: MetricsExportConfig = MetricsExportConfig()
+    eventbus: EventBusConfig = EventBusConfig()
+    histograms: HistogramConfig = HistogramConfig()
 
 
 class LoggingConfig(BaseModel):
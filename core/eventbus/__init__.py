@@ -1,67 +1,382 @@
-"""EventBus v1 (sync in-process) per ADR-0011.
+"""EventBus v2 (in-process, sync or background dispatch) per ADR-0011.
 
 Features:
-  - subscribe(event_name, handler)
-  - emit(event_name, payload) adds ts if missing
+  - subscribe(event_name, handler); subscribe_all(handler, events=...)
+    receives every event (or the declared ``events``) as
+    handler(name, payload)
+  - emit(event_name, payload) adds ts if missing; payload may be a
+    zero-arg factory
+  - subscription-aware: an event nobody is interested in returns from
+    emit before its payload is built or any metric is touched
+    (``wants(event)`` exposes the same check). Interest is resolved per
+    event name once and cached until subscriptions change.
+  - handlers share one read-only ``MappingProxyType`` view of the payload
+    (no per-handler copies); copy with dict() to keep or modify it
   - handler isolation (exceptions counted, not propagated)
-    - metrics counters:
-            events_emitted_total{event}, handler_exceptions_total{event},
-            dispatch_latency_accum_ms{event}, dispatch_count{event}
+  - mode ``sync`` (default): handlers run on the emitting thread (v1
+    behaviour)
+  - mode ``async`` (opt-in): emit only enqueues into a bounded ring and dedicated
+    dispatcher threads deliver, so a slow subscriber no longer stalls the
+    decode thread. With one dispatcher (default) delivery keeps emit
+    order; more dispatchers trade ordering for throughput.
+  - overflow policy per event type when the ring is full:
+      drop   - discard the new event
+      sample - from ``sample_watermark`` x queue_size on, admit only every
+               ``sample_every``-th event of that type; drop when full
+      block  - wait up to ``block_timeout_ms`` for space, then drop
+  - inline subscribers (``inline=True``) always run on the emitting
+    thread, for request-scoped captures that must see the event before
+    emit returns
+  - flush(timeout) waits until queued events are delivered
+  - metrics counters:
+        events_emitted_total{event}, handler_exceptions_total{event},
+        dispatch_latency_accum_ms{event}, dispatch_count{event},
+        eventbus_dropped_total{event,policy}
+    histograms: eventbus_queue_depth (sampled on enqueue),
+        eventbus_dispatch_lag_ms (enqueue -> delivery, sampled)
 
-No async / filtering / replay yet (planned v2).
+Config ``metrics.eventbus``: mode, queue_size, dispatchers, overflow,
+overflow_by_event, sample_every, sample_watermark, block_timeout_ms.
+
+No filtering / replay yet.
 """
 from __future__ import annotations
 
-from threading import RLock
-from time import time
-from typing import Any, Callable, Dict, List
+from collections import deque
+from itertools import count
+from threading import Condition, Lock, RLock, Semaphore, Thread
+from time import perf_counter, time
+from types import MappingProxyType
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Set,
+    Tuple,
+    Union,
+)
 
 from core import metrics
 
-Handler = Callable[[Dict[str, Any]], None]
+Handler = Callable[[Mapping[str, Any]], None]
+AnyHandler = Callable[[str, Mapping[str, Any]], None]
+Payload = Union[Dict[str, Any], Callable[[], Dict[str, Any]]]
+Route = Tuple[Tuple[Tuple[Callable[..., None], bool], ...], ...]
+
+POLICIES = ("drop", "sample", "block")
+# every N-th enqueue / delivery feeds the depth and lag histograms
+_SAMPLE_METRICS_EVERY = 64
+
+
+def _config() -> dict:
+    try:
+        from core.config import get_config
+
+        cfg = getattr(get_config().metrics, "eventbus", None)
+        if cfg is None:
+            return {}
+        if hasattr(cfg, "model_dump"):
+            return cfg.model_dump()
+        return dict(cfg)
+    except Exception:  # noqa: BLE001
+        return {}
 
 
 class EventBus:
     def __init__(self) -> None:
-        self._subs: Dict[str, List[Handler]] = {}
+        self._subs: Dict[str, List[Tuple[Handler, bool]]] = {}
+        self._any: List[Tuple[AnyHandler, bool, Set[str] | None]] = []
+        self._routes: Dict[str, Route] = {}
         self._lock = RLock()
+        self._configured = False
+        self.mode = "sync"
+        self._capacity = 8192
+        self._dispatchers = 1
+        self._overflow = "drop"
+        self._overflow_by_event: Dict[str, str] = {}
+        self._sample_every = 10
+        self._sample_from = 4096
+        self._block_timeout_s = 0.05
+        self._queue: Deque[Tuple[str, Mapping[str, Any], float]] = deque()
+        self._items = Semaphore(0)
+        self._space = Condition(Lock())
+        self._blocked = 0
+        self._in_flight = 0
+        self._idle = Condition(Lock())
+        self._threads: List[Thread] = []
+        # emit runs on many threads, dispatchers on several
+        self._counts_lock = Lock()
+        self._sample_counts: Dict[str, int] = {}
+        self._enqueued = count(1)
+        self._delivered = count(1)
 
-    def subscribe(self, event: str, handler: Handler) -> None:
+    # -- configuration ----------------------------------------------------
+    def configure(self, **overrides: Any) -> None:
+        """(Re)read ``metrics.eventbus``; keyword overrides win."""
+        cfg = {**_config(), **overrides}
+        mode = str(cfg.get("mode", "sync"))
+        self.mode = mode if mode in ("sync", "async") else "sync"
+        self._capacity = max(1, int(cfg.get("queue_size", 8192) or 1))
+        self._dispatchers = max(1, int(cfg.get("dispatchers", 1) or 1))
+        overflow = str(cfg.get("overflow", "drop"))
+        self._overflow = overflow if overflow in POLICIES else "drop"
+        self._overflow_by_event = {
+            str(k): str(v)
+            for k, v in dict(cfg.get("overflow_by_event") or {}).items()
+            if v in POLICIES
+        }
+        self._sample_every = max(1, int(cfg.get("sample_every", 10) or 1))
+        watermark = float(cfg.get("sample_watermark", 0.5) or 0.0)
+        self._sample_from = int(self._capacity * min(1.0, max(0.0, watermark)))
+        self._block_timeout_s = (
+            max(0.0, float(cfg.get("block_timeout_ms", 50) or 0)) / 1000.0
+        )
+        self._configured = True
+
+    def policy(self, event: str) -> str:
+        return self._overflow_by_event.get(event, self._overflow)
+
+    # -- subscriptions ----------------------------------------------------
+    def subscribe(
+        self, event: str, handler: Handler, *, inline: bool = False
+    ) -> None:
         with self._lock:
-            self._subs.setdefault(event, []).append(handler)
+            self._subs.setdefault(event, []).append((handler, inline))
+            self._routes.clear()
 
-    def emit(self, event: str, payload: Dict[str, Any]) -> None:
-        t0 = time()
-        if "ts" not in payload:
-            payload["ts"] = t0
+    def subscribe_all(
+        self,
+        handler: AnyHandler,
+        *,
+        inline: bool = False,
+        events: Iterable[str] | None = None,
+    ) -> Callable[[], None]:
+        """Receive every event (or only ``events``); returns unsubscribe."""
+        entry = (handler, inline, None if events is None else set(events))
         with self._lock:
-            subs = list(self._subs.get(event, ()))
+            self._any.append(entry)
+            self._routes.clear()
+
+        def _unsub() -> None:
+            with self._lock:
+                try:
+                    self._any.remove(entry)
+                except ValueError:
+                    pass
+                self._routes.clear()
+
+        return _unsub
+
+    def _route(self, event: str) -> Route:
+        """Handlers interested in ``event``: (inline, background, all)."""
+        route = self._routes.get(event)
+        if route is not None:
+            return route
+        with self._lock:
+            handlers = [
+                (h, False, flag) for h, flag in self._subs.get(event, ())
+            ]
+            handlers += [
+                (h, True, flag)
+                for h, flag, names in self._any
+                if names is None or event in names
+            ]
+            route = (
+                tuple((h, w) for h, w, flag in handlers if flag),
+                tuple((h, w) for h, w, flag in handlers if not flag),
+                tuple((h, w) for h, w, _ in handlers),
+            )
+            self._routes[event] = route
+        return route
+
+    def wants(self, event: str) -> bool:
+        """True when at least one subscriber is interested in ``event``."""
+        return bool(self._route(event)[2])
+
+    # -- emit / dispatch --------------------------------------------------
+    def emit(self, event: str, payload: Payload) -> None:
+        """Dispatch ``payload`` (a dict or a zero-arg factory of one).
+
+        Without interested subscribers this returns before the payload is
+        built or any metric is touched.
+        """
+        inline, background, every = self._route(event)
+        if not every:
+            return
+        if not self._configured:
+            self.configure()
+        if callable(payload):
+            payload = payload()
+        if "ts" not in payload:
+            payload["ts"] = time()
         metrics.inc("events_emitted_total", {"event": event})
-        for h in subs:
+        view = MappingProxyType(payload)
+        if self.mode == "sync":
+            self._deliver(event, view, every)
+            return
+        if inline:
+            self._deliver(event, view, inline, account=False)
+        if background:
+            self._enqueue(event, view)
+
+    def _deliver(
+        self,
+        event: str,
+        view: Mapping[str, Any],
+        handlers: Tuple[Tuple[Callable[..., None], bool], ...],
+        account: bool = True,
+    ) -> None:
+        t0 = time()
+        for h, wildcard in handlers:
             try:
-                h(dict(payload))  # shallow copy for safety
+                if wildcard:
+                    h(event, view)
+                else:
+                    h(view)
             except Exception:  # noqa: BLE001
                 metrics.inc("handler_exceptions_total", {"event": event})
+        if not account:
+            return  # accounted with the background delivery
         latency_ms = int((time() - t0) * 1000)
         metrics.inc(
             "dispatch_latency_accum_ms", {"event": event}, latency_ms
         )
         metrics.inc("dispatch_count", {"event": event})
 
+    def _drop(self, event: str, policy: str) -> None:
+        metrics.inc(
+            "eventbus_dropped_total", {"event": event, "policy": policy}
+        )
+
+    def _enqueue(self, event: str, payload: Mapping[str, Any]) -> None:
+        if not self._threads:
+            self._start()
+        queue = self._queue
+        depth = len(queue)
+        policy = self.policy(event)
+        if policy == "sample" and depth >= self._sample_from:
+            with self._counts_lock:
+                n = self._sample_counts.get(event, 0) + 1
+                self._sample_counts[event] = n
+            if n % self._sample_every:
+                self._drop(event, "sample")
+                return
+        if depth >= self._capacity:
+            if policy != "block" or not self._wait_for_space():
+                self._drop(event, policy)
+                return
+        with self._idle:
+            self._in_flight += 1
+        queue.append((event, payload, perf_counter()))
+        self._items.release()
+        if next(self._enqueued) % _SAMPLE_METRICS_EVERY == 0:
+            metrics.observe("eventbus_queue_depth", len(queue))
+
+    def _wait_for_space(self) -> bool:
+        with self._space:
+            self._blocked += 1
+            try:
+                return self._space.wait_for(
+                    lambda: len(self._queue) < self._capacity,
+                    self._block_timeout_s,
+                )
+            finally:
+                self._blocked -= 1
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self._dispatchers):
+                t = Thread(
+                    target=self._run, name=f"eventbus-{i}", daemon=True
+                )
+                t.start()
+                self._threads.append(t)
+
+    def _run(self) -> None:
+        queue = self._queue
+        while True:
+            self._items.acquire()
+            try:
+                event, payload, enqueued_at = queue.popleft()
+            except IndexError:  # pragma: no cover - defensive
+                continue
+            if self._blocked:
+                with self._space:
+                    self._space.notify()
+            try:
+                self._deliver(event, payload, self._route(event)[1])
+            finally:
+                if next(self._delivered) % _SAMPLE_METRICS_EVERY == 0:
+                    metrics.observe(
+                        "eventbus_dispatch_lag_ms",
+                        (perf_counter() - enqueued_at) * 1000.0,
+                    )
+                with self._idle:
+                    self._in_flight -= 1
+                    if not self._in_flight:
+                        self._idle.notify_all()
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until every queued event was delivered."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._in_flight, timeout)
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
     def reset_for_tests(self) -> None:  # pragma: no cover
+        """Drop per-event subscriptions (wildcards and mode are kept)."""
+        self.flush(5)
         with self._lock:
             self._subs.clear()
+            self._routes.clear()
 
 
 _BUS = EventBus()
 
 
-def subscribe(event: str, handler: Handler) -> None:
-    _BUS.subscribe(event, handler)
+def subscribe(event: str, handler: Handler, *, inline: bool = False) -> None:
+    _BUS.subscribe(event, handler, inline=inline)
+
 
+def subscribe_all(
+    handler: AnyHandler,
+    *,
+    inline: bool = False,
+    events: Iterable[str] | None = None,
+) -> Callable[[], None]:
+    return _BUS.subscribe_all(handler, inline=inline, events=events)
 
-def emit(event: str, payload: Dict[str, Any]) -> None:
+
+def emit(event: str, payload: Payload) -> None:
     _BUS.emit(event, payload)
 
 
-__all__ = ["emit", "subscribe", "EventBus"]
+def wants(event: str) -> bool:
+    return _BUS.wants(event)
+
+
+def flush(timeout: float | None = None) -> bool:
+    return _BUS.flush(timeout)
+
+
+def get_bus() -> EventBus:
+    return _BUS
+
+
+__all__ = [
+    "emit",
+    "flush",
+    "get_bus",
+    "subscribe",
+    "subscribe_all",
+    "wants",
+    "EventBus",
+]
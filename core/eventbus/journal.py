@@ -0,0 +1,536 @@
+"""Persistent append-only event journal (perf forensics).
+
+Summary:
+* ``Journal`` is a background bus subscriber (``subscribe_all``) that
+    appends every event to segment files under
+    ``<storage.paths.data>/<storage.journal.dir>``. The handler only
+    enqueues; a writer thread drains the queue in batches of up to
+    ``batch_max`` records (or every ``flush_interval_ms``) through a
+    buffered file and flushes once per batch. A full queue drops the
+    record (``journal_dropped_total``) instead of stalling dispatch.
+* Record: ``{"event": name, "ts": ts, "payload": {...}}`` encoded as
+    compact JSON lines (``encoding=jsonl``, ``events-NNNNNN.jsonl``) or
+    length-prefixed JSON (``encoding=lp``: 4-byte big-endian length +
+    UTF-8 JSON body, ``events-NNNNNN.evlog``).
+* Segments rotate at ``segment_max_mb`` or ``segment_max_s``; only the
+    newest ``max_segments`` are kept. A writer never appends to an
+    existing segment: every start opens the next number.
+* Each sealed segment gets a sidecar ``events-NNNNNN.idx`` (JSON) with the
+    sorted request ids and their record offsets plus a sparse time index
+    (every ``index_every``-th record: running max ts, offset), so
+    ``JournalReader`` finds a request or the start of a time range with a
+    binary search instead of a scan. The active segment (no sidecar yet)
+    is indexed on the fly by the reader.
+* Time lookups follow writer order: ts is the running maximum, so events
+    emitted out of order across threads land where they were written.
+* ``latency_breakdown(timeline)`` derives ttft / decode / total timings
+    from a request's events; ``scripts/event_journal.py`` is the CLI.
+* Config ``storage.journal``: enabled, dir, encoding, segment_max_mb,
+    segment_max_s, max_segments, batch_max, flush_interval_ms,
+    queue_size, index_every.
+
+Metrics:
+    journal_records_total, journal_bytes_total, journal_dropped_total,
+    journal_segments_total (opened), journal_write_errors_total
+"""
+from __future__ import annotations
+
+import json
+import struct
+from bisect import bisect_left
+from collections import deque
+from pathlib import Path
+from threading import Condition, Event, Lock, Thread
+from time import time
+from typing import Any, Deque, Dict, Iterator, List, Mapping, Tuple
+
+from core import metrics
+
+ENCODINGS = {"jsonl": ".jsonl", "lp": ".evlog"}
+_SUFFIX_ENCODING = {v: k for k, v in ENCODINGS.items()}
+_LEN = struct.Struct(">I")
+_INDEX_VERSION = 1
+
+
+def journal_config() -> dict:
+    try:
+        from core.config import get_config
+
+        cfg = get_config().storage
+        out = cfg.journal.model_dump()
+        out["root"] = str(Path(cfg.paths.data) / out.get("dir", "journal"))
+        return out
+    except Exception:  # noqa: BLE001
+        return {}
+
+
+def encode(record: Mapping[str, Any], encoding: str) -> bytes:
+    body = json.dumps(
+        record, separators=(",", ":"), ensure_ascii=False, default=str
+    ).encode("utf-8")
+    if encoding == "lp":
+        return _LEN.pack(len(body)) + body
+    return body + b"\n"
+
+
+def _read_record(fh, encoding: str) -> Dict[str, Any] | None:
+    if encoding == "lp":
+        head = fh.read(_LEN.size)
+        if len(head) < _LEN.size:
+            return None
+        body = fh.read(_LEN.unpack(head)[0])
+    else:
+        body = fh.readline()
+    if not body:
+        return None
+    return json.loads(body)
+
+
+class _IndexBuilder:
+    """Sidecar index of one segment, filled as records are written."""
+
+    def __init__(self, index_every: int) -> None:
+        self.index_every = max(1, int(index_every))
+        self.count = 0
+        self.first_ts: float | None = None
+        self.max_ts: float | None = None
+        self.time: List[Tuple[float, int]] = []
+        self.requests: Dict[str, List[int]] = {}
+
+    def add(self, record: Mapping[str, Any], offset: int) -> None:
+        ts = float(record.get("ts") or 0.0)
+        if self.first_ts is None:
+            self.first_ts = ts
+        self.max_ts = ts if self.max_ts is None else max(self.max_ts, ts)
+        if self.count % self.index_every == 0:
+            self.time.append((self.max_ts, offset))
+        self.count += 1
+        rid = (record.get("payload") or {}).get("request_id")
+        if rid:
+            self.requests.setdefault(str(rid), []).append(offset)
+
+    def to_json(self, encoding: str) -> Dict[str, Any]:
+        ids = sorted(self.requests)
+        return {
+            "version": _INDEX_VERSION,
+            "encoding": encoding,
+            "count": self.count,
+            "first_ts": self.first_ts,
+            "max_ts": self.max_ts,
+            "time": self.time,
+            "request_ids": ids,
+            "offsets": [self.requests[i] for i in ids],
+        }
+
+
+class SegmentIndex:
+    """Loaded sidecar: O(log n) request / time lookups in one segment."""
+
+    def __init__(self, data: Mapping[str, Any]) -> None:
+        self.count = int(data.get("count", 0))
+        self.first_ts = data.get("first_ts")
+        self.max_ts = data.get("max_ts")
+        time_marks = data.get("time") or []
+        self._mark_ts = [float(t) for t, _ in time_marks]
+        self._mark_off = [int(o) for _, o in time_marks]
+        self._ids = list(data.get("request_ids") or [])
+        self._offsets = list(data.get("offsets") or [])
+
+    def offsets_for(self, request_id: str) -> List[int]:
+        i = bisect_left(self._ids, request_id)
+        if i < len(self._ids) and self._ids[i] == request_id:
+            return list(self._offsets[i])
+        return []
+
+    def start_offset(self, since: float) -> int:
+        """Offset to scan from for records with ts >= ``since``."""
+        i = bisect_left(self._mark_ts, since)
+        return self._mark_off[i - 1] if i > 0 else 0
+
+
+class Journal:
+    """Background writer of segmented, rotating event files."""
+
+    def __init__(
+        self,
+        root: str | Path,
+        encoding: str = "jsonl",
+        segment_max_mb: float = 64,
+        segment_max_s: float = 3600,
+        max_segments: int = 48,
+        batch_max: int = 512,
+        flush_interval_ms: float = 200,
+        queue_size: int = 65536,
+        index_every: int = 64,
+    ) -> None:
+        self.root = Path(root)
+        self.encoding = encoding if encoding in ENCODINGS else "jsonl"
+        self.segment_max_bytes = max(1, int(segment_max_mb * 1024 * 1024))
+        self.segment_max_s = float(segment_max_s)
+        self.max_segments = max(1, int(max_segments))
+        self.batch_max = max(1, int(batch_max))
+        self.flush_interval_s = max(0.001, float(flush_interval_ms) / 1000)
+        self.queue_size = max(1, int(queue_size))
+        self.index_every = index_every
+        self._queue: Deque[Dict[str, Any]] = deque()
+        self._wake = Event()
+        self._stop = False
+        self._thread: Thread | None = None
+        self._done = Condition(Lock())
+        self._accepted = 0
+        self._written = 0
+        self._fh: Any | None = None
+        self._segment: Path | None = None
+        self._segment_no = 0
+        self._opened_at = 0.0
+        self._size = 0
+        self._index: _IndexBuilder | None = None
+
+    # -- producer (bus handler) ------------------------------------------
+    def record(self, name: str, payload: Mapping[str, Any]) -> None:
+        if len(self._queue) >= self.queue_size:
+            metrics.inc("journal_dropped_total")
+            return
+        self._queue.append(
+            {"event": name, "ts": payload.get("ts"), "payload": dict(payload)}
+        )
+        with self._done:
+            self._accepted += 1
+        if len(self._queue) >= self.batch_max:
+            self._wake.set()
+
+    # -- lifecycle --------------------------------------------------------
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        existing = [_segment_no(p) for p in segment_paths(self.root)]
+        self._segment_no = max(existing, default=0)
+        self._thread = Thread(
+            target=self._run, name="event-journal", daemon=True
+        )
+        self._thread.start()
+
+    def flush(self, timeout: float | None = 5.0) -> bool:
+        """Wait until everything accepted so far is on disk."""
+        with self._done:
+            target = self._accepted
+        self._wake.set()
+        with self._done:
+            return self._done.wait_for(
+                lambda: self._written >= target, timeout
+            )
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Drain, seal the active segment (writes its index) and stop."""
+        self._stop = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # -- writer thread ----------------------------------------------------
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            while self._queue:
+                self._write_batch()
+            if self._stop:
+                self._seal()
+                return
+
+    def _write_batch(self) -> None:
+        batch = []
+        while self._queue and len(batch) < self.batch_max:
+            batch.append(self._queue.popleft())
+        written = 0
+        try:
+            for rec in batch:
+                data = encode(rec, self.encoding)
+                if self._fh is None or self._should_rotate():
+                    self._rotate()
+                self._fh.write(data)
+                self._index.add(rec, self._size)
+                self._size += len(data)
+                written += len(data)
+            self._fh.flush()
+        except Exception:  # noqa: BLE001
+            metrics.inc("journal_write_errors_total")
+        metrics.inc("journal_records_total", value=len(batch))
+        metrics.inc("journal_bytes_total", value=written)
+        with self._done:
+            self._written += len(batch)
+            self._done.notify_all()
+
+    def _should_rotate(self) -> bool:
+        return self._size >= self.segment_max_bytes or (
+            time() - self._opened_at >= self.segment_max_s
+        )
+
+    def _rotate(self) -> None:
+        self._seal()
+        self._segment_no += 1
+        name = f"events-{self._segment_no:06d}{ENCODINGS[self.encoding]}"
+        self._segment = self.root / name
+        self._fh = open(self._segment, "ab", buffering=1024 * 1024)
+        self._opened_at = time()
+        self._size = 0
+        self._index = _IndexBuilder(self.index_every)
+        metrics.inc("journal_segments_total")
+        self._retain()
+
+    def _seal(self) -> None:
+        if self._fh is None or self._segment is None:
+            return
+        try:
+            self._fh.close()
+            index_path(self._segment).write_text(
+                json.dumps(
+                    self._index.to_json(self.encoding),
+                    separators=(",", ":"),
+                ),
+                encoding="utf-8",
+            )
+        except Exception:  # noqa: BLE001
+            metrics.inc("journal_write_errors_total")
+        self._fh = None
+
+    def _retain(self) -> None:
+        for old in segment_paths(self.root)[: -self.max_segments]:
+            for path in (old, index_path(old)):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+
+def _segment_no(path: Path) -> int:
+    try:
+        return int(path.stem.split("-", 1)[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+def segment_paths(root: str | Path) -> List[Path]:
+    root = Path(root)
+    if not root.is_dir():
+        return []
+    found = [
+        p
+        for p in root.iterdir()
+        if p.name.startswith("events-") and p.suffix in _SUFFIX_ENCODING
+    ]
+    return sorted(found, key=_segment_no)
+
+
+def index_path(segment: Path) -> Path:
+    return segment.with_suffix(".idx")
+
+
+class JournalReader:
+    """Request / time-range queries over a journal directory."""
+
+    def __init__(self, root: str | Path) -> None:
+        self.root = Path(root)
+        self._cache: Dict[Path, Tuple[float, SegmentIndex]] = {}
+
+    def segments(self) -> List[Path]:
+        return segment_paths(self.root)
+
+    def index(self, segment: Path) -> SegmentIndex:
+        """Sidecar index, or one built by scanning the active segment."""
+        sidecar = index_path(segment)
+        mtime = (sidecar if sidecar.exists() else segment).stat().st_mtime
+        cached = self._cache.get(segment)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        if sidecar.exists():
+            idx = SegmentIndex(json.loads(sidecar.read_text("utf-8")))
+        else:
+            builder = _IndexBuilder(64)
+            for offset, rec in self._scan(segment, 0):
+                builder.add(rec, offset)
+            idx = SegmentIndex(builder.to_json(_encoding(segment)))
+        self._cache[segment] = (mtime, idx)
+        return idx
+
+    def _scan(
+        self, segment: Path, offset: int
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        encoding = _encoding(segment)
+        with open(segment, "rb") as fh:
+            fh.seek(offset)
+            while True:
+                pos = fh.tell()
+                try:
+                    rec = _read_record(fh, encoding)
+                except ValueError:  # torn tail of a live segment
+                    return
+                if rec is None:
+                    return
+                yield pos, rec
+
+    def timeline(self, request_id: str) -> List[Dict[str, Any]]:
+        """All events of ``request_id``, in write order."""
+        out = []
+        for segment in self.segments():
+            offsets = self.index(segment).offsets_for(request_id)
+            if not offsets:
+                continue
+            encoding = _encoding(segment)
+            with open(segment, "rb") as fh:
+                for offset in offsets:
+                    fh.seek(offset)
+                    rec = _read_record(fh, encoding)
+                    if rec is not None:
+                        out.append(rec)
+        return out
+
+    def between(
+        self, since: float | None = None, until: float | None = None
+    ) -> Iterator[Dict[str, Any]]:
+        """Events with ``since <= ts <= until`` (open ends when None)."""
+        lo = float("-inf") if since is None else since
+        hi = float("inf") if until is None else until
+        for segment in self.segments():
+            idx = self.index(segment)
+            if idx.count == 0 or (idx.max_ts is not None and idx.max_ts < lo):
+                continue
+            if idx.first_ts is not None and idx.first_ts > hi:
+                return
+            running = lo
+            for _, rec in self._scan(segment, idx.start_offset(lo)):
+                ts = float(rec.get("ts") or 0.0)
+                running = max(running, ts)
+                if running > hi:
+                    return
+                if lo <= ts <= hi:
+                    yield rec
+
+    def request_ids(
+        self, since: float | None = None, until: float | None = None
+    ) -> List[str]:
+        """Requests whose GenerationStarted falls in the range."""
+        seen: Dict[str, None] = {}
+        for rec in self.between(since, until):
+            if rec.get("event") == "GenerationStarted":
+                rid = (rec.get("payload") or {}).get("request_id")
+                if rid:
+                    seen[str(rid)] = None
+        return list(seen)
+
+
+def _encoding(segment: Path) -> str:
+    return _SUFFIX_ENCODING.get(segment.suffix, "jsonl")
+
+
+def _ms(a: float | None, b: float | None) -> float | None:
+    if a is None or b is None:
+        return None
+    return round((b - a) * 1000.0, 3)
+
+
+def latency_breakdown(timeline: List[Mapping[str, Any]]) -> Dict[str, Any]:
+    """Per-request timings from its journal events.
+
+    ttft_ms: GenerationStarted -> first chunk event; decode_ms: first
+    chunk -> terminal event; total_ms: provider-reported latency when
+    present, else start -> terminal.
+    """
+    started = first_chunk = end = None
+    out: Dict[str, Any] = {"events": len(timeline)}
+    for rec in timeline:
+        name = rec.get("event")
+        p = rec.get("payload") or {}
+        ts = rec.get("ts")
+        out.setdefault("request_id", p.get("request_id"))
+        if name == "GenerationStarted" and started is None:
+            started = ts
+            out["model_id"] = p.get("model_id")
+            out["prompt_tokens"] = p.get("prompt_tokens")
+        elif name in ("GenerationChunk", "GenerationChunkBatch"):
+            if first_chunk is None:
+                first_chunk = ts
+            out["output_tokens"] = p.get("tokens_out")
+        elif name == "GenerationCompleted":
+            end = ts
+            out["status"] = p.get("status")
+            out["stop_reason"] = p.get("stop_reason")
+            out["output_tokens"] = p.get("output_tokens")
+            out["reported_latency_ms"] = p.get("latency_ms")
+        elif name == "GenerationCancelled":
+            end = end or ts
+            out["status"] = "cancelled"
+            out["stop_reason"] = p.get("reason")
+        elif name == "CancelLatencyMeasured":
+            out["cancel_latency_ms"] = p.get("duration_ms")
+    out["ttft_ms"] = _ms(started, first_chunk)
+    out["decode_ms"] = _ms(first_chunk, end)
+    out["total_ms"] = out.get("reported_latency_ms") or _ms(started, end)
+    tokens = out.get("output_tokens")
+    decode_ms = out["decode_ms"]
+    out["tokens_per_s"] = (
+        round(tokens / (decode_ms / 1000.0), 2)
+        if tokens and decode_ms
+        else None
+    )
+    return out
+
+
+_JOURNAL: Journal | None = None
+_UNSUB: Any | None = None
+_LOCK = Lock()
+
+
+def start_journal() -> Journal | None:
+    """Start the configured journal (None when ``enabled`` is false)."""
+    global _JOURNAL, _UNSUB  # noqa: PLW0603
+    cfg = journal_config()
+    if not cfg.get("enabled"):
+        return None
+    from core.eventbus import subscribe_all
+
+    with _LOCK:
+        if _JOURNAL is not None:
+            return _JOURNAL
+        journal = Journal(
+            cfg["root"],
+            encoding=str(cfg.get("encoding", "jsonl")),
+            segment_max_mb=float(cfg.get("segment_max_mb", 64)),
+            segment_max_s=float(cfg.get("segment_max_s", 3600)),
+            max_segments=int(cfg.get("max_segments", 48)),
+            batch_max=int(cfg.get("batch_max", 512)),
+            flush_interval_ms=float(cfg.get("flush_interval_ms", 200)),
+            queue_size=int(cfg.get("queue_size", 65536)),
+            index_every=int(cfg.get("index_every", 64)),
+        )
+        journal.start()
+        _UNSUB = subscribe_all(journal.record)
+        _JOURNAL = journal
+        return journal
+
+
+def stop_journal() -> None:
+    global _JOURNAL, _UNSUB  # noqa: PLW0603
+    with _LOCK:
+        if _UNSUB is not None:
+            _UNSUB()
+        if _JOURNAL is not None:
+            _JOURNAL.close()
+        _JOURNAL = _UNSUB = None
+
+
+__all__ = [
+    "ENCODINGS",
+    "Journal",
+    "JournalReader",
+    "SegmentIndex",
+    "encode",
+    "index_path",
+    "journal_config",
+    "latency_breakdown",
+    "segment_paths",
+    "start_journal",
+    "stop_journal",
+]
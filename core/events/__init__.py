@@ -4,17 +4,28 @@ Preferred: use `core.eventbus` for per-event subscriptions.
 This transitional module exposes `subscribe(handler)` where
 handler(name, payload) receives every event. Will be removed after
 migration.
+
+Every event goes through the bus once. Legacy any-subscribers run inline
+on the emitting thread (callers read what they captured right after
+emit); the metrics collector is a background bus subscriber, so in
+``metrics.eventbus.mode=async`` it runs on the dispatcher threads.
+
+``emit`` hands the bus ``ev.to_event`` itself, so the payload dict is
+only built when some subscriber is interested in the event type;
+handlers receive a read-only mapping view of it.
 """
 from __future__ import annotations
 
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, fields
+from functools import lru_cache
 from time import time
-from typing import Any, Callable, Dict, List, Protocol
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Protocol
 
 from core import metrics as _metrics
 from core.eventbus import emit as _emit_bus
+from core.eventbus import subscribe_all as _subscribe_all
 
-EventHandler = Callable[[str, Dict[str, Any]], None]
+EventHandler = Callable[[str, Mapping[str, Any]], None]
 
 
 class SupportsEvent(Protocol):  # pragma: no cover
@@ -22,10 +33,16 @@ class SupportsEvent(Protocol):  # pragma: no cover
         ...
 
 
+@lru_cache(maxsize=None)
+def _field_names(cls: type) -> tuple[str, ...]:
+    return tuple(f.name for f in fields(cls))
+
+
 @dataclass(slots=True)
 class BaseEvent:
     def to_event(self) -> Dict[str, Any]:  # noqa: D401
-        data = asdict(self)
+        # shallow: event fields are flat (nested dicts/lists are shared)
+        data = {k: getattr(self, k) for k in _field_names(type(self))}
         data["ts"] = data.get("ts") or time()
         return data
 
@@ -36,6 +53,8 @@ class ModelLoaded(BaseEvent):
     role: str
     load_ms: int
     revision: str | None = None
+    # per-phase ms (prefetch / construct / warmup) when measured
+    phases: Dict[str, int] | None = None
 
 
 @dataclass(slots=True)
@@ -102,6 +121,24 @@ class GenerationChunk(BaseEvent):
     tokens_out: int  # cumulative produced tokens
 
 
+@dataclass(slots=True)
+class GenerationChunkBatch(BaseEvent):
+    """Coalesced GenerationChunk run (``llm.chunk_events.mode=batch``).
+
+    seq_start..seq_end: inclusive piece range covered by ``text``.
+    tokens: pieces in this batch; tokens_out: cumulative produced tokens.
+    """
+    request_id: str
+    model_id: str
+    role: str
+    correlation_id: str
+    seq_start: int
+    seq_end: int
+    text: str
+    tokens: int
+    tokens_out: int
+
+
 @dataclass(slots=True)
 class GenerationCompleted(BaseEvent):
     request_id: str
@@ -121,11 +158,11 @@ class GenerationCompleted(BaseEvent):
 
 @dataclass(slots=True)
 class GenerationCancelled(BaseEvent):
-    """Generation cancelled mid-flight (user abort or timeout)."""
+    """Generation cancelled mid-flight (abort, timeout, client gone)."""
     request_id: str
     model_id: str
     role: str
-    reason: str  # user_abort|timeout
+    reason: str  # user_abort|timeout|client_disconnect
     latency_ms: int
     output_tokens: int
     correlation_id: str | None = None
@@ -263,7 +300,8 @@ class ReasoningSuppressedOrNone(BaseEvent):
     final_tokens: int
 
 
-_ANY_SUBS: List[EventHandler] = []
+# unsubscribe callables of the legacy any-subscribers (reset for tests)
+_ANY_SUBS: List[Callable[[], None]] = []
 # Generation counter used by tests: each call to reset_listeners_for_tests
 # increments this so already-loaded providers can re-emit ModelLoaded when
 # first accessed in a new test without needing to fully reload weights.
@@ -274,17 +312,34 @@ def get_event_generation() -> int:  # pragma: no cover - lightweight helper
     return _EVENT_GENERATION
 
 
-def _metrics_collector(
-    name: str, payload: Dict[str, Any]
-) -> None:  # noqa: D401
-    gen_names = {
+_GENERATION_EVENTS = frozenset(
+    {
         "GenerationStarted",
         "GenerationChunk",
+        "GenerationChunkBatch",
         "GenerationCompleted",
         "GenerationFailed",
         "GenerationCancelled",
     }
-    if name in gen_names:
+)
+# event types _metrics_collector turns into metrics (its bus interest)
+_COLLECTED_EVENTS = _GENERATION_EVENTS | {
+    "ModelLoaded",
+    "ModelUnloaded",
+    "ModelAliasedLoaded",
+    "ModelDowngraded",
+    "ReasoningPresetApplied",
+    "ModelPassportMismatch",
+    "CancelLatencyMeasured",
+    "ToolCallResult",
+    "ReasoningSuppressedOrNone",
+}
+
+
+def _metrics_collector(
+    name: str, payload: Mapping[str, Any]
+) -> None:  # noqa: D401
+    if name in _GENERATION_EVENTS:
         _metrics.inc("events_generation", {"type": name[10:].lower()})
     elif name in {"ModelLoaded", "ModelUnloaded"}:
         _metrics.inc("events_" + name.lower(), {"role": payload.get("role")})
@@ -338,39 +393,41 @@ def _metrics_collector(
         )
 
 
-_ANY_SUBS.append(_metrics_collector)
+_subscribe_all(_metrics_collector, events=_COLLECTED_EVENTS)
 
 
 def emit(ev: BaseEvent | SupportsEvent) -> None:
-    name = ev.__class__.__name__
-    payload = ev.to_event()
-    _emit_bus(name, payload)
-    for h in list(_ANY_SUBS):  # copy for isolation
-        try:
-            h(name, dict(payload))
-        except Exception:  # noqa: BLE001
-            _metrics.inc("handler_exceptions_total", {"event": name})
+    _emit_bus(ev.__class__.__name__, ev.to_event)
 
 
-def on(handler: EventHandler) -> None:
-    _ANY_SUBS.append(handler)
+def subscribe(
+    handler: EventHandler, events: Iterable[str] | None = None
+):  # backward compatible helper
+    """handler(name, payload) for every event (or only ``events``).
 
-
-def subscribe(handler: EventHandler):  # backward compatible helper
-    on(handler)
+    Runs inline on the emitting thread; returns an unsubscribe callable.
+    """
+    unsub = _subscribe_all(handler, inline=True, events=events)
+    _ANY_SUBS.append(unsub)
 
     def _unsub() -> None:  # noqa: D401
+        unsub()
         try:
-            _ANY_SUBS.remove(handler)
+            _ANY_SUBS.remove(unsub)
         except ValueError:
             pass
     return _unsub
 
 
+def on(handler: EventHandler, events: Iterable[str] | None = None) -> None:
+    subscribe(handler, events)
+
+
 def reset_listeners_for_tests() -> None:  # pragma: no cover
     global _EVENT_GENERATION  # noqa: PLW0603
+    for unsub in list(_ANY_SUBS):
+        unsub()
     _ANY_SUBS.clear()
-    _ANY_SUBS.append(_metrics_collector)
     # Bump generation so cached providers know to re-emit ModelLoaded
     _EVENT_GENERATION += 1
 
@@ -386,6 +443,7 @@ __all__ = [
     "ModelDowngraded",
     "GenerationStarted",
     "GenerationChunk",
+    "GenerationChunkBatch",
     "GenerationCompleted",
     "GenerationFailed",
     "GenerationCancelled",
@@ -5,6 +5,11 @@ Implements incremental parsing of Harmony messages:
   <|start|>assistant<|channel|>final<|message|>...<|return|>
 
 If no Harmony tokens are detected we fallback to a single final message.
+
+Parsing is single-pass: a marker lexer keeps a cursor over the stream and
+only examines newly appended text; a small state machine (outside / header
+/ body) consumes its items, so per-chunk cost does not grow with output
+length (see scripts/perf_harmony_adapter.py).
 """
 from __future__ import annotations
 
@@ -15,6 +20,8 @@ import os
 import logging
 import time
 
+from .types import HarmonyVocab
+
 # Shared service marker regex (used for sanitation & tests)
 SERVICE_MARKER_RE = r"<\|[^|>]+\|>"
 
@@ -68,6 +75,75 @@ except Exception:  # noqa: BLE001
             return None
  
 
+class _MarkerLexer:
+    """Incremental splitter of streamed text into text / marker items.
+
+    Only newly appended characters are examined. A trailing fragment that
+    may still turn into a marker (``<``, ``<|chan``, ``<|end|``) is held
+    back until the next chunk. Marker grammar mirrors SERVICE_MARKER_RE.
+    """
+
+    _MAX_PENDING = 128
+    _RE_NAME = re.compile(r"[^|>]*")
+
+    def __init__(self):  # noqa: D401
+        self.pending = ""
+
+    def feed(self, chunk: str) -> List[tuple]:
+        """Return ``[(marker_name | None, raw_text), ...]`` for ``chunk``.
+
+        ``marker_name`` is lower-cased; ``None`` denotes plain text.
+        """
+        text = self.pending + chunk if self.pending else chunk
+        self.pending = ""
+        items: List[tuple] = []
+        n = len(text)
+        emitted = 0  # start of not yet emitted text
+        pos = 0
+        while True:
+            lt = text.find("<|", pos)
+            if lt == -1:
+                if text.endswith("<"):
+                    self._hold(text, n - 1, emitted, items)
+                    return items
+                break
+            name_end = self._RE_NAME.match(text, lt + 2).end()
+            if name_end >= n - 1 and (
+                name_end == n or text[name_end] == "|"
+            ):
+                # Incomplete marker at the tail: wait for more data
+                if n - lt <= self._MAX_PENDING:
+                    self._hold(text, lt, emitted, items)
+                    return items
+                break
+            if (
+                name_end > lt + 2
+                and text[name_end] == "|"
+                and text[name_end + 1] == ">"
+            ):
+                if lt > emitted:
+                    items.append((None, text[emitted:lt]))
+                items.append(
+                    (text[lt + 2:name_end].lower(), text[lt:name_end + 2])
+                )
+                emitted = pos = name_end + 2
+            else:
+                pos = lt + 1
+        if emitted < n:
+            items.append((None, text[emitted:]))
+        return items
+
+    def _hold(self, text: str, at: int, emitted: int, items: List[tuple]):
+        if at > emitted:
+            items.append((None, text[emitted:at]))
+        self.pending = text[at:]
+
+
+_ST_OUTSIDE, _ST_HEADER, _ST_BODY = 0, 1, 2
+_START_ASSISTANT = "<|start|>assistant"
+_RAW_TAIL_MAX = 512
+
+
 class HarmonyChannelAdapter:
     """Spec-aligned Harmony streaming parser (analysis/commentary/final).
 
@@ -78,23 +154,29 @@ class HarmonyChannelAdapter:
       * <|return|> treated as terminal (final message complete)
     """
 
-    _RE_START = re.compile(r"<\|start\|>assistant", re.IGNORECASE)
     _RE_CHANNEL_KNOWN = re.compile(
-        r"<\|channel\|>(analysis|commentary|final|tool)",
-        re.IGNORECASE,
-    )
-    _RE_CHANNEL_ANY = re.compile(r"<\|channel\|>([a-z0-9_.-]+)", re.IGNORECASE)
-    _RE_MESSAGE = re.compile(r"<\|message\|>", re.IGNORECASE)
-    _RE_END = re.compile(r"<\|(end|return)\|>", re.IGNORECASE)
-    _RE_SERVICE = re.compile(r"<\|[^|>]+\|>")
-    _RE_RECIPIENT = re.compile(
-        r"<\|recipient\|>([a-zA-Z0-9_.-]+)", re.IGNORECASE
+        r"(analysis|commentary|final|tool)", re.IGNORECASE
     )
-    _RE_CONSTRAIN = re.compile(r"<\|constrain\|>", re.IGNORECASE)
+    _RE_CHANNEL_ANY = re.compile(r"[a-z0-9_.-]+", re.IGNORECASE)
+    _RE_RECIPIENT = re.compile(r"[a-zA-Z0-9_.-]+")
 
     def __init__(self, cfg: Dict):  # noqa: D401
         self.cfg = cfg
-        self._buffer = ""
+        # Incremental parse state (see _feed_item): lexer cursor, message
+        # state, header entries, body pieces and the raw text of the
+        # message still in flight (finalize() fallback input).
+        self._lexer = _MarkerLexer()
+        self._state = _ST_OUTSIDE
+        self._role: Optional[List[str]] = None
+        self._header: List[tuple] = []
+        self._body: List[str] = []
+        self._msg_kind: Optional[str] = None
+        self._msg_recipient: Optional[str] = None
+        self._msg_constrain = False
+        self._raw: List[str] = []
+        self._raw_len = 0
+        self._raw_has_start = False
+        self._start_idx = 0
         self._model_id = str(cfg.get("model_id", "unknown"))
         # Context identifiers (set later by pipeline/route)
         self.request_id: Optional[str] = None
@@ -229,114 +311,197 @@ class HarmonyChannelAdapter:
             pass
 
     # ---------------- core parse -----------------
-    def _scan_next_message(self) -> Optional[Dict]:
-        """Attempt to parse a single complete assistant message from buffer.
+    @property
+    def _buffer(self) -> str:
+        """Raw text of the message still in flight (incl. lexer tail)."""
+        return "".join(self._raw) + self._lexer.pending
+
+    def _raw_append(self, raw: str) -> None:
+        self._raw.append(raw)
+        self._raw_len += len(raw)
+        if (
+            self._state == _ST_OUTSIDE
+            and not self._raw_has_start
+            and self._raw_len > _RAW_TAIL_MAX
+        ):
+            # Keep tail to avoid unbounded growth on malformed streams
+            tail = "".join(self._raw)[-_RAW_TAIL_MAX:]
+            self._raw = [tail]
+            self._raw_len = len(tail)
 
-        Returns an event dict list (analysis/commentary deltas) or None if
-        incomplete. On final message, sets _final_message_closed.
+    def _begin_header(self, *, virtual: bool = False) -> None:
+        self._state = _ST_HEADER
+        self._header = []
+        if virtual:
+            # Model continues the prompt suffix without echoing it
+            self._role = None
+            self._raw_append(_START_ASSISTANT)
+            self._raw_has_start = True
+        else:
+            # Role text decides whether this is an assistant message
+            self._role = []
+            self._start_idx = len(self._raw)
+
+    def _confirm_start(self) -> None:
+        if self._raw_has_start:
+            return
+        # Trim leading noise before the first assistant start
+        self._raw = self._raw[self._start_idx:]
+        self._raw_len = sum(len(r) for r in self._raw)
+        self._raw_has_start = True
+
+    def _feed(self, name: Optional[str], raw: str, out: List[Dict]) -> None:
+        """Advance the message state machine by one lexer item.
+
+        ``name`` is the lower-cased marker name or None for plain text.
+        Every item is touched once; message content is joined only when
+        its end marker arrives.
         """
-        # Find start
-        m_start = self._RE_START.search(self._buffer)
-        if not m_start:
-            return None
-        # Detect potential tool call (<|recipient|>) before channel
-        m_recipient = self._RE_RECIPIENT.search(self._buffer, m_start.end())
-        m_chan_known = self._RE_CHANNEL_KNOWN.search(
-            self._buffer, m_start.end()
-        )
-        if m_recipient and (
-            not m_chan_known or m_recipient.start() < m_chan_known.start()
+        state = self._state
+        if state == _ST_BODY:
+            self._raw_append(raw)
+            if name is None:
+                self._body.append(raw)
+            elif name in ("end", "return"):
+                self._complete_message(name, out)
+            # Any other service marker inside content is stripped
+            return
+        if state == _ST_OUTSIDE:
+            if name == "start":
+                self._begin_header()
+            self._raw_append(raw)
+            return
+        if self._role is not None:
+            if name is None:
+                self._raw_append(raw)
+                self._role.append(raw)
+                role = "".join(self._role)
+                if len(role) < len("assistant"):
+                    return
+                self._role = None
+                if role.startswith("assistant"):
+                    self._confirm_start()
+                else:
+                    self._state = _ST_OUTSIDE
+                return
+            # Marker before a full role name: not an assistant message
+            self._role = None
+            self._state = _ST_OUTSIDE
+            self._feed(name, raw, out)
+            return
+        self._raw_append(raw)
+        if name is None:
+            if self._header:
+                self._header[-1][1].append(raw)
+        elif name == "message":
+            self._resolve_header()
+            self._body = []
+            self._state = _ST_BODY
+        else:
+            self._header.append((name, []))
+
+    def _resolve_header(self) -> None:
+        """Classify the message from its header entries.
+
+        First known channel wins; a recipient ahead of it makes the message
+        a tool call (``<|constrain|>`` directly after the recipient name is
+        recorded). Headers without any channel stay unresolved.
+        """
+        known = None
+        any_channel = None
+        recipient = None
+        constrain = False
+        header = self._header
+        for idx, (name, texts) in enumerate(header):
+            if name == "channel" and known is None:
+                channel, valid = self._classify_channel(idx, texts)
+                if channel is not None:
+                    known = (idx, channel)
+                elif any_channel is None and valid:
+                    any_channel = idx
+            elif name == "recipient" and recipient is None:
+                text = "".join(texts)
+                m = self._RE_RECIPIENT.match(text)
+                if m:
+                    recipient = (idx, m.group(0))
+                    constrain = (
+                        m.end() == len(text)
+                        and idx + 1 < len(header)
+                        and header[idx + 1][0] == "constrain"
+                    )
+        self._msg_recipient = None
+        self._msg_constrain = False
+        if recipient is not None and (
+            known is None or recipient[0] < known[0]
         ):
-            # Optional <|constrain|> tokens before <|message|>
-            pos = m_recipient.end()
-            constrain_present = False
-            while True:
-                m_con = self._RE_CONSTRAIN.match(self._buffer, pos)
-                if not m_con:
-                    break
-                constrain_present = True
-                pos = m_con.end()
-            m_msg = self._RE_MESSAGE.search(self._buffer, pos)
-            if not m_msg:
-                return None
-            m_end = self._RE_END.search(self._buffer, m_msg.end())
-            if not m_end:
-                return None
-            raw_segment = self._buffer[m_msg.end():m_end.start()]
-            segment = self._RE_SERVICE.sub("", raw_segment)
-            segment = self._ws(segment)
-            event = {
+            self._msg_kind = "tool_call"
+            self._msg_recipient = recipient[1]
+            self._msg_constrain = constrain
+        elif known is not None:
+            self._msg_kind = known[1]
+        elif any_channel is not None:
+            self._msg_kind = "unknown"
+        else:
+            self._msg_kind = None
+
+    def _classify_channel(
+        self, idx: int, texts: List[str]
+    ) -> tuple:
+        """Return ``(known_channel | None, is_valid_name)`` for a header."""
+        text = "".join(texts)
+        m = self._RE_CHANNEL_KNOWN.match(text)
+        if m:
+            return m.group(1).lower(), True
+        return None, self._RE_CHANNEL_ANY.match(text) is not None
+
+    def _complete_message(self, end: str, out: List[Dict]) -> None:
+        """Emit events for the message closed by ``<|end|>/<|return|>``."""
+        kind = self._msg_kind
+        segment = self._ws("".join(self._body))
+        self._body = []
+        self._state = _ST_OUTSIDE
+        if kind is None:
+            # No channel header: keep the raw text for finalize() fallback
+            return
+        self._raw = []
+        self._raw_len = 0
+        self._raw_has_start = False
+        if kind == "tool_call":
+            out.append({
                 "type": "tool_call",
-                "recipient": m_recipient.group(1),
+                "recipient": self._msg_recipient,
                 "args_text": segment,
-                "constrain": True if constrain_present else None,
-            }
-            self._buffer = self._buffer[m_end.end():]
-            return {"events": [event]}
-        # Ensure header present up to channel token
-        m_chan_known = self._RE_CHANNEL_KNOWN.search(
-            self._buffer, m_start.end()
-        )
-        if not m_chan_known:
-            # maybe unknown channel? detect generic channel token
-            m_any = self._RE_CHANNEL_ANY.search(self._buffer, m_start.end())
-            if m_any:
-                # unknown channel: try to skip whole message when closed
-                m_msg_marker = self._RE_MESSAGE.search(
-                    self._buffer, m_any.end()
+                "constrain": True if self._msg_constrain else None,
+            })
+        elif kind == "unknown":
+            # Unknown channel: parse error metric & drop
+            try:
+                _metrics.inc(
+                    "harmony_parse_error_total",
+                    {"stage": "unknown_channel"},
                 )
-                if not m_msg_marker:
-                    return None  # wait more data
-                m_end = self._RE_END.search(self._buffer, m_msg_marker.end())
-                if not m_end:
-                    return None
-                # emit parse error metric & drop
-                try:
-                    _metrics.inc(
-                        "harmony_parse_error_total",
-                        {"stage": "unknown_channel"},
-                    )
-                except Exception:  # noqa: BLE001
-                    pass
-                # slice out skipped region
-                self._buffer = self._buffer[m_end.end():]
-                return {"skipped": True}
-            return None
-        channel = m_chan_known.group(1).lower()
-        m_msg = self._RE_MESSAGE.search(self._buffer, m_chan_known.end())
-        if not m_msg:
-            return None
-        m_end = self._RE_END.search(self._buffer, m_msg.end())
-        if not m_end:
-            return None
-        # Extract content
-        raw_segment = self._buffer[m_msg.end():m_end.start()]
-        segment = self._RE_SERVICE.sub("", raw_segment)
-        segment = self._ws(segment)
-        events: List[Dict] = []
-        if channel == "analysis":
-            self._emit_analysis(segment, events)
-        elif channel == "commentary":
-            self._emit_commentary(segment, events)
-        elif channel == "tool":
+            except Exception:  # noqa: BLE001
+                pass
+        elif kind == "analysis":
+            self._emit_analysis(segment, out)
+        elif kind == "commentary":
+            self._emit_commentary(segment, out)
+        elif kind == "tool":
             # New tool channel JSON payload. We'll emit a structured
             # tool_call and synthetic tool_result (immediate) so the
             # route can translate into events.
             payload = segment.strip()
             if payload:
-                events.append({
+                out.append({
                     "type": "tool_channel_raw",
                     "raw": payload,
                 })
         else:  # final
             if not self._final_message_closed:
-                self._emit_final(segment, events)
+                self._emit_final(segment, out)
             self._final_message_closed = True
-            if m_end.group(1).lower() == "return":
+            if end == "return":
                 self._saw_return_token = True
-        # Trim processed region
-        self._buffer = self._buffer[m_end.end():]
-        return {"events": events}
 
     def process_chunk(self, chunk: str):  # type: ignore[override]
         out: List[Dict] = []
@@ -348,65 +513,48 @@ class HarmonyChannelAdapter:
         )
         # After final channel closed: only record anomalies, no output
         if self._final_message_closed:
-            # After closure: record anomalies only
-            try:
-                saw_final = "<|channel|>final" in chunk
-                saw_analysis = "<|channel|>analysis" in chunk
-                saw_commentary = "<|channel|>commentary" in chunk
-                if saw_final:
-                    _metrics.inc_unexpected_order("extra_final")
-                if saw_analysis:
-                    _metrics.inc_unexpected_order("analysis_after_final")
-                    _metrics.inc_reasoning_leak(
-                        "post_final_analysis"
-                    )  # type: ignore[attr-defined]
-                if saw_commentary:
-                    _metrics.inc_unexpected_order("commentary_after_final")
-                if saw_analysis or saw_commentary or saw_final:
-                    _metrics.inc_unexpected_order("interleaved_final")
-                    _metrics.inc_channel_merge_anomaly(
-                        "post_finalize_emission"
-                    )  # type: ignore[attr-defined]
-            except Exception:  # noqa: BLE001
-                pass
+            self._record_post_final(
+                saw_final="<|channel|>final" in chunk,
+                saw_analysis="<|channel|>analysis" in chunk,
+                saw_commentary="<|channel|>commentary" in chunk,
+            )
             return iter(())
-        # Normal flow
-        self._buffer += chunk
-        # On first chunk, prepend <|start|>assistant if not present
-        # (model generates from there, but doesn't emit the prompt suffix)
+        # Normal flow: only the newly appended text is examined
         if self._first_chunk:
             self._first_chunk = False
-            if "<|start|>assistant" not in self._buffer:
-                self._buffer = "<|start|>assistant" + self._buffer
-        # Wait until we see the assistant preamble
-        if "<|start|>assistant" not in self._buffer:
-            if len(self._buffer) > 512:
-                # Keep tail to avoid unbounded growth on malformed streams
-                self._buffer = self._buffer[-512:]
-            return iter(())
-        # Trim any leading noise before first start token
-        first_idx = self._buffer.find("<|start|>assistant")
-        if first_idx > 0:
-            self._buffer = self._buffer[first_idx:]
-        safety = 0
-        while True:
-            safety += 1
-            if safety > 1000:  # hard guard to avoid infinite loops
-                try:
-                    _metrics.inc(
-                        "harmony_parse_error_total", {"stage": "loop_guard"}
-                    )
-                except Exception:  # noqa: BLE001
-                    pass
-                break
-            res = self._scan_next_message()
-            if res is None:
-                break
-            if res.get("skipped"):
-                continue
-            out.extend(res.get("events", []))
+            # Model generates from <|start|>assistant (prompt suffix) but
+            # doesn't echo it
+            if _START_ASSISTANT not in chunk:
+                self._begin_header(virtual=True)
+        for name, raw in self._lexer.feed(chunk):
+            self._feed(name, raw, out)
             if self._final_message_closed:
                 break
+        return self._deliver(out)
+
+    def _record_post_final(
+        self, *, saw_final: bool, saw_analysis: bool, saw_commentary: bool
+    ) -> None:
+        # After closure: record anomalies only
+        try:
+            if saw_final:
+                _metrics.inc_unexpected_order("extra_final")
+            if saw_analysis:
+                _metrics.inc_unexpected_order("analysis_after_final")
+                _metrics.inc_reasoning_leak(
+                    "post_final_analysis"
+                )  # type: ignore[attr-defined]
+            if saw_commentary:
+                _metrics.inc_unexpected_order("commentary_after_final")
+            if saw_analysis or saw_commentary or saw_final:
+                _metrics.inc_unexpected_order("interleaved_final")
+                _metrics.inc_channel_merge_anomaly(
+                    "post_finalize_emission"
+                )  # type: ignore[attr-defined]
+        except Exception:  # noqa: BLE001
+            pass
+
+    def _deliver(self, out: List[Dict]):
         # Wrap iterator to track actual delivery of final delta tokens
         if not out:
             return iter(())
@@ -828,6 +976,83 @@ class HarmonyChannelAdapter:
         return iter(out)
 
 
+class HarmonyTokenAdapter(HarmonyChannelAdapter):
+    """Harmony parser driven by token ids instead of text.
+
+    llama.cpp emits Harmony markers as single special tokens; with
+    ``provider.stream(..., with_token_ids=True)`` the pipeline feeds
+    ``(token_id, piece)`` pairs into ``process_token``. Markers and channel
+    names are resolved by id lookups (``HarmonyVocab``) and drive the same
+    message state machine as the text path, so events are identical while
+    marker text is never scanned (a literal ``<|end|>`` written as plain
+    tokens stays content). ``process_chunk`` remains the text fallback when
+    no vocab is bound.
+    """
+
+    def __init__(self, cfg: Dict, vocab: Optional[HarmonyVocab] = None):
+        super().__init__(cfg)
+        self._marker_ids: Dict[int, str] = {}
+        self._channel_ids: Dict[int, str] = {}
+        # header entry index -> channel resolved from its first token id
+        self._header_channels: Dict[int, str] = {}
+        self._after_channel_marker = False
+        if vocab is not None:
+            self.bind_vocab(vocab)
+
+    @property
+    def vocab_bound(self) -> bool:  # noqa: D401
+        return bool(self._marker_ids)
+
+    def bind_vocab(self, vocab: HarmonyVocab) -> None:  # noqa: D401
+        self._marker_ids = dict(vocab.markers)
+        self._channel_ids = dict(vocab.channels)
+
+    def process_token(self, token_id: int, piece: str):
+        """Consume one decoded token; returns an iterator of events."""
+        name = self._marker_ids.get(token_id)
+        if self._final_message_closed:
+            if self._after_channel_marker:
+                channel = self._channel_ids.get(token_id)
+                self._record_post_final(
+                    saw_final=channel == "final",
+                    saw_analysis=channel == "analysis",
+                    saw_commentary=channel == "commentary",
+                )
+            self._after_channel_marker = name == "channel"
+            return iter(())
+        if name is None and not piece:
+            return iter(())
+        if self._first_chunk:
+            self._first_chunk = False
+            if name != "start":
+                self._begin_header(virtual=True)
+        if (
+            name is None
+            and self._state == _ST_HEADER
+            and self._role is None
+            and self._header
+            and self._header[-1][0] == "channel"
+            and not self._header[-1][1]
+        ):
+            channel = self._channel_ids.get(token_id)
+            if channel is not None:
+                self._header_channels[len(self._header) - 1] = channel
+        out: List[Dict] = []
+        self._feed(name, piece, out)
+        return self._deliver(out)
+
+    def _resolve_header(self) -> None:
+        super()._resolve_header()
+        self._header_channels = {}
+
+    def _classify_channel(self, idx: int, texts: List[str]) -> tuple:
+        channel = self._header_channels.get(idx)
+        if channel is not None:
+            return channel, True
+        # Channel name not a single vocab token: classify header text once
+        return super()._classify_channel(idx, texts)
+
+
 class StreamingStructureAdapter(HarmonyChannelAdapter):  # compat shim
     """Deprecated alias for legacy imports.
 
@@ -0,0 +1,331 @@
+"""Admission control in front of the generation pipeline.
+
+Summary:
+* Every ``/generate`` request takes a ticket from its model's
+    ``AdmissionController`` before any preparation work. At most
+    ``max_concurrent`` tickets per model are active; the rest wait in a
+    bounded queue (``max_queue``) and a full queue rejects immediately
+    (HTTP 429 with ``Retry-After``).
+* Fair across sessions: waiting tickets are grouped per ``session_id``
+    and granted round-robin, one ticket per session per turn, so a client
+    firing many requests cannot starve the others.
+* Waiters are asynchronous: a grant (from whatever thread released the
+    slot) wakes the waiter's event loop; every waiter is also woken when
+    its queue position changes so the stream can report it.
+* ``queue_timeout_s`` is the queue-time budget; a ticket still waiting
+    at its ``deadline`` is withdrawn with ``expire``.
+* ``Retry-After`` estimate: mean slot hold time (EWMA) times queued
+    requests per slot, never below ``retry_after_s``.
+* Config ``llm.admission``: enabled, max_concurrent, max_queue,
+    queue_timeout_s, retry_after_s, per_model (``{model_id: {...}}``
+    overrides of the limits).
+
+Metrics:
+    admission_admitted_total{model,path}      immediate|queued
+    admission_rejected_total{model,reason}    queue_full|queue_timeout
+    admission_queue_depth{model}              waiting tickets, per enqueue
+    admission_wait_ms{model}                  enqueue -> grant (histogram)
+"""
+from __future__ import annotations
+
+import asyncio
+import math
+from collections import OrderedDict, deque
+from threading import Lock
+from time import perf_counter
+from typing import Any, Dict
+
+from core import metrics
+
+
+def admission_config() -> dict:
+    try:
+        from core.config import get_config
+
+        return dict(getattr(get_config().llm, "admission", {}) or {})
+    except Exception:  # noqa: BLE001
+        return {}
+
+
+class AdmissionRejected(Exception):
+    """Queue full: retry after ``retry_after_s`` seconds."""
+
+    def __init__(self, model_id: str, retry_after_s: int) -> None:
+        super().__init__(f"admission queue full for {model_id}")
+        self.model_id = model_id
+        self.retry_after_s = retry_after_s
+
+
+class Ticket:
+    """One request's claim on a model slot."""
+
+    __slots__ = (
+        "controller",
+        "session_id",
+        "enqueued_at",
+        "granted_at",
+        "granted",
+        "released",
+        "_loop",
+        "_changed",
+    )
+
+    def __init__(self, controller: "AdmissionController", session_id: str):
+        self.controller = controller
+        self.session_id = session_id
+        self.enqueued_at = perf_counter()
+        self.granted_at: float | None = None
+        self.granted = False
+        self.released = False
+        self._loop: Any | None = None
+        self._changed: asyncio.Event | None = None
+
+    @property
+    def position(self) -> int:
+        """1-based place in the grant order (0 once granted)."""
+        return self.controller.position(self)
+
+    @property
+    def deadline(self) -> float:
+        """``perf_counter`` time at which the queue-time budget runs out."""
+        return self.enqueued_at + self.controller.queue_timeout_s
+
+    @property
+    def wait_ms(self) -> float:
+        end = self.granted_at if self.granted_at is not None else (
+            perf_counter()
+        )
+        return (end - self.enqueued_at) * 1000.0
+
+    def _notify(self) -> None:
+        if self._loop is None or self._changed is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._changed.set)
+        except RuntimeError:  # loop closed: waiter is gone
+            pass
+
+    async def changed(self, timeout: float) -> None:
+        """Sleep until granted, the position moves or ``timeout``."""
+        if self._changed is None:  # admitted outside a loop: poll
+            await asyncio.sleep(min(max(0.0, timeout), 0.05))
+            return
+        try:
+            await asyncio.wait_for(self._changed.wait(), max(0.0, timeout))
+        except asyncio.TimeoutError:
+            pass
+        self._changed.clear()
+
+    def release(self) -> None:
+        """Free the slot (granted) or leave the queue (waiting)."""
+        self.controller.release(self)
+
+    def withdraw(self) -> None:
+        """Release for a client that left; wakes a pending ``changed``."""
+        self.controller.release(self)
+        self._notify()
+
+
+class AdmissionController:
+    """Per-model concurrency limit with a fair bounded wait queue."""
+
+    def __init__(
+        self,
+        model_id: str,
+        max_concurrent: int = 4,
+        max_queue: int = 16,
+        queue_timeout_s: float = 30.0,
+        retry_after_s: int = 2,
+    ) -> None:
+        self.model_id = model_id
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout_s = float(queue_timeout_s)
+        self.retry_after_s = max(1, int(retry_after_s))
+        self._lock = Lock()
+        self._active = 0
+        self._waiting = 0
+        # session_id -> waiting tickets; order of keys = next turn first
+        self._queues: "OrderedDict[str, deque[Ticket]]" = OrderedDict()
+        self._hold_ewma_s: float | None = None
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def retry_after(self) -> int:
+        hold = self._hold_ewma_s
+        if not hold:
+            return self.retry_after_s
+        backlog = (self._waiting + 1) / self.max_concurrent
+        return max(self.retry_after_s, int(math.ceil(hold * backlog)))
+
+    def admit(self, session_id: str) -> Ticket:
+        """Granted ticket, a waiting ticket, or ``AdmissionRejected``.
+
+        Call from the event loop that will wait on the ticket.
+        """
+        ticket = Ticket(self, session_id or "")
+        labels = {"model": self.model_id}
+        with self._lock:
+            if self._active < self.max_concurrent and not self._waiting:
+                self._grant(ticket)
+                path = "immediate"
+            elif self._waiting >= self.max_queue:
+                retry = self.retry_after()
+                metrics.inc(
+                    "admission_rejected_total",
+                    {**labels, "reason": "queue_full"},
+                )
+                raise AdmissionRejected(self.model_id, retry)
+            else:
+                try:
+                    ticket._loop = asyncio.get_running_loop()
+                    ticket._changed = asyncio.Event()
+                except RuntimeError:  # sync caller: poll ``granted``
+                    pass
+                self._queues.setdefault(ticket.session_id, deque()).append(
+                    ticket
+                )
+                self._waiting += 1
+                path = "queued"
+                metrics.observe(
+                    "admission_queue_depth", self._waiting, labels
+                )
+        if path == "immediate":
+            metrics.inc("admission_admitted_total", {**labels, "path": path})
+        return ticket
+
+    def expire(self, ticket: Ticket) -> bool:
+        """Withdraw a waiting ticket at its budget (True if granted)."""
+        with self._lock:
+            if ticket.granted:
+                return True
+            self._withdraw(ticket)
+        metrics.inc(
+            "admission_rejected_total",
+            {"model": self.model_id, "reason": "queue_timeout"},
+        )
+        return False
+
+    def position(self, ticket: Ticket) -> int:
+        with self._lock:
+            if ticket.granted:
+                return 0
+            own = self._queues.get(ticket.session_id)
+            if not own or ticket not in own:
+                return 0
+            depth = own.index(ticket)
+            before = 0
+            ahead = True  # sessions whose turn comes before ours
+            for sid, waiting in self._queues.items():
+                if sid == ticket.session_id:
+                    ahead = False
+                    continue
+                before += min(len(waiting), depth + (1 if ahead else 0))
+            return before + depth + 1
+
+    def release(self, ticket: Ticket) -> None:
+        with self._lock:
+            if ticket.released:
+                return
+            ticket.released = True
+            if not ticket.granted:
+                self._withdraw(ticket)
+                return
+            self._active -= 1
+            held = perf_counter() - (ticket.granted_at or ticket.enqueued_at)
+            prev = self._hold_ewma_s
+            self._hold_ewma_s = held if prev is None else (
+                0.8 * prev + 0.2 * held
+            )
+            self._grant_next()
+
+    # -- internals (lock held) -------------------------------------------
+    def _grant(self, ticket: Ticket) -> None:
+        ticket.granted = True
+        ticket.granted_at = perf_counter()
+        self._active += 1
+
+    def _withdraw(self, ticket: Ticket) -> None:
+        waiting = self._queues.get(ticket.session_id)
+        if not waiting or ticket not in waiting:
+            return
+        waiting.remove(ticket)
+        self._waiting -= 1
+        if not waiting:
+            del self._queues[ticket.session_id]
+        self._notify_waiters()
+
+    def _grant_next(self) -> None:
+        granted = []
+        while self._active < self.max_concurrent and self._queues:
+            sid, waiting = next(iter(self._queues.items()))
+            ticket = waiting.popleft()
+            self._waiting -= 1
+            del self._queues[sid]
+            if waiting:  # back of the rotation
+                self._queues[sid] = waiting
+            self._grant(ticket)
+            granted.append(ticket)
+        for ticket in granted:
+            labels = {"model": self.model_id}
+            metrics.inc(
+                "admission_admitted_total", {**labels, "path": "queued"}
+            )
+            metrics.observe("admission_wait_ms", ticket.wait_ms, labels)
+            ticket._notify()
+        if granted:
+            self._notify_waiters()
+
+    def _notify_waiters(self) -> None:
+        for waiting in self._queues.values():
+            for ticket in waiting:
+                ticket._notify()
+
+
+_CONTROLLERS: Dict[str, AdmissionController] = {}
+_REG_LOCK = Lock()
+
+
+def get_controller(model_id: str) -> AdmissionController | None:
+    """Controller for ``model_id`` (None when admission is disabled).
+
+    Controllers are kept for the process lifetime; callers only pass ids
+    of models they can serve, never raw client input.
+    """
+    cfg = admission_config()
+    if not cfg.get("enabled", True):
+        return None
+    with _REG_LOCK:
+        ctrl = _CONTROLLERS.get(model_id)
+        if ctrl is None:
+            per_model = cfg.get("per_model") or {}
+            limits = {**cfg, **(per_model.get(model_id) or {})}
+            ctrl = AdmissionController(
+                model_id,
+                max_concurrent=int(limits.get("max_concurrent", 4) or 1),
+                max_queue=int(limits.get("max_queue", 16) or 0),
+                queue_timeout_s=float(limits.get("queue_timeout_s", 30.0)),
+                retry_after_s=int(limits.get("retry_after_s", 2) or 1),
+            )
+            _CONTROLLERS[model_id] = ctrl
+        return ctrl
+
+
+def reset_for_tests() -> None:  # pragma: no cover - test helper
+    with _REG_LOCK:
+        _CONTROLLERS.clear()
+
+
+__all__ = [
+    "AdmissionController",
+    "AdmissionRejected",
+    "Ticket",
+    "admission_config",
+    "get_controller",
+]
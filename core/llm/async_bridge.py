@@ -0,0 +1,85 @@
+"""Thread -> event loop bridge for synchronous decode iterators.
+
+Summary:
+* ``aiter_thread(factory)`` runs ``factory()`` (a blocking iterator, e.g.
+    ``provider.stream``) on a daemon thread and yields its items on the
+    running event loop.
+* Bounded with backpressure: the producer holds one credit per item in
+    flight (``maxsize``) and blocks while the consumer is behind, so a
+    slow client throttles decode instead of buffering unboundedly.
+* Closing the async iterator early (client gone, abort) stops the
+    producer at its next item and closes the underlying iterator, which
+    releases the provider's decode loop.
+* Exceptions raised by the iterator are re-raised in the consumer.
+"""
+from __future__ import annotations
+
+import asyncio
+from threading import Event, Semaphore, Thread
+from typing import Any, AsyncIterator, Callable, Iterable
+
+_DONE = object()
+
+
+class _Failure:
+    __slots__ = ("exc",)
+
+    def __init__(self, exc: BaseException) -> None:
+        self.exc = exc
+
+
+async def aiter_thread(
+    factory: Callable[[], Iterable[Any]],
+    *,
+    maxsize: int = 32,
+    name: str = "stream-bridge",
+) -> AsyncIterator[Any]:
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    credits = Semaphore(max(1, int(maxsize)))
+    stop = Event()
+
+    def _send(item: Any) -> None:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:  # loop closed: consumer is gone
+            stop.set()
+
+    def _produce() -> None:
+        it = None
+        try:
+            it = iter(factory())
+            for item in it:
+                while not credits.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                if stop.is_set():
+                    return
+                _send(item)
+        except BaseException as exc:  # noqa: BLE001
+            _send(_Failure(exc))
+        finally:
+            close = getattr(it, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:  # noqa: BLE001
+                    pass
+            _send(_DONE)
+
+    Thread(target=_produce, name=name, daemon=True).start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.exc
+            credits.release()
+            yield item
+    finally:
+        stop.set()
+        credits.release()  # wake a producer blocked on a full window
+
+
+__all__ = ["aiter_thread"]
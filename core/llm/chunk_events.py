@@ -0,0 +1,152 @@
+"""Per-request ``GenerationChunk`` event policy for streaming decode.
+
+Summary:
+* Providers hand every decoded piece to a ``ChunkEmitter`` instead of
+    emitting ``GenerationChunk`` themselves; the SSE stream is unaffected
+    (it is driven by the yielded pieces, not by events).
+* Modes (``llm.chunk_events.mode``):
+    - ``per_token``: one ``GenerationChunk`` per piece (default, the
+      historical behaviour);
+    - ``batch``: pieces are coalesced into one ``GenerationChunkBatch``
+      (``seq_start..seq_end`` inclusive, joined ``text``, ``tokens`` in
+      the batch) every ``batch_tokens`` pieces or, when a piece arrives,
+      if the oldest pending piece is ``batch_ms`` old, whichever comes
+      first. There is no timer: the age is only checked on the next
+      piece, so a stalled decode holds its batch until the next piece or
+      ``close()``;
+    - ``sample``: only every ``sample_every``-th ``GenerationChunk``;
+    - ``off``: no chunk events.
+* ``tokens_out`` is always the exact cumulative count at the last piece an
+    event covers, and ``close()`` emits the pending tail (``batch``) or
+    the last piece (``sample``) so the final event carries the true
+    total.
+* Nothing is built while no subscriber listens to the event type.
+* Config ``llm.chunk_events``: mode, batch_tokens, batch_ms, sample_every.
+"""
+from __future__ import annotations
+
+from time import perf_counter
+from typing import List
+
+from core.eventbus import wants
+from core.events import GenerationChunk, GenerationChunkBatch, emit
+
+MODES = ("per_token", "batch", "sample", "off")
+
+
+def chunk_events_config() -> dict:
+    try:
+        from core.config import get_config
+
+        return dict(getattr(get_config().llm, "chunk_events", {}) or {})
+    except Exception:  # noqa: BLE001
+        return {}
+
+
+class ChunkEmitter:
+    """Turns one request's decoded pieces into chunk events."""
+
+    def __init__(
+        self,
+        request_id: str,
+        model_id: str,
+        role: str,
+        mode: str = "per_token",
+        batch_tokens: int = 16,
+        batch_ms: float = 100.0,
+        sample_every: int = 10,
+    ) -> None:
+        self.request_id = request_id
+        self.model_id = model_id
+        self.role = role
+        self.mode = mode if mode in MODES else "per_token"
+        self.batch_tokens = max(1, int(batch_tokens))
+        self.batch_s = max(0.0, float(batch_ms)) / 1000.0
+        self.sample_every = max(1, int(sample_every))
+        self.tokens_out = 0
+        self._pending: List[str] = []
+        self._pending_start = 0
+        self._pending_since = 0.0
+        self._last: tuple[int, str] | None = None  # sample: unsent piece
+
+    @classmethod
+    def from_config(
+        cls, request_id: str, model_id: str, role: str
+    ) -> "ChunkEmitter":
+        cfg = chunk_events_config()
+        return cls(
+            request_id,
+            model_id,
+            role,
+            mode=str(cfg.get("mode", "per_token")),
+            batch_tokens=int(cfg.get("batch_tokens", 16) or 1),
+            batch_ms=float(cfg.get("batch_ms", 100.0) or 0.0),
+            sample_every=int(cfg.get("sample_every", 10) or 1),
+        )
+
+    def add(self, seq: int, text: str) -> None:
+        """Record piece ``seq``; emits whatever the mode calls for."""
+        self.tokens_out += 1
+        mode = self.mode
+        if mode == "per_token":
+            self._chunk(seq, text)
+        elif mode == "batch":
+            if not self._pending:
+                self._pending_start = seq
+                self._pending_since = perf_counter()
+            self._pending.append(text)
+            if len(self._pending) >= self.batch_tokens or (
+                perf_counter() - self._pending_since >= self.batch_s
+            ):
+                self._flush_batch()
+        elif mode == "sample":
+            if seq % self.sample_every == 0:
+                self._last = None
+                self._chunk(seq, text)
+            else:
+                self._last = (seq, text)
+
+    def close(self) -> None:
+        """Emit the pending tail so the last event has the final count."""
+        if self._pending:
+            self._flush_batch()
+        if self._last is not None:
+            seq, text = self._last
+            self._last = None
+            self._chunk(seq, text)
+
+    def _chunk(self, seq: int, text: str) -> None:
+        if not wants("GenerationChunk"):
+            return
+        emit(
+            GenerationChunk(
+                request_id=self.request_id,
+                model_id=self.model_id,
+                role=self.role,
+                correlation_id=self.request_id,
+                seq=seq,
+                text=text,
+                tokens_out=self.tokens_out,
+            )
+        )
+
+    def _flush_batch(self) -> None:
+        pending, self._pending = self._pending, []
+        if not wants("GenerationChunkBatch"):
+            return
+        emit(
+            GenerationChunkBatch(
+                request_id=self.request_id,
+                model_id=self.model_id,
+                role=self.role,
+                correlation_id=self.request_id,
+                seq_start=self._pending_start,
+                seq_end=self._pending_start + len(pending) - 1,
+                text="".join(pending),
+                tokens=len(pending),
+                tokens_out=self.tokens_out,
+            )
+        )
+
+
+__all__ = ["ChunkEmitter", "MODES", "chunk_events_config"]
@@ -0,0 +1,282 @@
+"""Background history compaction into a rolling session summary.
+
+Summary:
+* When the prompt window drops old turns (``HistoryWindow.dropped``) the
+    pipeline hands them to ``HistoryCompactor.submit``. A single daemon
+    worker folds them into the session's rolling summary with the
+    lightweight model, off the request path (never adds TTFT); the next
+    turn's prompt carries the summary in the developer block.
+* Summaries live on the session (``SummaryStore``: ``get_summary`` /
+    ``set_summary``, implemented by the API session store).
+    ``HistorySummary.through`` is the digest of the last folded message,
+    so only turns dropped since the previous compaction are summarized.
+* Pending jobs are coalesced per session (latest window wins) and bounded
+    by ``max_pending``; results are cached by (previous summary, folded
+    turns) digest, so repeated requests over the same history are free.
+* The summarizer model is resolved lazily on the worker through the
+    ``resolve_provider`` callable passed with each job (None -> skipped).
+    ``core.llm`` cannot import the module manager, so the API layer
+    supplies it. The summary is decoded through that model's decode
+    scheduler (``core.llm.scheduler``), like any other request on it.
+* Config ``llm.compaction``: enabled, load_model, max_summary_tokens,
+    max_pending, cache_entries.
+* Metrics: history_compactions_total{status=ok|cached|skipped|error|
+    dropped}, history_compaction_ms (histogram).
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Condition, Lock, Thread
+from time import perf_counter
+from typing import Any, Callable, Protocol, Sequence
+import hashlib
+
+from core import metrics
+from core.llm.scheduler import get_scheduler
+
+
+def _config() -> dict:
+    try:
+        from core.config import get_config
+
+        return dict(getattr(get_config().llm, "compaction", {}) or {})
+    except Exception:  # noqa: BLE001
+        return {}
+
+
+def message_digest(role: str, content: str) -> str:
+    return hashlib.sha1(f"{role}\x00{content}".encode("utf-8")).hexdigest()
+
+
+@dataclass(slots=True)
+class HistorySummary:
+    """Rolling summary of turns no longer in the prompt window."""
+
+    text: str
+    through: str  # digest of the last folded message
+    folded: int  # messages folded so far
+
+
+class SummaryStore(Protocol):
+    def get_summary(self, session_id: str) -> HistorySummary | None: ...
+
+    def set_summary(self, session_id: str, summary: HistorySummary) -> None:
+        ...
+
+
+def unsummarized(
+    dropped: Sequence[tuple[str, str]], summary: HistorySummary | None
+) -> list[tuple[str, str]]:
+    """Dropped turns not yet covered by ``summary`` (oldest first)."""
+    if summary is None:
+        return list(dropped)
+    for i in range(len(dropped) - 1, -1, -1):
+        if message_digest(*dropped[i]) == summary.through:
+            return list(dropped[i + 1:])
+    # summarized turns already evicted from the session: all are new
+    return list(dropped)
+
+
+def summary_prompt(
+    previous: str | None, turns: Sequence[tuple[str, str]]
+) -> str:
+    lines = [
+        "Update the running summary of a conversation between a user and "
+        "an assistant. Keep names, facts, decisions, open questions and "
+        "the user's preferences. Answer with the summary only, in the "
+        "conversation's language.",
+        "",
+        "Current summary:",
+        previous or "(empty)",
+        "",
+        "New turns:",
+    ]
+    lines += [f"{role}: {content}" for role, content in turns]
+    lines += ["", "Updated summary:"]
+    return "\n".join(lines)
+
+
+@dataclass(slots=True)
+class _Job:
+    session_id: str
+    dropped: list[tuple[str, str]]
+    store: Any
+    resolve_provider: Callable[[], Any]
+
+
+class HistoryCompactor:
+    """Single-worker summarizer (see module docstring)."""
+
+    def __init__(
+        self,
+        *,
+        max_summary_tokens: int = 256,
+        max_pending: int = 64,
+        cache_entries: int = 256,
+    ) -> None:
+        self._max_tokens = max(16, int(max_summary_tokens))
+        self._max_pending = max(1, int(max_pending))
+        self._cache_entries = max(1, int(cache_entries))
+        self._pending: OrderedDict[str, _Job] = OrderedDict()
+        self._cache: OrderedDict[str, str] = OrderedDict()
+        self._cond = Condition()
+        self._busy = False
+        self._worker: Thread | None = None
+
+    def submit(
+        self,
+        session_id: str,
+        dropped: Sequence[tuple[str, str]],
+        store: SummaryStore,
+        resolve_provider: Callable[[], Any],
+    ) -> bool:
+        """Queue ``dropped`` turns of ``session_id`` for folding."""
+        if not session_id or not dropped:
+            return False
+        if not unsummarized(dropped, store.get_summary(session_id)):
+            return False
+        with self._cond:
+            if (
+                session_id not in self._pending
+                and len(self._pending) >= self._max_pending
+            ):
+                metrics.inc("history_compactions_total", {"status": "dropped"})
+                return False
+            self._pending[session_id] = _Job(
+                session_id, list(dropped), store, resolve_provider
+            )
+            self._pending.move_to_end(session_id)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = Thread(
+                    target=self._run, name="history-compactor", daemon=True
+                )
+                self._worker.start()
+            self._cond.notify()
+        return True
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until no job is pending or running (tests, shutdown)."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not self._pending and not self._busy, timeout
+            )
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: bool(self._pending))
+                _, job = self._pending.popitem(last=False)
+                self._busy = True
+            try:
+                self._compact(job)
+            except Exception:  # noqa: BLE001
+                metrics.inc("history_compactions_total", {"status": "error"})
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def _summarize(self, provider: Any, prompt: str) -> Any:
+        """``provider.generate`` through the model's decode scheduler.
+
+        Compaction then queues behind the model's other sequences instead
+        of entering its context from this thread, and counts for
+        ``decode_busy`` (residency never evicts it mid-summary).
+        """
+        try:
+            model_id = provider.info().id
+        except Exception:  # noqa: BLE001
+            model_id = "compaction"
+
+        def _call() -> Any:
+            return provider.generate(prompt, max_tokens=self._max_tokens)
+
+        sched = get_scheduler(provider, model_id)
+        if sched is None:
+            return _call()
+        res = None
+        for res in sched.submit(
+            f"compaction-{model_id}", lambda: iter([_call()])
+        ):
+            pass
+        return res
+
+    def _compact(self, job: _Job) -> None:
+        previous = job.store.get_summary(job.session_id)
+        turns = unsummarized(job.dropped, previous)
+        if not turns:
+            return
+        prev_text = previous.text if previous else None
+        key = hashlib.sha1(
+            "\x00".join(
+                [prev_text or ""] + [message_digest(*t) for t in turns]
+            ).encode("utf-8")
+        ).hexdigest()
+        text = self._cache.get(key)
+        status = "cached"
+        if text is None:
+            provider = job.resolve_provider()
+            if provider is None:
+                metrics.inc("history_compactions_total", {"status": "skipped"})
+                return
+            t0 = perf_counter()
+            res = self._summarize(provider, summary_prompt(prev_text, turns))
+            text = (getattr(res, "text", res) or "").strip()
+            metrics.observe(
+                "history_compaction_ms", (perf_counter() - t0) * 1000.0
+            )
+            if not text or getattr(res, "status", "ok") != "ok":
+                metrics.inc("history_compactions_total", {"status": "error"})
+                return
+            status = "ok"
+            self._cache[key] = text
+            while len(self._cache) > self._cache_entries:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+        job.store.set_summary(
+            job.session_id,
+            HistorySummary(
+                text=text,
+                through=message_digest(*turns[-1]),
+                folded=(previous.folded if previous else 0) + len(turns),
+            ),
+        )
+        metrics.inc("history_compactions_total", {"status": status})
+
+
+_COMPACTOR: HistoryCompactor | None = None
+_COMPACTOR_LOCK = Lock()
+
+
+def get_compactor() -> HistoryCompactor | None:
+    """Process-wide compactor (None when ``llm.compaction`` disabled)."""
+    global _COMPACTOR
+    cfg = _config()
+    if not cfg.get("enabled", True):
+        return None
+    with _COMPACTOR_LOCK:
+        if _COMPACTOR is None:
+            known = ("max_summary_tokens", "max_pending", "cache_entries")
+            _COMPACTOR = HistoryCompactor(
+                **{k: cfg[k] for k in known if cfg.get(k) is not None}
+            )
+        return _COMPACTOR
+
+
+def reset_for_tests() -> None:  # pragma: no cover - test helper
+    global _COMPACTOR
+    _COMPACTOR = None
+
+
+__all__ = [
+    "HistoryCompactor",
+    "HistorySummary",
+    "SummaryStore",
+    "get_compactor",
+    "message_digest",
+    "reset_for_tests",
+    "summary_prompt",
+    "unsummarized",
+]
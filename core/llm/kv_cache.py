@@ -0,0 +1,320 @@
+"""Per-session KV state pool for llama.cpp providers.
+
+Summary:
+* A single llama.cpp context holds the KV cache of exactly one token
+    sequence. Interleaved sessions therefore re-prefill their whole history
+    on every turn. The pool snapshots the context (``Llama.save_state()``)
+    when another session takes it over and restores the snapshot when the
+    owner returns, so only the new suffix has to be evaluated.
+* Entries are keyed by session id and remember the token prefix they
+    cover; lookup returns the entry with the longest common prefix
+    (session entry first, then the shared system-prefix entry).
+* RAM tier: LRU bounded by ``ram_budget_mb``. Evicted entries spill to a
+    disk tier under ``<storage.paths.cache>/kv_states`` (LRU bounded by
+    ``disk_budget_mb``) when ``disk_enabled``.
+* Metrics: kv_cache_hits_total{source}, kv_cache_misses_total,
+    kv_cache_prefill_tokens_saved_total, kv_cache_evictions_total{tier}.
+
+The pool is backend agnostic: snapshots are opaque objects that expose
+``input_ids`` (token ids covered) and optionally ``llama_state_size``.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from threading import RLock
+from typing import Any, Iterable, Sequence
+import hashlib
+import pickle
+
+from core import metrics
+
+SHARED_KEY = "__shared_prefix__"
+
+
+@dataclass(slots=True)
+class _Entry:
+    key: str
+    tokens: tuple[int, ...]
+    size: int
+    state: Any | None = None  # None -> spilled to disk
+    path: Path | None = None
+
+
+@dataclass(slots=True)
+class KVLookup:
+    """Lookup outcome: snapshot to restore and reusable prefix length."""
+
+    state: Any | None
+    prefix_tokens: int
+    source: str  # ram | disk | miss
+
+
+def common_prefix_len(a: Sequence[int], b: Sequence[int]) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def state_tokens(state: Any) -> tuple[int, ...]:
+    """Token ids covered by a snapshot or a live ``Llama``.
+
+    ``input_ids`` is a fixed ``n_ctx`` numpy buffer on a real ``Llama``;
+    only the first ``n_tokens`` entries are meaningful.
+    """
+    ids = getattr(state, "input_ids", None)
+    if ids is None:
+        return ()
+    try:
+        n = int(getattr(state, "n_tokens", len(ids)))
+    except Exception:  # noqa: BLE001
+        n = len(ids)
+    return tuple(int(t) for t in ids[:n])
+
+
+def state_size(state: Any) -> int:
+    size = getattr(state, "llama_state_size", None)
+    if isinstance(size, int) and size > 0:
+        return size
+    raw = getattr(state, "llama_state", None)
+    if isinstance(raw, (bytes, bytearray)):
+        return len(raw)
+    return 1
+
+
+class KVStatePool:
+    """LRU pool of KV snapshots with RAM and optional disk tiers."""
+
+    def __init__(
+        self,
+        *,
+        model_id: str,
+        ram_budget_bytes: int,
+        disk_dir: str | Path | None = None,
+        disk_budget_bytes: int = 0,
+        min_prefix_tokens: int = 32,
+    ) -> None:
+        self._model_id = model_id
+        self._ram_budget = max(0, int(ram_budget_bytes))
+        self._disk_dir = Path(disk_dir) if disk_dir else None
+        self._disk_budget = max(0, int(disk_budget_bytes))
+        self._min_prefix = max(1, int(min_prefix_tokens))
+        self._ram: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._disk: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._ram_bytes = 0
+        self._disk_bytes = 0
+        self._lock = RLock()
+
+    # introspection -------------------------------------------------------
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "ram_entries": len(self._ram),
+                "ram_bytes": self._ram_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+            }
+
+    def keys(self) -> list[str]:
+        with self._lock:
+            return list(self._ram.keys()) + list(self._disk.keys())
+
+    # mutation ------------------------------------------------------------
+    def put(self, key: str, state: Any) -> None:
+        """Store (or replace) the snapshot for ``key`` in the RAM tier."""
+        tokens = state_tokens(state)
+        if len(tokens) < self._min_prefix:
+            return
+        entry = _Entry(key=key, tokens=tokens, size=state_size(state))
+        entry.state = state
+        with self._lock:
+            self._drop(key)
+            if entry.size > self._ram_budget:
+                self._spill(entry)
+                return
+            self._ram[key] = entry
+            self._ram_bytes += entry.size
+            self._evict_ram()
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in list(self._ram.keys()) + list(self._disk.keys()):
+                self._drop(key)
+
+    # lookup --------------------------------------------------------------
+    def lookup(
+        self, key: str | None, tokens: Sequence[int]
+    ) -> KVLookup:
+        """Return the snapshot sharing the longest prefix with ``tokens``.
+
+        Only ``key`` and the shared prefix entry are candidates: snapshots
+        of other sessions never leak into a request.
+        """
+        best: _Entry | None = None
+        best_len = 0
+        with self._lock:
+            for cand_key in self._candidates(key):
+                entry = self._ram.get(cand_key) or self._disk.get(cand_key)
+                if entry is None:
+                    continue
+                n = common_prefix_len(entry.tokens, tokens)
+                if n > best_len:
+                    best, best_len = entry, n
+            if best is None or best_len < self._min_prefix:
+                return KVLookup(state=None, prefix_tokens=0, source="miss")
+            if best.state is not None:
+                self._ram.move_to_end(best.key)
+                return KVLookup(
+                    state=best.state, prefix_tokens=best_len, source="ram"
+                )
+            state = self._load_disk(best)
+            if state is None:
+                return KVLookup(state=None, prefix_tokens=0, source="miss")
+            return KVLookup(
+                state=state, prefix_tokens=best_len, source="disk"
+            )
+
+    def record(self, outcome: KVLookup | None, source: str = "") -> None:
+        """Emit hit/miss metrics for a prefill decision."""
+        labels = {"model": self._model_id}
+        if outcome is None or outcome.prefix_tokens <= 0:
+            metrics.inc("kv_cache_misses_total", labels)
+            return
+        metrics.inc(
+            "kv_cache_hits_total",
+            {**labels, "source": source or outcome.source},
+        )
+        metrics.inc(
+            "kv_cache_prefill_tokens_saved_total",
+            labels,
+            value=outcome.prefix_tokens,
+        )
+
+    # internals -----------------------------------------------------------
+    @staticmethod
+    def _candidates(key: str | None) -> Iterable[str]:
+        if key:
+            yield key
+        yield SHARED_KEY
+
+    def _drop(self, key: str) -> None:
+        entry = self._ram.pop(key, None)
+        if entry is not None:
+            self._ram_bytes -= entry.size
+        entry = self._disk.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry.size
+            self._unlink(entry)
+
+    def _evict_ram(self) -> None:
+        while self._ram_bytes > self._ram_budget and self._ram:
+            _, victim = self._ram.popitem(last=False)
+            self._ram_bytes -= victim.size
+            metrics.inc(
+                "kv_cache_evictions_total",
+                {"model": self._model_id, "tier": "ram"},
+            )
+            self._spill(victim)
+
+    def _spill(self, entry: _Entry) -> None:
+        if (
+            self._disk_dir is None
+            or entry.size > self._disk_budget
+            or entry.state is None
+        ):
+            entry.state = None
+            return
+        digest = hashlib.sha1(
+            f"{self._model_id}:{entry.key}".encode("utf-8")
+        ).hexdigest()[:20]
+        path = self._disk_dir / f"{digest}.kvstate"
+        try:
+            self._disk_dir.mkdir(parents=True, exist_ok=True)
+            with path.open("wb") as fh:
+                pickle.dump(entry.state, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:  # noqa: BLE001
+            entry.state = None
+            return
+        entry.state = None
+        entry.path = path
+        self._disk[entry.key] = entry
+        self._disk_bytes += entry.size
+        while self._disk_bytes > self._disk_budget and self._disk:
+            _, victim = self._disk.popitem(last=False)
+            self._disk_bytes -= victim.size
+            self._unlink(victim)
+            metrics.inc(
+                "kv_cache_evictions_total",
+                {"model": self._model_id, "tier": "disk"},
+            )
+
+    def _load_disk(self, entry: _Entry) -> Any | None:
+        if entry.path is None:
+            return None
+        try:
+            with entry.path.open("rb") as fh:
+                state = pickle.load(fh)  # noqa: S301 - local cache files
+        except Exception:  # noqa: BLE001
+            self._drop(entry.key)
+            return None
+        # Promote back to RAM (file removed; snapshot now lives in memory)
+        self._drop(entry.key)
+        entry.state = state
+        entry.path = None
+        if entry.size <= self._ram_budget:
+            self._ram[entry.key] = entry
+            self._ram_bytes += entry.size
+            self._evict_ram()
+        return state
+
+    @staticmethod
+    def _unlink(entry: _Entry) -> None:
+        if entry.path is None:
+            return
+        try:
+            entry.path.unlink()
+        except Exception:  # noqa: BLE001
+            pass
+        entry.path = None
+
+
+def build_pool(model_id: str) -> KVStatePool | None:
+    """Construct a pool from ``llm.kv_cache`` config (None if disabled)."""
+    try:
+        from core.config import get_config
+
+        cfg = get_config()
+        kv = dict(getattr(cfg.llm, "kv_cache", {}) or {})
+        if not kv.get("enabled", True):
+            return None
+        disk_dir = None
+        if kv.get("disk_enabled", True):
+            disk_dir = Path(cfg.storage.paths.cache) / "kv_states"
+        return KVStatePool(
+            model_id=model_id,
+            ram_budget_bytes=int(kv.get("ram_budget_mb", 2048)) * 1024 * 1024,
+            disk_dir=disk_dir,
+            disk_budget_bytes=int(kv.get("disk_budget_mb", 8192))
+            * 1024
+            * 1024,
+            min_prefix_tokens=int(kv.get("min_prefix_tokens", 32)),
+        )
+    except Exception:  # noqa: BLE001
+        return None
+
+
+__all__ = [
+    "KVStatePool",
+    "KVLookup",
+    "SHARED_KEY",
+    "build_pool",
+    "common_prefix_len",
+    "state_tokens",
+]
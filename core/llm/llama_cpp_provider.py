@@ -5,34 +5,148 @@ Summary:
 * On import / constructor failure uses a deterministic stub (repeats prompt
     words) so tests remain stable without model weights.
 * Emits: ModelLoaded / ModelLoadFailed and GenerationStarted /
-    GenerationChunk / GenerationCompleted.
+    GenerationChunk / GenerationCompleted; chunk events follow the
+    ``llm.chunk_events`` policy (``chunk_events.ChunkEmitter``: per token,
+    ``GenerationChunkBatch`` batches, sampled or off).
 * Filters sampling kwargs against llama callable signature; unsupported keys
     listed under sampling.filtered_out.
+* Optional ``session_id`` kwarg routes prefill through the per-session KV
+    state pool (``core.llm.kv_cache``) so interleaved sessions reuse their
+    cached prefix instead of re-evaluating the whole history.
+* Optional ``cancel_event`` kwarg (anything with ``is_set()``) is wired into
+    llama.cpp ``stopping_criteria`` so decode halts within one token of an
+    abort (stop_reason ``cancelled``).
+* ``with_token_ids=True`` streams ``(token_id, piece)`` pairs decoded via
+    ``Llama.generate`` so Harmony special tokens can be parsed by id
+    (``harmony_vocab()`` + ``adapters.HarmonyTokenAdapter``); the stub path
+    assigns ids from a synthetic per-provider vocab.
+* ``reasoning_budget`` (``types.ReasoningBudget``, token-id mode only):
+    once the analysis channel reaches the budget, sampling is interrupted,
+    ``<|end|><|start|>assistant<|channel|>final<|message|>`` is injected
+    and decode resumes in the final channel on the existing KV state.
+    Text-mode decode cannot cut over; the pipeline reports it as
+    ``reasoning_budget_unenforced_total{reason=text_path}``.
+* Degenerate loops (``core.llm.repetition``) stop decode early with
+    stop_reason ``repetition``; an optional ``decode_outcome``
+    (``types.DecodeOutcome``) receives the stop reason and token count.
+* Load phases (``llm.warmup``): sequential page prefetch of the weights
+    file, Llama construction and a tiny warm-up decode; the per-phase ms
+    are carried in ``ModelLoaded.phases``. ``llm.warmup.prefetch``:
+    ``startup`` (default) prefetches only loads made by the warm pool
+    (inside ``startup_load()``), ``always`` every load, ``off`` never.
+    A load within ``prefetch_skip_after_unload_s`` of unloading the same
+    file skips it: its pages are most likely still cached.
+    ``prefill_prefix(text)`` evaluates a shared prompt prefix and stores
+    it as the shared KV pool entry so the first request of any session
+    starts from it.
+* ``speculative`` (``types.SpeculativeRequest`` or mode string): a draft
+    source from ``core.llm.speculative`` (prompt lookup or a draft model)
+    is set as the binding's ``draft_model`` for the request, so proposed
+    tokens are verified by the primary in one batch. Needs the context
+    built with ``logits_all`` (``llm.speculative``); ``draft_llama()``
+    gives a draft provider its own small context on the same weights.
 * Space-only indentation (no tabs) and short lines for lint stability.
 """
 
 from __future__ import annotations
 
+import codecs
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from threading import Lock
-from time import perf_counter
+from threading import Lock, local
+from time import monotonic, perf_counter
 from typing import Any, Dict, Iterable, List, Tuple
 
 from .provider import ModelProvider, ModelInfo
-from .types import GenerationResult
+from .types import GenerationResult, HarmonyVocab, ReasoningBudget
+from .kv_cache import (
+    SHARED_KEY,
+    KVLookup,
+    KVStatePool,
+    build_pool,
+    common_prefix_len,
+    state_tokens,
+)
+from .chunk_events import ChunkEmitter
+from .repetition import build_detector
+from .speculative import DraftRecorder, build_recorder, speculative_config
+from .token_count import count_tokens
 from core.errors import map_exception, validate_error_type
 from core.events import (
     emit,
     ModelLoaded,
     ModelLoadFailed,
     GenerationStarted,
-    GenerationChunk,
     GenerationCompleted,
 )
 from core import metrics
 
 
+_PREFETCH_BLOCK = 8 * 1024 * 1024
+# weights path -> monotonic time of its last unload (page cache still warm)
+_UNLOADED_AT: Dict[str, float] = {}
+_LOAD_CTX = local()
+
+
+@contextmanager
+def startup_load():
+    """Mark loads on this thread as startup loads (warm pool)."""
+    prev = getattr(_LOAD_CTX, "startup", False)
+    _LOAD_CTX.startup = True
+    try:
+        yield
+    finally:
+        _LOAD_CTX.startup = prev
+
+
+def _prefetch_skip_reason(path: Any, warm: dict) -> str | None:
+    """Why a load of ``path`` skips page prefetch (None: prefetch)."""
+    mode = warm.get("prefetch", "startup")
+    if mode is True:
+        mode = "startup"
+    if mode in (False, None, "off"):
+        return "off"
+    if mode != "always" and not getattr(_LOAD_CTX, "startup", False):
+        return "not_startup"
+    unloaded = _UNLOADED_AT.get(str(path))
+    window = float(warm.get("prefetch_skip_after_unload_s", 600) or 0)
+    if unloaded is not None and monotonic() - unloaded < window:
+        return "recent_unload"
+    return None
+
+
+def _warmup_config() -> dict:
+    try:
+        from core.config import get_config
+
+        return dict(getattr(get_config().llm, "warmup", {}) or {})
+    except Exception:  # noqa: BLE001
+        return {}
+
+
+def prefetch_pages(path: str | Path) -> int:
+    """Read ``path`` sequentially so its pages sit in the OS page cache.
+
+    llama.cpp maps the weights; touching them in file order here turns the
+    random page faults of the first evaluation into one sequential read.
+    Returns the number of bytes read (0 when the file is unavailable).
+    """
+    total = 0
+    try:
+        buf = bytearray(_PREFETCH_BLOCK)
+        view = memoryview(buf)
+        with open(path, "rb", buffering=0) as fh:
+            while True:
+                n = fh.readinto(view)
+                if not n:
+                    break
+                total += n
+    except OSError:
+        return total
+    return total
+
+
 @dataclass(slots=True)
 class _State:
     llama: Any | None = None
@@ -40,6 +154,55 @@ class _State:
     supported_args: set[str] | None = None
     stub: bool = False
     effective_n_gpu_layers: int | None = None
+    kv_owner: str | None = None  # session whose tokens fill the context
+    harmony_vocab: HarmonyVocab | None = None
+    harmony_probed: bool = False
+
+
+class _StoppingCriteria(list):
+    """Fallback mirroring ``llama_cpp.StoppingCriteriaList`` semantics."""
+
+    def __call__(self, input_ids: Any, logits: Any) -> bool:
+        return any(crit(input_ids, logits) for crit in self)
+
+
+_HARMONY_CORE_MARKERS = ("start", "channel", "message", "end", "return")
+_HARMONY_OPTIONAL_MARKERS = ("call", "constrain", "recipient")
+_HARMONY_CHANNELS = ("analysis", "commentary", "final", "tool")
+# Terminal Harmony markers: decode stops right after yielding them
+_HARMONY_STOP_MARKERS = ("return", "call")
+_GENERATE_ALIASES = {"temperature": "temp"}
+_FINAL_CUTOVER = "<|end|><|start|>assistant<|channel|>final<|message|>"
+
+
+class _AnalysisTracker:
+    """Counts sampled analysis-channel tokens by Harmony token id."""
+
+    __slots__ = ("markers", "analysis_id", "after_channel", "pending",
+                 "active", "count")
+
+    def __init__(self, vocab: HarmonyVocab, analysis_id: int) -> None:
+        self.markers = vocab.markers
+        self.analysis_id = analysis_id
+        self.after_channel = False
+        self.pending = False  # header names the analysis channel
+        self.active = False  # inside analysis message content
+        self.count = 0
+
+    def step(self, tid: int) -> None:
+        name = self.markers.get(tid)
+        if self.after_channel:
+            self.after_channel = False
+            self.pending = tid == self.analysis_id
+        if name is None:
+            if self.active:
+                self.count += 1
+        elif name == "channel":
+            self.after_channel = True
+        elif name == "message":
+            self.active = self.pending
+        else:
+            self.active = self.pending = False
 
 
 class LlamaCppProvider(ModelProvider):
@@ -80,6 +243,12 @@ class LlamaCppProvider(ModelProvider):
             self._base_sampling["n_gpu_layers"] = normalized_gpu_layers
         self._state = _State()
         self._lock = Lock()
+        self._kv_pool: KVStatePool | None = None
+        self._kv_pool_built = False
+        self._stub_vocab: Dict[str, int] = {}
+        # speculative decoding: this provider drafting for another one
+        self.draft_lock = Lock()
+        self._draft_llama: Any | None = None
 
     # helpers --------------------------------------------------------------
     def _normalize_n_gpu_layers_input(self, raw: Any) -> int | str | None:
@@ -164,6 +333,12 @@ class LlamaCppProvider(ModelProvider):
             "logits_all": False,
             "embedding": False,
         }
+        spec = speculative_config()
+        if spec.get("enabled", False) and self._role in (
+            spec.get("target_roles") or ["primary"]
+        ):
+            # per-position logits let the target verify drafted tokens
+            kwargs["logits_all"] = True
         n_gpu_layers = self._resolve_n_gpu_layers(
             self._base_sampling.get("n_gpu_layers")
         )
@@ -209,9 +384,22 @@ class LlamaCppProvider(ModelProvider):
                     )
                     self._sync_info_metadata()
                     return
+                warm = _warmup_config()
+                phases: Dict[str, int] = {}
+                skip = _prefetch_skip_reason(self._model_path, warm)
+                if skip == "recent_unload":
+                    metrics.inc(
+                        "model_prefetch_skipped_total",
+                        {"model": self._model_id, "reason": skip},
+                    )
+                if skip is None:
+                    t0 = perf_counter()
+                    prefetch_pages(self._model_path)
+                    phases["prefetch"] = int((perf_counter() - t0) * 1000)
                 llama_kwargs = self._build_llama_kwargs()
                 resolved_layers = llama_kwargs.get("n_gpu_layers")
                 llama_obj = None
+                t0 = perf_counter()
                 try:
                     llama_obj = Llama(**llama_kwargs)
                     self._state.effective_n_gpu_layers = resolved_layers
@@ -258,11 +446,17 @@ class LlamaCppProvider(ModelProvider):
                     and resolved_layers is not None
                 ):
                     self._state.effective_n_gpu_layers = resolved_layers
+                phases["construct"] = int((perf_counter() - t0) * 1000)
                 self._state.llama = llama_obj
                 import inspect
 
                 sig = inspect.signature(self._state.llama.__call__)
                 self._state.supported_args = set(sig.parameters.keys())
+                decode_tokens = int(warm.get("decode_tokens", 0) or 0)
+                if decode_tokens > 0:
+                    t0 = perf_counter()
+                    self._warmup_decode(llama_obj, decode_tokens)
+                    phases["warmup"] = int((perf_counter() - t0) * 1000)
                 self._state.loaded = True
                 self._loaded = True  # legacy flag
                 emit(
@@ -271,6 +465,7 @@ class LlamaCppProvider(ModelProvider):
                         role=self._role,
                         load_ms=int((perf_counter() - start) * 1000),
                         revision=None,
+                        phases=phases,
                     )
                 )
                 self._sync_info_metadata()
@@ -305,6 +500,90 @@ class LlamaCppProvider(ModelProvider):
                 )
                 self._sync_info_metadata()
 
+    def _warmup_decode(self, llama_obj: Any, tokens: int) -> None:
+        """Tiny decode so first-kernel setup is not paid by a request."""
+        try:
+            llama_obj("Hello", max_tokens=tokens, temperature=0.0)
+        except Exception:  # noqa: BLE001
+            metrics.inc("model_warmup_errors_total", {"model": self._model_id})
+
+    def prefill_prefix(self, text: str) -> int:
+        """Evaluate ``text`` and keep it as the shared KV pool prefix.
+
+        Returns the number of prefilled tokens (0 for stub / no pool).
+        """
+        state = self._state
+        pool = self._get_kv_pool()
+        if state.stub or state.llama is None or pool is None or not text:
+            return 0
+        with self._lock:
+            llama_obj = state.llama
+            try:
+                tokens = llama_obj.tokenize(
+                    text.encode("utf-8"), add_bos=True, special=True
+                )
+                owner = state.kv_owner
+                if owner:
+                    pool.put(owner, llama_obj.save_state())
+                llama_obj.reset()
+                llama_obj.eval(tokens)
+                pool.put(SHARED_KEY, llama_obj.save_state())
+                state.kv_owner = None
+                return len(tokens)
+            except Exception:  # noqa: BLE001
+                state.kv_owner = None
+                metrics.inc(
+                    "model_warmup_errors_total", {"model": self._model_id}
+                )
+                return 0
+
+    # speculative decoding -------------------------------------------------
+    def draft_llama(self) -> Any | None:
+        """Dedicated draft context on this model's weights (None: stub).
+
+        Separate from the serving context so drafting never disturbs this
+        provider's own requests; weights are mmap-shared and the context's
+        KV is reserved by residency for the configured draft model.
+        Callers hold ``draft_lock``.
+        """
+        self.load()
+        if self._state.stub or self._state.llama is None:
+            return None
+        if self._draft_llama is None:
+            from llama_cpp import Llama  # type: ignore
+
+            kwargs = self._build_llama_kwargs()
+            kwargs["logits_all"] = False
+            kwargs["n_ctx"] = min(
+                self._context_length,
+                int(speculative_config().get("draft_context", 2048)),
+            )
+            if self._state.effective_n_gpu_layers is not None:
+                kwargs["n_gpu_layers"] = self._state.effective_n_gpu_layers
+            self._draft_llama = Llama(**kwargs)
+        return self._draft_llama
+
+    def _attach_draft(
+        self, llama_obj: Any, speculative: Any
+    ) -> DraftRecorder | None:
+        recorder = build_recorder(speculative, llama_obj, self._model_id)
+        if recorder is not None:
+            try:
+                llama_obj.draft_model = recorder
+            except Exception:  # noqa: BLE001
+                recorder.finish([])
+                return None
+        return recorder
+
+    @staticmethod
+    def _detach_draft(
+        llama_obj: Any, recorder: DraftRecorder | None
+    ) -> None:
+        if recorder is None:
+            return
+        llama_obj.draft_model = None
+        recorder.finish(list(state_tokens(llama_obj)))
+
     # helpers --------------------------------------------------------------
     def _filter_sampling(
         self, kwargs: Dict[str, Any]
@@ -322,6 +601,295 @@ class LlamaCppProvider(ModelProvider):
                 removed.append(key)
         return out, removed
 
+    # KV state pool --------------------------------------------------------
+    def _get_kv_pool(self) -> KVStatePool | None:
+        if not self._kv_pool_built:
+            self._kv_pool = build_pool(self._model_id)
+            self._kv_pool_built = True
+        return self._kv_pool
+
+    def _kv_prepare(
+        self, llama_obj: Any, session_id: str | None, prompt: str
+    ) -> None:
+        """Make the context hold the longest cached prefix of ``prompt``.
+
+        Snapshots the current owner's state before another session takes
+        over the context, then restores the requesting session's snapshot
+        unless the live context already covers a longer prefix. llama.cpp
+        itself skips re-evaluating the matching prefix afterwards. A
+        request without a session (history compaction) only snapshots the
+        owner and leaves the context unowned.
+        """
+        pool = self._get_kv_pool()
+        if pool is None:
+            return
+        try:
+            owner = self._state.kv_owner
+            if not session_id:
+                if owner:
+                    pool.put(owner, llama_obj.save_state())
+                self._state.kv_owner = None
+                return
+            tokens = llama_obj.tokenize(
+                prompt.encode("utf-8"), add_bos=True, special=True
+            )
+            live = 0
+            if owner == session_id:
+                live = common_prefix_len(state_tokens(llama_obj), tokens)
+            elif owner:
+                pool.put(owner, llama_obj.save_state())
+            hit = pool.lookup(session_id, tokens)
+            if live and live >= hit.prefix_tokens:
+                pool.record(
+                    KVLookup(state=None, prefix_tokens=live, source="live")
+                )
+            else:
+                if hit.state is not None:
+                    llama_obj.load_state(hit.state)
+                pool.record(hit)
+            self._state.kv_owner = session_id
+        except Exception:  # noqa: BLE001
+            self._state.kv_owner = None
+            metrics.inc("kv_cache_errors_total", {"model": self._model_id})
+
+    # cancellation ---------------------------------------------------------
+    def _attach_cancel(self, sampling: Dict[str, Any], cancel: Any) -> None:
+        """Add a stopping criterion that fires once ``cancel`` is set."""
+        if cancel is None:
+            return
+        supported = self._state.supported_args
+        if supported and "stopping_criteria" not in supported:
+            return
+        try:
+            from llama_cpp import StoppingCriteriaList  # type: ignore
+        except Exception:  # noqa: BLE001
+            StoppingCriteriaList = _StoppingCriteria  # noqa: N806
+
+        def _cancelled(input_ids: Any, logits: Any) -> bool:
+            return cancel.is_set()
+
+        criteria = StoppingCriteriaList([_cancelled])
+        existing = sampling.get("stopping_criteria")
+        if existing:
+            criteria.extend(existing)
+        sampling["stopping_criteria"] = criteria
+
+    def _record_repetition(self, kind: str | None, unused: int) -> None:
+        labels = {"model": self._model_id}
+        metrics.inc(
+            "generation_repetition_stops_total",
+            {**labels, "kind": kind or "unknown"},
+        )
+        metrics.inc(
+            "repetition_unused_budget_tokens_total", labels, max(0, unused)
+        )
+
+    def _stop_reason(self, cancel: Any) -> str:
+        if cancel is not None and cancel.is_set():
+            return "cancelled"
+        return "stub" if self._state.stub else "eos"
+
+    # token ids --------------------------------------------------------------
+    def harmony_vocab(self) -> HarmonyVocab | None:
+        """Harmony special-token ids of the loaded model (None if absent).
+
+        Core markers must each be a single special token; optional markers
+        and channel names are included when they map to exactly one id.
+        Probed once per load.
+        """
+        self.load()
+        state = self._state
+        if state.stub or state.llama is None:
+            return None
+        if state.harmony_probed:
+            return state.harmony_vocab
+        state.harmony_probed = True
+        try:
+            tokenize = state.llama.tokenize
+            markers: Dict[int, str] = {}
+            for name in _HARMONY_CORE_MARKERS + _HARMONY_OPTIONAL_MARKERS:
+                ids = tokenize(
+                    f"<|{name}|>".encode("utf-8"), add_bos=False, special=True
+                )
+                if len(ids) == 1:
+                    markers[int(ids[0])] = name
+                elif name in _HARMONY_CORE_MARKERS:
+                    return None
+            channels: Dict[int, str] = {}
+            for name in _HARMONY_CHANNELS:
+                ids = tokenize(name.encode("utf-8"), add_bos=False)
+                if len(ids) == 1:
+                    channels[int(ids[0])] = name
+            state.harmony_vocab = HarmonyVocab(
+                markers=markers, channels=channels
+            )
+        except Exception:  # noqa: BLE001
+            state.harmony_vocab = None
+        return state.harmony_vocab
+
+    def count_tokens(self, text: str) -> int | None:
+        """Exact token count with the loaded tokenizer (None if unloaded).
+
+        Never triggers a load; callers fall back to the calibrated
+        estimator in ``core.llm.token_count``.
+        """
+        state = self._state
+        if state.stub or state.llama is None or not state.loaded:
+            return None
+        return len(
+            state.llama.tokenize(
+                text.encode("utf-8"), add_bos=False, special=True
+            )
+        )
+
+    def _stub_token_id(self, word: str) -> int:
+        return self._stub_vocab.setdefault(word, len(self._stub_vocab) + 1)
+
+    @staticmethod
+    def _decode_text(
+        llama_obj: Any, prompt: str, sampling: Dict[str, Any]
+    ) -> Iterable[Tuple[int | None, str]]:
+        for token in llama_obj(prompt, stream=True, **sampling):
+            if not isinstance(token, dict):
+                continue
+            yield None, token.get("choices", [{}])[0].get("text", "")
+
+    def _cutover_tokens(
+        self, llama_obj: Any, vocab: HarmonyVocab | None
+    ) -> Tuple[int | None, List[int]]:
+        """Analysis channel id and the ids closing analysis -> final."""
+        if vocab is None:
+            return None, []
+        analysis_id = next(
+            (t for t, n in vocab.channels.items() if n == "analysis"), None
+        )
+        if analysis_id is None:
+            return None, []
+        try:
+            ids = llama_obj.tokenize(
+                _FINAL_CUTOVER.encode("utf-8"), add_bos=False, special=True
+            )
+        except Exception:  # noqa: BLE001
+            return None, []
+        return analysis_id, [int(t) for t in ids]
+
+    def _decode_token_ids(
+        self,
+        llama_obj: Any,
+        prompt: str,
+        sampling: Dict[str, Any],
+        budget: ReasoningBudget | None = None,
+    ) -> Iterable[Tuple[int | None, str]]:
+        """Low-level decode loop yielding ``(token_id, piece)`` pairs.
+
+        Sampling keys are mapped onto ``Llama.generate`` parameters
+        (``temperature`` -> ``temp``); ``max_tokens`` bounds the loop and
+        decode stops after a terminal Harmony marker or EOS. Pieces are
+        detokenized with special tokens kept and UTF-8 decoded
+        incrementally (multi-byte characters may span tokens).
+
+        With ``budget`` the analysis channel is counted per sampled token;
+        at the limit the cutover ids are appended and ``generate`` restarts
+        on the full sequence, which llama.cpp matches against the cached
+        prefix so only the injected tokens are evaluated.
+        """
+        import inspect
+
+        try:
+            params = set(inspect.signature(llama_obj.generate).parameters)
+        except (TypeError, ValueError):
+            params = set()
+        gen_kwargs: Dict[str, Any] = {}
+        for key, val in sampling.items():
+            key = _GENERATE_ALIASES.get(key, key)
+            if key in params:
+                gen_kwargs[key] = val
+        max_tokens = int(sampling.get("max_tokens") or 128)
+        vocab = self.harmony_vocab()
+        stop_ids = set()
+        if vocab is not None:
+            stop_ids = {
+                tid
+                for tid, name in vocab.markers.items()
+                if name in _HARMONY_STOP_MARKERS
+            }
+        try:
+            eos = llama_obj.token_eos()
+        except Exception:  # noqa: BLE001
+            eos = None
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+        def _piece(tid: int) -> str:
+            try:
+                raw = llama_obj.detokenize([tid], special=True)
+            except TypeError:  # older bindings: no ``special`` flag
+                raw = llama_obj.detokenize([tid])
+            return decoder.decode(raw)
+
+        tracker = None
+        cutover: List[int] = []
+        if budget is not None:
+            analysis_id, cutover = self._cutover_tokens(llama_obj, vocab)
+            if analysis_id is not None and cutover:
+                tracker = _AnalysisTracker(vocab, analysis_id)
+                budget.enforced = True
+            else:
+                budget.unenforced = "no_cutover_ids"
+                metrics.inc(
+                    "reasoning_budget_unenforced_total",
+                    {"model": self._model_id, "reason": "no_cutover_ids"},
+                )
+        tokens = list(
+            llama_obj.tokenize(
+                prompt.encode("utf-8"), add_bos=True, special=True
+            )
+        )
+        produced = 0
+        gen = llama_obj.generate(list(tokens), **gen_kwargs)
+        while gen is not None:
+            interrupted = False
+            try:
+                for tid in gen:
+                    if tid == eos or produced >= max_tokens:
+                        break
+                    produced += 1
+                    tokens.append(int(tid))
+                    yield int(tid), _piece(tid)
+                    if tid in stop_ids:
+                        break
+                    if tracker is not None:
+                        tracker.step(tid)
+                        if tracker.count >= budget.max_tokens:
+                            interrupted = True
+                            break
+            finally:
+                close = getattr(gen, "close", None)
+                if close is not None:
+                    close()
+            gen = None
+            if interrupted:
+                budget.analysis_tokens = tracker.count
+                tracker = None
+                budget.cutover = True
+                for tid in cutover:
+                    tokens.append(tid)
+                    yield tid, _piece(tid)
+                gen = llama_obj.generate(list(tokens), **gen_kwargs)
+        if tracker is not None:
+            budget.analysis_tokens = tracker.count
+        if budget is not None and budget.enforced:
+            if budget.cutover:
+                budget.decode_tokens_unused_budget = max(
+                    0, max_tokens - produced
+                )
+                labels = {"model": self._model_id}
+                metrics.inc("reasoning_cutover_total", labels)
+                metrics.inc(
+                    "reasoning_unused_budget_tokens_total",
+                    labels,
+                    budget.decode_tokens_unused_budget,
+                )
+
     # info -----------------------------------------------------------------
     def info(self) -> ModelInfo:  # noqa: D401
         caps = getattr(self, "_manifest_capabilities", ("chat",))
@@ -372,11 +940,19 @@ class LlamaCppProvider(ModelProvider):
         self.load()
         self._loaded = self._state.loaded  # legacy flag
         rid = request_id or f"req_{id(self)}_{perf_counter():.0f}"
+        session_id = kwargs.pop("session_id", None)
+        cancel = kwargs.pop("cancel_event", None)
+        kwargs.pop("with_token_ids", None)  # stream-only options
+        kwargs.pop("reasoning_budget", None)
+        kwargs.pop("decode_outcome", None)
+        speculative = kwargs.pop("speculative", None)
         sampling, removed = self._filter_sampling(kwargs)
         sampling_meta = dict(sampling)
         if removed:
             sampling_meta["filtered_out"] = removed
-        ptoks = len(prompt.split())
+        ptoks = count_tokens(
+            prompt, model_id=self._model_id, provider=self
+        )
         emit(
             GenerationStarted(
                 request_id=rid,
@@ -394,7 +970,13 @@ class LlamaCppProvider(ModelProvider):
             else:
                 llama_obj = self._state.llama
                 assert llama_obj is not None
-                out = llama_obj(prompt, echo=False, **sampling)
+                self._kv_prepare(llama_obj, session_id, prompt)
+                self._attach_cancel(sampling, cancel)
+                recorder = self._attach_draft(llama_obj, speculative)
+                try:
+                    out = llama_obj(prompt, echo=False, **sampling)
+                finally:
+                    self._detach_draft(llama_obj, recorder)
                 text = (
                     out.get("choices", [{}])[0].get("text", "")
                     or self._stub_text(prompt, max_tokens)
@@ -420,7 +1002,7 @@ class LlamaCppProvider(ModelProvider):
                     output_tokens=res.usage.completion_tokens,
                     latency_ms=res.timings.total_ms,
                     result_summary={"decode_tps": res.timings.decode_tps},
-                    stop_reason="stub" if self._state.stub else "eos",
+                    stop_reason=self._stop_reason(cancel),
                 )
             )
             return res
@@ -462,9 +1044,10 @@ class LlamaCppProvider(ModelProvider):
     def stream(
         self, prompt: str, request_id: str | None = None, **kwargs: Any
     ) -> Iterable[str]:
-        # Streaming variant (keeps existing generator code path)
+        # Streaming variant (keeps existing generator code path); yields
+        # (token_id, piece) tuples when ``with_token_ids=True``.
         for part in self._gen(prompt, request_id, True, **kwargs):
-            if isinstance(part, str):
+            if isinstance(part, (str, tuple)):
                 yield part
 
     # core generation ------------------------------------------------------
@@ -478,11 +1061,19 @@ class LlamaCppProvider(ModelProvider):
         self.load()
         self._loaded = self._state.loaded
         rid = request_id or f"req_{id(self)}_{perf_counter():.0f}"
+        session_id = kwargs.pop("session_id", None)
+        cancel = kwargs.pop("cancel_event", None)
+        with_ids = bool(kwargs.pop("with_token_ids", False))
+        budget = kwargs.pop("reasoning_budget", None)
+        outcome = kwargs.pop("decode_outcome", None)
+        speculative = kwargs.pop("speculative", None)
         sampling, removed = self._filter_sampling(kwargs)
         sampling_meta = dict(sampling)
         if removed:
             sampling_meta["filtered_out"] = removed
-        ptoks = len(prompt.split())
+        ptoks = count_tokens(
+            prompt, model_id=self._model_id, provider=self
+        )
         emit(
             GenerationStarted(
                 request_id=rid,
@@ -500,21 +1091,22 @@ class LlamaCppProvider(ModelProvider):
                 full = self._stub_text(prompt, max_tokens)
                 tokens = full.split()
                 acc: List[str] = []
-                for idx, tok in enumerate(tokens):
-                    acc.append(tok)
-                    piece = tok + (" " if idx < len(tokens) - 1 else "")
-                    emit(
-                        GenerationChunk(
-                            request_id=rid,
-                            model_id=self._model_id,
-                            role=self._role,
-                            correlation_id=rid,
-                            seq=idx,
-                            text=piece,
-                            tokens_out=len(acc),
+                chunks = ChunkEmitter.from_config(
+                    rid, self._model_id, self._role
+                )
+                try:
+                    for idx, tok in enumerate(tokens):
+                        if cancel is not None and cancel.is_set():
+                            break
+                        acc.append(tok)
+                        piece = tok + (" " if idx < len(tokens) - 1 else "")
+                        chunks.add(idx, piece)
+                        yield (
+                            (self._stub_token_id(tok), piece) if with_ids
+                            else piece
                         )
-                    )
-                    yield piece
+                finally:
+                    chunks.close()
                 total = int((perf_counter() - start) * 1000)
                 emit(
                     GenerationCompleted(
@@ -523,104 +1115,57 @@ class LlamaCppProvider(ModelProvider):
                         role=self._role,
                         status="ok",
                         correlation_id=rid,
-                        output_tokens=len(tokens),
+                        output_tokens=len(acc),
                         latency_ms=total,
                         result_summary=None,
-                        stop_reason="stub",
+                        stop_reason=self._stop_reason(cancel),
                     )
                 )
+                if outcome is not None:
+                    outcome.stop_reason = self._stop_reason(cancel)
+                    outcome.output_tokens = len(acc)
                 return
             llama_obj = self._state.llama
             assert llama_obj is not None
+            self._kv_prepare(llama_obj, session_id, prompt)
+            self._attach_cancel(sampling, cancel)
+            recorder = self._attach_draft(llama_obj, speculative)
             seq = 0
             acc: List[str] = []
-            for token in llama_obj(prompt, stream=True, **sampling):
-                if not isinstance(token, dict):
-                    continue
-                piece = token.get("choices", [{}])[0].get("text", "")
-                if not piece:
-                    continue
-                acc.append(piece)
-                emit(
-                    GenerationChunk(
-                        request_id=rid,
-                        model_id=self._model_id,
-                        role=self._role,
-                        correlation_id=rid,
-                        seq=seq,
-                        text=piece,
-                        tokens_out=len(acc),
-                    )
-                )
-                seq += 1
-                yield piece
-            total = int((perf_counter() - start) * 1000)
-            emit(
-                GenerationCompleted(
-                    request_id=rid,
-                    model_id=self._model_id,
-                    role=self._role,
-                    status="ok",
-                    correlation_id=rid,
-                    output_tokens=len(acc),
-                    latency_ms=total,
-                    result_summary=None,
-                    stop_reason="eos",
-                )
+            pieces = (
+                self._decode_token_ids(llama_obj, prompt, sampling, budget)
+                if with_ids
+                else self._decode_text(llama_obj, prompt, sampling)
             )
-        except Exception as e:  # noqa: BLE001
-            total = int((perf_counter() - start) * 1000)
-            code = validate_error_type(map_exception(e, "generation"))
-            emit(
-                GenerationCompleted(
-                    request_id=rid,
-                    model_id=self._model_id,
-                    role=self._role,
-                    status="error",
-                    correlation_id=rid,
-                    output_tokens=0,
-                    latency_ms=total,
-                    error_type=code,
-                    message=str(e)[:400],
-                    result_summary=None,
-                    stop_reason="error",
-                )
-            )
-            if stream:
-                return
-            fail = GenerationResult.failure(
-                err_type=code,
-                message=str(e)[:400],
-                prompt_tokens=ptoks,
-                completion_tokens=0,
-                total_ms=total,
-                model_id=self._model_id,
-                role=self._role,
-                request_id=rid,
-            )
-            return fail
-            seq = 0
-            acc: List[str] = []
-            for token in llama_obj(prompt, stream=True, **sampling):
-                if not isinstance(token, dict):
-                    continue
-                piece = token.get("choices", [{}])[0].get("text", "")
-                if not piece:
-                    continue
-                acc.append(piece)
-                emit(
-                    GenerationChunk(
-                        request_id=rid,
-                        model_id=self._model_id,
-                        role=self._role,
-                        correlation_id=rid,
-                        seq=seq,
-                        text=piece,
-                        tokens_out=len(acc),
-                    )
-                )
-                seq += 1
-                yield piece
+            detector = build_detector()
+            stop_reason = None
+            chunks = ChunkEmitter.from_config(rid, self._model_id, self._role)
+            try:
+                for tid, piece in pieces:
+                    if not piece:
+                        continue
+                    acc.append(piece)
+                    chunks.add(seq, piece)
+                    seq += 1
+                    yield (tid, piece) if with_ids else piece
+                    if detector is not None and detector.feed(
+                        tid if tid is not None else hash(piece)
+                    ):
+                        stop_reason = "repetition"
+                        self._record_repetition(
+                            detector.kind, max_tokens - len(acc)
+                        )
+                        break
+            finally:
+                close = getattr(pieces, "close", None)
+                if close is not None:
+                    close()  # release the llama generator on early stop
+                self._detach_draft(llama_obj, recorder)
+                chunks.close()
+            stop_reason = stop_reason or self._stop_reason(cancel)
+            if outcome is not None:
+                outcome.stop_reason = stop_reason
+                outcome.output_tokens = len(acc)
             total = int((perf_counter() - start) * 1000)
             emit(
                 GenerationCompleted(
@@ -632,7 +1177,7 @@ class LlamaCppProvider(ModelProvider):
                     output_tokens=len(acc),
                     latency_ms=total,
                     result_summary=None,
-                    stop_reason="eos",
+                    stop_reason=stop_reason,
                 )
             )
         except Exception as e:  # noqa: BLE001
@@ -670,14 +1215,21 @@ class LlamaCppProvider(ModelProvider):
     # unload --------------------------------------------------------------
     def unload(self) -> None:  # noqa: D401
         if self._state.llama is not None:
+            _UNLOADED_AT[str(self._model_path)] = monotonic()
             try:
                 del self._state.llama  # type: ignore[attr-defined]
             except Exception:  # noqa: BLE001
                 pass
         self._state.llama = None
+        self._draft_llama = None
         self._state.loaded = False
         self._state.supported_args = None
         self._state.effective_n_gpu_layers = None
+        self._state.kv_owner = None
+        self._state.harmony_vocab = None
+        self._state.harmony_probed = False
+        if self._kv_pool is not None:
+            self._kv_pool.clear()
 
     # configuration --------------------------------------------------------
     def set_n_gpu_layers(self, value: Any) -> dict[str, Any]:  # noqa: D401
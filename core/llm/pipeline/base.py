@@ -27,6 +27,7 @@ class PipelineContext:
     provider: Any
     prompt: str
     sampling: PipelineSampling
+    session_id: str | None = None  # KV state pool key (per-session prefix)
     adapter: Any | None = None
     adapter_name: str | None = None
     fragments: list[str] = field(default_factory=list)
@@ -46,6 +47,15 @@ class PipelineContext:
     requested_max_tokens: int | None = None
     effective_max_tokens: int | None = None
     reasoning_mode: str | None = None
+    # Hard analysis budget (token-id mode); provider fills runtime fields
+    reasoning_budget: Any | None = None
+    # Provider-side stop info (types.DecodeOutcome), filled after decode
+    decode_outcome: Any | None = None
+    # Speculative decoding opt-in (types.SpeculativeRequest), counters
+    # filled by the provider
+    speculative: Any | None = None
+    # Prompt history window (history.HistoryWindow): kept/dropped messages
+    history_window: Any | None = None
     # Runtime populated fields (post streaming)
     output_tokens: int = 0
     latency_ms: int | None = None
@@ -0,0 +1,251 @@
+"""Incremental Harmony history window (per-session render cache).
+
+Summary:
+* Each session keeps its history rendered as Harmony messages
+    (``<|start|>{role}<|message|>...<|end|>``) with token counts and a
+    cumulative prefix-sum array. A new turn only renders and counts the
+    messages appended since the previous request; messages evicted from
+    the front of the session (``SessionStore`` maxlen) shift the cache.
+* ``build_window`` picks the first kept message by binary search over the
+    prefix sums (newest message always kept) and joins only the kept
+    messages, so assembly is O(messages kept).
+* ``HistoryWindow.dropped`` lists the (role, content) pairs left out of the
+    prompt, oldest first.
+* Counts that were estimated while the model was not loaded are recounted
+    once the tokenizer is available.
+* Sessions are kept in an LRU of ``MAX_SESSIONS`` entries (internal
+    constant, like ``SessionStore`` limits). The registry lock only
+    guards that LRU; each session has its own lock, and the new / estimated
+    messages are counted (tokenized) outside any lock, then applied from
+    those counts.
+"""
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from threading import Lock
+from typing import Any, Sequence
+
+from core import metrics
+from core.llm.token_count import get_counter
+
+MAX_SESSIONS = 256
+
+
+def render_message(role: str, content: str) -> str:
+    return f"<|start|>{role}<|message|>" + (content or "") + "<|end|>"
+
+
+@dataclass(slots=True)
+class _Rendered:
+    role: str
+    content: str
+    text: str
+    tokens: int
+    exact: bool
+
+
+@dataclass(slots=True)
+class HistoryWindow:
+    """Rendered history that fits the budget plus what was left out."""
+
+    text: str
+    tokens: int
+    kept: int
+    dropped: list[tuple[str, str]] = field(default_factory=list)
+
+
+class _SessionRender:
+    """Rendered messages of one session with cumulative token sums."""
+
+    __slots__ = ("model_id", "items", "cum", "estimated", "lock")
+
+    def __init__(self, model_id: str) -> None:
+        self.model_id = model_id
+        self.items: list[_Rendered] = []
+        self.cum: list[int] = [0]  # cum[i] = tokens of items[:i]
+        self.estimated = 0
+        self.lock = Lock()
+
+    def _align(self, messages: Sequence[tuple[str, str]]) -> int:
+        """Drop stale entries; return how many cached items are reusable."""
+        items = self.items
+        if not items or not messages:
+            return 0
+        first = messages[0]
+        shift = next(
+            (
+                i for i, it in enumerate(items)
+                if it.role == first[0] and it.content == first[1]
+            ),
+            None,
+        )
+        if shift is None:
+            return 0
+        if shift:
+            base = self.cum[shift]
+            self.estimated -= sum(1 for it in items[:shift] if not it.exact)
+            del items[:shift]
+            self.cum = [c - base for c in self.cum[shift:]]
+        n = 0
+        for it, (role, content) in zip(items, messages):
+            if it.role != role or it.content != content:
+                break
+            n += 1
+        return n
+
+    def _truncate(self, n: int) -> None:
+        if n < len(self.items):
+            self.estimated -= sum(
+                1 for it in self.items[n:] if not it.exact
+            )
+            del self.items[n:]
+            del self.cum[n + 1:]
+
+    def _count(
+        self, text: str, provider: Any, counts: dict[str, tuple[int, bool]]
+    ) -> tuple[int, bool]:
+        hit = counts.get(text)
+        if hit is None:
+            hit = get_counter().lookup(
+                text, model_id=self.model_id, provider=provider
+            )
+        return hit
+
+    def _recount(
+        self, provider: Any, counts: dict[str, tuple[int, bool]]
+    ) -> None:
+        first = None
+        for i, it in enumerate(self.items):
+            if it.exact:
+                continue
+            tokens, exact = self._count(it.text, provider, counts)
+            if not exact:
+                return  # tokenizer still unavailable
+            it.tokens, it.exact = tokens, True
+            self.estimated -= 1
+            first = i if first is None else first
+        if first is not None:
+            for i in range(first, len(self.items)):
+                self.cum[i + 1] = self.cum[i] + self.items[i].tokens
+
+    def pending(
+        self, messages: Sequence[tuple[str, str]]
+    ) -> tuple[list[str], list[str]]:
+        """Texts ``sync(messages)`` has to count: (estimated, new)."""
+        self._truncate(self._align(messages))
+        estimated = [it.text for it in self.items if not it.exact]
+        new = [
+            render_message(role, content)
+            for role, content in messages[len(self.items):]
+        ]
+        return estimated, new
+
+    def sync(
+        self,
+        messages: Sequence[tuple[str, str]],
+        provider: Any,
+        counts: dict[str, tuple[int, bool]] | None = None,
+    ) -> None:
+        """Bring the cache up to ``messages``.
+
+        ``counts`` holds precomputed ``(tokens, exact)`` per rendered text;
+        anything missing is counted here.
+        """
+        counts = counts or {}
+        self._truncate(self._align(messages))
+        if self.estimated:
+            self._recount(provider, counts)
+        for role, content in messages[len(self.items):]:
+            text = render_message(role, content)
+            tokens, exact = self._count(text, provider, counts)
+            self.items.append(
+                _Rendered(role, content, text, tokens, exact)
+            )
+            self.cum.append(self.cum[-1] + tokens)
+            if not exact:
+                self.estimated += 1
+
+    def window(self, budget: int | None) -> HistoryWindow:
+        items, cum = self.items, self.cum
+        n = len(items)
+        first = 0
+        if budget is not None and n and cum[n] > budget:
+            # smallest i with cum[n] - cum[i] <= budget; keep the newest
+            first = min(bisect_left(cum, cum[n] - budget, 0, n), n - 1)
+        kept = items[first:]
+        return HistoryWindow(
+            text="".join(it.text for it in kept),
+            tokens=cum[n] - cum[first],
+            kept=len(kept),
+            dropped=[(it.role, it.content) for it in items[:first]],
+        )
+
+
+_SESSIONS: "OrderedDict[str, _SessionRender]" = OrderedDict()
+_LOCK = Lock()
+
+
+def build_window(
+    messages: Sequence[tuple[str, str]],
+    *,
+    model_id: str,
+    provider: Any = None,
+    budget_tokens: int | None = None,
+    session_id: str | None = None,
+) -> HistoryWindow:
+    """Render ``messages`` (role, content) and keep the newest that fit.
+
+    ``budget_tokens`` bounds the history tokens (None -> keep all). With a
+    ``session_id`` the rendered messages are cached for the next turn.
+    """
+    if not session_id:
+        render = _SessionRender(model_id)
+        render.sync(messages, provider)
+        return render.window(budget_tokens)
+    with _LOCK:
+        render = _SESSIONS.get(session_id)
+        if render is None or render.model_id != model_id:
+            render = _SessionRender(model_id)
+            _SESSIONS[session_id] = render
+        _SESSIONS.move_to_end(session_id)
+        while len(_SESSIONS) > MAX_SESSIONS:
+            _SESSIONS.popitem(last=False)
+    with render.lock:
+        estimated, new = render.pending(messages)
+    counter = get_counter()
+    counts: dict[str, tuple[int, bool]] = {}
+    for text in estimated:
+        counts[text] = counter.lookup(
+            text, model_id=model_id, provider=provider
+        )
+        if not counts[text][1]:
+            break  # tokenizer still unavailable
+    for text in new:
+        counts[text] = counter.lookup(
+            text, model_id=model_id, provider=provider
+        )
+    with render.lock:
+        render.sync(messages, provider, counts)
+        window = render.window(budget_tokens)
+    if window.dropped:
+        metrics.inc(
+            "history_messages_dropped_total",
+            {"model": model_id},
+            len(window.dropped),
+        )
+    return window
+
+
+def reset_for_tests() -> None:  # pragma: no cover - test helper
+    with _LOCK:
+        _SESSIONS.clear()
+
+
+__all__ = [
+    "HistoryWindow",
+    "build_window",
+    "render_message",
+    "reset_for_tests",
+]
@@ -19,21 +19,63 @@ from core.events import (
     ModelPassportMismatch,
     GenerationCancelled,
 )
-from core.llm.adapters import HarmonyChannelAdapter
+from core.llm.adapters import HarmonyChannelAdapter, HarmonyTokenAdapter
+from core.llm.compaction import get_compactor
+from core.llm.scheduler import scheduled_astream, scheduled_stream
+from core.llm.token_count import count_tokens
+from core.llm.types import DecodeOutcome, ReasoningBudget
 from .base import (
     PipelineContext,
     PipelineSampling,
     GenerationPipeline,
     PipelineResult,
 )
+from .history import HistoryWindow, build_window, render_message
+
+
+# Final channel opened around plain-text (stub) provider output
+_STUB_OPEN = "<|start|>assistant<|channel|>final<|message|>"
+
+
+def harmony_system_message(reasoning_mode: str | None) -> str:
+    lvl = (reasoning_mode or "medium").lower()
+    now = _dt.datetime.utcnow().strftime("%Y-%m-%d")
+    system_lines = [
+        "You are ChatGPT, a large language model trained by OpenAI.",
+        "Knowledge cutoff: 2024-10",
+        f"Current date: {now}",
+        f"Reasoning: {lvl}",
+        (
+            "# Valid channels: analysis, commentary, final. "
+            "Channel must be included for every message."
+        ),
+    ]
+    return "\n".join(system_lines)
+
+
+def harmony_developer_block(dev_block_text: str) -> str:
+    dev_block = dev_block_text
+    if not dev_block.startswith("# Instructions"):
+        dev_block = "# Instructions\n" + dev_block.strip()
+        dev_block = "# Instructions\n" + dev_block.strip()
+    return dev_block
+
+
+def harmony_prefix(dev_block_text: str, reasoning_mode: str | None) -> str:
+    """System + developer messages every prompt starts with (KV prefill)."""
+    return render_message(
+        "system", harmony_system_message(reasoning_mode)
+    ) + render_message("developer", harmony_developer_block(dev_block_text))
 
 
 class PrimaryPipeline(GenerationPipeline):  # pragma: no cover
-    def _approx_tokens(self, text: str) -> int:
-        try:
-            return max(1, len((text or "").split()))
-        except Exception:
-            return max(1, len(text) // 4)
+    def _count_tokens(
+        self, text: str, model_id: str | None, provider: Any = None
+    ) -> int:
+        """Tokenizer-exact when the model is loaded (cached per message)."""
+        return count_tokens(
+            text or "", model_id=model_id or "", provider=provider
+        )
 
     def _build_harmony_prompt(
         self,
@@ -45,27 +87,14 @@ class PrimaryPipeline(GenerationPipeline):  # pragma: no cover
         user_prompt: str,
         context_length: int | None,
         reserved_output_tokens: int | None,
-    ) -> tuple[str, int, str | None]:  # noqa: D401
-        lvl = (reasoning_mode or "medium").lower()
-        now = _dt.datetime.utcnow().strftime("%Y-%m-%d")
-        system_lines = [
-            "You are ChatGPT, a large language model trained by OpenAI.",
-            "Knowledge cutoff: 2024-10",
-            f"Current date: {now}",
-            f"Reasoning: {lvl}",
-            (
-                "# Valid channels: analysis, commentary, final. "
-                "Channel must be included for every message."
-            ),
-        ]
-        system_msg = "\n".join(system_lines)
-        dev_block = dev_block_text
-        if not dev_block.startswith("# Instructions"):
-            dev_block = "# Instructions\n" + dev_block.strip()
-            dev_block = "# Instructions\n" + dev_block.strip()
-    # Build history with a simple character budget heuristic
-    # (~4 chars/token)
-        chars_per_token = 4
+        model_id: str | None = None,
+        provider: Any = None,
+        session_id: str | None = None,
+        history_summary: str | None = None,
+    ) -> tuple[str, int, str | None, HistoryWindow]:  # noqa: D401
+        system_msg = harmony_system_message(reasoning_mode)
+        dev_block = harmony_developer_block(dev_block_text)
+    # Build history within the context budget, counted in model tokens
         budget_tokens = None
         try:
             if context_length:
@@ -75,54 +104,59 @@ class PrimaryPipeline(GenerationPipeline):  # pragma: no cover
                 )
         except Exception:
             budget_tokens = None
-        budget_chars = (
-            budget_tokens * chars_per_token if budget_tokens else None
-        )
-        parts: list[str] = []
-        parts.append("<|start|>system<|message|>" + system_msg + "<|end|>")
-        parts.append(
-            "<|start|>developer<|message|>" + dev_block + "<|end|>"
+        fixed = (
+            render_message("system", system_msg)
+            + render_message("developer", dev_block)
         )
-    # Append prior history (excluding final assistant tag)
-    # oldest -> newest
-        history = session_messages or []
-    # Ensure last message is current user prompt if history provided
-        # We'll reconstruct all but ensure we end with assistant tag open
-        for role, content in history:
+        tail = "<|start|>assistant"
+    # Prior history (user/assistant only), oldest -> newest
+        messages: list[tuple[str, str]] = []
+        for role, content in session_messages or []:
             r = role.strip().lower()
-            if r not in {"user", "assistant"}:
-                continue
-            tag = "user" if r == "user" else "assistant"
-            parts.append(
-                f"<|start|>{tag}<|message|>" + (content or "") + "<|end|>"
-            )
+            if r in {"user", "assistant"}:
+                messages.append((r, content or ""))
         # Ensure the latest user prompt is present (in case history was empty)
+        history = session_messages or []
         if (
             not history
             or history[-1][0] != "user"
             or history[-1][1] != user_prompt
         ):
-            parts.append("<|start|>user<|message|>" + user_prompt + "<|end|>")
-    # Assemble and clamp to budget if needed
-    # (trim from the start of history)
-        assembled = "".join(parts) + "<|start|>assistant"
-        if budget_chars and len(assembled) > budget_chars:
-            # Drop earliest history chunks (keep system+dev + latest turns)
-            fixed = parts[:2]  # system + dev
-            dyn = parts[2:]
-            # Drop from the left until within budget
-            for i in range(len(dyn)):
-                candidate = "".join(fixed + dyn[i:]) + "<|start|>assistant"
-                if len(candidate) <= budget_chars:
-                    assembled = candidate
-                    break
-        prompt_tokens = self._approx_tokens(assembled)
+            messages.append(("user", user_prompt))
+        fixed_tokens = self._count_tokens(fixed, model_id, provider)
+        fixed_tokens += self._count_tokens(tail, model_id, provider)
+        # Rolling summary of compacted turns; only used when turns drop
+        summary_block = (
+            "\n\n# Earlier conversation (summary)\n" + history_summary
+            if history_summary
+            else ""
+        )
+        summary_tokens = self._count_tokens(summary_block, model_id, provider)
+        window = build_window(
+            messages,
+            model_id=model_id or "",
+            provider=provider,
+            budget_tokens=(
+                max(0, budget_tokens - fixed_tokens - summary_tokens)
+                if budget_tokens
+                else None
+            ),
+            session_id=session_id,
+        )
+        if window.dropped and summary_block:
+            fixed = (
+                render_message("system", system_msg)
+                + render_message("developer", dev_block + summary_block)
+            )
+            fixed_tokens += summary_tokens
+        assembled = fixed + window.text + tail
+        prompt_tokens = fixed_tokens + window.tokens
         sp_hash = (
             hashlib.sha256(system_prompt_text.encode("utf-8")).hexdigest()[:16]
             if system_prompt_text
             else None
         )
-        return assembled, prompt_tokens, sp_hash
+        return assembled, prompt_tokens, sp_hash, window
 
     def prepare(
         self,
@@ -137,6 +171,10 @@ class PrimaryPipeline(GenerationPipeline):  # pragma: no cover
         passport_defaults: dict,
         sampling_origin: str | None,
         reasoning_max_tokens: int | None = None,
+        session_id: str | None = None,
+        history_store: Any = None,
+        summarizer: Any = None,
+        speculative: Any = None,
     ) -> PipelineContext:  # noqa: D401
         base_kwargs = dict(user_sampling)
         cap_applied = False
@@ -217,7 +255,17 @@ class PrimaryPipeline(GenerationPipeline):  # pragma: no cover
         )
         dev_block = base_sp
         mi = provider.info()
-        harmony_prompt, sp_version, sp_hash = self._build_harmony_prompt(
+        summary = (
+            history_store.get_summary(session_id)
+            if history_store is not None and session_id
+            else None
+        )
+        (
+            harmony_prompt,
+            prompt_tokens,
+            sp_hash,
+            window,
+        ) = self._build_harmony_prompt(
             system_prompt_text=base_sp,
             dev_block_text=dev_block,
             reasoning_mode=reasoning_mode,
@@ -225,8 +273,35 @@ class PrimaryPipeline(GenerationPipeline):  # pragma: no cover
             user_prompt=prompt,
             context_length=getattr(mi, "context_length", None),
             reserved_output_tokens=effective_max,
+            model_id=model_id,
+            provider=provider,
+            session_id=session_id,
+            history_summary=summary.text if summary else None,
         )
-        adapter = HarmonyChannelAdapter(getattr(llm_cfg, "postproc", {}))
+        if window.dropped and session_id and history_store is not None:
+            compactor = get_compactor()
+            if compactor is not None and summarizer is not None:
+                # Off the request path: folded into the next turn's prompt
+                compactor.submit(
+                    session_id, window.dropped, history_store, summarizer
+                )
+        sp_version = prompt_tokens  # legacy: version slot carried the count
+        postproc = getattr(llm_cfg, "postproc", {}) or {}
+        if postproc.get("token_ids", True) and callable(
+            getattr(provider, "harmony_vocab", None)
+        ):
+            # Vocab bound at stream time (needs the loaded model)
+            adapter = HarmonyTokenAdapter(postproc)
+        else:
+            adapter = HarmonyChannelAdapter(postproc)
+        budget_mode = str(
+            (postproc.get("reasoning", {}) or {}).get("budget_mode", "hard")
+        )
+        reasoning_budget = None
+        if budget_mode == "hard" and reasoning_max_tokens:
+            reasoning_budget = ReasoningBudget(
+                max_tokens=int(reasoning_max_tokens)
+            )
         try:
             adapter.set_context(  # type: ignore[attr-defined]
                 request_id=request_id,
@@ -250,9 +325,10 @@ class PrimaryPipeline(GenerationPipeline):  # pragma: no cover
             provider=provider,
             prompt=harmony_prompt,
             sampling=sampling_struct,
+            session_id=session_id,
             adapter=adapter,
             adapter_name="harmony",
-            prompt_tokens=self._approx_tokens(harmony_prompt),
+            prompt_tokens=prompt_tokens,
             system_prompt_version=sp_version,
             system_prompt_hash=sp_hash,
             sampling_origin=sampling_origin,
@@ -262,6 +338,10 @@ class PrimaryPipeline(GenerationPipeline):  # pragma: no cover
             requested_max_tokens=requested_max,
             effective_max_tokens=effective_max,
             reasoning_mode=reasoning_mode,
+            reasoning_budget=reasoning_budget,
+            decode_outcome=DecodeOutcome(),
+            speculative=speculative,
+            history_window=window,
             system_prompt_text=base_sp,
             user_prompt=prompt,
         )
@@ -310,17 +390,77 @@ class PrimaryPipeline(GenerationPipeline):  # pragma: no cover
         )
         return ctx
 
-    def stream(self, ctx: PipelineContext):  # noqa: D401
-        provider = ctx.provider
+    def _provider_kwargs(self, ctx: PipelineContext) -> dict:
+        kwargs = dict(ctx.merged_sampling or {})
+        if ctx.session_id:
+            kwargs["session_id"] = ctx.session_id
+        cancel = self._cancel_handle(ctx)
+        if cancel is not None:
+            kwargs["cancel_event"] = cancel
+        if ctx.decode_outcome is not None:
+            kwargs["decode_outcome"] = ctx.decode_outcome
+        if ctx.speculative is not None:
+            kwargs["speculative"] = ctx.speculative
+        return kwargs
+
+    @staticmethod
+    def _cancel_handle(ctx: PipelineContext) -> Any:
+        from mia4.api import abort_registry  # local import to avoid cycles
+
+        return abort_registry.get(ctx.request_id)
+
+    @staticmethod
+    def _bind_token_vocab(ctx: PipelineContext) -> bool:
+        """Switch the adapter to token-id parsing when the model allows."""
         adapter = ctx.adapter
-    # If provider is a stub (internal llama stub or our
-    # deterministic stub), wrap its raw token stream into a
-    # Harmony final channel so the adapter emits token events
-    # for SSE API.
+        if not isinstance(adapter, HarmonyTokenAdapter):
+            return False
         try:
-            is_internal_stub = getattr(
-                getattr(provider, "_state", None), "stub", False
-            )
+            vocab = ctx.provider.harmony_vocab()
+        except Exception:  # noqa: BLE001
+            vocab = None
+        if vocab is None:
+            return False
+        adapter.bind_vocab(vocab)
+        return True
+
+    def _open_stream(self, ctx: PipelineContext, **extra: Any):
+        # Decode is owned by the provider's scheduler (one decode loop per
+        # provider); pieces arrive through a per-request token queue.
+        return scheduled_stream(
+            ctx.provider,
+            ctx.model_id,
+            ctx.request_id,
+            ctx.prompt,
+            **self._provider_kwargs(ctx),
+            **extra,
+        )
+
+    def _open_astream(self, ctx: PipelineContext, **extra: Any):
+        # Same scheduler, pieces delivered on the caller's event loop
+        return scheduled_astream(
+            ctx.provider,
+            ctx.model_id,
+            ctx.request_id,
+            ctx.prompt,
+            **self._provider_kwargs(ctx),
+            **extra,
+        )
+
+    @staticmethod
+    def _close_stream(raw_stream: Any) -> None:
+        close = getattr(raw_stream, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception:  # noqa: BLE001
+                pass
+
+    @staticmethod
+    def _is_stub(provider: Any) -> bool:
+        try:
+            if getattr(getattr(provider, "_state", None), "stub", False):
+                return True
             meta = {}
             try:
                 info_meta = getattr(provider.info(), "metadata", None)
@@ -328,47 +468,93 @@ class PrimaryPipeline(GenerationPipeline):  # pragma: no cover
                     meta = info_meta
             except Exception:  # noqa: BLE001
                 pass
-            is_stub_provider = bool(meta.get("stub")) or (
+            return bool(meta.get("stub")) or (
                 getattr(provider.__class__, "__name__", "")
                 == "_StubProvider"
             )
-            if is_internal_stub or is_stub_provider:
-                from mia4.api import abort_registry  # local import
-                # Open final channel
-                for ev in adapter.process_chunk(
-                    "<|start|>assistant<|channel|>final<|message|>"
-                ):
-                    yield ev
-                # Pipe raw tokens through adapter as content
-                raw_stream = provider.stream(
-                    ctx.prompt, **(ctx.merged_sampling or {})
-                )
-                for chunk in raw_stream:
-                    if abort_registry.is_aborted(ctx.request_id):
-                        raise RuntimeError("aborted")
-                    for ev in adapter.process_chunk(chunk):
-                        yield ev
-                # Close channel
-                for ev in adapter.process_chunk("<|return|>"):
-                    yield ev
-                for ev in adapter.finalize():  # type: ignore[attr-defined]
-                    yield ev
-                return
         except Exception:  # noqa: BLE001
-            pass
-        raw_stream = provider.stream(ctx.prompt, **(ctx.merged_sampling or {}))
-        # Simple passthrough loop; adapter already harmony
-        from mia4.api import abort_registry  # local import to avoid cycles
-        for chunk in raw_stream:
-            # Abort fast-path (checked per provider chunk)
-            if abort_registry.is_aborted(ctx.request_id):
-                raise RuntimeError("aborted")
-            for ev in adapter.process_chunk(  # type: ignore[attr-defined]
-                chunk
-            ):
+            return False
+
+    def _stream_plan(self, ctx: PipelineContext) -> tuple[bool, bool, dict]:
+        """(stub wrap, token-id mode, extra provider kwargs) for a stream.
+
+        Stub providers (internal llama stub or the deterministic stub)
+        emit plain text; it is wrapped into a Harmony final channel so the
+        adapter still produces token events for the SSE API. Token-id mode:
+        the provider yields ``(token_id, piece)`` and the adapter switches
+        channels on special-token ids.
+        """
+        if self._is_stub(ctx.provider):
+            return True, False, {}
+        token_ids = self._bind_token_vocab(ctx)
+        extra: dict = {}
+        if token_ids:
+            extra["with_token_ids"] = True
+            # Hard reasoning budget: provider cuts analysis over to final
+            if ctx.reasoning_budget is not None:
+                extra["reasoning_budget"] = ctx.reasoning_budget
+        elif ctx.reasoning_budget is not None:
+            # Text decode cannot cut over: only the soft trim applies
+            ctx.reasoning_budget.unenforced = "text_path"
+            metrics.inc(
+                "reasoning_budget_unenforced_total",
+                {"model": ctx.model_id, "reason": "text_path"},
+            )
+        return False, token_ids, extra
+
+    @staticmethod
+    def _chunk_events(adapter: Any, chunk: Any, token_ids: bool):
+        if token_ids:
+            return adapter.process_token(*chunk)
+        # SSOT: never emit raw fallback fragments; the adapter waits for
+        # structured channel events to avoid leaking Harmony markers.
+        return adapter.process_chunk(chunk)  # type: ignore
+
+    @staticmethod
+    def _check_cancel(cancel: Any) -> None:
+        # Lock-free Event check per provider chunk; the handle also wakes
+        # the token queue and stops decode
+        if cancel is not None and cancel.is_set():
+            raise RuntimeError("aborted")
+
+    def stream(self, ctx: PipelineContext):  # noqa: D401
+        adapter = ctx.adapter
+        stub, token_ids, extra = self._stream_plan(ctx)
+        if stub:
+            yield from adapter.process_chunk(_STUB_OPEN)
+        cancel = self._cancel_handle(ctx)
+        raw_stream = self._open_stream(ctx, **extra)
+        try:
+            for chunk in raw_stream:
+                self._check_cancel(cancel)
+                yield from self._chunk_events(adapter, chunk, token_ids)
+        finally:
+            self._close_stream(raw_stream)
+        self._check_cancel(cancel)
+        if stub:
+            yield from adapter.process_chunk("<|return|>")
+        yield from adapter.finalize()  # type: ignore[attr-defined]
+
+    async def astream(self, ctx: PipelineContext):  # noqa: D401
+        """Async ``stream``: same events, pieces awaited on the loop."""
+        adapter = ctx.adapter
+        stub, token_ids, extra = self._stream_plan(ctx)
+        if stub:
+            for ev in adapter.process_chunk(_STUB_OPEN):
+                yield ev
+        cancel = self._cancel_handle(ctx)
+        raw_stream = self._open_astream(ctx, **extra)
+        try:
+            async for chunk in raw_stream:
+                self._check_cancel(cancel)
+                for ev in self._chunk_events(adapter, chunk, token_ids):
+                    yield ev
+        finally:
+            await raw_stream.aclose()
+        self._check_cancel(cancel)
+        if stub:
+            for ev in adapter.process_chunk("<|return|>"):
                 yield ev
-            # SSOT: never emit raw fallback fragments; wait for structured
-            # channel events to avoid leaking Harmony service markers.
         for ev in adapter.finalize():  # type: ignore[attr-defined]
             yield ev
 
@@ -429,6 +615,10 @@ class PrimaryPipeline(GenerationPipeline):  # pragma: no cover
             "cap_source": ctx.cap_source,
         }
         stop_reason = ctx.stop_hit and "stop_sequence" or None
+        outcome = ctx.decode_outcome
+        if stop_reason is None and outcome is not None:
+            if outcome.stop_reason == "repetition":
+                stop_reason = "repetition"
         # Base usage
         usage = {
             "prompt_tokens": ctx.prompt_tokens,
@@ -469,6 +659,24 @@ class PrimaryPipeline(GenerationPipeline):  # pragma: no cover
                     ),
                 }
             )
+        budget = ctx.reasoning_budget
+        if budget is not None and budget.enforced:
+            usage.update(
+                {
+                    "reasoning_cutover": budget.cutover,
+                    "decode_tokens_unused_budget": (
+                        budget.decode_tokens_unused_budget
+                    ),
+                }
+            )
+        if budget is not None and budget.unenforced:
+            usage["reasoning_budget_unenforced"] = budget.unenforced
+        spec = ctx.speculative
+        if spec is not None and spec.enabled:
+            usage["speculative"] = spec.summary()
+        window = ctx.history_window
+        if window is not None and window.dropped:
+            usage["history_dropped"] = len(window.dropped)
         usage = {k: v for k, v in usage.items() if v is not None}
         result_summary = {"sampling": sampling_summary}
         if ctx.reasoning_stats:
@@ -529,5 +737,5 @@ class PrimaryPipeline(GenerationPipeline):  # pragma: no cover
         )
 
 
-__all__ = ["PrimaryPipeline"]
+__all__ = ["PrimaryPipeline", "harmony_prefix"]
 
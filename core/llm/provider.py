@@ -8,7 +8,7 @@ from __future__ import annotations
 
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Iterable, Dict, Any
+from typing import AsyncIterator, Iterable, Dict, Any
 from .types import GenerationResult
 # No direct event imports needed at interface level.
 
@@ -24,6 +24,11 @@ class ModelInfo:
 
 
 class ModelProvider(ABC):
+    # Decode sequences the scheduler may time-slice on this provider (see
+    # core.llm.scheduler; steps never run in parallel). A single llama.cpp
+    # context holds one sequence.
+    decode_slots: int = 1
+
     @abstractmethod
     def load(self) -> None:
         """Load underlying model weights/resources (idempotent)."""
@@ -36,6 +41,19 @@ class ModelProvider(ABC):
     def stream(self, prompt: str, **kwargs: Any) -> Iterable[str]:
         """Yield incremental text chunks."""
 
+    async def astream(self, prompt: str, **kwargs: Any) -> AsyncIterator[Any]:
+        """Async ``stream`` bridged from a decode thread.
+
+        Pieces reach the event loop through a bounded queue, so a slow
+        consumer blocks decode instead of buffering without limit.
+        """
+        from .async_bridge import aiter_thread
+
+        async for item in aiter_thread(
+            lambda: self.stream(prompt, **kwargs)
+        ):
+            yield item
+
     @abstractmethod
     def info(self) -> ModelInfo:
         """Return static model information."""
@@ -0,0 +1,130 @@
+"""Streaming degenerate-loop detector for the decode loop.
+
+Summary:
+* Fed one integer key per decoded token (the token id, or a hash of the
+    text piece on the text path). Work per token is O(max_period) and
+    memory is bounded by the rolling window.
+* Periodic suffix: for every period ``p <= max_period`` the detector keeps
+    the length of the current run where ``tok[i] == tok[i - p]``. A run
+    covering ``min_repeats`` whole periods (and at least
+    ``min_span_tokens`` tokens) is a loop (``kind="period"``).
+* Rolling n-gram hashes: a polynomial hash of the last ``ngram`` tokens is
+    counted over the last ``window`` tokens. One n-gram seen
+    ``ngram_repeats`` times flags looser loops, e.g. periods longer than
+    ``max_period`` or cycles with small drift (``kind="ngram"``).
+* ``build_detector()`` reads ``llm.repetition``. It returns None when the
+    detector is disabled.
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import Any
+
+_MOD = (1 << 61) - 1
+_BASE = 1_000_003
+
+
+class RepetitionDetector:
+    """Incremental loop detector (see module docstring)."""
+
+    def __init__(
+        self,
+        *,
+        window: int = 512,
+        ngram: int = 16,
+        ngram_repeats: int = 4,
+        max_period: int = 64,
+        min_repeats: int = 4,
+        min_span_tokens: int = 48,
+    ) -> None:
+        self._window = max(2, int(window))
+        self._n = max(2, int(ngram))
+        self._ngram_repeats = max(2, int(ngram_repeats))
+        self._max_period = max(1, int(max_period))
+        self._min_repeats = max(2, int(min_repeats))
+        self._min_span = max(2, int(min_span_tokens))
+        size = max(self._window, self._max_period, self._n) + 1
+        self._ring: list[int] = [0] * size
+        self._size = size
+        self._count = 0
+        self._runs = [0] * (self._max_period + 1)
+        self._hash = 0
+        self._drop_pow = pow(_BASE, self._n - 1, _MOD)
+        self._hashes: deque[int] = deque()
+        self._seen: dict[int, int] = {}
+        self.kind: str | None = None
+        self.period: int | None = None
+
+    @property
+    def tokens(self) -> int:
+        return self._count
+
+    def feed(self, key: int) -> bool:
+        """Add one token; True once a loop has been detected."""
+        if self.kind is not None:
+            return True
+        key %= _MOD
+        ring, size, count = self._ring, self._size, self._count
+        # periodic suffix: run lengths of tok[i] == tok[i - p]
+        runs = self._runs
+        for p in range(1, min(self._max_period, count) + 1):
+            if ring[(count - p) % size] == key:
+                runs[p] += 1
+                need = max((self._min_repeats - 1) * p, self._min_span - p)
+                if runs[p] >= need:
+                    self.kind, self.period = "period", p
+            else:
+                runs[p] = 0
+        # rolling n-gram hash over the last n tokens
+        h = self._hash
+        if count >= self._n:
+            h = (h - ring[(count - self._n) % size] * self._drop_pow) % _MOD
+        h = (h * _BASE + key) % _MOD
+        self._hash = h
+        ring[count % size] = key
+        self._count = count + 1
+        if self._count >= self._n:
+            seen = self._seen
+            hits = seen.get(h, 0) + 1
+            seen[h] = hits
+            self._hashes.append(h)
+            if len(self._hashes) > self._window - self._n + 1:
+                old = self._hashes.popleft()
+                left = seen[old] - 1
+                if left:
+                    seen[old] = left
+                else:
+                    del seen[old]
+            if hits >= self._ngram_repeats and self.kind is None:
+                self.kind = "ngram"
+        return self.kind is not None
+
+
+def _config() -> dict:
+    try:
+        from core.config import get_config
+
+        return dict(getattr(get_config().llm, "repetition", {}) or {})
+    except Exception:  # noqa: BLE001
+        return {}
+
+
+def build_detector(**overrides: Any) -> RepetitionDetector | None:
+    """Detector configured from ``llm.repetition`` (None when disabled)."""
+    cfg = {**_config(), **overrides}
+    if not cfg.pop("enabled", True):
+        return None
+    known = (
+        "window",
+        "ngram",
+        "ngram_repeats",
+        "max_period",
+        "min_repeats",
+        "min_span_tokens",
+    )
+    return RepetitionDetector(
+        **{k: cfg[k] for k in known if cfg.get(k) is not None}
+    )
+
+
+__all__ = ["RepetitionDetector", "build_detector"]
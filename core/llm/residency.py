@@ -0,0 +1,420 @@
+"""Memory-budget model residency (which providers stay loaded).
+
+Summary:
+* Every loaded model has a ``Footprint``: weights (the GGUF file is mapped
+    whole, so its size) plus the KV cache for its ``n_ctx``
+    (``2 * n_layer * n_ctx * n_head_kv * head_dim * kv_type_bytes``) plus a
+    fixed compute overhead. Layer / head counts come from the GGUF header
+    (``GGUFInfo.facts()``); without them a per-token KV default is used.
+    Providers may report their own footprint (``footprint_bytes()``), which
+    is how stub providers in tests fake sizes. The speculative draft model
+    also carries its draft context's KV (``n_ctx`` passed by the caller).
+* ``ResidencyManager.admit`` registers a model about to load and picks
+    victims until the total fits the budget: pinned roles (primary) are
+    never evicted, the rest go lowest priority first, then least recently
+    used. Victims are evicted through the caller's callback outside the
+    lock. If the model cannot fit even after evicting every candidate it
+    still loads (over budget is reported, not refused).
+* Models that are busy (``busy(model_id)``: a decode in progress) are
+    never picked as victims; a victim whose ``evict`` callback returns
+    False (it became busy meanwhile) is kept and re-registered. Such a
+    model is only evicted by a later ``admit`` once it is idle.
+* A model handed out (``touch``) less than ``handout_grace_s`` ago is
+    not a victim either: its caller holds the provider but may not have
+    submitted a decode yet.
+* Budget: ``llm.residency.budget_gb`` or, when 0, ``ram_fraction`` of the
+    physical RAM (unknown RAM -> unlimited).
+* Config ``llm.residency``: enabled, budget_gb, ram_fraction, pinned_roles,
+    priorities, kv_type_bytes, kv_bytes_per_token, overhead_mb,
+    handout_grace_s.
+* Metrics: model_residency_evictions_total{model,reason},
+    model_residency_eviction_skipped_total{model,reason},
+    model_residency_over_budget_total{model}.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Iterable, Mapping
+import os
+import sys
+import time
+
+from core import metrics
+
+_MIB = 1024 * 1024
+_GIB = 1024 * _MIB
+
+
+def _config() -> dict:
+    try:
+        from core.config import get_config
+
+        return dict(getattr(get_config().llm, "residency", {}) or {})
+    except Exception:  # noqa: BLE001
+        return {}
+
+
+def total_ram_bytes() -> int | None:
+    """Physical RAM in bytes (None when it cannot be determined)."""
+    try:
+        pages = os.sysconf("SC_PHYS_PAGES")
+        page = os.sysconf("SC_PAGE_SIZE")
+        if pages > 0 and page > 0:
+            return int(pages * page)
+    except (AttributeError, OSError, ValueError):
+        pass
+    if sys.platform == "win32":  # pragma: no cover - platform specific
+        try:
+            import ctypes
+
+            class _MemStatus(ctypes.Structure):
+                _fields_ = [
+                    ("dwLength", ctypes.c_ulong),
+                    ("dwMemoryLoad", ctypes.c_ulong),
+                    ("ullTotalPhys", ctypes.c_ulonglong),
+                    ("ullAvailPhys", ctypes.c_ulonglong),
+                    ("ullTotalPageFile", ctypes.c_ulonglong),
+                    ("ullAvailPageFile", ctypes.c_ulonglong),
+                    ("ullTotalVirtual", ctypes.c_ulonglong),
+                    ("ullAvailVirtual", ctypes.c_ulonglong),
+                    ("sullAvailExtendedVirtual", ctypes.c_ulonglong),
+                ]
+
+            status = _MemStatus()
+            status.dwLength = ctypes.sizeof(_MemStatus)
+            if ctypes.windll.kernel32.GlobalMemoryStatusEx(
+                ctypes.byref(status)
+            ):
+                return int(status.ullTotalPhys)
+        except Exception:  # noqa: BLE001
+            pass
+    return None
+
+
+@dataclass(slots=True)
+class Footprint:
+    """Estimated resident bytes of one loaded model."""
+
+    weights_bytes: int
+    kv_bytes: int = 0
+    overhead_bytes: int = 0
+    source: str = "estimate"  # provider | metadata | estimate
+
+    @property
+    def total(self) -> int:
+        return self.weights_bytes + self.kv_bytes + self.overhead_bytes
+
+    def as_dict(self) -> dict:
+        return {
+            "weights_bytes": self.weights_bytes,
+            "kv_bytes": self.kv_bytes,
+            "overhead_bytes": self.overhead_bytes,
+            "total_bytes": self.total,
+            "source": self.source,
+        }
+
+
+def kv_bytes_per_token(
+    facts: Mapping[str, Any] | None, kv_type_bytes: int = 2
+) -> int | None:
+    """K+V bytes per context token from model facts (None if unknown)."""
+    if not facts:
+        return None
+    try:
+        layers = int(facts["block_count"])
+        heads = int(facts.get("head_count") or 0)
+        heads_kv = int(facts.get("head_count_kv") or heads)
+        head_dim = facts.get("key_length")
+        if not head_dim:
+            head_dim = int(facts["embedding_length"]) // max(1, heads)
+        head_dim = int(head_dim)
+    except (KeyError, TypeError, ValueError):
+        return None
+    if layers <= 0 or heads_kv <= 0 or head_dim <= 0:
+        return None
+    return 2 * layers * heads_kv * head_dim * int(kv_type_bytes)
+
+
+def estimate_footprint(
+    model_path: str | Path | None,
+    n_ctx: int,
+    *,
+    facts: Mapping[str, Any] | None = None,
+    kv_type_bytes: int = 2,
+    default_kv_bytes_per_token: int = 131072,
+    overhead_bytes: int = 0,
+) -> Footprint:
+    """Weights (file size) + KV cache for ``n_ctx`` + overhead."""
+    weights = 0
+    if model_path:
+        try:
+            weights = Path(model_path).stat().st_size
+        except (OSError, ValueError):
+            weights = 0
+    per_token = kv_bytes_per_token(facts, kv_type_bytes)
+    source = "metadata" if per_token else "estimate"
+    if not per_token:
+        per_token = int(default_kv_bytes_per_token)
+    return Footprint(
+        weights_bytes=int(weights),
+        kv_bytes=int(per_token) * max(0, int(n_ctx or 0)),
+        overhead_bytes=int(overhead_bytes),
+        source=source,
+    )
+
+
+@dataclass(slots=True)
+class _Resident:
+    model_id: str
+    role: str
+    footprint: Footprint
+    pinned: bool
+    priority: int
+    last_used: float
+
+
+class ResidencyManager:
+    """Tracks resident models against a byte budget (see module doc)."""
+
+    def __init__(
+        self,
+        budget_bytes: int | None,
+        *,
+        pinned_roles: Iterable[str] = ("primary",),
+        priorities: Mapping[str, int] | None = None,
+        handout_grace_s: float = 0.0,
+    ) -> None:
+        self.budget_bytes = (
+            int(budget_bytes) if budget_bytes and budget_bytes > 0 else None
+        )
+        self.handout_grace_s = max(0.0, float(handout_grace_s or 0.0))
+        self._pinned_roles = frozenset(pinned_roles or ())
+        self._priorities = dict(priorities or {})
+        self._entries: OrderedDict[str, _Resident] = OrderedDict()
+        self._lock = Lock()
+
+    # --- accounting ----------------------------------------------------------
+    @property
+    def used_bytes(self) -> int:
+        with self._lock:
+            return sum(e.footprint.total for e in self._entries.values())
+
+    def __contains__(self, model_id: object) -> bool:
+        return model_id in self._entries
+
+    def touch(self, model_id: str) -> None:
+        """Mark ``model_id`` as just used (LRU order)."""
+        with self._lock:
+            entry = self._entries.get(model_id)
+            if entry is not None:
+                entry.last_used = time.time()
+                self._entries.move_to_end(model_id)
+
+    def release(self, model_id: str) -> bool:
+        with self._lock:
+            return self._entries.pop(model_id, None) is not None
+
+    def _victims(
+        self,
+        model_id: str,
+        need: int,
+        busy: Callable[[str], bool] | None = None,
+        skipped: list[tuple[str, str]] | None = None,
+    ) -> list[str]:
+        budget = self.budget_bytes
+        if budget is None:
+            return []
+        used = sum(
+            e.footprint.total
+            for mid, e in self._entries.items()
+            if mid != model_id
+        )
+        if used + need <= budget:
+            return []
+        # entries are kept in LRU order; sort is stable within a priority
+        candidates = sorted(
+            (
+                e for mid, e in self._entries.items()
+                if mid != model_id and not e.pinned
+            ),
+            key=lambda e: e.priority,
+        )
+        victims: list[str] = []
+        recent = time.time() - self.handout_grace_s
+        for entry in candidates:
+            if used + need <= budget:
+                break
+            reason = None
+            if busy is not None and busy(entry.model_id):
+                reason = "busy"
+            elif self.handout_grace_s and entry.last_used > recent:
+                reason = "recent"
+            if reason is not None:
+                if skipped is not None:
+                    skipped.append((entry.model_id, reason))
+                continue
+            victims.append(entry.model_id)
+            used -= entry.footprint.total
+        return victims
+
+    def plan(self, model_id: str, footprint: Footprint) -> list[str]:
+        """Ids that ``admit`` would evict for ``footprint`` (no changes)."""
+        with self._lock:
+            return self._victims(model_id, footprint.total)
+
+    def admit(
+        self,
+        model_id: str,
+        role: str,
+        footprint: Footprint,
+        evict: Callable[[str], Any] | None = None,
+        busy: Callable[[str], bool] | None = None,
+    ) -> list[str]:
+        """Register ``model_id``; evict (via ``evict``) to fit the budget.
+
+        Returns the evicted ids. Victims are dropped from the accounting
+        before ``evict`` runs, so the callback may call ``release``; an
+        ``evict`` returning False keeps its model (re-registered). Models
+        for which ``busy`` is true are skipped.
+        """
+        skipped: list[tuple[str, str]] = []
+        with self._lock:
+            victims = self._victims(
+                model_id, footprint.total, busy, skipped
+            )
+            removed = {mid: self._entries.pop(mid) for mid in victims}
+            self._entries[model_id] = _Resident(
+                model_id=model_id,
+                role=role,
+                footprint=footprint,
+                pinned=role in self._pinned_roles,
+                priority=int(self._priorities.get(role, 0)),
+                last_used=time.time(),
+            )
+            self._entries.move_to_end(model_id)
+        evicted: list[str] = []
+        for mid in victims:
+            kept = False
+            if evict is not None:
+                try:
+                    kept = evict(mid) is False
+                except Exception:  # noqa: BLE001
+                    pass
+            if kept:
+                skipped.append((mid, "busy"))
+                with self._lock:
+                    if mid not in self._entries:
+                        self._entries[mid] = removed[mid]
+                        self._entries.move_to_end(mid, last=False)
+                continue
+            evicted.append(mid)
+            metrics.inc(
+                "model_residency_evictions_total",
+                {"model": mid, "reason": "budget"},
+            )
+        for mid, reason in skipped:
+            metrics.inc(
+                "model_residency_eviction_skipped_total",
+                {"model": mid, "reason": reason},
+            )
+        used = self.used_bytes
+        if self.budget_bytes is not None and used > self.budget_bytes:
+            metrics.inc(
+                "model_residency_over_budget_total", {"model": model_id}
+            )
+        return evicted
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            entries = list(self._entries.values())
+        used = sum(e.footprint.total for e in entries)
+        return {
+            "budget_bytes": self.budget_bytes,
+            "used_bytes": used,
+            "free_bytes": (
+                None if self.budget_bytes is None
+                else self.budget_bytes - used
+            ),
+            # least recently used first (eviction order within a priority)
+            "models": [
+                {
+                    "id": e.model_id,
+                    "role": e.role,
+                    "pinned": e.pinned,
+                    "priority": e.priority,
+                    "last_used": e.last_used,
+                    **e.footprint.as_dict(),
+                }
+                for e in entries
+            ],
+        }
+
+
+def build_manager(**overrides: Any) -> ResidencyManager | None:
+    """Manager configured from ``llm.residency`` (None when disabled)."""
+    cfg = {**_config(), **overrides}
+    if not cfg.get("enabled", True):
+        return None
+    budget_gb = float(cfg.get("budget_gb") or 0)
+    if budget_gb > 0:
+        budget: int | None = int(budget_gb * _GIB)
+    else:
+        ram = total_ram_bytes()
+        fraction = float(cfg.get("ram_fraction", 0.8) or 0)
+        budget = int(ram * fraction) if ram and fraction > 0 else None
+    return ResidencyManager(
+        budget,
+        pinned_roles=cfg.get("pinned_roles") or ("primary",),
+        priorities=cfg.get("priorities") or {},
+        handout_grace_s=float(cfg.get("handout_grace_s", 10.0) or 0.0),
+    )
+
+
+def provider_footprint(
+    provider: Any,
+    *,
+    facts: Mapping[str, Any] | None = None,
+    model_path: str | Path | None = None,
+    n_ctx: int | None = None,
+) -> Footprint:
+    """Footprint of ``provider``: self-reported, else estimated."""
+    report = getattr(provider, "footprint_bytes", None)
+    if callable(report):
+        try:
+            value = report()
+            if value is not None:
+                return Footprint(weights_bytes=int(value), source="provider")
+        except Exception:  # noqa: BLE001
+            pass
+    cfg = _config()
+    if model_path is None:
+        model_path = getattr(provider, "_model_path", None)
+    if n_ctx is None:
+        try:
+            n_ctx = int(provider.info().context_length)
+        except Exception:  # noqa: BLE001
+            n_ctx = 0
+    return estimate_footprint(
+        model_path,
+        n_ctx or 0,
+        facts=facts,
+        kv_type_bytes=int(cfg.get("kv_type_bytes", 2) or 2),
+        default_kv_bytes_per_token=int(
+            cfg.get("kv_bytes_per_token", 131072) or 0
+        ),
+        overhead_bytes=int(float(cfg.get("overhead_mb", 0) or 0) * _MIB),
+    )
+
+
+__all__ = [
+    "Footprint",
+    "ResidencyManager",
+    "build_manager",
+    "estimate_footprint",
+    "kv_bytes_per_token",
+    "provider_footprint",
+    "total_ram_bytes",
+]
@@ -0,0 +1,447 @@
+"""Decode scheduler: single owner of a provider's decode loop.
+
+Summary:
+* Concurrent requests used to drive the same provider (and therefore the
+    same llama.cpp context) from several threadpool threads at once. The
+    scheduler gives every provider exactly one worker thread that owns its
+    decode loop; requests are submitted and receive their pieces through a
+    per-request token queue.
+* This is a per-provider serializer, not batched decode: the worker runs
+    one provider step at a time, so there is no throughput gain over a
+    single stream. Sequences are admitted FIFO into at most ``slots``
+    active slots and stepped round-robin (one provider chunk per step);
+    with more than one slot that is time slicing for fairness and
+    backpressure, never parallel decode. The slot count is
+    ``min(llm.scheduler.max_active_sequences, provider.decode_slots)``;
+    llama.cpp providers keep the default ``decode_slots = 1`` (one context,
+    one sequence), i.e. strictly serialized decode in FIFO order.
+    Batched multi-sequence decode (one ``llama_batch`` over several KV
+    sequences) is not implemented; scope in ADR-0035.
+* Consumers that stop early (abort / disconnect) cancel their request; the
+    worker closes the provider stream at the next step. A ``cancel_event``
+    kwarg exposing ``add_callback`` (``abort_registry.CancelHandle``) wakes
+    the consumer immediately, even while a decode step is still running.
+* Worker threads are daemons and exit after ``idle_exit_s`` without work;
+    ``shutdown_all()`` (app shutdown) and ``reset_for_tests()`` stop them
+    at once, ending every pending and active sequence.
+* Async consumers (``scheduled_astream``) receive pieces on their event
+    loop; no thread is held per stream. Backpressure: a sequence whose
+    consumer has ``llm.scheduler.async_buffer`` pieces undelivered is
+    skipped by the worker until the consumer drains, so one slow client
+    never stalls the other active sequences.
+
+Metrics:
+    scheduler_queue_wait_ms{model}      submit -> first decode step
+    scheduler_active_sequences{model}   active slots observed per admit
+    scheduler_backpressure_waits_total{model}  all active consumers behind
+"""
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from queue import SimpleQueue
+from threading import Condition, Lock, RLock, Thread, current_thread
+from time import perf_counter
+from typing import Any, AsyncIterator, Callable, Iterator
+import weakref
+
+from core import metrics
+
+_DONE = object()
+
+
+@dataclass(slots=True)
+class DecodeRequest:
+    """One submitted sequence; iterate it to receive provider pieces."""
+
+    request_id: str
+    factory: Callable[[], Iterator[Any]]
+    submitted_at: float = field(default_factory=perf_counter)
+    queue: SimpleQueue = field(default_factory=SimpleQueue)
+    cancelled: bool = False
+    gen: Iterator[Any] | None = None
+    # async consumer: pieces are handed to ``aqueue`` on ``loop``
+    loop: Any | None = None
+    aqueue: Any | None = None
+    max_buffered: int = 0
+    buffered: int = 0
+    wake: Callable[[], None] | None = None
+    lock: Lock = field(default_factory=Lock)
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def interrupt(self) -> None:
+        """Cancel and wake the consumer even if decode is mid-step."""
+        self.cancelled = True
+        self.put(_DONE)
+
+    def put(self, item: Any) -> None:
+        """Deliver one item to the consumer (called from the worker)."""
+        if self.loop is None:
+            self.queue.put(item)
+            return
+        with self.lock:
+            self.buffered += 1
+        try:
+            self.loop.call_soon_threadsafe(self.aqueue.put_nowait, item)
+        except RuntimeError:  # event loop closed: consumer is gone
+            self.cancelled = True
+
+    @property
+    def blocked(self) -> bool:
+        """Async consumer is ``max_buffered`` pieces behind."""
+        return (
+            self.max_buffered > 0
+            and not self.cancelled
+            and self.buffered >= self.max_buffered
+        )
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        try:
+            while True:
+                item = await self.aqueue.get()
+                with self.lock:
+                    self.buffered -= 1
+                    drained = self.buffered == self.max_buffered - 1
+                if drained and self.wake is not None:
+                    self.wake()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.exc
+                yield item
+        finally:
+            self.cancel()
+            if self.wake is not None:
+                self.wake()  # let the worker close the sequence now
+
+    def __iter__(self) -> Iterator[Any]:
+        try:
+            while True:
+                item = self.queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, _Failure):
+                    raise item.exc
+                yield item
+        finally:
+            self.cancel()
+
+
+@dataclass(slots=True)
+class _Failure:
+    exc: BaseException
+
+
+class DecodeScheduler:
+    """Per-provider decode loop owner (see module docstring)."""
+
+    def __init__(
+        self,
+        model_id: str,
+        *,
+        slots: int = 1,
+        idle_exit_s: float = 30.0,
+    ) -> None:
+        self._model_id = model_id
+        self._slots = max(1, int(slots))
+        self._idle_exit_s = idle_exit_s
+        self._pending: deque[DecodeRequest] = deque()
+        self._active: list[DecodeRequest] = []
+        self._cond = Condition(Lock())
+        self._worker: Thread | None = None
+        self._stopping = False
+        with _REG_LOCK:
+            _ALL.add(self)
+
+    @property
+    def slots(self) -> int:
+        return self._slots
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "slots": self._slots,
+                "active": len(self._active),
+                "pending": len(self._pending),
+            }
+
+    def submit(
+        self,
+        request_id: str,
+        factory: Callable[[], Iterator[Any]],
+        *,
+        loop: Any | None = None,
+        max_buffered: int = 0,
+    ) -> DecodeRequest:
+        req = DecodeRequest(request_id=request_id, factory=factory)
+        if loop is not None:
+            req.loop = loop
+            req.aqueue = asyncio.Queue()
+            req.max_buffered = max(0, int(max_buffered))
+            req.wake = self._wake
+        with self._cond:
+            self._pending.append(req)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = Thread(
+                    target=self._run,
+                    name=f"decode-{self._model_id}",
+                    daemon=True,
+                )
+                self._worker.start()
+            self._cond.notify()
+        return req
+
+    def shutdown(self, timeout: float | None = 5.0) -> None:
+        """Stop the worker; pending and active sequences end early.
+
+        Consumers see the end of their stream. The scheduler stays usable:
+        a later ``submit`` starts a new worker.
+        """
+        with self._cond:
+            worker = self._worker
+            if worker is None:
+                return
+            self._stopping = True
+            self._cond.notify_all()
+        if worker is not current_thread():
+            worker.join(timeout)
+
+    # worker ---------------------------------------------------------------
+    def _admit(self) -> list[tuple[float, int]]:
+        """Move pending requests into free slots (caller holds ``_cond``).
+
+        Returns (queue wait ms, active count) per admitted request; the
+        caller records them once the lock is released.
+        """
+        admitted = []
+        while self._pending and len(self._active) < self._slots:
+            req = self._pending.popleft()
+            if req.cancelled:
+                req.put(_DONE)
+                continue
+            self._active.append(req)
+            admitted.append(
+                (
+                    (perf_counter() - req.submitted_at) * 1000.0,
+                    len(self._active),
+                )
+            )
+        return admitted
+
+    def _record(self, admitted: list[tuple[float, int]]) -> None:
+        labels = {"model": self._model_id}
+        for wait_ms, active in admitted:
+            metrics.observe("scheduler_queue_wait_ms", wait_ms, labels)
+            metrics.observe("scheduler_active_sequences", active, labels)
+
+    def _runnable(self) -> bool:
+        return self._stopping or any(
+            not req.blocked for req in self._active
+        )
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                admitted = self._admit()
+                if not self._active and not self._stopping:
+                    self._cond.wait(timeout=self._idle_exit_s)
+                    admitted += self._admit()
+                if self._stopping or not self._active:
+                    dropped = [*self._active, *self._pending]
+                    self._active.clear()
+                    self._pending.clear()
+                    self._worker = None
+                    self._stopping = False
+                    break
+                batch = [req for req in self._active if not req.blocked]
+            self._record(admitted)
+            if not batch:
+                # every consumer is behind: wait for one to drain
+                metrics.inc(
+                    "scheduler_backpressure_waits_total",
+                    {"model": self._model_id},
+                )
+                with self._cond:
+                    self._cond.wait_for(self._runnable, timeout=0.5)
+                continue
+            ended = []
+            for req in batch:
+                end = self._step(req)
+                if end is not None:
+                    ended.append((req, end))
+            if ended:
+                # leave the active set before the consumer sees the end,
+                # so decode_busy() is already false when its stream closes
+                with self._cond:
+                    for req, _end in ended:
+                        self._active.remove(req)
+                for req, end in ended:
+                    req.put(end)
+        self._record(admitted)
+        for req in dropped:
+            self._close(req)
+            req.put(_DONE)
+
+    def _step(self, req: DecodeRequest) -> Any:
+        """Advance ``req`` by one chunk.
+
+        Returns None while the sequence continues, else the final item
+        (end marker or failure) for the caller to deliver.
+        """
+        if req.cancelled:
+            self._close(req)
+            return _DONE
+        try:
+            if req.gen is None:
+                req.gen = iter(req.factory())
+            item = next(req.gen)
+        except StopIteration:
+            return _DONE
+        except BaseException as exc:  # noqa: BLE001
+            return _Failure(exc)
+        req.put(item)
+        return None
+
+    def _wake(self) -> None:
+        with self._cond:
+            self._cond.notify()
+
+    @staticmethod
+    def _close(req: DecodeRequest) -> None:
+        gen = req.gen
+        if gen is None:
+            return
+        try:
+            gen.close()  # type: ignore[attr-defined]
+        except Exception:  # noqa: BLE001
+            pass
+
+
+_ALL: "weakref.WeakSet[DecodeScheduler]" = weakref.WeakSet()
+_SCHEDULERS: "weakref.WeakKeyDictionary[Any, DecodeScheduler]" = (
+    weakref.WeakKeyDictionary()
+)
+_REG_LOCK = RLock()  # get_scheduler constructs under it
+
+
+def _config() -> dict:
+    try:
+        from core.config import get_config
+
+        return dict(getattr(get_config().llm, "scheduler", {}) or {})
+    except Exception:  # noqa: BLE001
+        return {}
+
+
+def get_scheduler(provider: Any, model_id: str) -> DecodeScheduler | None:
+    """Return the scheduler owning ``provider`` (None when disabled)."""
+    cfg = _config()
+    if not cfg.get("enabled", True):
+        return None
+    with _REG_LOCK:
+        try:
+            sched = _SCHEDULERS.get(provider)
+        except TypeError:  # provider not weak-referenceable
+            return None
+        if sched is None:
+            slots = min(
+                int(cfg.get("max_active_sequences", 4) or 1),
+                int(getattr(provider, "decode_slots", 1) or 1),
+            )
+            sched = DecodeScheduler(model_id, slots=slots)
+            _SCHEDULERS[provider] = sched
+        return sched
+
+
+def decode_busy(provider: Any) -> bool:
+    """True while ``provider``'s scheduler has pending or active sequences."""
+    with _REG_LOCK:
+        try:
+            sched = _SCHEDULERS.get(provider)
+        except TypeError:  # provider not weak-referenceable
+            return False
+    if sched is None:
+        return False
+    stats = sched.stats()
+    return bool(stats["active"] or stats["pending"])
+
+
+def scheduled_stream(
+    provider: Any,
+    model_id: str,
+    request_id: str,
+    prompt: str,
+    **kwargs: Any,
+) -> Iterator[Any]:
+    """``provider.stream`` routed through the provider's scheduler."""
+    sched = get_scheduler(provider, model_id)
+    if sched is None:
+        return iter(provider.stream(prompt, **kwargs))
+    req = sched.submit(
+        request_id, lambda: provider.stream(prompt, **kwargs)
+    )
+    add_callback = getattr(kwargs.get("cancel_event"), "add_callback", None)
+    if add_callback is not None:
+        add_callback(req.interrupt)
+    return iter(req)
+
+
+def scheduled_astream(
+    provider: Any,
+    model_id: str,
+    request_id: str,
+    prompt: str,
+    **kwargs: Any,
+) -> AsyncIterator[Any]:
+    """Async ``scheduled_stream``; call from the consuming event loop.
+
+    Without a scheduler the provider's own ``astream`` (thread bridge) is
+    used.
+    """
+    sched = get_scheduler(provider, model_id)
+    if sched is None:
+        astream = getattr(provider, "astream", None)
+        if astream is not None:
+            return astream(prompt, **kwargs)
+        from .async_bridge import aiter_thread
+
+        return aiter_thread(lambda: provider.stream(prompt, **kwargs))
+    req = sched.submit(
+        request_id,
+        lambda: provider.stream(prompt, **kwargs),
+        loop=asyncio.get_running_loop(),
+        max_buffered=int(_config().get("async_buffer", 32) or 0),
+    )
+    add_callback = getattr(kwargs.get("cancel_event"), "add_callback", None)
+    if add_callback is not None:
+        add_callback(req.interrupt)
+    return req.__aiter__()
+
+
+def shutdown_all(timeout: float | None = 5.0) -> None:
+    """Stop every scheduler's worker (app shutdown)."""
+    with _REG_LOCK:
+        schedulers = list(_ALL)
+    for sched in schedulers:
+        sched.shutdown(timeout)
+
+
+def reset_for_tests() -> None:  # pragma: no cover - test helper
+    shutdown_all(timeout=1.0)
+    with _REG_LOCK:
+        _SCHEDULERS.clear()
+
+
+__all__ = [
+    "DecodeRequest",
+    "DecodeScheduler",
+    "decode_busy",
+    "get_scheduler",
+    "scheduled_astream",
+    "scheduled_stream",
+    "shutdown_all",
+    "reset_for_tests",
+]
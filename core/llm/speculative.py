@@ -0,0 +1,366 @@
+"""Speculative decoding draft sources for the llama.cpp provider.
+
+Summary:
+* llama-cpp-python's ``Llama.generate`` consults ``llama.draft_model``:
+    called with the context token ids it returns proposed next ids, the
+    target evaluates them in one batch, samples every position and keeps
+    the proposal up to the first mismatch (the KV cache is rolled back
+    after it). The emitted sequence is what plain decode would sample; a
+    good draft only saves decode steps. Per-position sampling needs the
+    context built with ``logits_all`` (``llm.speculative.enabled``).
+* ``PromptLookupDraft``: n-gram prompt lookup, no second model. The last
+    ``ngram_max..ngram_min`` tokens are looked up in an incremental index
+    of the sequence so far and the tokens that followed their latest
+    earlier occurrence are proposed (cheap on CPU-only boxes; strong for
+    quoting, code edits and RAG answers).
+* ``ModelDraft``: a small model (the lightweight phi by default) drafts
+    greedily on its own context. With the same tokenizer ids pass through;
+    otherwise only the newly decoded text is tokenized for the draft each
+    step and the draft text is re-tokenized with the target tokenizer.
+    The draft sees a trailing window of at most ``n_ctx - k`` tokens
+    (``draft_context``); the window start only moves when it overflows,
+    then by half a window, so the draft's KV prefix stays reusable.
+* ``DraftRecorder`` wraps a source for one request: each proposal is
+    scored against the ids the target kept (the next call's context), the
+    totals land in ``types.SpeculativeRequest`` and in metrics. A source
+    that raises is disabled for the rest of the request (counted once as
+    ``draft_error``) and its draft model released.
+* Config ``llm.speculative``: enabled, target_roles, default_mode, k,
+    ngram_min, ngram_max, draft_model, load_draft, draft_context.
+* Metrics: speculative_draft_tokens_total{model,source},
+    speculative_accepted_tokens_total{model,source},
+    speculative_acceptance_pct{model,source} (histogram, per request),
+    speculative_unavailable_total{model,reason}.
+"""
+from __future__ import annotations
+
+from threading import Lock
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from core import metrics
+
+from .types import SpeculativeRequest
+
+MODES = ("off", "ngram", "draft")
+
+
+def speculative_config() -> dict:
+    try:
+        from core.config import get_config
+
+        return dict(getattr(get_config().llm, "speculative", {}) or {})
+    except Exception:  # noqa: BLE001
+        return {}
+
+
+def _as_ids(ids: List[int]) -> Any:
+    """Proposal in the form the binding expects (``np.ndarray``)."""
+    try:
+        import numpy as np  # type: ignore
+    except Exception:  # noqa: BLE001
+        return ids
+    return np.asarray(ids, dtype=np.intc)
+
+
+class PromptLookupDraft:
+    """Propose the continuation of the latest earlier n-gram match."""
+
+    source = "ngram"
+
+    def __init__(
+        self, k: int = 4, ngram_min: int = 1, ngram_max: int = 3
+    ) -> None:
+        self.k = max(1, int(k))
+        self.ngram_min = max(1, int(ngram_min))
+        self.ngram_max = max(self.ngram_min, int(ngram_max))
+        self._ids: List[int] = []
+        # (n-gram ids) -> index of the token that followed it, latest wins
+        self._index: Dict[Tuple[int, ...], int] = {}
+
+    def _extend(self, ids: Sequence[int]) -> None:
+        known = len(self._ids)
+        if len(ids) < known or (known and ids[known - 1] != self._ids[-1]):
+            self._ids, self._index, known = [], {}, 0  # rewound context
+        self._ids.extend(int(t) for t in ids[known:])
+        seq = self._ids
+        # index n-grams whose follower is known (end < len(seq))
+        for end in range(max(known, 1), len(seq)):
+            for size in range(self.ngram_min, self.ngram_max + 1):
+                if size > end:
+                    break
+                self._index[tuple(seq[end - size:end])] = end
+
+    def propose(self, ids: Sequence[int]) -> List[int]:
+        self._extend(ids)
+        seq = self._ids
+        n = len(seq)
+        for size in range(min(self.ngram_max, n), self.ngram_min - 1, -1):
+            pos = self._index.get(tuple(seq[n - size:]))
+            if pos is not None:
+                return seq[pos:pos + self.k]
+        return []
+
+
+def _same_vocab(target: Any, draft: Any) -> bool:
+    try:
+        if target.n_vocab() != draft.n_vocab():
+            return False
+        probe = "Speculative draft probe: 12345, привет!".encode("utf-8")
+        return list(target.tokenize(probe, add_bos=False)) == list(
+            draft.tokenize(probe, add_bos=False)
+        )
+    except Exception:  # noqa: BLE001
+        return False
+
+
+def _split_utf8(data: bytes) -> Tuple[bytes, bytes]:
+    """(complete UTF-8 prefix, trailing incomplete sequence)."""
+    for cut in range(1, min(4, len(data)) + 1):
+        lead = data[-cut]
+        if lead & 0xC0 != 0x80:  # first byte of the last sequence
+            need = 1
+            if lead >= 0xF0:
+                need = 4
+            elif lead >= 0xE0:
+                need = 3
+            elif lead >= 0xC0:
+                need = 2
+            if need > cut:
+                return data[:-cut], data[-cut:]
+            break
+    return data, b""
+
+
+class ModelDraft:
+    """Greedy drafts from a second model (own llama.cpp context)."""
+
+    source = "draft"
+
+    def __init__(
+        self, target: Any, draft: Any, k: int = 4, n_ctx: int | None = None
+    ) -> None:
+        self.k = max(1, int(k))
+        self._target = target
+        self._draft = draft
+        self.shared_vocab = _same_vocab(target, draft)
+        if n_ctx is None:
+            try:
+                n_ctx = int(draft.n_ctx())
+            except Exception:  # noqa: BLE001
+                n_ctx = None
+        # room for the k drafted tokens inside the draft context
+        self.window = max(1, n_ctx - self.k) if n_ctx else None
+        self._start = 0
+        # vocab bridge: target ids seen, draft ids of their text so far
+        self._ids: List[int] = []
+        self._draft_ids: List[int] = []
+        self._tail = b""  # incomplete UTF-8 bytes awaiting the next token
+
+    def _trailing(self, ids: List[int]) -> List[int]:
+        """Trailing window of ``ids`` that fits the draft context."""
+        window = self.window
+        if window is None:
+            return ids
+        if len(ids) < self._start:
+            self._start = 0
+        if len(ids) - self._start > window:
+            self._start = len(ids) - window // 2
+        return ids[self._start:]
+
+    def _greedy(self, ids: List[int]) -> List[int]:
+        out: List[int] = []
+        eos = self._draft.token_eos()
+        gen = self._draft.generate(self._trailing(ids), temp=0.0, top_k=1)
+        try:
+            for tid in gen:
+                if tid == eos:
+                    break
+                out.append(int(tid))
+                if len(out) >= self.k:
+                    break
+        finally:
+            close = getattr(gen, "close", None)
+            if close is not None:
+                close()
+        return out
+
+    def _draft_context(self, ids: Sequence[int]) -> List[int]:
+        """Draft-vocabulary ids for the target context ``ids``.
+
+        Only the text of target ids not seen before is tokenized.
+        """
+        known = len(self._ids)
+        if not known or len(ids) < known or list(ids[:known]) != self._ids:
+            self._ids, self._tail, known = [], b"", 0
+            # BOS (when the draft model adds one)
+            self._draft_ids = list(
+                self._draft.tokenize(b"", add_bos=True, special=True)
+            )
+            self._start = 0
+        fresh = [int(t) for t in ids[known:]]
+        if fresh:
+            self._ids.extend(fresh)
+            text, self._tail = _split_utf8(
+                self._tail + self._target.detokenize(fresh)
+            )
+            if text:
+                self._draft_ids.extend(
+                    self._draft.tokenize(text, add_bos=False, special=True)
+                )
+        return self._draft_ids
+
+    def propose(self, ids: Sequence[int]) -> List[int]:
+        if self.shared_vocab:
+            return self._greedy([int(t) for t in ids])
+        drafted = self._greedy(self._draft_context(ids))
+        if not drafted:
+            return []
+        piece = self._draft.detokenize(drafted)
+        return list(self._target.tokenize(piece, add_bos=False))[:self.k]
+
+
+class DraftRecorder:
+    """``draft_model`` callable for one request; scores its proposals."""
+
+    def __init__(
+        self,
+        source: Any,
+        request: SpeculativeRequest,
+        model_id: str,
+        release: Callable[[], None] | None = None,
+    ) -> None:
+        self.source = source
+        self.request = request
+        self._model_id = model_id
+        self._release = release
+        self._pending: Tuple[int, List[int]] | None = None
+        self._failed = False
+        request.source = source.source
+        request.enabled = True
+
+    def _score(self, ids: Sequence[int]) -> None:
+        if self._pending is None:
+            return
+        start, proposal = self._pending
+        self._pending = None
+        kept = ids[start:start + len(proposal)]
+        accepted = 0
+        for want, got in zip(proposal, kept):
+            if int(want) != int(got):
+                break
+            accepted += 1
+        self.request.proposed += len(proposal)
+        self.request.accepted += accepted
+
+    def __call__(self, input_ids: Any, /, **kwargs: Any) -> Any:
+        ids = [int(t) for t in input_ids]
+        self._score(ids)
+        if self._failed:
+            return _as_ids([])
+        try:
+            proposal = self.source.propose(ids)
+        except Exception:  # noqa: BLE001
+            # a broken source stays broken: stop drafting for this request
+            proposal = []
+            self._failed = True
+            self._free()
+            metrics.inc(
+                "speculative_unavailable_total",
+                {"model": self._model_id, "reason": "draft_error"},
+            )
+        if proposal:
+            self._pending = (len(ids), list(proposal))
+        return _as_ids(list(proposal))
+
+    def _free(self) -> None:
+        if self._release is not None:
+            self._release()
+            self._release = None
+
+    def finish(self, final_ids: Sequence[int]) -> None:
+        """Score the last proposal, record metrics, free the draft."""
+        self._score([int(t) for t in final_ids])
+        self._free()
+        req = self.request
+        labels = {"model": self._model_id, "source": req.source or ""}
+        metrics.inc("speculative_draft_tokens_total", labels, req.proposed)
+        metrics.inc(
+            "speculative_accepted_tokens_total", labels, req.accepted
+        )
+        if req.proposed:
+            metrics.observe(
+                "speculative_acceptance_pct",
+                round(100.0 * req.accepted / req.proposed, 1),
+                labels,
+            )
+
+
+def _unavailable(model_id: str, reason: str) -> None:
+    metrics.inc(
+        "speculative_unavailable_total",
+        {"model": model_id, "reason": reason},
+    )
+
+
+def _model_source(
+    target: Any, draft_provider: Any, k: int
+) -> Tuple[ModelDraft | None, Callable[[], None] | None, str]:
+    lock: Lock | None = getattr(draft_provider, "draft_lock", None)
+    if draft_provider is None or lock is None:
+        return None, None, "no_draft_model"
+    if not lock.acquire(blocking=False):
+        return None, None, "draft_busy"
+    try:
+        llama = draft_provider.draft_llama()
+        if llama is not None:
+            return ModelDraft(target, llama, k), lock.release, ""
+    except Exception:  # noqa: BLE001
+        pass
+    lock.release()
+    return None, None, "no_draft_model"
+
+
+def build_recorder(
+    request: SpeculativeRequest | str | None,
+    target: Any,
+    model_id: str,
+) -> DraftRecorder | None:
+    """Draft source for one request (None: decode without speculation).
+
+    ``draft`` falls back to prompt lookup when the draft model is absent
+    or busy with another request; a context built without ``logits_all``
+    cannot verify drafts at all.
+    """
+    if isinstance(request, str):
+        request = SpeculativeRequest(mode=request)
+    if request is None or request.mode not in ("ngram", "draft"):
+        return None
+    ctx_params = getattr(target, "context_params", None)
+    if not getattr(ctx_params, "logits_all", False):
+        _unavailable(model_id, "logits_all")
+        return None
+    cfg = speculative_config()
+    k = int(request.k or cfg.get("k", 4) or 4)
+    if request.mode == "draft":
+        source, release, reason = _model_source(
+            target, request.draft_provider, k
+        )
+        if source is not None:
+            return DraftRecorder(source, request, model_id, release)
+        _unavailable(model_id, reason)
+    ngram = PromptLookupDraft(
+        k,
+        int(cfg.get("ngram_min", 1) or 1),
+        int(cfg.get("ngram_max", 3) or 3),
+    )
+    return DraftRecorder(ngram, request, model_id)
+
+
+__all__ = [
+    "MODES",
+    "DraftRecorder",
+    "ModelDraft",
+    "PromptLookupDraft",
+    "build_recorder",
+    "speculative_config",
+]
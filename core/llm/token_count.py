@@ -0,0 +1,175 @@
+"""Tokenizer-exact token counting with a memoized per-message cache.
+
+Summary:
+* ``count_tokens(text, model_id=, provider=)`` asks the provider's loaded
+    tokenizer (``provider.count_tokens(text)``) and memoizes the result in
+    an LRU keyed by ``(model_id, sha1(text))``. Prompts are counted per
+    message, so history messages re-sent on every turn of a session hit
+    the cache and only the new turn is tokenized.
+* When the model is not loaded the count comes from a cheap estimator:
+    Cyrillic and other characters have separate chars-per-token rates
+    (Russian text packs far fewer characters per token than English) and
+    the result is scaled by a per-model factor calibrated (EMA) against
+    every exact count seen for that model. Estimates are never cached.
+* Config ``llm.token_count``: cache_entries, chars_per_token,
+    cyrillic_chars_per_token, calibration_alpha.
+* Metrics: token_count_cache_total{result=hit|miss|estimate}.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Iterable
+import hashlib
+
+from core import metrics
+
+
+def _config() -> dict:
+    try:
+        from core.config import get_config
+
+        return dict(getattr(get_config().llm, "token_count", {}) or {})
+    except Exception:  # noqa: BLE001
+        return {}
+
+
+def _cyrillic_chars(text: str) -> int:
+    return sum(1 for ch in text if "\u0400" <= ch <= "\u04ff")
+
+
+class TokenCounter:
+    """Per-model token counts: exact via tokenizer, else calibrated."""
+
+    def __init__(
+        self,
+        *,
+        cache_entries: int = 8192,
+        chars_per_token: float = 4.0,
+        cyrillic_chars_per_token: float = 2.5,
+        calibration_alpha: float = 0.2,
+    ) -> None:
+        self._capacity = max(1, int(cache_entries))
+        self._cpt = max(0.5, float(chars_per_token))
+        self._cyr_cpt = max(0.5, float(cyrillic_chars_per_token))
+        self._alpha = min(1.0, max(0.0, float(calibration_alpha)))
+        self._cache: OrderedDict[tuple[str, str], int] = OrderedDict()
+        self._scale: dict[str, float] = {}
+        self._lock = Lock()
+
+    # estimator -------------------------------------------------------------
+    def _raw_estimate(self, text: str) -> float:
+        cyr = _cyrillic_chars(text)
+        return cyr / self._cyr_cpt + (len(text) - cyr) / self._cpt
+
+    def estimate(self, text: str, model_id: str) -> int:
+        """Fallback count scaled by the model's calibration factor."""
+        if not text:
+            return 0
+        scale = self._scale.get(model_id, 1.0)
+        return max(1, round(self._raw_estimate(text) * scale))
+
+    def calibration(self, model_id: str) -> float:
+        return self._scale.get(model_id, 1.0)
+
+    def _calibrate(self, model_id: str, text: str, exact: int) -> None:
+        raw = self._raw_estimate(text)
+        if raw < 8:  # too short to say anything about the ratio
+            return
+        ratio = exact / raw
+        prev = self._scale.get(model_id)
+        self._scale[model_id] = (
+            ratio if prev is None
+            else prev + self._alpha * (ratio - prev)
+        )
+
+    # exact counts ----------------------------------------------------------
+    def lookup(
+        self, text: str, *, model_id: str, provider: Any = None
+    ) -> tuple[int, bool]:
+        """``(count, exact)``; ``exact`` is False for estimator results."""
+        if not text:
+            return 0, True
+        key = (model_id, hashlib.sha1(text.encode("utf-8")).hexdigest())
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+        if hit is not None:
+            metrics.inc("token_count_cache_total", {"result": "hit"})
+            return hit, True
+        exact = None
+        counter = getattr(provider, "count_tokens", None)
+        if callable(counter):
+            try:
+                exact = counter(text)
+            except Exception:  # noqa: BLE001
+                exact = None
+        if exact is None:
+            metrics.inc("token_count_cache_total", {"result": "estimate"})
+            return self.estimate(text, model_id), False
+        exact = int(exact)
+        metrics.inc("token_count_cache_total", {"result": "miss"})
+        with self._lock:
+            self._calibrate(model_id, text, exact)
+            self._cache[key] = exact
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._capacity:
+                self._cache.popitem(last=False)
+        return exact, True
+
+    def count(
+        self, text: str, *, model_id: str, provider: Any = None
+    ) -> int:
+        """Token count of ``text`` for ``model_id`` (see module docstring)."""
+        return self.lookup(text, model_id=model_id, provider=provider)[0]
+
+    def count_many(
+        self, texts: Iterable[str], *, model_id: str, provider: Any = None
+    ) -> list[int]:
+        return [
+            self.count(t, model_id=model_id, provider=provider) for t in texts
+        ]
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+
+_COUNTER: TokenCounter | None = None
+_COUNTER_LOCK = Lock()
+
+
+def get_counter() -> TokenCounter:
+    """Process-wide counter configured from ``llm.token_count``."""
+    global _COUNTER
+    with _COUNTER_LOCK:
+        if _COUNTER is None:
+            cfg = _config()
+            known = (
+                "cache_entries",
+                "chars_per_token",
+                "cyrillic_chars_per_token",
+                "calibration_alpha",
+            )
+            _COUNTER = TokenCounter(
+                **{k: cfg[k] for k in known if cfg.get(k) is not None}
+            )
+        return _COUNTER
+
+
+def count_tokens(text: str, *, model_id: str, provider: Any = None) -> int:
+    return get_counter().count(text, model_id=model_id, provider=provider)
+
+
+def reset_for_tests() -> None:  # pragma: no cover - test helper
+    global _COUNTER
+    with _COUNTER_LOCK:
+        _COUNTER = None
+
+
+__all__ = [
+    "TokenCounter",
+    "count_tokens",
+    "get_counter",
+    "reset_for_tests",
+]
@@ -96,3 +96,84 @@ class GenerationResult:
             request_id=request_id,
             error=GenerationError(type=err_type, message=message),
         )
+
+
+@dataclass(slots=True)
+class HarmonyVocab:
+    """Harmony special-token ids of a model (token id -> lower-case name).
+
+    ``markers``: ``<|start|>`` -> "start", ``<|channel|>`` -> "channel", ...
+    ``channels``: channel-name tokens ("analysis", "final", ...).
+    """
+
+    markers: Dict[int, str]
+    channels: Dict[int, str]
+
+
+@dataclass(slots=True)
+class ReasoningBudget:
+    """Hard analysis-channel budget enforced inside the decode loop.
+
+    Passed to ``provider.stream(..., reasoning_budget=...)``; the provider
+    fills the runtime fields. ``decode_tokens_unused_budget`` is the part
+    of ``max_tokens`` left undecoded after a cutover: an upper bound on
+    what the cutover saved, not a count of tokens it avoided.
+    ``unenforced`` names why a requested hard budget could not be applied
+    (``text_path``: no token-id decode; ``no_cutover_ids``: the model has
+    no analysis channel / final header ids); the adapter's soft trim is
+    all that remains then.
+    """
+
+    max_tokens: int
+    enforced: bool = False  # provider could track the analysis channel
+    unenforced: str | None = None
+    analysis_tokens: int = 0
+    cutover: bool = False
+    decode_tokens_unused_budget: int = 0
+
+
+@dataclass(slots=True)
+class DecodeOutcome:
+    """How a streamed decode ended, filled by the provider on completion.
+
+    Passed as ``provider.stream(..., decode_outcome=...)`` so the pipeline
+    can report provider-side stops (e.g. ``repetition``) in its result.
+    """
+
+    stop_reason: str | None = None
+    output_tokens: int = 0
+
+
+@dataclass(slots=True)
+class SpeculativeRequest:
+    """Per-request speculative decoding opt-in (``core.llm.speculative``).
+
+    Passed as ``provider.stream(..., speculative=...)``; ``mode`` is
+    ``ngram`` (prompt lookup) or ``draft`` (``draft_provider`` proposes).
+    The provider fills ``enabled``/``source`` and the token counters.
+    """
+
+    mode: str
+    draft_provider: Any = None
+    k: int | None = None
+    enabled: bool = False  # a draft source was attached to the decode
+    source: str | None = None  # ngram | draft (after fallback)
+    proposed: int = 0
+    accepted: int = 0
+
+    @property
+    def acceptance_rate(self) -> float | None:
+        if not self.proposed:
+            return None
+        return self.accepted / self.proposed
+
+    def summary(self) -> Dict[str, Any]:
+        rate = self.acceptance_rate
+        return {
+            "mode": self.mode,
+            "source": self.source,
+            "enabled": self.enabled,
+            "proposed": self.proposed,
+            "accepted": self.accepted,
+            "acceptance_rate": None if rate is None else round(rate, 3),
+        }
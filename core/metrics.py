@@ -11,6 +11,21 @@ Core API (intentionally tiny):
 
 Thread-safety: coarse RLock; overhead negligible for low event volume.
 
+Histograms are constant-memory log-linear buckets (HDR style): a sample
+lands in its power-of-two range split into ``sub_buckets`` linear
+sub-buckets, so quantiles carry at most ~1/(2*sub_buckets) relative error
+(about 3% at the default 16) and memory is bounded by the value range,
+never by the sample count. Each snapshot entry keeps the historical keys
+(count, min, max, p50, last; min/max/last exact) and adds p90, p95, p99,
+sum and mean. With ``window_s`` > 0 it also has ``window``: the same
+statistics over the last ``window_s`` seconds, kept as ``window_slices``
+rotating sub-histograms. Config ``metrics.histograms`` (sub_buckets,
+window_s, window_slices) is pushed in via ``configure_histograms`` at app
+startup; until then, and after ``reset_for_tests``, module defaults apply.
+Settings are captured when a histogram is created, so recording never
+touches the config loader. Non-finite samples (NaN, inf) are dropped and
+counted as ``metrics_nonfinite_dropped_total{name}``.
+
 Harmony / LLM related metric names (documented for discoverability):
     - harmony_parse_error_total{stage}
     - reasoning_ratio_alert_total{bucket}
@@ -23,19 +38,221 @@ Harmony / LLM related metric names (documented for discoverability):
     - reasoning_leak_total{reason}                    # (ADR-CH-SEP-V2)
     - channel_merge_anomaly_total{type}               # (ADR-CH-SEP-V2)
     - fused_marker_sanitizations_total{kind}          # (ADR-0013i addendum)
+    - kv_cache_hits_total{model,source}               # KV state pool
+    - kv_cache_misses_total{model}
+    - kv_cache_prefill_tokens_saved_total{model}
+    - kv_cache_evictions_total{model,tier}
+    - reasoning_cutover_total{model}                  # hard reasoning budget
+    - reasoning_unused_budget_tokens_total{model}     # max_tokens left
+    - reasoning_budget_unenforced_total{model,reason}  # hard -> soft only
+    - generation_repetition_stops_total{model,kind}   # loop detector
+    - repetition_unused_budget_tokens_total{model}    # max_tokens left
+    - token_count_cache_total{result}                 # hit|miss|estimate
+    - history_messages_dropped_total{model}           # over prompt budget
+    - history_compactions_total{status}               # rolling summary
+    - history_compaction_ms (histogram)
+    - model_integrity_checks_total{model,result}      # cached|sampled|full
+    - model_integrity_failures_total{model,stage}
+    - model_integrity_verify_ms{model,result} (histogram)
+    - model_load_waiters_total{model}          # waited on an in-progress load
+    - model_load_wait_ms{model} (histogram)
+    - model_residency_evictions_total{model,reason}   # memory budget
+    - model_residency_eviction_skipped_total{model,reason}  # busy|recent
+    - model_residency_over_budget_total{model}
+    - gguf_metadata_total{result}                     # hit|miss|error
+    - model_warmup_ms{model,phase} (histogram)       # load|prefill
+    - model_warmup_errors_total{model}
+    - model_prefetch_skipped_total{model,reason}      # recent_unload
+    - speculative_draft_tokens_total{model,source}    # ngram|draft
+    - speculative_accepted_tokens_total{model,source}
+    - speculative_acceptance_pct{model,source} (histogram, per request)
+    - speculative_unavailable_total{model,reason}
+    - client_disconnect_unused_budget_tokens_total{model}  # client gone
+    - admission_admitted_total{model,path}            # immediate|queued
+    - admission_rejected_total{model,reason}  # queue_full|queue_timeout
+    - admission_abandoned_total{model}  # client left while queued
+    - admission_queue_depth{model} (histogram, per enqueue)
+    - admission_wait_ms{model} (histogram)
+    - sse_resume_attach_total{state}                  # live|completed
+    - sse_resume_truncated_total                      # follower behind ring
+    - sse_resume_abandoned_total                      # no viewer in grace
+    - sse_resume_pump_errors_total
+    - eventbus_dropped_total{event,policy}            # ring full / sampled
+    - eventbus_queue_depth (histogram)                # async ring depth
+    - eventbus_dispatch_lag_ms (histogram)            # enqueue -> delivery
+    - journal_records_total / journal_bytes_total     # event journal writes
+    - journal_dropped_total                           # journal queue full
+    - journal_segments_total / journal_write_errors_total
 
 Helper functions are provided for newly added ADR-backed metrics to reduce
 label spelling drift and ease refactors. They are thin wrappers over ``inc``.
 """
 from __future__ import annotations
 
+from collections import deque
+from math import frexp, isfinite, ldexp
 from threading import RLock
-from time import time
-from typing import Dict, Tuple, Any
+from time import monotonic, time
+from typing import Any, Deque, Dict, List, Tuple
 
 _COUNTERS: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
-_HIST: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], list] = {}
+_HIST: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], "_Histogram"] = {}
 _LOCK = RLock()
+_clock = monotonic  # window rotation clock (patched in tests)
+_HIST_DEFAULTS: Dict[str, Any] = {
+    "sub_buckets": 16,
+    "window_s": 0.0,
+    "window_slices": 5,
+}
+_HIST_SETTINGS: Dict[str, Any] = dict(_HIST_DEFAULTS)
+_QUANTILES = (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99))
+# keeps bucket keys of positive values above zero (frexp exponent >= -1074)
+_KEY_OFFSET = 1 << 20
+
+
+def configure_histograms(
+    sub_buckets: int | None = None,
+    window_s: float | None = None,
+    window_slices: int | None = None,
+) -> None:
+    """Set histogram settings (``metrics.histograms``) for new histograms.
+
+    Omitted arguments fall back to the module defaults. Histograms that
+    already exist keep the settings they were created with.
+    """
+    global _HIST_SETTINGS  # noqa: PLW0603
+    d = _HIST_DEFAULTS
+    if sub_buckets is None:
+        sub_buckets = d["sub_buckets"]
+    if window_s is None:
+        window_s = d["window_s"]
+    if window_slices is None:
+        window_slices = d["window_slices"]
+    settings = {
+        "sub_buckets": max(1, int(sub_buckets)),
+        "window_s": max(0.0, float(window_s)),
+        "window_slices": max(1, int(window_slices)),
+    }
+    with _LOCK:
+        _HIST_SETTINGS = settings
+
+
+class _Buckets:
+    """Log-linear bucket counts plus exact count / sum."""
+
+    __slots__ = ("sub", "counts", "count", "sum")
+
+    def __init__(self, sub: int) -> None:
+        self.sub = sub
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+
+    def _key(self, value: float) -> int:
+        if value == 0:
+            return 0
+        mant, exp = frexp(abs(value))  # abs(value) = mant * 2**exp
+        key = exp * self.sub + int((mant - 0.5) * 2 * self.sub)
+        return key + _KEY_OFFSET if value > 0 else -(key + _KEY_OFFSET)
+
+    def _value(self, key: int) -> float:
+        """Midpoint of bucket ``key``."""
+        if key == 0:
+            return 0.0
+        raw = abs(key) - _KEY_OFFSET
+        exp, sub = divmod(raw, self.sub)
+        mid = ldexp(0.5 + (sub + 0.5) / (2 * self.sub), exp)
+        return mid if key > 0 else -mid
+
+    def add(self, value: float) -> None:
+        key = self._key(value)
+        self.counts[key] = self.counts.get(key, 0) + 1
+        self.count += 1
+        self.sum += value
+
+    def merge(self, other: "_Buckets") -> None:
+        for key, n in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + n
+        self.count += other.count
+        self.sum += other.sum
+
+    def quantiles(self, lo: float, hi: float) -> Dict[str, float]:
+        """p50..p99 as the sample at index int(q * count), clamped."""
+        out: Dict[str, float] = {}
+        targets = [
+            (name, min(self.count - 1, int(q * self.count)))
+            for name, q in _QUANTILES
+        ]
+        seen = 0
+        i = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            while i < len(targets) and targets[i][1] < seen:
+                value = min(hi, max(lo, self._value(key)))
+                out[targets[i][0]] = value
+                i += 1
+            if i == len(targets):
+                break
+        return out
+
+
+class _Histogram:
+    __slots__ = ("total", "min", "max", "last", "window_s", "slices")
+
+    def __init__(self, settings: Dict[str, Any]) -> None:
+        self.total = _Buckets(settings["sub_buckets"])
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.last: float = 0.0
+        self.window_s = settings["window_s"]
+        # (slice number, buckets, slice min, slice max), oldest first
+        self.slices: Deque[List[Any]] = deque(
+            maxlen=settings["window_slices"] if self.window_s else 0
+        )
+
+    def add(self, value: float) -> None:
+        self.total.add(value)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.last = value
+        if not self.window_s:
+            return
+        slice_s = self.window_s / self.slices.maxlen
+        number = int(_clock() // slice_s)
+        if not self.slices or self.slices[-1][0] != number:
+            self.slices.append(
+                [number, _Buckets(self.total.sub), value, value]
+            )
+        current = self.slices[-1]
+        current[1].add(value)
+        current[2] = min(current[2], value)
+        current[3] = max(current[3], value)
+
+    def window(self) -> Dict[str, Any] | None:
+        slice_s = self.window_s / self.slices.maxlen
+        oldest = int(_clock() // slice_s) - self.slices.maxlen + 1
+        merged = _Buckets(self.total.sub)
+        lo, hi = float("inf"), float("-inf")
+        for number, buckets, s_lo, s_hi in self.slices:
+            if number >= oldest:
+                merged.merge(buckets)
+                lo, hi = min(lo, s_lo), max(hi, s_hi)
+        if not merged.count:
+            return None
+        return _stats(merged, lo, hi)
+
+
+def _stats(buckets: _Buckets, lo: float, hi: float) -> Dict[str, Any]:
+    return {
+        "count": buckets.count,
+        "min": lo,
+        "max": hi,
+        **buckets.quantiles(lo, hi),
+        "sum": buckets.sum,
+        "mean": buckets.sum / buckets.count,
+    }
 
 
 def _norm_labels(labels: dict[str, Any] | None) -> Tuple[Tuple[str, str], ...]:
@@ -59,9 +276,16 @@ def observe(
     value: float,
     labels: dict[str, Any] | None = None,
 ) -> None:
+    value = float(value)
+    if not isfinite(value):  # NaN / inf have no bucket
+        inc("metrics_nonfinite_dropped_total", {"name": name})
+        return
     key = (name, _norm_labels(labels))
+    hist = _HIST.get(key)
     with _LOCK:
-        _HIST.setdefault(key, []).append(value)
+        if hist is None:
+            hist = _HIST.setdefault(key, _Histogram(_HIST_SETTINGS))
+        hist.add(value)
 
 
 def snapshot() -> dict[str, Any]:
@@ -79,19 +303,17 @@ def snapshot() -> dict[str, Any]:
             legacy_key = (name,)
             legacy_counters[legacy_key] = v
         hist = {}
-        for (name, labels), vals in _HIST.items():
-            if not vals:
+        for (name, labels), h in _HIST.items():
+            if not h.total.count:
                 continue
             label_str = ""
             if labels:
                 label_str = "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
-            hist[name + label_str] = {
-                "count": len(vals),
-                "min": min(vals),
-                "max": max(vals),
-                "p50": sorted(vals)[len(vals) // 2],
-                "last": vals[-1],
-            }
+            entry = _stats(h.total, h.min, h.max)
+            entry["last"] = h.last
+            if h.window_s:
+                entry["window"] = h.window()
+            hist[name + label_str] = entry
         return {
             "ts": time(),
             "counters": counters,
@@ -103,14 +325,17 @@ def snapshot() -> dict[str, Any]:
 
 
 def reset_for_tests() -> None:  # pragma: no cover
+    global _HIST_SETTINGS  # noqa: PLW0603
     with _LOCK:
         _COUNTERS.clear()
         _HIST.clear()
+        _HIST_SETTINGS = dict(_HIST_DEFAULTS)
 
 
 __all__ = [
     "inc",
     "observe",
+    "configure_histograms",
     "snapshot",
     "reset_for_tests",
 ]
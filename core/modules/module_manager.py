@@ -19,6 +19,7 @@ from pathlib import Path
 from typing import Callable, Dict, Optional, Any
 
 from core.config import get_config
+from core.registry.gguf import gguf_info
 from core.registry.loader import load_manifests, verify_model_checksum
 from core.llm import (
     LlamaCppProvider,
@@ -26,9 +27,20 @@ from core.llm import (
     ModelLoadError,
 )
 from core.llm.alias_provider import AliasedProvider
+from core.llm.scheduler import decode_busy
+from core.llm.speculative import speculative_config
+from core.llm.residency import (
+    ResidencyManager,
+    build_manager as build_residency_manager,
+    provider_footprint,
+)
 from core.events import emit, ModelUnloaded, ModelAliasedLoaded, ModelLoaded
 import time
-from threading import RLock
+from concurrent.futures import Future
+from contextlib import contextmanager
+from threading import Lock, local
+
+from core import metrics
 
 
 @dataclass(frozen=True)
@@ -135,8 +147,13 @@ class LLMModule:
         self._providers: Dict[str, ModelProvider] = {}
         self._manifest_cache: Dict[str, Any] | None = None
         self._capabilities_cache: Dict[str, tuple[str, ...]] = {}
-        # Protect provider loads (double-checked locking in _load_provider)
-        self._load_lock = RLock()
+        # Single-flight loads: one in-flight Future per model id
+        self._inflight: Dict[str, Future] = {}
+        self._flight_lock = Lock()
+        # Per-thread state: ids being loaded, forced stub fallback flag
+        self._tls = local()
+        # Memory-budget residency (None when llm.residency disabled)
+        self._residency: ResidencyManager | None = build_residency_manager()
 
     # --- Provider management -------------------------------------------------
     def _load_provider(
@@ -144,6 +161,208 @@ class LLMModule:
         model_id: str,
         repo_root: str | Path = ".",
         skip_checksum: bool | None = None,
+    ) -> ModelProvider:
+        """Load (or return) ``model_id`` with per-model single-flight.
+
+        An already loaded provider is returned directly. Concurrent callers
+        for an id being loaded wait on the leader's Future; loads of other
+        ids proceed in parallel. A re-entrant call for an id this thread is
+        already loading (stub fallbacks) runs inline.
+        Metrics (callers that waited on an in-progress load only):
+        model_load_waiters_total{model}, model_load_wait_ms{model}.
+        """
+        provider = self._providers.get(model_id)
+        if provider is not None and not self._force_stub_active():
+            return provider
+        leading = self._tls.__dict__.setdefault("loading", set())
+        if model_id in leading:
+            return self._load_provider_once(
+                model_id, repo_root, skip_checksum
+            )
+        with self._flight_lock:
+            flight = self._inflight.get(model_id)
+            leader = flight is None
+            if leader:
+                flight = Future()
+                self._inflight[model_id] = flight
+        labels = {"model": model_id}
+        if not leader:
+            metrics.inc("model_load_waiters_total", labels)
+            t0 = time.perf_counter()
+            try:
+                return flight.result()
+            finally:
+                metrics.observe(
+                    "model_load_wait_ms",
+                    (time.perf_counter() - t0) * 1000.0,
+                    labels,
+                )
+        leading.add(model_id)
+        try:
+            provider = self._load_provider_once(
+                model_id, repo_root, skip_checksum
+            )
+        except BaseException as exc:  # propagate to waiters as well
+            flight.set_exception(exc)
+            raise
+        else:
+            flight.set_result(provider)
+            return provider
+        finally:
+            leading.discard(model_id)
+            with self._flight_lock:
+                self._inflight.pop(model_id, None)
+
+    def _force_stub_active(self) -> bool:
+        import os  # local import
+
+        return os.getenv("MIA_FORCE_STUB") == "1" or bool(
+            getattr(self._tls, "force_stub", False)
+        )
+
+    @contextmanager
+    def _forced_stub(self):
+        """Stub fallback for this thread only (concurrent loads unaffected)."""
+        prev = getattr(self._tls, "force_stub", False)
+        self._tls.force_stub = True
+        try:
+            yield
+        finally:
+            self._tls.force_stub = prev
+
+    # --- Residency -----------------------------------------------------------
+    def _admit_resident(
+        self, model_id: str, role: str, provider: ModelProvider
+    ) -> list[str]:
+        """Account ``provider`` and evict others to fit the budget."""
+        if self._residency is None:
+            return []
+        header = gguf_info(getattr(provider, "_model_path", None))
+        n_ctx = None
+        draft_ctx = self._draft_context(model_id, provider)
+        if draft_ctx:
+            n_ctx = int(provider.info().context_length) + draft_ctx
+        footprint = provider_footprint(
+            provider, facts=header.facts() if header else None, n_ctx=n_ctx
+        )
+        return self._residency.admit(
+            model_id,
+            role,
+            footprint,
+            evict=self._evict_resident,
+            busy=self._provider_busy,
+        )
+
+    @staticmethod
+    def _draft_context(model_id: str, provider: Any) -> int:
+        """KV tokens of the speculative draft context ``model_id`` gets.
+
+        The configured draft model builds a second context
+        (``draft_llama()``) on its mmap'd weights; its KV cache is
+        reserved at admission so residency does not under-count it.
+        """
+        spec = speculative_config()
+        if not spec.get("enabled", False):
+            return 0
+        draft_id = spec.get("draft_model")
+        if not draft_id:
+            try:
+                cfg = get_config().llm
+                draft_id = cfg.lightweight.id if cfg.lightweight else None
+            except Exception:  # noqa: BLE001
+                draft_id = None
+        if draft_id != model_id:
+            return 0
+        try:
+            n_ctx = int(provider.info().context_length)
+        except Exception:  # noqa: BLE001
+            return 0
+        return min(n_ctx, int(spec.get("draft_context", 2048) or 0))
+
+    def _with_aliases(self, prov: Any) -> list[tuple[str, Any]]:
+        """Registry entries sharing ``prov``'s weights (aliases)."""
+        return [
+            (mid, other)
+            for mid, other in list(self._providers.items())
+            if isinstance(other, AliasedProvider)
+            and getattr(other, "_base", None) is prov
+        ]
+
+    def _provider_busy(self, model_id: str) -> bool:
+        """Decode in progress on ``model_id`` or an alias of it.
+
+        Scheduler sequences (pending or active) and a held speculative
+        ``draft_lock`` both count.
+        """
+        prov = self._providers.get(model_id)
+        if prov is None:
+            return False
+        for other in [prov, *(p for _, p in self._with_aliases(prov))]:
+            if decode_busy(other):
+                return True
+            lock = getattr(other, "draft_lock", None)
+            if lock is not None and lock.locked():
+                return True
+        return False
+
+    def _evict_resident(self, model_id: str) -> bool:
+        """Unload a residency victim; False (kept) while it is decoding."""
+        if self._provider_busy(model_id):
+            return False
+        prov = self._providers.pop(model_id, None)
+        if prov is None:
+            return True
+        # aliases share the evicted weights: drop them as well
+        for mid, _other in self._with_aliases(prov):
+            self._providers.pop(mid, None)
+        try:
+            prov.unload()
+        finally:
+            emit(
+                ModelUnloaded(
+                    model_id=prov.info().id,
+                    role=prov.info().role,
+                    reason="residency",
+                    idle_seconds=None,
+                )
+            )
+        return True
+
+    def _touch_resident(self, model_id: str, provider: Any) -> None:
+        if self._residency is None:
+            return
+        if isinstance(provider, AliasedProvider):
+            base = getattr(provider, "_base", None)
+            try:
+                model_id = base.info().id if base is not None else model_id
+            except Exception:  # noqa: BLE001
+                pass
+        self._residency.touch(model_id)
+
+    def model_facts(
+        self, model_id: str, repo_root: str | Path = "."
+    ) -> dict | None:
+        """GGUF header summary of ``model_id`` without loading it."""
+        manifest = load_manifests(repo_root).get(model_id)
+        if manifest is None:
+            return None
+        path = Path(manifest.path)
+        if not path.is_absolute():
+            path = Path(repo_root) / path
+        header = gguf_info(path)
+        return header.summary() if header else None
+
+    def residency(self) -> dict | None:
+        """Residency state (budget, resident footprints in LRU order)."""
+        if self._residency is None:
+            return None
+        return self._residency.snapshot()
+
+    def _load_provider_once(
+        self,
+        model_id: str,
+        repo_root: str | Path = ".",
+        skip_checksum: bool | None = None,
     ) -> ModelProvider:
         # Test stub fast-path (deterministic provider) with stricter rules:
         # * Only activates when MIA_FORCE_STUB=1 AND manifest exists.
@@ -156,8 +375,7 @@ class LLMModule:
         # * Streaming path produces Harmony structured tokens so adapter tests
         #   receive token / analysis / commentary separation.
         try:  # noqa: WPS501
-            import os  # local import
-            if os.getenv("MIA_FORCE_STUB") == "1":
+            if self._force_stub_active():
                 from core.llm.provider import ModelInfo, ModelProvider  # local
                 from core.events import (  # noqa: WPS433
                     emit,
@@ -165,7 +383,7 @@ class LLMModule:
                     GenerationStarted,
                     GenerationCompleted,
                 )
-                from core.events import GenerationChunk
+                from core.llm.chunk_events import ChunkEmitter
                 from core.llm.types import GenerationResult
                 import time as _time
 
@@ -310,22 +528,14 @@ class LLMModule:
                         # Provide immediate final channel with streamed tokens
                         # to minimize first-token latency in API tests.
                         answer = self._echo(prompt, min(16, max_tokens))
-                        seq = 0
-                        # Emit GenerationChunk events for each token in final
-                        for tok in answer.split():
-                            emit(
-                                GenerationChunk(
-                                    request_id=rid,
-                                    model_id=self._mid,
-                                    role=self._role,
-                                    correlation_id=rid,
-                                    seq=seq,
-                                    text=tok + " ",
-                                    tokens_out=seq + 1,
-                                )
-                            )
-                            seq += 1
+                        # Chunk events per llm.chunk_events for each token
+                        chunks = ChunkEmitter.from_config(
+                            rid, self._mid, self._role
+                        )
+                        for seq, tok in enumerate(answer.split()):
+                            chunks.add(seq, tok + " ")
                             yield tok + " "
+                        chunks.close()
                         emit(
                             GenerationCompleted(
                                 request_id=rid,
@@ -340,65 +550,64 @@ class LLMModule:
                             )
                         )
 
-                with self._load_lock:
-                    # Re-check under lock
-                    existing2 = self._providers.get(model_id)
-                    if (
-                        existing2
-                        and getattr(existing2, "__class__", None).__name__
-                        == "_StubProvider"
-                    ):
-                        return existing2
-                    prov = _StubProvider(model_id)
-                    try:
-                        prov.load()
-                    except Exception:  # noqa: BLE001
-                        pass
-                    # Attach passport metadata if present (mirrors logic below)
-                    try:
-                        passport_path = (
-                            Path("models") / manifest.id / "passport.yaml"
+                # Re-check (a concurrent alias/stub may have registered it)
+                existing2 = self._providers.get(model_id)
+                if (
+                    existing2
+                    and getattr(existing2, "__class__", None).__name__
+                    == "_StubProvider"
+                ):
+                    return existing2
+                prov = _StubProvider(model_id)
+                try:
+                    prov.load()
+                except Exception:  # noqa: BLE001
+                    pass
+                # Attach passport metadata if present (mirrors logic below)
+                try:
+                    passport_path = (
+                        Path("models") / manifest.id / "passport.yaml"
+                    )
+                    if passport_path.exists():
+                        import yaml  # type: ignore  # noqa: WPS433
+                        import hashlib  # noqa: WPS433
+                        data = yaml.safe_load(
+                            passport_path.read_text(encoding="utf-8")
+                        ) or {}
+                        samp = data.get("sampling_defaults", {}) or {}
+                        norm = {}
+                        for k, v in samp.items():
+                            if k == "repetition_penalty":
+                                norm["repeat_penalty"] = v
+                            else:
+                                norm[k] = v
+                        phash = data.get("hash") or hashlib.sha256(
+                            passport_path.read_bytes()
+                        ).hexdigest()[:16]
+                        meta = prov.info().metadata or {}
+                        meta.update(
+                            {
+                                "passport_sampling_defaults": norm,
+                                "passport_version": data.get(
+                                    "passport_version"
+                                ),
+                                "passport_hash": phash,
+                            }
                         )
-                        if passport_path.exists():
-                            import yaml  # type: ignore  # noqa: WPS433
-                            import hashlib  # noqa: WPS433
-                            data = yaml.safe_load(
-                                passport_path.read_text(encoding="utf-8")
-                            ) or {}
-                            samp = data.get("sampling_defaults", {}) or {}
-                            norm = {}
-                            for k, v in samp.items():
-                                if k == "repetition_penalty":
-                                    norm["repeat_penalty"] = v
-                                else:
-                                    norm[k] = v
-                            phash = data.get("hash") or hashlib.sha256(
-                                passport_path.read_bytes()
-                            ).hexdigest()[:16]
-                            meta = prov.info().metadata or {}
-                            meta.update(
-                                {
-                                    "passport_sampling_defaults": norm,
-                                    "passport_version": data.get(
-                                        "passport_version"
-                                    ),
-                                    "passport_hash": phash,
-                                }
-                            )
-                            from core.llm.provider import ModelInfo as _MI
-                            new_info = _MI(
-                                id=prov.info().id,
-                                role=prov.info().role,
-                                capabilities=prov.info().capabilities,
-                                context_length=prov.info().context_length,
-                                revision=prov.info().revision,
-                                metadata=meta,
-                            )
-                            setattr(prov, "_info_cache", new_info)
-                    except Exception:  # noqa: BLE001
-                        pass
-                    self._providers[model_id] = prov
-                    return prov
+                        from core.llm.provider import ModelInfo as _MI
+                        new_info = _MI(
+                            id=prov.info().id,
+                            role=prov.info().role,
+                            capabilities=prov.info().capabilities,
+                            context_length=prov.info().context_length,
+                            revision=prov.info().revision,
+                            metadata=meta,
+                        )
+                        setattr(prov, "_info_cache", new_info)
+                except Exception:  # noqa: BLE001
+                    pass
+                self._providers[model_id] = prov
+                return prov
         except ModelLoadError:
             # propagate explicit model load errors (unknown / checksum)
             raise
@@ -483,124 +692,41 @@ class LLMModule:
             except Exception:  # noqa: BLE001
                 pass
             return prov
-        with self._load_lock:
-            prov = self._providers.get(model_id)
-            if prov is not None:
-                try:
-                    prov.load()
-                except Exception:  # noqa: BLE001
-                    pass
-                return prov
-            manifests = load_manifests(repo_root)
-            if model_id not in manifests:
-                # Soft fallback: if this is the configured primary id but
-                # manifest is absent (common in isolated tests that patched
-                # config earlier), return a stub provider instead of failing.
-                try:
-                    cfg_llm = get_config().llm
-                    primary_id_cfg = cfg_llm.primary.id if cfg_llm else None
-                except Exception:  # noqa: BLE001
-                    primary_id_cfg = None
-                if model_id == primary_id_cfg:
-                    primary_cfg = cfg_llm.primary  # type: ignore[union-attr]
-                    provider = LlamaCppProvider(
-                        model_path=f"missing://{model_id}",
-                        model_id=model_id,
-                        role="primary",
-                        context_length=primary_cfg.max_output_tokens
-                        if hasattr(primary_cfg, "max_output_tokens")
-                        else 2048,
-                        n_gpu_layers=0,
-                        temperature=primary_cfg.temperature,
-                        top_p=primary_cfg.top_p,
-                        top_k=primary_cfg.top_k,
-                        repeat_penalty=primary_cfg.repeat_penalty,
-                        min_p=primary_cfg.min_p,
-                        max_output_tokens=primary_cfg.max_output_tokens,
-                        n_threads=primary_cfg.n_threads,
-                        n_batch=primary_cfg.n_batch,
-                    )
-                    try:
-                        provider.load()
-                    except Exception:  # noqa: BLE001
-                        pass
-                    self._providers[model_id] = provider
-                    return provider
-                raise ModelLoadError(f"Unknown model id: {model_id}")
-            manifest = manifests[model_id]
-            cfg_llm = get_config().llm
-            if skip_checksum is None:
-                skip_checksum = cfg_llm.skip_checksum
-            elif skip_checksum is False:
-                # Factory layer defaults to False; elevate to True if config
-                # requests global checksum skip (test environments).
-                try:
-                    if getattr(cfg_llm, "skip_checksum", False):
-                        skip_checksum = True
-                except Exception:  # noqa: BLE001
-                    pass
-            # If global llm.skip_checksum=True, honor that before verifying
-            # to allow tests (warning frame) to proceed with stub fallback
-            # instead of raising a pre-stream 500 on checksum mismatch.
-            if skip_checksum:
-                # Directly short-circuit into stub path (if tiny dummy file)
-                # or proceed without checksum enforcement.
-                try:
-                    mp = Path(manifest.path)
-                    if mp.exists() and mp.stat().st_size < 1_000_000:
-                        from os import environ as _env
-                        prev = _env.get("MIA_FORCE_STUB")
-                        _env["MIA_FORCE_STUB"] = "1"
-                        try:
-                            return self._load_provider(
-                                model_id,
-                                repo_root=repo_root,
-                                skip_checksum=True,
-                            )
-                        finally:
-                            if prev is not None:
-                                _env["MIA_FORCE_STUB"] = prev
-                            else:
-                                _env.pop("MIA_FORCE_STUB", None)
-                except Exception:  # noqa: BLE001
-                    pass
-            # Convenience: if fake mode env flag active, always skip checksum
-            # to avoid requiring real model files during tests even when
-            # config.llm.skip_checksum is False.
-            # No fake checksum bypass.
+        prov = self._providers.get(model_id)
+        if prov is not None:
             try:
-                verify_model_checksum(manifest, repo_root, skip=skip_checksum)
-            except ModelLoadError:
-                # If checksum mismatch but config later specifies skip_checksum
-                # (or we want graceful primary service), attempt deterministic
-                # stub provider instead of raising hard 500 so warning frame
-                # tests (passport mismatch) can proceed. Only do this for
-                # primary role to avoid masking genuine integrity issues for
-                # auxiliary models.
-                try:  # noqa: WPS501
-                    from os import environ as _env
-                    if manifest.role == "primary":
-                        prev = _env.get("MIA_FORCE_STUB")
-                        _env["MIA_FORCE_STUB"] = "1"
-                        try:
-                            return self._load_provider(
-                                model_id,
-                                repo_root=repo_root,
-                                skip_checksum=True,
-                            )
-                        finally:
-                            if prev is not None:
-                                _env["MIA_FORCE_STUB"] = prev
-                            else:
-                                _env.pop("MIA_FORCE_STUB", None)
-                except Exception:  # noqa: BLE001
-                    pass
+                prov.load()
+            except Exception:  # noqa: BLE001
+                pass
+            return prov
+        manifests = load_manifests(repo_root)
+        if model_id not in manifests:
+            # Soft fallback: if this is the configured primary id but
+            # manifest is absent (common in isolated tests that patched
+            # config earlier), return a stub provider instead of failing.
+            try:
+                cfg_llm = get_config().llm
+                primary_id_cfg = cfg_llm.primary.id if cfg_llm else None
+            except Exception:  # noqa: BLE001
+                primary_id_cfg = None
+            if model_id == primary_id_cfg:
+                primary_cfg = cfg_llm.primary  # type: ignore[union-attr]
                 provider = LlamaCppProvider(
-                    model_path=f"invalid-checksum://{model_id}",
+                    model_path=f"missing://{model_id}",
                     model_id=model_id,
-                    role=manifest.role,
-                    context_length=getattr(manifest, "context_length", 2048),
+                    role="primary",
+                    context_length=primary_cfg.max_output_tokens
+                    if hasattr(primary_cfg, "max_output_tokens")
+                    else 2048,
                     n_gpu_layers=0,
+                    temperature=primary_cfg.temperature,
+                    top_p=primary_cfg.top_p,
+                    top_k=primary_cfg.top_k,
+                    repeat_penalty=primary_cfg.repeat_penalty,
+                    min_p=primary_cfg.min_p,
+                    max_output_tokens=primary_cfg.max_output_tokens,
+                    n_threads=primary_cfg.n_threads,
+                    n_batch=primary_cfg.n_batch,
                 )
                 try:
                     provider.load()
@@ -608,253 +734,251 @@ class LLMModule:
                     pass
                 self._providers[model_id] = provider
                 return provider
-            # Early tiny-file fast-path: if the manifest path exists but is a
-            # very small non-GGUF file (common in tests writing a short
-            # placeholder like 'dummy'), skip attempting a real llama load
-            # (which triggers GPU init & fails after >1s) and instead reuse
-            # the deterministic stub provider path so first token latency
-            # remains sub-second. Heuristic kept intentionally strict to
-            # avoid catching legitimate models: size < 1MB AND magic != GGUF.
-            try:  # noqa: WPS501
-                mp = Path(manifest.path)
-                if mp.exists():
-                    sz = mp.stat().st_size
-                    if sz < 1_000_000:  # ~1MB threshold
-                        with mp.open('rb') as fh:
-                            head = fh.read(4)
-                        if head != b'GGUF':
-                            from os import environ as _env  # local import
-                            prev = _env.get("MIA_FORCE_STUB")
-                            _env["MIA_FORCE_STUB"] = "1"
-                            try:
-                                return self._load_provider(
-                                    model_id,
-                                    repo_root=repo_root,
-                                    skip_checksum=True,
-                                )
-                            finally:
-                                if prev is not None:
-                                    _env["MIA_FORCE_STUB"] = prev
-                                else:
-                                    _env.pop("MIA_FORCE_STUB", None)
-            except Exception:  # noqa: BLE001
-                pass
-            # Auto-unload previous heavy model if switching to another
-            # heavy/lightweight (single heavy resident policy)
+            raise ModelLoadError(f"Unknown model id: {model_id}")
+        manifest = manifests[model_id]
+        cfg_llm = get_config().llm
+        if skip_checksum is None:
+            skip_checksum = cfg_llm.skip_checksum
+        elif skip_checksum is False:
+            # Factory layer defaults to False; elevate to True if config
+            # requests global checksum skip (test environments).
             try:
-                threshold = float(cfg_llm.heavy_model_vram_threshold_gb)
+                if getattr(cfg_llm, "skip_checksum", False):
+                    skip_checksum = True
             except Exception:  # noqa: BLE001
-                threshold = 10.0
-            # Estimate size in GiB by file size (mmap footprint approximation)
+                pass
+        # If global llm.skip_checksum=True, honor that before verifying
+        # to allow tests (warning frame) to proceed with stub fallback
+        # instead of raising a pre-stream 500 on checksum mismatch.
+        if skip_checksum:
+            # Directly short-circuit into stub path (if tiny dummy file)
+            # or proceed without checksum enforcement.
             try:
-                file_size_gib = Path(manifest.path).stat().st_size / (1024**3)
-            except OSError:
-                file_size_gib = 0.0
-            is_new_heavy = file_size_gib >= threshold
-            if is_new_heavy:
-                for _mid, existing in list(self._providers.items()):
-                    # Identify heavy already loaded providers
-                    # (best-effort using stored _model_path)
-                    try:
-                        existing_path = getattr(existing, "_model_path", None)
-                        if not existing_path:
-                            continue
-                        sz = Path(existing_path).stat().st_size / (1024**3)
-                        if sz >= threshold:
-                            existing.unload()
-                            emit(
-                                ModelUnloaded(
-                                    model_id=existing.info().id,
-                                    role=existing.info().role,
-                                    reason="switch_heavy",
-                                    idle_seconds=None,
-                                )
-                            )
-                            # Remove from registry so it can be reloaded later
-                            self._providers.pop(_mid, None)
-                    except Exception:  # noqa: BLE001
-                        continue
-            else:
-                # If switching to lightweight from a heavy model, unload
-                # heavy to satisfy event expectations
-                try:
-                    for _mid, existing in list(self._providers.items()):
-                        if _mid == model_id:
-                            continue
-                        existing_path = getattr(existing, "_model_path", None)
-                        if not existing_path:
-                            continue
-                        try:
-                            sz = Path(existing_path).stat().st_size / (1024**3)
-                        except Exception:
-                            sz = 0.0
-                        if sz >= threshold:
-                            existing.unload()
-                            emit(
-                                ModelUnloaded(
-                                    model_id=existing.info().id,
-                                    role=existing.info().role,
-                                    reason="switch_heavy_to_lightweight",
-                                    idle_seconds=None,
-                                )
-                            )
-                            self._providers.pop(_mid, None)
-                except Exception:  # noqa: BLE001
-                    pass
-            # Re-use already loaded provider if identical underlying model file
-            # Reuse pass: scan existing providers (attr-defined false positive)
-            for existing in self._providers.values():  # noqa: B950
-                try:
-                    base_path = getattr(existing, "_model_path", None)
-                except Exception:  # noqa: BLE001
-                    base_path = None
-                same_path = False
-                if base_path:
-                    try:
-                        same_path = (
-                            Path(base_path).resolve()
-                            == Path(manifest.path).resolve()
-                        )
-                    except Exception:  # noqa: BLE001
-                        same_path = False
-                if same_path:
-                    provider = AliasedProvider(
-                        existing,
-                        alias_id=manifest.id,
-                        alias_role=manifest.role,
-                        alias_caps=tuple(manifest.capabilities),
-                    )
-                    self._capabilities_cache[model_id] = tuple(
-                        manifest.capabilities
-                    )
-                    self._providers[model_id] = provider
-                    try:  # emit alias load event
-                        emit(
-                            ModelAliasedLoaded(
-                                alias_id=manifest.id,
-                                base_id=existing.info().id,
-                                role=manifest.role,
-                                base_role=existing.info().role,
-                                reuse=True,
-                            )
+                mp = Path(manifest.path)
+                if mp.exists() and mp.stat().st_size < 1_000_000:
+                    with self._forced_stub():
+                        return self._load_provider(
+                            model_id,
+                            repo_root=repo_root,
+                            skip_checksum=True,
                         )
-                    except Exception:  # noqa: BLE001
-                        pass
-                    return provider
-            # Fake mode alias detection removed.
-            primary_cfg = cfg_llm.primary
-            provider = LlamaCppProvider(
-                model_path=manifest.path,
-                model_id=manifest.id,
-                role=manifest.role,
-                context_length=manifest.context_length,
-                n_gpu_layers=primary_cfg.n_gpu_layers,
-                temperature=primary_cfg.temperature,
-                top_p=primary_cfg.top_p,
-                top_k=primary_cfg.top_k,
-                repeat_penalty=primary_cfg.repeat_penalty,
-                min_p=primary_cfg.min_p,
-                max_output_tokens=primary_cfg.max_output_tokens,
-                n_threads=primary_cfg.n_threads,
-                n_batch=primary_cfg.n_batch,
-            )
-            try:
-                provider.load()
             except Exception:  # noqa: BLE001
-                # Deterministic fallback: if primary model fails to load
-                # (invalid dummy file in tests), synthesize a stub provider
-                # so streaming/API tests still observe token events.
+                pass
+        # Convenience: if fake mode env flag active, always skip checksum
+        # to avoid requiring real model files during tests even when
+        # config.llm.skip_checksum is False.
+        # No fake checksum bypass.
+        try:
+            verify_model_checksum(manifest, repo_root, skip=skip_checksum)
+        except ModelLoadError:
+            # If checksum mismatch but config later specifies skip_checksum
+            # (or we want graceful primary service), attempt deterministic
+            # stub provider instead of raising hard 500 so warning frame
+            # tests (passport mismatch) can proceed. Only do this for
+            # primary role to avoid masking genuine integrity issues for
+            # auxiliary models.
+            try:  # noqa: WPS501
                 if manifest.role == "primary":
-                    # Reuse earlier stub creation path by invoking loader
-                    # with FORCE_STUB env semantics simulated (skip checksum
-                    # because we already verified earlier).
-                    from os import environ as _env  # noqa: WPS433
-                    prev = _env.get("MIA_FORCE_STUB")
-                    _env["MIA_FORCE_STUB"] = "1"
-                    try:
+                    with self._forced_stub():
                         return self._load_provider(
                             model_id,
                             repo_root=repo_root,
                             skip_checksum=True,
                         )
-                    finally:
-                        if prev is not None:
-                            _env["MIA_FORCE_STUB"] = prev
-                        else:
-                            _env.pop("MIA_FORCE_STUB", None)
-            self._capabilities_cache[model_id] = tuple(manifest.capabilities)
+            except Exception:  # noqa: BLE001
+                pass
+            provider = LlamaCppProvider(
+                model_path=f"invalid-checksum://{model_id}",
+                model_id=model_id,
+                role=manifest.role,
+                context_length=getattr(manifest, "context_length", 2048),
+                n_gpu_layers=0,
+            )
             try:
-                setattr(
-                    provider,
-                    "_manifest_capabilities",
-                    tuple(manifest.capabilities),
+                provider.load()
+            except Exception:  # noqa: BLE001
+                pass
+            self._providers[model_id] = provider
+            return provider
+        # Early tiny-file fast-path: if the manifest path exists but is a
+        # very small non-GGUF file (common in tests writing a short
+        # placeholder like 'dummy'), skip attempting a real llama load
+        # (which triggers GPU init & fails after >1s) and instead reuse
+        # the deterministic stub provider path so first token latency
+        # remains sub-second. Heuristic kept intentionally strict to
+        # avoid catching legitimate models: size < 1MB AND magic != GGUF.
+        try:  # noqa: WPS501
+            mp = Path(manifest.path)
+            if mp.exists():
+                sz = mp.stat().st_size
+                if sz < 1_000_000:  # ~1MB threshold
+                    with mp.open('rb') as fh:
+                        head = fh.read(4)
+                    if head != b'GGUF':
+                        with self._forced_stub():
+                            return self._load_provider(
+                                model_id,
+                                repo_root=repo_root,
+                                skip_checksum=True,
+                            )
+        except Exception:  # noqa: BLE001
+            pass
+        # Re-use already loaded provider if identical underlying model file
+        # Reuse pass: scan existing providers (attr-defined false positive)
+        for existing in list(self._providers.values()):  # noqa: B950
+            try:
+                base_path = getattr(existing, "_model_path", None)
+            except Exception:  # noqa: BLE001
+                base_path = None
+            same_path = False
+            if base_path:
+                try:
+                    same_path = (
+                        Path(base_path).resolve()
+                        == Path(manifest.path).resolve()
+                    )
+                except Exception:  # noqa: BLE001
+                    same_path = False
+            if same_path:
+                provider = AliasedProvider(
+                    existing,
+                    alias_id=manifest.id,
+                    alias_role=manifest.role,
+                    alias_caps=tuple(manifest.capabilities),
                 )
-                # Attach passport sampling defaults if passport exists
-                passport_path = Path("models") / manifest.id / "passport.yaml"
-                if passport_path.exists():
-                    try:
-                        # Local imports (were missing here previously).
-                        # Without these a NameError was raised then swallowed
-                        # by the broad except, skipping passport attachment.
-                        import yaml  # type: ignore  # local import
-                        import hashlib  # local import
-                        data = yaml.safe_load(
-                            passport_path.read_text(encoding="utf-8")
-                        ) or {}
-                        samp = (
-                            data.get("sampling_defaults")
-                            if isinstance(data, dict)
-                            else None
-                        ) or {}
-                        # Normalize keys: repetition_penalty -> repeat_penalty
-                        norm = {}
-                        for k, v in samp.items():
-                            if k == "repetition_penalty":
-                                norm["repeat_penalty"] = v
-                            else:
-                                norm[k] = v
-                        # Compute hash if none present
-                        phash = data.get("hash")
-                        if not phash:
-                            h = hashlib.sha256(
-                                passport_path.read_bytes()
-                            ).hexdigest()
-                            phash = h[:16]
-                        meta = provider.info().metadata or {}
-                        meta["passport_sampling_defaults"] = norm
-                        meta["passport_version"] = data.get(
-                            "passport_version"
+                self._capabilities_cache[model_id] = tuple(
+                    manifest.capabilities
+                )
+                self._providers[model_id] = provider
+                try:  # emit alias load event
+                    emit(
+                        ModelAliasedLoaded(
+                            alias_id=manifest.id,
+                            base_id=existing.info().id,
+                            role=manifest.role,
+                            base_role=existing.info().role,
+                            reuse=True,
                         )
-                        meta["passport_hash"] = phash
-                        # Rebuild ModelInfo with enriched metadata
-                        try:
-                            base_info = provider.info()
-                            from core.llm.provider import ModelInfo as _MI
+                    )
+                except Exception:  # noqa: BLE001
+                    pass
+                return provider
+        # Fake mode alias detection removed.
+        primary_cfg = cfg_llm.primary
+        # Never ask for more context than the model was trained with
+        context_length = manifest.context_length
+        header = gguf_info(manifest.path)
+        if header and header.context_length:
+            context_length = min(context_length, int(header.context_length))
+        provider = LlamaCppProvider(
+            model_path=manifest.path,
+            model_id=manifest.id,
+            role=manifest.role,
+            context_length=context_length,
+            n_gpu_layers=primary_cfg.n_gpu_layers,
+            temperature=primary_cfg.temperature,
+            top_p=primary_cfg.top_p,
+            top_k=primary_cfg.top_k,
+            repeat_penalty=primary_cfg.repeat_penalty,
+            min_p=primary_cfg.min_p,
+            max_output_tokens=primary_cfg.max_output_tokens,
+            n_threads=primary_cfg.n_threads,
+            n_batch=primary_cfg.n_batch,
+        )
+        try:
+            provider.load()
+        except Exception:  # noqa: BLE001
+            # Deterministic fallback: if primary model fails to load
+            # (invalid dummy file in tests), synthesize a stub provider
+            # so streaming/API tests still observe token events.
+            if manifest.role == "primary":
+                # Reuse earlier stub creation path by invoking loader
+                # with FORCE_STUB env semantics simulated (skip checksum
+                # because we already verified earlier).
+                with self._forced_stub():
+                    return self._load_provider(
+                        model_id,
+                        repo_root=repo_root,
+                        skip_checksum=True,
+                    )
+        else:
+            # Residency: account the loaded model, evict others to fit.
+            # Only after a successful load, so a failed load never costs
+            # the models it would have displaced.
+            self._admit_resident(model_id, manifest.role, provider)
+        self._capabilities_cache[model_id] = tuple(manifest.capabilities)
+        try:
+            setattr(
+                provider,
+                "_manifest_capabilities",
+                tuple(manifest.capabilities),
+            )
+            # Attach passport sampling defaults if passport exists
+            passport_path = Path("models") / manifest.id / "passport.yaml"
+            if passport_path.exists():
+                try:
+                    # Local imports (were missing here previously).
+                    # Without these a NameError was raised then swallowed
+                    # by the broad except, skipping passport attachment.
+                    import yaml  # type: ignore  # local import
+                    import hashlib  # local import
+                    data = yaml.safe_load(
+                        passport_path.read_text(encoding="utf-8")
+                    ) or {}
+                    samp = (
+                        data.get("sampling_defaults")
+                        if isinstance(data, dict)
+                        else None
+                    ) or {}
+                    # Normalize keys: repetition_penalty -> repeat_penalty
+                    norm = {}
+                    for k, v in samp.items():
+                        if k == "repetition_penalty":
+                            norm["repeat_penalty"] = v
+                        else:
+                            norm[k] = v
+                    # Compute hash if none present
+                    phash = data.get("hash")
+                    if not phash:
+                        h = hashlib.sha256(
+                            passport_path.read_bytes()
+                        ).hexdigest()
+                        phash = h[:16]
+                    meta = provider.info().metadata or {}
+                    meta["passport_sampling_defaults"] = norm
+                    meta["passport_version"] = data.get(
+                        "passport_version"
+                    )
+                    meta["passport_hash"] = phash
+                    # Rebuild ModelInfo with enriched metadata
+                    try:
+                        base_info = provider.info()
+                        from core.llm.provider import ModelInfo as _MI
 
-                            new_info = _MI(
-                                id=base_info.id,
-                                role=base_info.role,
-                                capabilities=base_info.capabilities,
-                                context_length=base_info.context_length,
-                                revision=base_info.revision,
-                                metadata=meta,
-                            )
-                            # Cache new info object for subsequent calls
-                            setattr(provider, "_info_cache", new_info)
-                            # Monkey patch info method to return cached
+                        new_info = _MI(
+                            id=base_info.id,
+                            role=base_info.role,
+                            capabilities=base_info.capabilities,
+                            context_length=base_info.context_length,
+                            revision=base_info.revision,
+                            metadata=meta,
+                        )
+                        # Cache new info object for subsequent calls
+                        setattr(provider, "_info_cache", new_info)
+                        # Monkey patch info method to return cached
                             
-                            def _info_override():  # noqa: D401
-                                return getattr(provider, "_info_cache")
+                        def _info_override():  # noqa: D401
+                            return getattr(provider, "_info_cache")
 
-                            provider.info = _info_override  # type: ignore
-                        except Exception:  # noqa: BLE001
-                            pass
+                        provider.info = _info_override  # type: ignore
                     except Exception:  # noqa: BLE001
                         pass
-            except Exception:  # noqa: BLE001
-                pass
-            self._providers[model_id] = provider
-            return provider
+                except Exception:  # noqa: BLE001
+                    pass
+        except Exception:  # noqa: BLE001
+            pass
+        self._providers[model_id] = provider
+        return provider
 
     def get_provider(
         self,
@@ -862,7 +986,9 @@ class LLMModule:
         repo_root: str | Path = ".",
         skip_checksum: bool = False,
     ) -> ModelProvider:
-        return self._load_provider(model_id, repo_root, skip_checksum)
+        provider = self._load_provider(model_id, repo_root, skip_checksum)
+        self._touch_resident(model_id, provider)
+        return provider
 
     def get_provider_by_role(
         self,
@@ -997,6 +1123,8 @@ class LLMModule:
                 continue
             if ts - last_used >= timeout:
                 prov.unload()
+                if self._residency is not None:
+                    self._residency.release(mid)
                 emit(
                     ModelUnloaded(
                         model_id=prov.info().id,
@@ -1024,23 +1152,31 @@ class LLMModule:
     # --- Explicit unload API -----------------------------------------------
     def unload(self, model_id: str) -> bool:
         """Unload provider by id (returns True if unloaded)."""
-        with self._load_lock:
-            prov = self._providers.get(model_id)
-            if not prov:
-                return False
+        with self._flight_lock:
+            flight = self._inflight.get(model_id)
+        if flight is not None:  # let an in-flight load finish first
             try:
-                prov.unload()
-                emit(
-                    ModelUnloaded(
-                        model_id=prov.info().id,
-                        role=prov.info().role,
-                        reason="explicit_unload",
-                        idle_seconds=None,
-                    )
+                flight.result()
+            except Exception:  # noqa: BLE001
+                pass
+        prov = self._providers.get(model_id)
+        if not prov:
+            return False
+        try:
+            prov.unload()
+            emit(
+                ModelUnloaded(
+                    model_id=prov.info().id,
+                    role=prov.info().role,
+                    reason="explicit_unload",
+                    idle_seconds=None,
                 )
-            finally:
-                self._providers.pop(model_id, None)
-            return True
+            )
+        finally:
+            self._providers.pop(model_id, None)
+            if self._residency is not None:
+                self._residency.release(model_id)
+        return True
 
 
 @lru_cache(maxsize=1)
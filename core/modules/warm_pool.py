@@ -0,0 +1,250 @@
+"""Startup warm pool: preload, warm-up decode and KV prefix prefill.
+
+Summary:
+* ``WarmPool.start()`` runs in one background daemon thread: for each
+    target (the primary, plus optional models with ``load_mode: eager``
+    when ``preload_optional``) it loads the provider through the LLM
+    module (page prefetch, construction and warm-up decode happen inside
+    the provider load, see ``ModelLoaded.phases``; these are the startup
+    loads that ``llm.warmup.prefetch: startup`` prefetches), then
+    prefills the
+    Harmony system/developer prefix into the provider's shared KV entry.
+* The prefill is submitted through the provider's decode scheduler, so it
+    never overlaps a request decoding on the same llama.cpp context.
+* ``status()`` is the ``/ready`` payload: overall state
+    (disabled|pending|warming|ready|failed), per-model state and phase
+    timings. A failed optional model does not fail readiness; a failed
+    primary does.
+* Config ``llm.warmup``: enabled, preload_optional, prefetch,
+    prefetch_skip_after_unload_s, decode_tokens, prefill_prefix,
+    reasoning_mode.
+* Metrics: model_warmup_ms{model,phase} (histogram).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from threading import Event, Lock, Thread
+from time import perf_counter, time
+from typing import Any, Callable
+
+from core import metrics
+
+
+def _config() -> dict:
+    try:
+        from core.config import get_config
+
+        return dict(getattr(get_config().llm, "warmup", {}) or {})
+    except Exception:  # noqa: BLE001
+        return {}
+
+
+@dataclass(slots=True)
+class WarmTarget:
+    model_id: str
+    role: str
+    required: bool = False
+    state: str = "pending"  # pending|loading|prefill|ready|failed
+    phases: dict[str, int] = field(default_factory=dict)
+    prefix_tokens: int = 0
+    error: str | None = None
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.model_id,
+            "role": self.role,
+            "required": self.required,
+            "state": self.state,
+            "phases_ms": dict(self.phases),
+            "prefix_tokens": self.prefix_tokens,
+            "error": self.error,
+        }
+
+
+def default_targets() -> list[WarmTarget]:
+    """Primary plus eager optional models (``preload_optional``)."""
+    from core.config import get_config
+
+    llm = get_config().llm
+    targets = [WarmTarget(llm.primary.id, "primary", required=True)]
+    if _config().get("preload_optional", False):
+        for spec in llm.optional_models.values():
+            if spec.enabled and spec.id and spec.load_mode == "eager":
+                targets.append(WarmTarget(spec.id, "optional"))
+    return targets
+
+
+def default_prefix() -> str | None:
+    """Harmony prefix shared by every prompt (None when unavailable)."""
+    try:
+        from core.config import get_config
+        from core.llm.pipeline.primary import harmony_prefix
+
+        sp = getattr(get_config().llm.system_prompt, "text", "") or ""
+        mode = _config().get("reasoning_mode") or "medium"
+        return harmony_prefix(sp, mode)
+    except Exception:  # noqa: BLE001
+        return None
+
+
+def _prefill(provider: Any, model_id: str, prefix: str) -> int:
+    fill = getattr(provider, "prefill_prefix", None)
+    if not callable(fill):
+        return 0
+    from core.llm.scheduler import get_scheduler
+
+    sched = get_scheduler(provider, model_id)
+    if sched is None:
+        return int(fill(prefix) or 0)
+    req = sched.submit(f"warmup-{model_id}", lambda: iter([fill(prefix)]))
+    return int(next(iter(req), 0) or 0)
+
+
+class WarmPool:
+    """Background warm-up of the models listed in ``targets``."""
+
+    def __init__(
+        self,
+        get_provider: Callable[[str], Any],
+        targets: list[WarmTarget],
+        *,
+        prefix: str | None = None,
+    ) -> None:
+        self._get_provider = get_provider
+        self._targets = targets
+        self._prefix = prefix
+        self._state = "pending"
+        self._started: float | None = None
+        self._finished: float | None = None
+        self._thread: Thread | None = None
+        self._done = Event()
+        self._lock = Lock()
+
+    def start(self) -> "WarmPool":
+        with self._lock:
+            if self._thread is None:
+                self._state = "warming"
+                self._started = time()
+                self._thread = Thread(
+                    target=self._run, name="model-warm-pool", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._done.wait(timeout)
+
+    @property
+    def ready(self) -> bool:
+        return self._state == "ready"
+
+    def _warm(self, target: WarmTarget) -> None:
+        from core.llm.llama_cpp_provider import startup_load
+
+        labels = {"model": target.model_id}
+        target.state = "loading"
+        t0 = perf_counter()
+        with startup_load():
+            provider = self._get_provider(target.model_id)
+        target.phases["load"] = int((perf_counter() - t0) * 1000)
+        metrics.observe(
+            "model_warmup_ms",
+            target.phases["load"],
+            {**labels, "phase": "load"},
+        )
+        if self._prefix:
+            target.state = "prefill"
+            t0 = perf_counter()
+            target.prefix_tokens = _prefill(
+                provider, target.model_id, self._prefix
+            )
+            target.phases["prefill"] = int((perf_counter() - t0) * 1000)
+            metrics.observe(
+                "model_warmup_ms",
+                target.phases["prefill"],
+                {**labels, "phase": "prefill"},
+            )
+        target.state = "ready"
+
+    def _run(self) -> None:
+        failed = False
+        try:
+            for target in self._targets:
+                try:
+                    self._warm(target)
+                except Exception as e:  # noqa: BLE001
+                    target.state = "failed"
+                    target.error = str(e)[:200]
+                    failed = failed or target.required
+        finally:
+            self._state = "failed" if failed else "ready"
+            self._finished = time()
+            self._done.set()
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "state": self._state,
+            "started_at": self._started,
+            "finished_at": self._finished,
+            "models": [t.as_dict() for t in self._targets],
+        }
+
+
+_POOL: WarmPool | None = None
+_POOL_LOCK = Lock()
+
+
+def start_warm_pool() -> WarmPool | None:
+    """Start the process-wide warm pool (None when ``llm.warmup`` off)."""
+    global _POOL
+    cfg = _config()
+    if not cfg.get("enabled", True):
+        return None
+    with _POOL_LOCK:
+        if _POOL is None:
+            from core.modules.module_manager import get_module_manager
+
+            llm = get_module_manager().get("llm")
+            _POOL = WarmPool(
+                llm.get_provider,
+                default_targets(),
+                prefix=(
+                    default_prefix() if cfg.get("prefill_prefix", True)
+                    else None
+                ),
+            )
+        pool = _POOL
+    return pool.start()
+
+
+def readiness() -> dict:
+    """``/ready`` payload; ready immediately when warm-up is disabled."""
+    pool = _POOL
+    if pool is None:
+        enabled = bool(_config().get("enabled", True))
+        return {
+            "ready": not enabled,
+            "state": "pending" if enabled else "disabled",
+            "started_at": None,
+            "finished_at": None,
+            "models": [],
+        }
+    return pool.status()
+
+
+def reset_for_tests() -> None:  # pragma: no cover - test helper
+    global _POOL
+    with _POOL_LOCK:
+        _POOL = None
+
+
+__all__ = [
+    "WarmPool",
+    "WarmTarget",
+    "default_prefix",
+    "default_targets",
+    "readiness",
+    "reset_for_tests",
+    "start_warm_pool",
+]
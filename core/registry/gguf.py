@@ -0,0 +1,418 @@
+"""GGUF header / metadata reader (no model load, no tensor data reads).
+
+Summary:
+* ``read_gguf(path)`` parses the GGUF header through a read-only mmap:
+    metadata key/values and tensor infos only. Pages of tensor data are
+    never touched, so the cost is independent of the weights size.
+* ``GGUFInfo`` exposes architecture, training context length, layer /
+    head counts, file type, per-quant-type tensor counts and bytes, tensor
+    byte sizes and tokenizer specials (bos/eos/... id and text). Large
+    arrays (vocab, merges) are not kept: only their lengths, plus the
+    token strings of special ids.
+* ``gguf_info(path)`` memoizes results keyed by file identity
+    ``(path, size, mtime_ns, inode)``: a replaced file is parsed again.
+    It returns None for missing / non-GGUF / malformed files.
+* Metrics: gguf_metadata_total{result=hit|miss|error}.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import Any
+import mmap
+import struct
+
+from core import metrics
+from .integrity import file_identity
+
+MAGIC = b"GGUF"
+_CACHE_ENTRIES = 64
+
+# GGUF metadata value types
+_UINT8, _INT8, _UINT16, _INT16, _UINT32, _INT32, _FLOAT32 = range(7)
+_BOOL, _STRING, _ARRAY, _UINT64, _INT64, _FLOAT64 = range(7, 13)
+_SCALAR = {
+    _UINT8: "<B",
+    _INT8: "<b",
+    _UINT16: "<H",
+    _INT16: "<h",
+    _UINT32: "<I",
+    _INT32: "<i",
+    _FLOAT32: "<f",
+    _BOOL: "<?",
+    _UINT64: "<Q",
+    _INT64: "<q",
+    _FLOAT64: "<d",
+}
+
+# ggml tensor type -> (name, block elements, block bytes)
+GGML_TYPES: dict[int, tuple[str, int, int]] = {
+    0: ("F32", 1, 4),
+    1: ("F16", 1, 2),
+    2: ("Q4_0", 32, 18),
+    3: ("Q4_1", 32, 20),
+    6: ("Q5_0", 32, 22),
+    7: ("Q5_1", 32, 24),
+    8: ("Q8_0", 32, 34),
+    9: ("Q8_1", 32, 36),
+    10: ("Q2_K", 256, 84),
+    11: ("Q3_K", 256, 110),
+    12: ("Q4_K", 256, 144),
+    13: ("Q5_K", 256, 176),
+    14: ("Q6_K", 256, 210),
+    15: ("Q8_K", 256, 292),
+    16: ("IQ2_XXS", 256, 66),
+    17: ("IQ2_XS", 256, 74),
+    18: ("IQ3_XXS", 256, 98),
+    19: ("IQ1_S", 256, 50),
+    20: ("IQ4_NL", 32, 18),
+    21: ("IQ3_S", 256, 110),
+    22: ("IQ2_S", 256, 82),
+    23: ("IQ4_XS", 256, 136),
+    24: ("I8", 1, 1),
+    25: ("I16", 1, 2),
+    26: ("I32", 1, 4),
+    27: ("I64", 1, 8),
+    28: ("F64", 1, 8),
+    29: ("IQ1_M", 256, 56),
+    30: ("BF16", 1, 2),
+    34: ("TQ1_0", 256, 54),
+    35: ("TQ2_0", 256, 66),
+    39: ("MXFP4", 32, 17),
+}
+
+_SPECIALS = {
+    "bos": "tokenizer.ggml.bos_token_id",
+    "eos": "tokenizer.ggml.eos_token_id",
+    "eot": "tokenizer.ggml.eot_token_id",
+    "eom": "tokenizer.ggml.eom_token_id",
+    "unk": "tokenizer.ggml.unknown_token_id",
+    "sep": "tokenizer.ggml.seperator_token_id",
+    "pad": "tokenizer.ggml.padding_token_id",
+}
+
+
+class GGUFError(ValueError):
+    """File is not a GGUF model or its header is malformed."""
+
+
+@dataclass(frozen=True, slots=True)
+class GGUFTensor:
+    name: str
+    ggml_type: int
+    shape: tuple[int, ...]
+    offset: int  # relative to the data section
+    nbytes: int | None  # None for unknown ggml types
+
+    @property
+    def type_name(self) -> str:
+        return GGML_TYPES.get(self.ggml_type, (f"type{self.ggml_type}",))[0]
+
+
+@dataclass(frozen=True, slots=True)
+class GGUFInfo:
+    """Header facts of one GGUF file (see module docstring)."""
+
+    path: str
+    version: int
+    file_size: int
+    data_offset: int
+    metadata: dict[str, Any]  # scalar values only
+    array_lengths: dict[str, int]
+    tensors: tuple[GGUFTensor, ...]
+    special_tokens: dict[str, tuple[int, str | None]] = field(
+        default_factory=dict
+    )
+
+    def _arch_key(self, suffix: str) -> Any:
+        return self.metadata.get(f"{self.architecture}.{suffix}")
+
+    @property
+    def architecture(self) -> str | None:
+        return self.metadata.get("general.architecture")
+
+    @property
+    def context_length(self) -> int | None:
+        return self._arch_key("context_length")
+
+    @property
+    def block_count(self) -> int | None:
+        return self._arch_key("block_count")
+
+    @property
+    def file_type(self) -> int | None:
+        return self.metadata.get("general.file_type")
+
+    @property
+    def vocab_size(self) -> int | None:
+        return self.array_lengths.get("tokenizer.ggml.tokens")
+
+    @property
+    def tensor_bytes(self) -> int:
+        return sum(t.nbytes or 0 for t in self.tensors)
+
+    def quant_types(self) -> dict[str, dict[str, int]]:
+        """Per ggml type: tensor count and bytes."""
+        out: dict[str, dict[str, int]] = {}
+        for t in self.tensors:
+            slot = out.setdefault(t.type_name, {"tensors": 0, "bytes": 0})
+            slot["tensors"] += 1
+            slot["bytes"] += t.nbytes or 0
+        return out
+
+    def facts(self) -> dict[str, Any]:
+        """Model shape facts (``core.llm.residency`` KV estimate keys)."""
+        keys = (
+            ("context_length", "context_length"),
+            ("block_count", "block_count"),
+            ("embedding_length", "embedding_length"),
+            ("head_count", "attention.head_count"),
+            ("head_count_kv", "attention.head_count_kv"),
+            ("key_length", "attention.key_length"),
+        )
+        return {
+            name: self._arch_key(suffix)
+            for name, suffix in keys
+            if self._arch_key(suffix) is not None
+        }
+
+    def summary(self) -> dict[str, Any]:
+        """JSON-friendly overview (``/models``)."""
+        return {
+            "architecture": self.architecture,
+            "name": self.metadata.get("general.name"),
+            "version": self.version,
+            "context_length": self.context_length,
+            "file_type": self.file_type,
+            "file_size": self.file_size,
+            "tensor_count": len(self.tensors),
+            "tensor_bytes": self.tensor_bytes,
+            "quant_types": self.quant_types(),
+            "tokenizer": {
+                "model": self.metadata.get("tokenizer.ggml.model"),
+                "vocab_size": self.vocab_size,
+                "special_tokens": {
+                    k: {"id": tid, "text": text}
+                    for k, (tid, text) in self.special_tokens.items()
+                },
+            },
+            **{
+                k: v for k, v in self.facts().items()
+                if k != "context_length"
+            },
+        }
+
+
+def _tensor_nbytes(ggml_type: int, shape: tuple[int, ...]) -> int | None:
+    spec = GGML_TYPES.get(ggml_type)
+    if spec is None:
+        return None
+    _, block, size = spec
+    n = 1
+    for dim in shape:
+        n *= dim
+    return n // block * size
+
+
+class _Reader:
+    __slots__ = ("buf", "pos", "size")
+
+    def __init__(self, buf: Any, size: int) -> None:
+        self.buf = buf
+        self.pos = 0
+        self.size = size
+
+    def take(self, fmt: str) -> Any:
+        n = struct.calcsize(fmt)
+        if self.pos + n > self.size:
+            raise GGUFError("truncated GGUF header")
+        (value,) = struct.unpack_from(fmt, self.buf, self.pos)
+        self.pos += n
+        return value
+
+    def skip(self, n: int) -> None:
+        if n < 0 or self.pos + n > self.size:
+            raise GGUFError("truncated GGUF header")
+        self.pos += n
+
+    def string(self) -> str:
+        n = self.take("<Q")
+        start = self.pos
+        self.skip(n)
+        return bytes(self.buf[start:self.pos]).decode("utf-8", "replace")
+
+    def skip_string(self) -> None:
+        self.skip(self.take("<Q"))
+
+    def value(self, vtype: int) -> Any:
+        if vtype == _STRING:
+            return self.string()
+        fmt = _SCALAR.get(vtype)
+        if fmt is None:
+            raise GGUFError(f"unknown GGUF value type {vtype}")
+        return self.take(fmt)
+
+    def skip_array(self, itype: int, count: int, keep: set[int]) -> dict:
+        """Skip ``count`` items; return {index: value} for ``keep``."""
+        kept: dict[int, Any] = {}
+        if itype == _STRING:
+            for i in range(count):
+                if i in keep:
+                    kept[i] = self.string()
+                else:
+                    self.skip_string()
+        elif itype == _ARRAY:
+            for _ in range(count):
+                inner = self.take("<I")
+                self.skip_array(inner, self.take("<Q"), set())
+        else:
+            fmt = _SCALAR.get(itype)
+            if fmt is None:
+                raise GGUFError(f"unknown GGUF array type {itype}")
+            width = struct.calcsize(fmt)
+            for i in sorted(k for k in keep if k < count):
+                (kept[i],) = struct.unpack_from(
+                    fmt, self.buf, self.pos + i * width
+                )
+            self.skip(width * count)
+        return kept
+
+
+def _parse(buf: Any, size: int, path: str) -> GGUFInfo:
+    r = _Reader(buf, size)
+    if size < 4 or bytes(buf[0:4]) != MAGIC:
+        raise GGUFError("not a GGUF file")
+    r.pos = 4
+    version = r.take("<I")
+    if version < 2:
+        raise GGUFError(f"unsupported GGUF version {version}")
+    n_tensors = r.take("<Q")
+    n_kv = r.take("<Q")
+    metadata: dict[str, Any] = {}
+    arrays: dict[str, int] = {}
+    tokens_at: int | None = None
+    special_texts: dict[int, str] = {}
+    for _ in range(n_kv):
+        key = r.string()
+        vtype = r.take("<I")
+        if vtype != _ARRAY:
+            metadata[key] = r.value(vtype)
+            continue
+        itype = r.take("<I")
+        count = r.take("<Q")
+        arrays[key] = count
+        if key == "tokenizer.ggml.tokens":
+            tokens_at = r.pos  # resolved after special ids are known
+            r.skip_array(itype, count, set())
+        elif itype not in (_STRING, _ARRAY) and count <= 4096:
+            # short numeric arrays (e.g. per-layer head counts): keep max
+            values = r.skip_array(itype, count, set(range(count)))
+            if values:
+                metadata[key] = max(values.values())
+        else:
+            r.skip_array(itype, count, set())
+    tensors: list[tuple[str, int, tuple[int, ...], int]] = []
+    for _ in range(n_tensors):
+        name = r.string()
+        n_dims = r.take("<I")
+        shape = tuple(r.take("<Q") for _ in range(n_dims))
+        ggml_type = r.take("<I")
+        offset = r.take("<Q")
+        tensors.append((name, ggml_type, shape, offset))
+    align = int(metadata.get("general.alignment", 32) or 32)
+    data_offset = -(-r.pos // align) * align
+    specials = {
+        name: int(metadata[key])
+        for name, key in _SPECIALS.items()
+        if isinstance(metadata.get(key), int)
+    }
+    if tokens_at is not None and specials:
+        r.pos = tokens_at
+        special_texts = r.skip_array(
+            _STRING,
+            arrays["tokenizer.ggml.tokens"],
+            set(specials.values()),
+        )
+    return GGUFInfo(
+        path=path,
+        version=version,
+        file_size=size,
+        data_offset=data_offset,
+        metadata=metadata,
+        array_lengths=arrays,
+        tensors=tuple(
+            GGUFTensor(
+                name, ggml_type, shape, offset,
+                _tensor_nbytes(ggml_type, shape),
+            )
+            for name, ggml_type, shape, offset in tensors
+        ),
+        special_tokens={
+            name: (tid, special_texts.get(tid))
+            for name, tid in specials.items()
+        },
+    )
+
+
+def read_gguf(path: str | Path) -> GGUFInfo:
+    """Parse the header of ``path`` (raises ``GGUFError`` / ``OSError``)."""
+    p = Path(path)
+    with p.open("rb") as fh:
+        size = p.stat().st_size
+        if size < 24:
+            raise GGUFError("not a GGUF file")
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            try:
+                return _parse(mm, size, str(p))
+            except (struct.error, UnicodeDecodeError, OverflowError) as e:
+                raise GGUFError(f"malformed GGUF header: {e}") from e
+
+
+_CACHE: "OrderedDict[str, GGUFInfo | None]" = OrderedDict()
+_LOCK = Lock()
+
+
+def gguf_info(path: str | Path | None) -> GGUFInfo | None:
+    """Cached ``read_gguf`` keyed by file identity (None if unreadable)."""
+    if not path:
+        return None
+    try:
+        p = Path(path)
+        identity = file_identity(p)
+    except (OSError, ValueError):
+        return None
+    with _LOCK:
+        if identity in _CACHE:
+            _CACHE.move_to_end(identity)
+            hit = _CACHE[identity]
+            metrics.inc("gguf_metadata_total", {"result": "hit"})
+            return hit
+    try:
+        info: GGUFInfo | None = read_gguf(p)
+        result = "miss"
+    except (GGUFError, OSError, ValueError):
+        info, result = None, "error"
+    metrics.inc("gguf_metadata_total", {"result": result})
+    with _LOCK:
+        _CACHE[identity] = info
+        while len(_CACHE) > _CACHE_ENTRIES:
+            _CACHE.popitem(last=False)
+    return info
+
+
+def clear_cache() -> None:
+    with _LOCK:
+        _CACHE.clear()
+
+
+__all__ = [
+    "GGML_TYPES",
+    "GGUFError",
+    "GGUFInfo",
+    "GGUFTensor",
+    "clear_cache",
+    "gguf_info",
+    "read_gguf",
+]
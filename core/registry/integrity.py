@@ -0,0 +1,400 @@
+"""Model file integrity: verification cache + chunked (Merkle) manifests.
+
+Summary:
+* Verified results are persisted in ``<storage.paths.cache>/integrity/
+    verified.json`` keyed by file identity ``(path, size, mtime_ns, inode)``.
+    An unchanged file passes without being read again; the stored digest
+    is still compared with the manifest checksum, so a changed manifest
+    is detected.
+* The first verification of a file is a single sequential pass. It
+    computes the full SHA-256 (compared with ``checksum_sha256``) and the
+    per-chunk digests at the same time. When the file matches, the chunk
+    list and its Merkle root are stored as
+    ``integrity/chunks/<sha256>.json``.
+* ``mode: sampled``: a file with a chunk manifest but no identity-cache
+    hit (e.g. touched or copied) is checked by hashing the first, last and
+    ``sample_chunks`` random chunks in parallel threads. It then serves,
+    and a background thread verifies every chunk (``background_full``). A
+    background mismatch is recorded so the next load fails, and it counts
+    model_integrity_failures_total{stage=background}.
+* Files below ``min_size_mb`` are hashed directly without any caching.
+* Config ``llm.integrity``: mode (sampled|full), cache_enabled,
+    min_size_mb, chunk_mb, sample_chunks, workers, background_full.
+* Metrics: model_integrity_checks_total{result=cached|sampled|full},
+    model_integrity_failures_total{stage}, model_integrity_verify_ms.
+"""
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock, Thread
+from time import perf_counter, time
+from typing import Any, Sequence
+import hashlib
+import json
+import os
+import random
+
+from core import metrics
+from core.llm import ModelLoadError
+
+_READ_SIZE = 8 * 1024 * 1024
+_VERSION = 1
+
+
+def file_identity(path: Path) -> str:
+    st = path.stat()
+    return f"{path.resolve()}|{st.st_size}|{st.st_mtime_ns}|{st.st_ino}"
+
+
+def merkle_root(digests: Sequence[str]) -> str:
+    """Root of a binary SHA-256 tree over chunk digests (odd node kept)."""
+    level = [bytes.fromhex(d) for d in digests]
+    if not level:
+        return hashlib.sha256().hexdigest()
+    while len(level) > 1:
+        nxt = [
+            hashlib.sha256(level[i] + level[i + 1]).digest()
+            for i in range(0, len(level) - 1, 2)
+        ]
+        if len(level) % 2:
+            nxt.append(level[-1])
+        level = nxt
+    return level[0].hex()
+
+
+def hash_file(path: Path, chunk_size: int) -> tuple[str, list[str]]:
+    """Full SHA-256 and per-chunk digests in one sequential pass."""
+    full = hashlib.sha256()
+    chunks: list[str] = []
+    part = hashlib.sha256()
+    filled = 0
+    buf = bytearray(min(_READ_SIZE, chunk_size))
+    view = memoryview(buf)
+    with path.open("rb", buffering=0) as f:
+        while True:
+            n = f.readinto(view[: min(len(buf), chunk_size - filled)])
+            if not n:
+                break
+            full.update(view[:n])
+            part.update(view[:n])
+            filled += n
+            if filled == chunk_size:
+                chunks.append(part.hexdigest())
+                part, filled = hashlib.sha256(), 0
+    if filled or not chunks:
+        chunks.append(part.hexdigest())
+    return full.hexdigest(), chunks
+
+
+def hash_chunk(path: Path, index: int, chunk_size: int) -> str:
+    h = hashlib.sha256()
+    left = chunk_size
+    with path.open("rb", buffering=0) as f:
+        f.seek(index * chunk_size)
+        while left > 0:
+            data = f.read(min(_READ_SIZE, left))
+            if not data:
+                break
+            h.update(data)  # releases the GIL for large buffers
+            left -= len(data)
+    return h.hexdigest()
+
+
+def _config() -> dict:
+    try:
+        from core.config import get_config
+
+        cfg = get_config()
+        out = dict(getattr(cfg.llm, "integrity", {}) or {})
+        out.setdefault(
+            "cache_dir", str(Path(cfg.storage.paths.cache) / "integrity")
+        )
+        return out
+    except Exception:  # noqa: BLE001
+        return {}
+
+
+class IntegrityVerifier:
+    """Checksum verification with persisted results (see module doc)."""
+
+    def __init__(
+        self,
+        *,
+        cache_dir: str | Path = ".cache/integrity",
+        mode: str = "sampled",
+        cache_enabled: bool = True,
+        min_size_bytes: int = 256 * 1024 * 1024,
+        chunk_size: int = 64 * 1024 * 1024,
+        sample_chunks: int = 4,
+        workers: int = 4,
+        background_full: bool = True,
+    ) -> None:
+        self._dir = Path(cache_dir)
+        self._mode = mode
+        self._cache_enabled = bool(cache_enabled)
+        self._min_size = max(0, int(min_size_bytes))
+        self._chunk_size = max(1, int(chunk_size))
+        self._samples = max(0, int(sample_chunks))
+        self._workers = max(1, int(workers))
+        self._background_full = bool(background_full)
+        self._lock = Lock()
+        self._background: dict[str, Thread] = {}
+
+    @classmethod
+    def from_config(cls) -> "IntegrityVerifier":
+        cfg = _config()
+        kwargs: dict[str, Any] = {}
+        for key in (
+            "cache_dir",
+            "mode",
+            "cache_enabled",
+            "sample_chunks",
+            "workers",
+            "background_full",
+        ):
+            if cfg.get(key) is not None:
+                kwargs[key] = cfg[key]
+        if cfg.get("min_size_mb") is not None:
+            kwargs["min_size_bytes"] = int(cfg["min_size_mb"]) << 20
+        if cfg.get("chunk_mb"):
+            kwargs["chunk_size"] = int(cfg["chunk_mb"]) << 20
+        return cls(**kwargs)
+
+    # persisted state -------------------------------------------------------
+    @property
+    def _cache_file(self) -> Path:
+        return self._dir / "verified.json"
+
+    def _read_entries(self) -> dict[str, dict]:
+        try:
+            data = json.loads(self._cache_file.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != _VERSION:
+            return {}
+        return dict(data.get("entries") or {})
+
+    def _record(self, identity: str, sha256: str) -> None:
+        with self._lock:
+            entries = self._read_entries()
+            entries[identity] = {"sha256": sha256, "ts": time()}
+            # drop entries of files that no longer exist / changed
+            entries = {
+                k: v for k, v in entries.items()
+                if k == identity or _identity_current(k)
+            }
+            self._dir.mkdir(parents=True, exist_ok=True)
+            tmp = self._cache_file.with_suffix(".tmp")
+            tmp.write_text(
+                json.dumps({"version": _VERSION, "entries": entries}),
+                encoding="utf-8",
+            )
+            os.replace(tmp, self._cache_file)
+
+    def _chunk_file(self, sha256: str) -> Path:
+        return self._dir / "chunks" / f"{sha256}.json"
+
+    def _read_chunks(self, sha256: str, size: int) -> list[str] | None:
+        try:
+            data = json.loads(
+                self._chunk_file(sha256).read_text(encoding="utf-8")
+            )
+        except (OSError, ValueError):
+            return None
+        chunks = list(data.get("chunks") or [])
+        if (
+            data.get("version") != _VERSION
+            or data.get("size") != size
+            or data.get("chunk_size") != self._chunk_size
+            or not chunks
+            or merkle_root(chunks) != data.get("root")
+        ):
+            return None
+        return chunks
+
+    def _write_chunks(self, sha256: str, size: int, chunks: list[str]):
+        path = self._chunk_file(sha256)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(
+            json.dumps(
+                {
+                    "version": _VERSION,
+                    "size": size,
+                    "chunk_size": self._chunk_size,
+                    "chunks": chunks,
+                    "root": merkle_root(chunks),
+                }
+            ),
+            encoding="utf-8",
+        )
+
+    # verification ----------------------------------------------------------
+    def verify(self, manifest: Any, repo_root: str | Path) -> bool:
+        """Raise ``ModelLoadError`` unless the model file is intact."""
+        file_path = manifest.resolve_model_path(Path(repo_root))
+        if not file_path.exists():
+            raise ModelLoadError(f"Model file not found: {file_path}")
+        expected = manifest.checksum_sha256.lower()
+        size = file_path.stat().st_size
+        if not self._cache_enabled or size < self._min_size:
+            from .loader import compute_sha256
+
+            _check(manifest, expected, compute_sha256(file_path))
+            return True
+        labels = {"model": manifest.id}
+        identity = file_identity(file_path)
+        entry = self._read_entries().get(identity)
+        if entry is not None:
+            metrics.inc(
+                "model_integrity_checks_total", {**labels, "result": "cached"}
+            )
+            _check(manifest, expected, entry.get("sha256", ""))
+            return True
+        t0 = perf_counter()
+        chunks = (
+            self._read_chunks(expected, size)
+            if self._mode == "sampled"
+            else None
+        )
+        if chunks is not None:
+            self._verify_sample(manifest, file_path, chunks)
+            result = "sampled"
+            if self._background_full:
+                self._spawn_full(manifest, file_path, identity, chunks)
+        else:
+            actual, digests = hash_file(file_path, self._chunk_size)
+            if actual == expected:
+                self._write_chunks(expected, size, digests)
+            self._record(identity, actual)
+            result = "full"
+        metrics.observe(
+            "model_integrity_verify_ms", (perf_counter() - t0) * 1000.0,
+            {**labels, "result": result},
+        )
+        metrics.inc(
+            "model_integrity_checks_total", {**labels, "result": result}
+        )
+        if result == "full":
+            _check(manifest, expected, actual)
+        return True
+
+    def _hash_many(self, path: Path, indices: Sequence[int]) -> list[str]:
+        with ThreadPoolExecutor(
+            max_workers=min(self._workers, max(1, len(indices))),
+            thread_name_prefix="integrity",
+        ) as pool:
+            return list(
+                pool.map(
+                    lambda i: hash_chunk(path, i, self._chunk_size), indices
+                )
+            )
+
+    def _verify_sample(
+        self, manifest: Any, path: Path, chunks: list[str]
+    ) -> None:
+        n = len(chunks)
+        picks = {0, n - 1}
+        rest = list(range(1, n - 1))
+        picks.update(random.sample(rest, min(self._samples, len(rest))))
+        indices = sorted(picks)
+        for i, digest in zip(indices, self._hash_many(path, indices)):
+            if digest != chunks[i]:
+                metrics.inc(
+                    "model_integrity_failures_total",
+                    {"model": manifest.id, "stage": "sampled"},
+                )
+                raise ModelLoadError(
+                    f"Checksum mismatch for {manifest.id}: chunk {i} differs"
+                )
+
+    def _spawn_full(
+        self, manifest: Any, path: Path, identity: str, chunks: list[str]
+    ) -> None:
+        with self._lock:
+            running = self._background.get(identity)
+            if running is not None and running.is_alive():
+                return
+            thread = Thread(
+                target=self._verify_all,
+                args=(manifest, path, identity, chunks),
+                name=f"integrity-{manifest.id}",
+                daemon=True,
+            )
+            self._background[identity] = thread
+        thread.start()
+
+    def _verify_all(
+        self, manifest: Any, path: Path, identity: str, chunks: list[str]
+    ) -> None:
+        expected = manifest.checksum_sha256.lower()
+        try:
+            digests = self._hash_many(path, range(len(chunks)))
+        except OSError:
+            return
+        if digests == chunks:
+            self._record(identity, expected)
+            return
+        metrics.inc(
+            "model_integrity_failures_total",
+            {"model": manifest.id, "stage": "background"},
+        )
+        print(
+            f"[WARN] Background integrity check failed for {manifest.id}: "
+            f"{path}"
+        )
+        # remembered under this identity: the next load fails fast
+        self._record(identity, "mismatch:" + merkle_root(digests))
+
+    def wait_background(self, timeout: float | None = None) -> None:
+        """Join running background verifications (tests, shutdown)."""
+        with self._lock:
+            threads = list(self._background.values())
+        for t in threads:
+            t.join(timeout)
+
+
+def _identity_current(identity: str) -> bool:
+    path = identity.split("|", 1)[0]
+    try:
+        return file_identity(Path(path)) == identity
+    except OSError:
+        return False
+
+
+def _check(manifest: Any, expected: str, actual: str) -> None:
+    if actual.lower() != expected:
+        raise ModelLoadError(
+            "Checksum mismatch for {id}: expected {exp} got {act}".format(
+                id=manifest.id, exp=manifest.checksum_sha256, act=actual
+            )
+        )
+
+
+_VERIFIER: IntegrityVerifier | None = None
+_VERIFIER_LOCK = Lock()
+
+
+def get_verifier() -> IntegrityVerifier:
+    global _VERIFIER
+    with _VERIFIER_LOCK:
+        if _VERIFIER is None:
+            _VERIFIER = IntegrityVerifier.from_config()
+        return _VERIFIER
+
+
+def reset_for_tests() -> None:  # pragma: no cover - test helper
+    global _VERIFIER
+    with _VERIFIER_LOCK:
+        _VERIFIER = None
+
+
+__all__ = [
+    "IntegrityVerifier",
+    "file_identity",
+    "get_verifier",
+    "hash_chunk",
+    "hash_file",
+    "merkle_root",
+    "reset_for_tests",
+]
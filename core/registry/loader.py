@@ -10,6 +10,7 @@ import yaml
 from yaml import YAMLError
 
 from core.llm import ModelLoadError
+from .integrity import get_verifier
 from .manifest import ModelManifest
 
 _registry_lock = threading.Lock()
@@ -78,7 +79,7 @@ def load_manifests(
         return index
 
 
-def compute_sha256(path: Path, chunk_size: int = 1024 * 1024) -> str:
+def compute_sha256(path: Path, chunk_size: int = 8 * 1024 * 1024) -> str:
     h = hashlib.sha256()
     with path.open("rb") as f:
         for chunk in iter(lambda: f.read(chunk_size), b""):
@@ -91,19 +92,14 @@ def verify_model_checksum(
     repo_root: str | Path,
     skip: bool = False,
 ) -> bool:
+    """Raise ``ModelLoadError`` unless the file matches ``checksum_sha256``.
+
+    Results are cached by file identity and large files may be checked by
+    sampled chunks with a background full pass (``core.registry.integrity``).
+    """
     if skip:
         return True
-    file_path = manifest.resolve_model_path(Path(repo_root))
-    if not file_path.exists():
-        raise ModelLoadError(f"Model file not found: {file_path}")
-    actual = compute_sha256(file_path)
-    if actual.lower() != manifest.checksum_sha256.lower():
-        raise ModelLoadError(
-            "Checksum mismatch for {id}: expected {exp} got {act}".format(
-                id=manifest.id, exp=manifest.checksum_sha256, act=actual
-            )
-        )
-    return True
+    return get_verifier().verify(manifest, repo_root)
 
 
 def clear_manifest_cache(repo_root: str | Path | None = None) -> None:
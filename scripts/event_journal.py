@@ -0,0 +1,153 @@
+"""Query the persistent event journal (``storage.journal``).
+
+Subcommands:
+  segments                 list segment files with record counts / spans
+  timeline REQUEST_ID      every event of one request (JSON lines, or a
+                           relative-time table with --table)
+  export [--since/--until] latency breakdown (ttft / decode / total,
+                           tokens/s) per request started in the range,
+                           CSV or JSON (--format), to stdout or --out
+
+Time arguments take epoch seconds or ISO-8601 (``2026-10-17T12:00``,
+local time when no offset is given). ``--dir`` overrides the configured
+journal directory (``<storage.paths.data>/<storage.journal.dir>``).
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from datetime import datetime
+
+# ensure repository root on path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from core.eventbus.journal import (  # noqa: E402
+    JournalReader,
+    journal_config,
+    latency_breakdown,
+)
+
+EXPORT_COLUMNS = [
+    "request_id",
+    "model_id",
+    "status",
+    "stop_reason",
+    "prompt_tokens",
+    "output_tokens",
+    "ttft_ms",
+    "decode_ms",
+    "total_ms",
+    "tokens_per_s",
+    "cancel_latency_ms",
+    "events",
+]
+
+
+def _when(value: str | None) -> float | None:
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def cmd_segments(reader: JournalReader, _args) -> str:  # noqa: ANN001
+    rows = []
+    for seg in reader.segments():
+        idx = reader.index(seg)
+        rows.append(
+            {
+                "segment": seg.name,
+                "bytes": seg.stat().st_size,
+                "records": idx.count,
+                "first_ts": idx.first_ts,
+                "max_ts": idx.max_ts,
+                "sealed": seg.with_suffix(".idx").exists(),
+            }
+        )
+    return json.dumps(rows, ensure_ascii=False, indent=2)
+
+
+def cmd_timeline(reader: JournalReader, args) -> str:  # noqa: ANN001
+    events = reader.timeline(args.request_id)
+    if not args.table:
+        return "\n".join(
+            json.dumps(e, ensure_ascii=False, default=str) for e in events
+        )
+    if not events:
+        return ""
+    t0 = float(events[0].get("ts") or 0.0)
+    lines = [f"{'+ms':>10}  event"]
+    for e in events:
+        dt = (float(e.get("ts") or t0) - t0) * 1000.0
+        p = e.get("payload") or {}
+        extra = ", ".join(
+            f"{k}={p[k]}"
+            for k in ("seq", "tokens_out", "status", "reason", "latency_ms")
+            if k in p
+        )
+        lines.append(f"{dt:>10.1f}  {e.get('event')}  {extra}".rstrip())
+    return "\n".join(lines)
+
+
+def cmd_export(reader: JournalReader, args) -> str:  # noqa: ANN001
+    ids = args.request_id or reader.request_ids(
+        _when(args.since), _when(args.until)
+    )
+    rows = [latency_breakdown(reader.timeline(rid)) for rid in ids]
+    if args.format == "json":
+        return json.dumps(rows, ensure_ascii=False, indent=2)
+    buf = io.StringIO()
+    writer = csv.DictWriter(
+        buf, fieldnames=EXPORT_COLUMNS, extrasaction="ignore"
+    )
+    writer.writeheader()
+    writer.writerows(rows)
+    return buf.getvalue().rstrip("\n")
+
+
+def main(argv: list[str] | None = None) -> int:  # noqa: D401
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--dir", help="journal directory (default: config)")
+    ap.add_argument("--out", help="write output to this file")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("segments")
+    tl = sub.add_parser("timeline")
+    tl.add_argument("request_id")
+    tl.add_argument("--table", action="store_true")
+    ex = sub.add_parser("export")
+    ex.add_argument("--since")
+    ex.add_argument("--until")
+    ex.add_argument(
+        "--request-id", action="append", help="repeatable; skips the range"
+    )
+    ex.add_argument("--format", choices=("csv", "json"), default="csv")
+    args = ap.parse_args(argv)
+    root = args.dir or journal_config().get("root")
+    if not root:
+        print("journal directory unknown (pass --dir)", file=sys.stderr)
+        return 2
+    reader = JournalReader(root)
+    handler = {
+        "segments": cmd_segments,
+        "timeline": cmd_timeline,
+        "export": cmd_export,
+    }[args.cmd]
+    text = handler(reader, args)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8", newline="") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
@@ -5,6 +5,14 @@
  overhead.
 Outputs JSON with total_ms and per_event_us plus overhead_ratio.
 
+Per-token workload (``per_token``): REQUESTS x TOKENS GenerationChunk
+emits, the shape of a streaming decode, under three subscriber setups:
+  unobserved  - private bus, nobody subscribed (payload never built)
+  collector   - core.events.emit with the default metrics collector
+  eager_copy  - private bus, one subscriber, payload built eagerly with
+                dataclasses.asdict (the pre-lazy path, for reference)
+Reported as per_token_us each (async mode: includes the final flush).
+
 Not a rigorous perf test; intended to document <2% target qualitatively.
 """
 from __future__ import annotations
@@ -20,9 +28,18 @@ ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 if ROOT not in sys.path:
     sys.path.insert(0, ROOT)
 
-from core.events import emit, GenerationCompleted  # noqa: E402
+from dataclasses import asdict  # noqa: E402
+
+from core.eventbus import EventBus, flush, get_bus  # noqa: E402
+from core.events import (  # noqa: E402
+    emit,
+    GenerationChunk,
+    GenerationCompleted,
+)
 
 N = 2000
+REQUESTS = 8
+TOKENS = 256
 
 
 def bench_events(n: int) -> float:  # ms
@@ -43,6 +60,47 @@ def bench_events(n: int) -> float:  # ms
     return (time.time() - start) * 1000
 
 
+def _chunks(requests: int, tokens: int):
+    for r in range(requests):
+        for i in range(tokens):
+            yield GenerationChunk(
+                request_id=f"r{r}",
+                model_id="bench",
+                role="primary",
+                correlation_id=f"r{r}",
+                seq=i,
+                text=" tok",
+                tokens_out=i + 1,
+            )
+
+
+def bench_per_token(requests: int, tokens: int) -> dict:  # us per token
+    total = requests * tokens
+    out = {}
+
+    quiet = EventBus()
+    quiet.configure(mode="sync")
+    start = time.perf_counter()
+    for ev in _chunks(requests, tokens):
+        quiet.emit("GenerationChunk", ev.to_event)
+    out["unobserved"] = (time.perf_counter() - start) / total * 1e6
+
+    start = time.perf_counter()
+    for ev in _chunks(requests, tokens):
+        emit(ev)
+    flush(30)
+    out["collector"] = (time.perf_counter() - start) / total * 1e6
+
+    eager = EventBus()
+    eager.configure(mode="sync")
+    eager.subscribe("GenerationChunk", lambda p: None)
+    start = time.perf_counter()
+    for ev in _chunks(requests, tokens):
+        eager.emit("GenerationChunk", asdict(ev))
+    out["eager_copy"] = (time.perf_counter() - start) / total * 1e6
+    return {k: round(v, 3) for k, v in out.items()}
+
+
 def bench_baseline(n: int) -> float:  # ms
     start = time.time()
     # minimal work approximating loop overhead
@@ -55,9 +113,11 @@ def main():  # noqa: D401
     runs = 5
     event_ms = []
     base_ms = []
+    per_token = []
     for _ in range(runs):
         event_ms.append(bench_events(N))
         base_ms.append(bench_baseline(N))
+        per_token.append(bench_per_token(REQUESTS, TOKENS))
     ev_avg = mean(event_ms)
     base_avg = mean(base_ms)
     per_event_us = (ev_avg / N) * 1000
@@ -70,6 +130,17 @@ def main():  # noqa: D401
                 "baseline_avg_ms": round(base_avg, 3),
                 "per_event_us": round(per_event_us, 3),
                 "overhead_ratio": round(overhead_ratio, 4),
+                "eventbus_mode": get_bus().mode,
+                "per_token": {
+                    "requests": REQUESTS,
+                    "tokens": TOKENS,
+                    **{
+                        f"{k}_per_token_us": round(
+                            mean(run[k] for run in per_token), 3
+                        )
+                        for k in per_token[0]
+                    },
+                },
             },
             ensure_ascii=False,
         )
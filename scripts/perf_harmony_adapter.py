@@ -0,0 +1,83 @@
+"""Micro-benchmark: Harmony adapter per-chunk cost vs output length.
+
+Feeds a synthetic llama-style token stream (one piece per chunk: an
+analysis message followed by a final message, up to ``--tokens`` pieces)
+through ``HarmonyChannelAdapter.process_chunk`` and reports the median
+per-chunk cost for consecutive windows of the stream. With the
+incremental parser the medians stay flat as the output grows; a parser
+that rescans its buffer grows linearly per chunk (quadratic in total).
+
+Outputs JSON: per-window median/p95 in microseconds plus ``growth_ratio``
+(last window median / first window median, ~1.0 expected).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from statistics import median
+
+# ensure repository root on path
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from core.llm.adapters import HarmonyChannelAdapter  # noqa: E402
+
+
+def token_stream(n_tokens: int, analysis_share: float = 0.5) -> list[str]:
+    n_analysis = int(n_tokens * analysis_share)
+    pieces = ["<|channel|>", "analysis", "<|message|>"]
+    pieces += [f" w{i}" for i in range(n_analysis)]
+    pieces += ["<|end|>", "<|start|>", "assistant", "<|channel|>", "final"]
+    pieces += ["<|message|>"]
+    pieces += [f" f{i}" for i in range(max(0, n_tokens - len(pieces) - 1))]
+    pieces.append("<|return|>")
+    return pieces
+
+
+def bench(n_tokens: int, window: int) -> dict:
+    adapter = HarmonyChannelAdapter(
+        {"model_id": "bench", "reasoning": {"max_tokens": n_tokens}}
+    )
+    costs_us: list[float] = []
+    for piece in token_stream(n_tokens):
+        t0 = time.perf_counter_ns()
+        for _ in adapter.process_chunk(piece):
+            pass
+        costs_us.append((time.perf_counter_ns() - t0) / 1000.0)
+    list(adapter.finalize())
+    windows = []
+    for start in range(0, len(costs_us), window):
+        chunk = sorted(costs_us[start:start + window])
+        if not chunk:
+            continue
+        windows.append(
+            {
+                "tokens": f"{start}-{start + len(chunk)}",
+                "median_us": round(median(chunk), 3),
+                "p95_us": round(chunk[int(len(chunk) * 0.95) - 1], 3),
+            }
+        )
+    first = windows[0]["median_us"] or 1e-9
+    return {
+        "tokens": n_tokens,
+        "window": window,
+        "total_ms": round(sum(costs_us) / 1000.0, 3),
+        "windows": windows,
+        "growth_ratio": round(windows[-1]["median_us"] / first, 3),
+    }
+
+
+def main():  # noqa: D401
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tokens", type=int, default=8192)
+    ap.add_argument("--window", type=int, default=1024)
+    args = ap.parse_args()
+    print(json.dumps(bench(args.tokens, args.window), ensure_ascii=False))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
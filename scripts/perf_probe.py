@@ -39,7 +39,7 @@ def _capture_generation_tokens(func) -> Dict[str, Any]:
     def handler(name: str, payload: Dict[str, Any]):  # noqa: D401
         nonlocal last
         if name == "GenerationCompleted":
-            last = payload
+            last = dict(payload)
 
     unsub = subscribe(handler)
     try:
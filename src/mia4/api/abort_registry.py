@@ -1,57 +1,134 @@
 """Abort registry for in-flight generation requests.
 
-Thread-safe minimal structure mapping request_id -> aborted flag.
+Maps request_id -> ``CancelHandle`` (a ``threading.Event`` plus abort
+timestamp). Producers hand the handle (or its event) down to the decode
+loop, where llama.cpp stopping criteria check it per token; consumers
+block on ``handle.wait()`` instead of polling. Reads are lock-free (dict
+lookups and ``Event.is_set`` are atomic); the lock only guards mutation.
+``handle.reason`` records why the request was cancelled first
+(``user_abort`` via ``abort()``, ``client_disconnect`` via
+``disconnect()``).
 Public API kept tiny to simplify future swap (e.g. to actor mailbox).
 """
 from __future__ import annotations
 
-from threading import RLock
+from threading import Event, RLock
+from time import time as _now
+from typing import Any, Callable
 
-_ABORTS: dict[str, bool] = {}
+_HANDLES: dict[str, "CancelHandle"] = {}
 _ABORT_START: dict[str, float] = {}
 _LOCK = RLock()
 
 
-def register(request_id: str) -> None:  # noqa: D401
+class CancelHandle:
+    """Per-request cancellation token.
+
+    Callable with the llama.cpp ``StoppingCriteria`` signature
+    ``(input_ids, logits) -> bool`` so it can be passed straight into a
+    ``StoppingCriteriaList``.
+    """
+
+    __slots__ = ("request_id", "event", "started_at", "reason", "_callbacks")
+
+    def __init__(self, request_id: str) -> None:
+        self.request_id = request_id
+        self.event = Event()
+        self.started_at: float | None = None
+        self.reason: str | None = None
+        self._callbacks: list[Callable[[], None]] = []
+
+    def is_set(self) -> bool:  # noqa: D401
+        return self.event.is_set()
+
+    def wait(self, timeout: float | None = None) -> bool:  # noqa: D401
+        return self.event.wait(timeout)
+
+    def cancel(
+        self, started_at: float | None = None, reason: str = "user_abort"
+    ) -> None:
+        with _LOCK:
+            if self.started_at is None:
+                self.started_at = started_at or _now()
+            if self.event.is_set():
+                return
+            self.reason = reason
+            self.event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for cb in callbacks:
+            try:
+                cb()
+            except Exception:  # noqa: BLE001
+                pass
+
+    def add_callback(self, cb: Callable[[], None]) -> None:
+        """Run ``cb`` on cancel (immediately if already cancelled)."""
+        with _LOCK:
+            if not self.event.is_set():
+                self._callbacks.append(cb)
+                return
+        cb()
+
+    def __call__(self, input_ids: Any = None, logits: Any = None) -> bool:
+        return self.event.is_set()
+
+
+def register(request_id: str) -> CancelHandle:  # noqa: D401
     with _LOCK:
-        _ABORTS[request_id] = False
+        handle = CancelHandle(request_id)
+        _HANDLES[request_id] = handle
+        return handle
+
+
+def get(request_id: str) -> CancelHandle | None:  # noqa: D401
+    return _HANDLES.get(request_id)
 
 
 def abort(request_id: str) -> bool:  # noqa: D401
     with _LOCK:
-        if request_id in _ABORTS:
-            _ABORTS[request_id] = True
-            from time import time as _t
-            _ABORT_START.setdefault(request_id, _t())
-            return True
+        handle = _HANDLES.get(request_id)
+        if handle is None:
+            return False
+        started = _ABORT_START.setdefault(request_id, _now())
+    handle.cancel(started)
+    return True
+
+
+def disconnect(request_id: str) -> bool:
+    """Cancel because the SSE client went away (no user abort marker)."""
+    handle = _HANDLES.get(request_id)
+    if handle is None or handle.event.is_set():
         return False
+    handle.cancel(reason="client_disconnect")
+    return True
 
 
 def is_aborted(request_id: str) -> bool:  # noqa: D401
-    with _LOCK:
-        return _ABORTS.get(request_id, False)
+    handle = _HANDLES.get(request_id)
+    return handle is not None and handle.event.is_set()
 
 
 def clear(request_id: str) -> None:  # noqa: D401
     with _LOCK:
-        _ABORTS.pop(request_id, None)
+        _HANDLES.pop(request_id, None)
         _ABORT_START.pop(request_id, None)
 
 
 def abort_started_at(request_id: str) -> float | None:  # noqa: D401
-    with _LOCK:
-        return _ABORT_START.get(request_id)
+    return _ABORT_START.get(request_id)
 
 
 def mark_start(request_id: str) -> None:  # noqa: D401
-    from time import time as _t
     with _LOCK:
-        _ABORT_START[request_id] = _t()
+        _ABORT_START[request_id] = _now()
 
 
 __all__ = [
+    "CancelHandle",
     "register",
+    "get",
     "abort",
+    "disconnect",
     "is_aborted",
     "clear",
     "abort_started_at",
@@ -2,16 +2,25 @@
 
 Minimal scaffold: /health and /config endpoints.
 /generate and /models to be added next iterations.
+Server startup runs the model warm pool (``llm.warmup``); /ready reports
+its progress (503 until the primary is warm). The event journal
+(``storage.journal``) runs for the lifetime of the app when enabled.
+Shutdown stops the decode scheduler workers.
 """
 from __future__ import annotations
 
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from core.registry.gguf import gguf_info
 from core.registry.loader import load_manifests
 from core.modules.module_manager import get_module_manager
+from core.modules.warm_pool import readiness, start_warm_pool
+from core.eventbus.journal import start_journal, stop_journal
+from core.llm.scheduler import shutdown_all as stop_decode_workers
 from pathlib import Path
 import yaml
 from mia4.api.routes.generate import router as generate_router
@@ -20,12 +29,35 @@ from core.config import get_config
 import time
 
 
+@asynccontextmanager
+async def _lifespan(_app: FastAPI):  # noqa: D401
+    try:
+        metrics.configure_histograms(
+            **get_config().metrics.histograms.model_dump()
+        )
+    except Exception:  # noqa: BLE001
+        pass
+    # Warm-up runs in a background thread: startup is not blocked
+    try:
+        start_warm_pool()
+    except Exception:  # noqa: BLE001
+        pass
+    try:
+        start_journal()  # storage.journal (off unless enabled)
+    except Exception:  # noqa: BLE001
+        pass
+    yield
+    stop_decode_workers()
+    stop_journal()
+
+
 def create_app() -> FastAPI:
     app = FastAPI(
         title="MIA4 API",
         version="0.1.0",
         docs_url=None,
         redoc_url=None,
+        lifespan=_lifespan,
     )
 
     # Dev CORS (UI on :3000)
@@ -44,6 +76,12 @@ def create_app() -> FastAPI:
     def health():  # noqa: D401
         return {"status": "ok"}
 
+    @app.get("/ready")
+    def ready():  # noqa: D401
+        status = readiness()
+        code = 200 if status["ready"] else 503
+        return JSONResponse(status, status_code=code)
+
     @app.get("/config")
     def config():  # noqa: D401
         ui_mode = os.getenv("MIA_UI_MODE", "user")
@@ -213,9 +251,14 @@ def create_app() -> FastAPI:
                 if passport
                 else None
             )
+            # GGUF header facts (cached by file identity; no model load)
+            header = gguf_info(m.path)
             limits = {
                 "max_output_tokens": max_out,
                 "context_length": m.context_length,
+                "context_length_train": (
+                    header.context_length if header else None
+                ),
                 "reasoning_max_tokens": reasoning_default,
             }
             models_out.append(
@@ -229,11 +272,17 @@ def create_app() -> FastAPI:
                     "passport_version": passport_version,
                     "passport_hash": passport_hash,
                     "limits": limits,
+                    "gguf": header.summary() if header else None,
                     # system prompt hash placeholder (filled later)
                     "system_prompt": None,
                 }
             )
-        return {"models": models_out}
+        residency = None
+        try:
+            residency = mgr.get("llm").residency()
+        except Exception:  # noqa: BLE001
+            pass
+        return {"models": models_out, "residency": residency}
 
     # Abort endpoint -------------------------------------------------------
     from mia4.api import abort_registry as _abort_reg  # local import
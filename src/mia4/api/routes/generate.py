@@ -1,14 +1,27 @@
-"""/generate route: streaming with reasoning split & stop sequence support."""
+"""/generate route: streaming with reasoning split & stop sequence support.
+
+Request preparation (model acquire, prompt framing) runs on the threadpool;
+the SSE body is an async generator over ``PrimaryPipeline.astream`` so an
+open stream costs a coroutine, not a worker thread. Requests pass the
+model's admission controller first (``core.llm.admission``): over the
+concurrency limit they wait in a fair queue and the stream opens with
+``queued`` meta frames; a full queue answers 429 with ``Retry-After``.
+The generation is pumped into a per-request frame buffer
+(``mia4.api.stream_buffer``) and responses follow it, so a dropped client
+can resume with ``GET /generate/{request_id}/stream`` + ``Last-Event-ID``.
+"""
 from __future__ import annotations
 
+import asyncio
 import json
 import os
 import time
 import traceback
 import uuid
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException
 import threading
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 
 from core import metrics
@@ -24,11 +37,17 @@ from core.events import (
 )
 from core.events import ModelPassportMismatch  # explicit for stream warning
 from core.events import subscribe
+from core.llm.admission import AdmissionRejected, Ticket, get_controller
 from core.llm.factory import apply_reasoning_overrides, get_model
 from core.llm.pipeline.primary import PrimaryPipeline
+from core.llm.speculative import MODES as SPECULATIVE_MODES
+from core.llm.speculative import speculative_config
+from core.llm.types import SpeculativeRequest
+from core.modules.module_manager import get_module_manager
+from core.registry.loader import load_manifests
 from mia4.api.session_store import store
-from mia4.api.sse import format_event
-from mia4.api import abort_registry
+from mia4.api.sse import DisconnectAwareStreamingResponse, format_event
+from mia4.api import abort_registry, stream_buffer
 
 router = APIRouter()
 
@@ -56,6 +75,7 @@ class GenerateOverrides(BaseModel):  # noqa: D401
     dev_pre_stream_delay_ms: float | None = None
     dev_per_token_delay_ms: float | None = None
     stop: list[str] | None = None
+    speculative: str | None = None  # off | ngram | draft
 
 
 class GenerateRequest(BaseModel):  # noqa: D401
@@ -127,16 +147,296 @@ def _record_reasoning_ratio_alert(
     )
 
 
+def _compaction_provider(model_id: str):
+    """Lightweight model for background history compaction (None: skip).
+
+    Never the decoding model itself (one llama context per provider).
+    Unless ``llm.compaction.load_model`` is set, only an already loaded
+    lightweight model is used, so compaction never triggers a load.
+    """
+    try:
+        cfg = get_config().llm
+        lw_id = cfg.lightweight.id if cfg.lightweight else None
+        if not lw_id or lw_id == model_id:
+            return None
+        comp_cfg = getattr(cfg, "compaction", {}) or {}
+        llm_mod = get_module_manager().get("llm")
+        if not comp_cfg.get("load_model", False) and lw_id not in set(
+            llm_mod.info().get("loaded_providers", [])
+        ):
+            return None
+        return llm_mod.get_provider(lw_id, skip_checksum=True)
+    except Exception:  # noqa: BLE001
+        return None
+
+
+def _servable(model_id: str) -> bool:
+    """Whether ``model_id`` names a model this server can serve.
+
+    Registry manifests, the configured primary / lightweight ids and
+    loaded providers (aliases) count; anything else is a client typo.
+    """
+    try:
+        if model_id in load_manifests("."):
+            return True
+        cfg = get_config().llm
+        roles = (cfg.primary, cfg.lightweight)
+        if model_id in {getattr(r, "id", None) for r in roles if r}:
+            return True
+        llm_mod = get_module_manager().get("llm")
+        return model_id in set(llm_mod.info().get("loaded_providers", []))
+    except Exception:  # noqa: BLE001
+        return False
+
+
+def _draft_provider(model_id: str):
+    """Draft model for speculative decoding (None: prompt lookup only).
+
+    ``llm.speculative.draft_model`` (default: the lightweight model); like
+    compaction it is only loaded on demand when ``load_draft`` is set.
+    """
+    try:
+        cfg = get_config().llm
+        spec = speculative_config()
+        draft_id = spec.get("draft_model") or (
+            cfg.lightweight.id if cfg.lightweight else None
+        )
+        if not draft_id or draft_id == model_id:
+            return None
+        llm_mod = get_module_manager().get("llm")
+        if not spec.get("load_draft", False) and draft_id not in set(
+            llm_mod.info().get("loaded_providers", [])
+        ):
+            return None
+        return llm_mod.get_provider(draft_id, skip_checksum=True)
+    except Exception:  # noqa: BLE001
+        return None
+
+
+def _speculative_request(
+    model_id: str, mode: str | None
+) -> SpeculativeRequest | None:
+    mode = mode or speculative_config().get("default_mode") or "off"
+    if mode == "off":
+        return None
+    draft = _draft_provider(model_id) if mode == "draft" else None
+    return SpeculativeRequest(mode=mode, draft_provider=draft)
+
+
 @router.post("/generate")
-def generate(req: GenerateRequest):  # noqa: D401
-    session_id = req.session_id
-    model_id = req.model
+async def generate(req: GenerateRequest):  # noqa: D401
     if not req.prompt.strip():  # Empty prompt guard
         raise HTTPException(status_code=400, detail="prompt-empty")
+    request_id = str(uuid.uuid4())
+    # Controllers live for the process: none for unknown ids (they fail in
+    # _open_generate), so client-chosen strings cannot grow the registry.
+    admission = get_controller(req.model) if _servable(req.model) else None
+    ticket = None
+    if admission is not None:
+        try:
+            ticket = admission.admit(req.session_id)
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=429,
+                detail="admission-queue-full",
+                headers={"Retry-After": str(e.retry_after_s)},
+            ) from e
+    if ticket is not None and not ticket.granted:
+        return _shared(_queued_response(req, ticket, request_id), request_id)
+    try:
+        # Preparation may load the model: keep it off the event loop
+        resp = await run_in_threadpool(_open_generate, req, request_id)
+    except BaseException:
+        if ticket is not None:
+            ticket.release()
+        raise
+    if ticket is not None:
+        resp.body_iterator = _holding_slot(resp.body_iterator, ticket)
+    return _shared(resp, request_id)
+
+
+@router.get("/generate/{request_id}/stream")
+async def generate_stream(
+    request_id: str, last_event_id: str | None = Header(None)
+):  # noqa: D401
+    """Reattach to a generation; replays frames after ``Last-Event-ID``."""
+    buf = stream_buffer.get(request_id)
+    if buf is None:
+        raise HTTPException(status_code=404, detail="stream-not-found")
+    try:
+        last = int(last_event_id) if last_event_id else None
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400, detail="invalid-last-event-id"
+        ) from e
+    metrics.inc(
+        "sse_resume_attach_total",
+        {"state": "completed" if buf.closed else "live"},
+    )
+    return _follower(buf, last)
+
+
+def _shared(
+    resp: DisconnectAwareStreamingResponse, request_id: str
+) -> StreamingResponse:
+    """Run the generation into its frame buffer; serve a follower of it.
+
+    The generation outlives its first connection: it is cancelled as a
+    client disconnect only when no follower remains for
+    ``llm.stream_resume.detach_grace_s``.
+    """
+    buf = stream_buffer.open_buffer(
+        request_id, on_abandon=resp.on_disconnect
+    )
+    if buf is None:
+        return resp
+    buf.start(resp.body_iterator)
+    return _follower(buf, None)
+
+
+def _follower(
+    buf: stream_buffer.StreamBuffer, last_event_id: int | None
+) -> StreamingResponse:
+    return DisconnectAwareStreamingResponse(
+        buf.follow(last_event_id), media_type="text/event-stream"
+    )
+
+
+async def _holding_slot(body, ticket: Ticket):  # noqa: ANN001
+    """Pass the SSE body through; free the admission slot when done."""
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        try:
+            await body.aclose()
+        finally:
+            ticket.release()
+
+
+def _queued_response(
+    req: GenerateRequest, ticket: Ticket, request_id: str
+) -> DisconnectAwareStreamingResponse:
+    """Stream ``queued`` meta frames until a slot frees, then generate.
+
+    Position updates are pushed whenever the queue moves; a request still
+    waiting at the queue-time budget ends with a ``queue-timeout`` error.
+    A client that leaves while queued withdraws its ticket: the
+    generation is never opened.
+    """
+    admission = ticket.controller
+    opened: dict[str, StreamingResponse] = {}
+    abandoned = False
+
+    def _meta(status: str, **extra: object) -> str:
+        payload = {
+            "request_id": request_id,
+            "model_id": req.model,
+            "status": status,
+            **extra,
+        }
+        return format_event("meta", json.dumps(payload))
+
+    def _on_client_disconnect() -> None:
+        nonlocal abandoned
+        abandoned = True
+        hook = getattr(opened.get("resp"), "on_disconnect", None)
+        if hook is not None:
+            hook()
+        elif not ticket.released:
+            ticket.withdraw()
+
+    async def _body():
+        try:
+            last_position = None
+            while not ticket.granted and not abandoned:
+                position = ticket.position
+                if position and position != last_position:
+                    last_position = position
+                    yield _meta(
+                        "queued",
+                        position=position,
+                        queue_depth=admission.waiting,
+                    )
+                remaining = ticket.deadline - time.perf_counter()
+                if remaining <= 0 and not admission.expire(ticket):
+                    err = {
+                        "request_id": request_id,
+                        "model_id": req.model,
+                        "code": "queue-timeout",
+                        "error_type": "queue-timeout",
+                        "message": "admission-queue-timeout",
+                        "retry_after_s": admission.retry_after(),
+                    }
+                    yield format_event("error", json.dumps(err))
+                    yield format_event(
+                        "end",
+                        json.dumps(
+                            {
+                                "request_id": request_id,
+                                "status": "error",
+                                "error_type": "queue-timeout",
+                            }
+                        ),
+                    )
+                    return
+                await ticket.changed(remaining)
+            if abandoned:
+                metrics.inc(
+                    "admission_abandoned_total", {"model": req.model}
+                )
+                return
+            yield _meta("admitted", wait_ms=int(ticket.wait_ms))
+            try:
+                resp = await run_in_threadpool(
+                    _open_generate, req, request_id
+                )
+            except HTTPException as e:
+                err = {
+                    "request_id": request_id,
+                    "model_id": req.model,
+                    "code": str(e.status_code),
+                    "error_type": "stream-init",
+                    "message": e.detail,
+                }
+                yield format_event("error", json.dumps(err))
+                yield format_event(
+                    "end",
+                    json.dumps(
+                        {
+                            "request_id": request_id,
+                            "status": "error",
+                            "error_type": "stream-init",
+                        }
+                    ),
+                )
+                return
+            opened["resp"] = resp
+            body = resp.body_iterator
+            try:
+                async for chunk in body:
+                    yield chunk
+            finally:
+                await body.aclose()
+        finally:
+            ticket.release()
+
+    return DisconnectAwareStreamingResponse(
+        _body(),
+        media_type="text/event-stream",
+        on_disconnect=_on_client_disconnect,
+    )
+
+
+def _open_generate(
+    req: GenerateRequest, request_id: str | None = None
+) -> DisconnectAwareStreamingResponse:
+    session_id = req.session_id
+    model_id = req.model
     store.add(session_id, "user", req.prompt)
 
-    request_id = str(uuid.uuid4())
-    abort_registry.register(request_id)
+    request_id = request_id or str(uuid.uuid4())
+    cancel = abort_registry.register(request_id)
     abort_started_at = None  # set if/when abort endpoint invoked
     t0 = time.time()
     is_test_mode = os.environ.get("MIA_TEST_MODE") == "1"
@@ -152,6 +452,13 @@ def generate(req: GenerateRequest):  # noqa: D401
         effective_reasoning_mode = norm_mode
     else:
         effective_reasoning_mode = None
+    speculative_mode = req.overrides.speculative if req.overrides else None
+    if speculative_mode is not None:
+        speculative_mode = speculative_mode.lower()
+        if speculative_mode not in SPECULATIVE_MODES:
+            raise HTTPException(
+                status_code=400, detail="invalid-speculative-mode"
+            )
     metrics.inc("sse_stream_open_total", {"model": model_id})
 
     # Collect user overrides
@@ -387,6 +694,10 @@ def generate(req: GenerateRequest):  # noqa: D401
         passport_defaults=passport_defaults,
         sampling_origin=sampling_origin,
         reasoning_max_tokens=reasoning_max_tokens_preset,
+        session_id=session_id,
+        history_store=store,
+        summarizer=lambda: _compaction_provider(model_id),
+        speculative=_speculative_request(model_id, speculative_mode),
     )
     # ctx.prompt already harmony-framed; no separate variable needed
     prompt_tokens = ctx.prompt_tokens
@@ -443,7 +754,57 @@ def generate(req: GenerateRequest):  # noqa: D401
         out = "\n".join(cleaned_lines).lstrip()
         return out
 
-    def _iter():  # noqa: D401
+    # Shared with the disconnect hook (runs outside the body generator)
+    stream_state = {"decoded": 0, "tokens_out": 0, "finished": False}
+
+    def _client_gone() -> bool:
+        return getattr(cancel, "reason", None) == "client_disconnect"
+
+    def _on_client_disconnect() -> None:
+        """Abort decode for a dead socket and report the unused budget."""
+        if stream_state["finished"] or not abort_registry.disconnect(
+            request_id
+        ):
+            return
+        labels = {"model": model_id}
+        budget = (
+            effective_max_tokens
+            or base_kwargs.get("max_tokens")
+            or passport_defaults.get("max_output_tokens")
+            or 0
+        )
+        try:
+            unused = max(0, int(budget) - stream_state["decoded"])
+        except (TypeError, ValueError):
+            unused = 0
+        try:
+            emit(
+                GenerationCancelled(
+                    request_id=request_id,
+                    model_id=model_id,
+                    role=provider.info().role,
+                    reason="client_disconnect",
+                    latency_ms=int((time.time() - t0) * 1000),
+                    output_tokens=stream_state["tokens_out"],
+                    correlation_id=request_id,
+                    message="client-disconnect",
+                )
+            )
+        except Exception:  # noqa: BLE001
+            pass
+        metrics.inc(
+            "generation_cancelled_total",
+            {**labels, "reason": "client_disconnect"},
+        )
+        metrics.inc(
+            "client_disconnect_unused_budget_tokens_total", labels, unused
+        )
+        metrics.inc(
+            "sse_stream_close_total",
+            {**labels, "reason": "client_disconnect"},
+        )
+
+    async def _iter():  # noqa: D401
         nonlocal gpu_layers_effective
         nonlocal gpu_layers_requested
         nonlocal gpu_offload
@@ -516,14 +877,8 @@ def generate(req: GenerateRequest):  # noqa: D401
                 pass
         try:
             # If abort was already signaled before streaming starts, capture ts
-            if (
-                abort_registry.is_aborted(request_id)
-                and abort_started_at is None
-            ):
-                abort_started_at = (
-                    abort_registry.abort_started_at(request_id)
-                    or time.time()
-                )
+            if cancel.is_set() and abort_started_at is None:
+                abort_started_at = cancel.started_at or time.time()
                 if is_test_mode:
                     print(
                         "DEBUG_ABORT_DETECTED",
@@ -532,8 +887,8 @@ def generate(req: GenerateRequest):  # noqa: D401
                         "pre-start",
                     )
                 raise RuntimeError("aborted")
-            # (heartbeat removed in refactor; early abort spin below)
             # Optional dev pre-stream delay to allow client-side abort wiring
+            # (waits on the cancel handle, so an abort ends it immediately)
             if is_test_mode:
                 try:
                     _dev_delay_ms = 0
@@ -545,9 +900,15 @@ def generate(req: GenerateRequest):  # noqa: D401
                         # and signal abort deterministically.
                         _dev_delay_ms = 200
                     if _dev_delay_ms:
-                        time.sleep(_dev_delay_ms / 1000.0)
+                        await asyncio.to_thread(
+                            cancel.wait, _dev_delay_ms / 1000.0
+                        )
                 except Exception:  # noqa: BLE001
                     pass
+                if cancel.is_set():
+                    if abort_started_at is None:
+                        abort_started_at = cancel.started_at or time.time()
+                    raise RuntimeError("aborted")
             # Emit non-blocking warning about passport/config mismatch
             # (UI toast)
             try:
@@ -589,28 +950,14 @@ def generate(req: GenerateRequest):  # noqa: D401
                     )
             except Exception:  # noqa: BLE001
                 pass
-            # Early quick abort check loop (allow client to signal abort)
-            for _spin in range(50):  # ~100ms window
-                if abort_registry.is_aborted(request_id):
-                    if abort_started_at is None:
-                        abort_started_at = (
-                            abort_registry.abort_started_at(request_id)
-                            or time.time()
-                        )
-                    print("DEBUG_ABORT_DETECTED", request_id, "phase", "spin")
-                    raise RuntimeError("aborted")
-                time.sleep(0.002)
             first_token_latency_ms: float | None = None
-            for evt in pipeline.stream(ctx):
+            async for evt in pipeline.astream(ctx):
                 # Abort & timeout checks
                 now = time.time()
-                if abort_registry.is_aborted(request_id):
-                    # Try to reuse earlier mark_start timestamp if available
+                if cancel.is_set():
+                    # Reuse the abort initiation timestamp (mark_start/abort)
                     if abort_started_at is None:
-                        abort_started_at = (
-                            abort_registry.abort_started_at(request_id)
-                            or time.time()
-                        )
+                        abort_started_at = cancel.started_at or time.time()
                     if is_test_mode:
                         print(
                             "DEBUG_ABORT_DETECTED",
@@ -633,7 +980,7 @@ def generate(req: GenerateRequest):  # noqa: D401
                                     )
                                 except Exception:  # noqa: BLE001
                                     pass
-                            time.sleep(0.05)
+                            await asyncio.sleep(0.05)
                             continue
                     raise TimeoutError(
                         (
@@ -642,6 +989,8 @@ def generate(req: GenerateRequest):  # noqa: D401
                         )
                     )
                 etype = evt.get("type")
+                if etype in ("delta", "analysis", "commentary"):
+                    stream_state["decoded"] += 1
                 if etype == "delta":
                     tok = evt.get("text", "")
                     if stop_sequences and tok:
@@ -655,6 +1004,7 @@ def generate(req: GenerateRequest):  # noqa: D401
                         last_activity = now
                         continue
                     tokens_out += 1
+                    stream_state["tokens_out"] = tokens_out
                     fragments.append(tok)
                     payload = {
                         "seq": seq,
@@ -885,12 +1235,9 @@ def generate(req: GenerateRequest):  # noqa: D401
             # Edge case: abort signalled after provider exhausted but before
             # finalize section executes (race where abort arrives between
             # last yield and finalize). Convert to aborted path.
-            if abort_registry.is_aborted(request_id):
+            if cancel.is_set():
                 if abort_started_at is None:
-                    abort_started_at = (
-                        abort_registry.abort_started_at(request_id)
-                        or time.time()
-                    )
+                    abort_started_at = cancel.started_at or time.time()
                 raise RuntimeError("aborted")
             now = time.time()
             latency_ms = int((now - t_start) * 1000)
@@ -1078,7 +1425,7 @@ def generate(req: GenerateRequest):  # noqa: D401
                 "model_id": model_id,
                 "text": final_text,
                 "reasoning_text": None,
-                "stop_reason": stop_hit and "stop_sequence" or None,
+                "stop_reason": res.stop_reason,
                 "stats": ctx.reasoning_stats,
                 "cap_applied": bool(cap_applied),
                 "effective_max_tokens": effective_max_tokens,
@@ -1108,12 +1455,12 @@ def generate(req: GenerateRequest):  # noqa: D401
                 print(
                     "DEBUG_LATE_ABORT_CHECK",
                     request_id,
-                    abort_registry.is_aborted(request_id),
+                    cancel.is_set(),
                     abort_started_at,
                     abort_registry.abort_started_at(request_id),
                 )
             if (
-                abort_registry.is_aborted(request_id)
+                cancel.is_set()
                 or abort_started_at is not None
                 or abort_registry.abort_started_at(request_id) is not None
             ):
@@ -1175,6 +1522,7 @@ def generate(req: GenerateRequest):  # noqa: D401
                     cancel_latency_emitted = True
                 except Exception:  # noqa: BLE001
                     pass
+            stream_state["finished"] = True
             yield format_event(
                 "end",
                 json.dumps({"request_id": request_id, "status": "ok"}),
@@ -1188,10 +1536,15 @@ def generate(req: GenerateRequest):  # noqa: D401
             timeout = isinstance(e, TimeoutError) and str(e).startswith(
                 "generation-timeout"
             )
+            disconnected = aborted and _client_gone()
             reason = "user_abort" if aborted else (
                 "timeout" if timeout else "runtime-error"
             )
-            if aborted or timeout:
+            if disconnected:
+                # already reported by the disconnect hook
+                reason = "client_disconnect"
+                generation_cancel_emitted = True
+            elif aborted or timeout:
                 if is_test_mode:
                     print(
                         "DEBUG_EMIT_GEN_CANCEL",
@@ -1350,8 +1703,9 @@ def generate(req: GenerateRequest):  # noqa: D401
             # Centralized cancel latency emission (single source of truth)
             try:
                 if (
-                    abort_registry.is_aborted(request_id)
+                    cancel.is_set()
                     and not cancel_latency_emitted
+                    and not _client_gone()
                 ):
                     duration_source = (
                         abort_started_at
@@ -1395,6 +1749,7 @@ def generate(req: GenerateRequest):  # noqa: D401
                         )
                     )
                     and not generation_cancel_emitted
+                    and not _client_gone()
                 ):
                     try:
                         if is_test_mode:
@@ -1483,23 +1838,29 @@ def generate(req: GenerateRequest):  # noqa: D401
 
         _unsub = subscribe(_capture)
 
-        def _gen_with_warnings():
+        async def _gen_with_warnings():
             emitted_warnings = False
             inner = _iter()
-            for item in inner:
-                if not emitted_warnings and mismatch_events:
-                    for ev in mismatch_events:
-                        payload = {
-                            "event": "ModelPassportMismatch",
-                            "request_id": request_id,
-                            "model_id": ev.model_id,
-                            "field": ev.field,
-                            "passport_value": ev.passport_value,
-                            "config_value": ev.config_value,
-                        }
-                        yield format_event("warning", json.dumps(payload))
-                    emitted_warnings = True
-                yield item
+            try:
+                async for item in inner:
+                    if not emitted_warnings and mismatch_events:
+                        for ev in mismatch_events:
+                            payload = {
+                                "event": "ModelPassportMismatch",
+                                "request_id": request_id,
+                                "model_id": ev.model_id,
+                                "field": ev.field,
+                                "passport_value": ev.passport_value,
+                                "config_value": ev.config_value,
+                            }
+                            yield format_event(
+                                "warning", json.dumps(payload)
+                            )
+                        emitted_warnings = True
+                    yield item
+            finally:
+                # client gone: unwind _iter so decode stops right away
+                await inner.aclose()
             if not mismatch_events:
                 return
             if not emitted_warnings:
@@ -1514,8 +1875,10 @@ def generate(req: GenerateRequest):  # noqa: D401
                     }
                     yield format_event("warning", json.dumps(payload))
 
-        return StreamingResponse(
-            _gen_with_warnings(), media_type="text/event-stream"
+        return DisconnectAwareStreamingResponse(
+            _gen_with_warnings(),
+            media_type="text/event-stream",
+            on_disconnect=_on_client_disconnect,
         )
     except Exception as e:  # noqa: BLE001
         tb = traceback.format_exc()
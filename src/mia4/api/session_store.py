@@ -2,6 +2,8 @@
 
 Not a public configurable component: limits are internal constants for Phase 2.
 Implements TTL + max messages per session; lazy cleanup on write.
+Each session may also carry a rolling summary of turns that no longer fit
+the prompt window (written by ``core.llm.compaction`` in the background).
 """
 from __future__ import annotations
 
@@ -11,6 +13,7 @@ from time import time
 from typing import Deque, Dict, List
 
 from core import metrics
+from core.llm.compaction import HistorySummary
 
 MAX_MESSAGES = 50
 SESSION_TTL_SECONDS = 60 * 60  # 60 minutes
@@ -27,6 +30,7 @@ class SessionStore:
     def __init__(self) -> None:
         self._sessions: Dict[str, Deque[ChatMessage]] = {}
         self._last_access: Dict[str, float] = {}
+        self._summaries: Dict[str, HistorySummary] = {}
 
     def add(self, session_id: str, role: str, content: str) -> None:
         now = time()
@@ -42,6 +46,13 @@ class SessionStore:
     def history(self, session_id: str) -> List[ChatMessage]:
         return list(self._sessions.get(session_id, []))
 
+    def get_summary(self, session_id: str) -> HistorySummary | None:
+        return self._summaries.get(session_id)
+
+    def set_summary(self, session_id: str, summary: HistorySummary) -> None:
+        if session_id in self._sessions:  # not for expired sessions
+            self._summaries[session_id] = summary
+
     def _cleanup(self, now: float) -> None:
         expired = [
             sid
@@ -51,9 +62,13 @@ class SessionStore:
         for sid in expired:
             self._sessions.pop(sid, None)
             self._last_access.pop(sid, None)
+            self._summaries.pop(sid, None)
 
     def stats(self) -> dict:
-        return {"sessions": len(self._sessions)}
+        return {
+            "sessions": len(self._sessions),
+            "summaries": len(self._summaries),
+        }
 
 
 store = SessionStore()
@@ -1,7 +1,10 @@
 """SSE utilities."""
 from __future__ import annotations
 
-from typing import AsyncGenerator, Iterable
+from typing import AsyncGenerator, Callable, Iterable
+
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
 
 
 def format_event(event: str | None, data: str) -> str:
@@ -19,3 +22,45 @@ async def wrap_generator(
 ) -> AsyncGenerator[bytes, None]:  # pragma: no cover - thin adapter
     for chunk in gen:
         yield chunk.encode("utf-8")
+
+
+class DisconnectAwareStreamingResponse(StreamingResponse):
+    """Streaming response that reports a client disconnect.
+
+    ``on_disconnect`` runs as soon as the ASGI server delivers
+    ``http.disconnect`` (even while the body generator is blocked waiting
+    for the next token), before the stream task is cancelled; the body
+    generator is then closed so its ``finally`` blocks run immediately
+    instead of at garbage collection.
+    """
+
+    def __init__(
+        self,
+        content,  # noqa: ANN001
+        *,
+        on_disconnect: Callable[[], None] | None = None,
+        **kwargs,  # noqa: ANN003
+    ) -> None:
+        super().__init__(content, **kwargs)
+        self.on_disconnect = on_disconnect
+        self.disconnected = False
+
+    async def listen_for_disconnect(self, receive: Receive) -> None:
+        await super().listen_for_disconnect(receive)
+        self.disconnected = True
+        if self.on_disconnect is not None:
+            try:
+                self.on_disconnect()
+            except Exception:  # noqa: BLE001
+                pass
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if self.disconnected and aclose is not None:
+                try:
+                    await aclose()
+                except Exception:  # noqa: BLE001
+                    pass
@@ -0,0 +1,244 @@
+"""Per-request SSE frame buffers (resumable and shared /generate streams).
+
+A generation is pumped by its own task into a ``StreamBuffer``; HTTP
+responses are followers reading from it. Every frame gets an SSE ``id:``
+(its ``seq``), so a client that lost the connection reattaches with
+``GET /generate/{request_id}/stream`` and ``Last-Event-ID`` and receives
+only what it missed, then the live tail. Several followers may read one
+generation at once.
+
+Bounded: the ring keeps the last ``buffer_frames`` frames; a follower
+that fell behind the ring gets a ``meta`` frame with ``status=truncated``
+and the number of missed frames before the retained ones. Completed
+buffers are dropped ``ttl_s`` after the generation ended (lazy cleanup).
+
+When the last follower leaves a running generation, ``on_abandon``
+(the client-disconnect cancel) runs unless a follower reattaches within
+``detach_grace_s``. The grace is kept short (2 s): every dead socket
+keeps decoding that long, so it only covers a quick reconnect.
+
+Config ``llm.stream_resume``: enabled, buffer_frames, ttl_s,
+detach_grace_s.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+from collections import OrderedDict, deque
+from threading import Lock
+from time import monotonic
+from typing import Any, AsyncIterator, Callable, Deque, Tuple
+
+from core import metrics
+from mia4.api.sse import format_event
+
+
+def resume_config() -> dict:
+    try:
+        from core.config import get_config
+
+        return dict(getattr(get_config().llm, "stream_resume", {}) or {})
+    except Exception:  # noqa: BLE001
+        return {}
+
+
+def with_id(frame: str, seq: int) -> str:
+    """Add the SSE ``id:`` field to a formatted frame."""
+    return f"{frame[:-1]}id: {seq}\n\n"
+
+
+class StreamBuffer:
+    def __init__(
+        self,
+        request_id: str,
+        capacity: int = 2048,
+        detach_grace_s: float = 2.0,
+        on_abandon: Callable[[], None] | None = None,
+    ) -> None:
+        self.request_id = request_id
+        self.capacity = max(1, int(capacity))
+        self.detach_grace_s = max(0.0, float(detach_grace_s))
+        self.on_abandon = on_abandon
+        self._frames: Deque[Tuple[int, str]] = deque(maxlen=self.capacity)
+        self._next_seq = 0
+        self._lock = Lock()
+        self._waiters: set[Tuple[Any, asyncio.Event]] = set()
+        self.followers = 0
+        self.closed = False
+        self.closed_at: float | None = None
+        self._pump_task: Any | None = None
+
+    # -- producer ---------------------------------------------------------
+    def append(self, frame: str) -> str:
+        """Store one frame; returns it with its ``id:`` line."""
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            framed = with_id(frame, seq)
+            self._frames.append((seq, framed))
+        self._notify()
+        return framed
+
+    def close(self) -> None:
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.closed_at = monotonic()
+        self._notify()
+
+    async def pump(self, body: AsyncIterator[str]) -> None:
+        """Drain the generation body into the buffer (runs as a task)."""
+        try:
+            async for frame in body:
+                self.append(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # noqa: BLE001
+            metrics.inc("sse_resume_pump_errors_total")
+        finally:
+            try:
+                aclose = getattr(body, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+            finally:
+                self.close()
+
+    def start(self, body: AsyncIterator[str]) -> None:
+        self._pump_task = asyncio.get_running_loop().create_task(
+            self.pump(body)
+        )
+
+    # -- followers --------------------------------------------------------
+    def _notify(self) -> None:
+        for loop, event in list(self._waiters):
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:  # loop closed: follower is gone
+                self._waiters.discard((loop, event))
+
+    def _since(self, seq: int) -> Tuple[list, int, bool]:
+        with self._lock:
+            frames = [f for f in self._frames if f[0] >= seq]
+            oldest = self._frames[0][0] if self._frames else self._next_seq
+            return frames, max(0, oldest - seq), self.closed
+
+    def _attach(self) -> None:
+        with self._lock:
+            self.followers += 1
+
+    def _detach(self) -> None:
+        with self._lock:
+            self.followers -= 1
+            abandoned = self.followers == 0 and not self.closed
+        if not abandoned:
+            return
+        if self.detach_grace_s <= 0:
+            self._abandon()
+            return
+        try:
+            asyncio.get_running_loop().call_later(
+                self.detach_grace_s, self._abandon
+            )
+        except RuntimeError:  # no loop (closing): cancel right away
+            self._abandon()
+
+    def _abandon(self) -> None:
+        with self._lock:
+            if self.followers or self.closed:
+                return
+        metrics.inc("sse_resume_abandoned_total")
+        if self.on_abandon is not None:
+            try:
+                self.on_abandon()
+            except Exception:  # noqa: BLE001
+                pass
+
+    async def follow(self, last_event_id: int | None = None):
+        """Frames after ``last_event_id`` (all when None), then live."""
+        loop = asyncio.get_running_loop()
+        waiter = (loop, asyncio.Event())
+        seq = 0 if last_event_id is None else last_event_id + 1
+        self._attach()
+        self._waiters.add(waiter)
+        try:
+            while True:
+                waiter[1].clear()
+                frames, missed, closed = self._since(seq)
+                if missed:
+                    metrics.inc("sse_resume_truncated_total")
+                    yield format_event(
+                        "meta",
+                        json.dumps(
+                            {
+                                "request_id": self.request_id,
+                                "status": "truncated",
+                                "missed": missed,
+                            }
+                        ),
+                    )
+                    seq += missed
+                for frame_seq, frame in frames:
+                    yield frame
+                    seq = frame_seq + 1
+                if closed and not frames:
+                    return
+                if not frames:
+                    await waiter[1].wait()
+        finally:
+            self._waiters.discard(waiter)
+            self._detach()
+
+
+_BUFFERS: "OrderedDict[str, StreamBuffer]" = OrderedDict()
+_REG_LOCK = Lock()
+
+
+def _sweep(now: float, ttl_s: float) -> None:
+    expired = [
+        rid
+        for rid, buf in _BUFFERS.items()
+        if buf.closed_at is not None and now - buf.closed_at > ttl_s
+    ]
+    for rid in expired:
+        del _BUFFERS[rid]
+
+
+def open_buffer(
+    request_id: str, on_abandon: Callable[[], None] | None = None
+) -> StreamBuffer | None:
+    """New buffer for a generation (None when resumption is disabled)."""
+    cfg = resume_config()
+    if not cfg.get("enabled", True):
+        return None
+    buf = StreamBuffer(
+        request_id,
+        capacity=int(cfg.get("buffer_frames", 2048) or 1),
+        detach_grace_s=float(cfg.get("detach_grace_s", 2.0) or 0.0),
+        on_abandon=on_abandon,
+    )
+    with _REG_LOCK:
+        _sweep(monotonic(), float(cfg.get("ttl_s", 300.0) or 0.0))
+        _BUFFERS[request_id] = buf
+    return buf
+
+
+def get(request_id: str) -> StreamBuffer | None:
+    ttl_s = float(resume_config().get("ttl_s", 300.0) or 0.0)
+    with _REG_LOCK:
+        _sweep(monotonic(), ttl_s)
+        return _BUFFERS.get(request_id)
+
+
+def reset_for_tests() -> None:  # pragma: no cover - test helper
+    with _REG_LOCK:
+        _BUFFERS.clear()
+
+
+__all__ = [
+    "StreamBuffer",
+    "get",
+    "open_buffer",
+    "resume_config",
+    "with_id",
+]
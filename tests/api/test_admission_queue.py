@@ -0,0 +1,212 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from core.llm import admission
+
+
+class _SlowProvider:
+    calls = 0
+
+    def info(self):  # noqa: D401
+        from types import SimpleNamespace
+
+        return SimpleNamespace(role="primary", metadata={})
+
+    def stream(self, prompt: str, **kwargs):  # noqa: D401, ANN003
+        _SlowProvider.calls += 1
+        for i in range(15):
+            time.sleep(0.01)
+            yield (
+                "<|start|>assistant<|channel|>analysis<|message|>"
+                f"w{i}<|end|>"
+            )
+
+
+async def _request(
+    app, session_id, first_chunk=None, leave_after=None
+):  # noqa: ANN001
+    """POST /generate over raw ASGI; returns (status, headers, frames).
+
+    ``leave_after``: the client disconnects after that many body chunks.
+    """
+    body = json.dumps(
+        {"session_id": session_id, "model": "admModel", "prompt": "hi"}
+    ).encode()
+    out = {"status": None, "headers": {}, "frames": []}
+    sent = False
+    gone = asyncio.Event()
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body}
+        await gone.wait()  # client stays connected unless leave_after
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            out["status"] = message["status"]
+            out["headers"] = {
+                k.decode(): v.decode() for k, v in message["headers"]
+            }
+        elif message.get("body"):
+            out["frames"].append(message["body"].decode("utf-8"))
+            if first_chunk is not None:
+                first_chunk.set()
+            if leave_after and len(out["frames"]) >= leave_after:
+                gone.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/generate",
+        "raw_path": b"/generate",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json")],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+    await asyncio.wait_for(app(scope, receive, send), 10)
+    return out
+
+
+def _meta(frames):  # noqa: ANN001
+    out = []
+    for frame in frames:
+        if frame.startswith("event: meta\n"):
+            data = frame.split("data: ", 1)[1].split("\n", 1)[0]
+            out.append(json.loads(data))
+    return out
+
+
+@pytest.mark.integration
+@pytest.mark.timeout(20)
+def test_generate_queues_then_rejects_when_full(
+    monkeypatch, tmp_path
+):  # noqa: D401
+    cfg_dir = tmp_path / "configs"
+    cfg_dir.mkdir()
+    cfg_dir.joinpath("base.yaml").write_text(
+        (
+            "modules:\n"
+            "  enabled: [llm]\n"
+            "llm:\n"
+            "  primary:\n"
+            "    id: admModel\n"
+            "  admission:\n"
+            "    max_concurrent: 1\n"
+            "    max_queue: 1\n"
+            "    retry_after_s: 4\n"
+        ),
+        encoding="utf-8",
+    )
+    monkeypatch.setenv("MIA_CONFIG_DIR", str(cfg_dir))
+    from core.llm import factory as factory_mod
+    from mia4.api.app import app
+    from mia4.api.routes import generate as generate_route
+
+    monkeypatch.setattr(
+        factory_mod, "get_model", lambda *a, **k: _SlowProvider()
+    )
+    monkeypatch.setattr(
+        generate_route, "get_model", lambda *a, **k: _SlowProvider()
+    )
+    admission.reset_for_tests()
+
+    async def scenario():
+        started = asyncio.Event()
+        first = asyncio.create_task(_request(app, "s1", started))
+        await started.wait()
+        second = asyncio.create_task(_request(app, "s2"))
+        await asyncio.sleep(0.05)
+        third = await _request(app, "s3")
+        return await first, await second, third
+
+    try:
+        first, second, third = asyncio.run(scenario())
+    finally:
+        admission.reset_for_tests()
+    assert first["status"] == 200 and not _meta(first["frames"])
+    assert third["status"] == 429
+    assert third["headers"]["retry-after"] == "4"
+    assert second["status"] == 200
+    meta = _meta(second["frames"])
+    assert meta[0]["status"] == "queued" and meta[0]["position"] == 1
+    assert meta[1]["status"] == "admitted"
+    assert second["frames"][-1].startswith("event: end")
+    assert '"status": "ok"' in second["frames"][-1]
+
+
+@pytest.mark.integration
+@pytest.mark.timeout(20)
+def test_client_leaving_queue_never_starts_generation(
+    monkeypatch, tmp_path
+):  # noqa: D401
+    cfg_dir = tmp_path / "configs"
+    cfg_dir.mkdir()
+    cfg_dir.joinpath("base.yaml").write_text(
+        (
+            "modules:\n"
+            "  enabled: [llm]\n"
+            "llm:\n"
+            "  primary:\n"
+            "    id: admModel\n"
+            "  admission:\n"
+            "    max_concurrent: 1\n"
+            "    max_queue: 4\n"
+            "  stream_resume:\n"
+            "    detach_grace_s: 0\n"
+        ),
+        encoding="utf-8",
+    )
+    monkeypatch.setenv("MIA_CONFIG_DIR", str(cfg_dir))
+    from core.llm import factory as factory_mod
+    from mia4.api.app import app
+    from mia4.api.routes import generate as generate_route
+
+    prov = _SlowProvider()
+    monkeypatch.setattr(factory_mod, "get_model", lambda *a, **k: prov)
+    monkeypatch.setattr(generate_route, "get_model", lambda *a, **k: prov)
+    monkeypatch.setattr(_SlowProvider, "calls", 0)
+    admission.reset_for_tests()
+
+    async def scenario():
+        started = asyncio.Event()
+        first = asyncio.create_task(_request(app, "s1", started))
+        await started.wait()
+        left = await _request(app, "s2", leave_after=1)
+        waiting = admission.get_controller("admModel").waiting
+        await first
+        await asyncio.sleep(0.1)
+        return left, waiting
+
+    try:
+        left, waiting = asyncio.run(scenario())
+    finally:
+        admission.reset_for_tests()
+    assert _meta(left["frames"])[0]["status"] == "queued"
+    assert waiting == 0  # ticket withdrawn as soon as the client left
+    assert _SlowProvider.calls == 1  # only the first request generated
+
+
+def test_unknown_model_creates_no_controller():  # noqa: D401
+    from fastapi.testclient import TestClient
+
+    from mia4.api.app import create_app
+
+    admission.reset_for_tests()
+    client = TestClient(create_app(), raise_server_exceptions=False)
+    for i in range(3):
+        client.post(
+            "/generate",
+            json={"session_id": "u", "model": f"typo-{i}", "prompt": "hi"},
+        )
+    assert not [m for m in admission._CONTROLLERS if m.startswith("typo-")]
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from core import metrics
+from core.events import on, reset_listeners_for_tests
+from mia4.api import abort_registry
+from mia4.api.sse import DisconnectAwareStreamingResponse
+
+
+class _SlowProvider:
+    def __init__(self):
+        self.produced = 0
+        self.closed = False
+
+    def info(self):  # noqa: D401
+        from types import SimpleNamespace
+
+        return SimpleNamespace(
+            role="primary",
+            metadata={"passport_sampling_defaults": {"max_output_tokens": 64}},
+        )
+
+    def stream(self, prompt: str, **kwargs):  # noqa: D401, ANN003
+        cancel = kwargs.get("cancel_event")
+        try:
+            for i in range(200):
+                if cancel is not None and cancel.is_set():
+                    return
+                time.sleep(0.01)
+                self.produced += 1
+                # one message per step: each becomes its own SSE frame
+                yield (
+                    "<|start|>assistant<|channel|>analysis<|message|>"
+                    f"w{i}<|end|>"
+                )
+        finally:
+            self.closed = True
+
+
+async def _drive(app, path, body, disconnect_after):  # noqa: ANN001
+    """Run one ASGI request; drop the client after N body chunks."""
+    chunks = []
+    gone = asyncio.Event()
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body}
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            chunks.append(message["body"].decode("utf-8"))
+            if len(chunks) >= disconnect_after:
+                gone.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json")],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+    await asyncio.wait_for(app(scope, receive, send), 5)
+    return chunks
+
+
+def test_response_reports_disconnect_and_closes_body():  # noqa: D401
+    state = {"closed": False, "calls": 0}
+
+    async def body():
+        try:
+            while True:
+                yield "data: x\n\n"
+                await asyncio.sleep(0.01)
+        finally:
+            state["closed"] = True
+
+    def hook():
+        state["calls"] += 1
+
+    resp = DisconnectAwareStreamingResponse(
+        body(), media_type="text/event-stream", on_disconnect=hook
+    )
+    chunks = asyncio.run(_drive(resp, "/", b"", disconnect_after=3))
+    assert len(chunks) >= 3
+    assert resp.disconnected and state["calls"] == 1
+    assert state["closed"]
+
+
+def test_disconnect_marks_reason_and_skips_abort_marker():  # noqa: D401
+    handle = abort_registry.register("rid-dc1")
+    fired = []
+    handle.add_callback(lambda: fired.append(1))
+    assert abort_registry.disconnect("rid-dc1") is True
+    assert handle.reason == "client_disconnect" and fired == [1]
+    assert abort_registry.abort_started_at("rid-dc1") is None
+    assert abort_registry.disconnect("rid-dc1") is False  # already set
+    abort_registry.clear("rid-dc1")
+    assert abort_registry.disconnect("rid-dc1") is False
+
+
+@pytest.mark.integration
+@pytest.mark.timeout(10)
+def test_generate_cancels_decode_on_client_disconnect(
+    monkeypatch, tmp_path
+):  # noqa: D401
+    cfg_dir = tmp_path / "configs"
+    cfg_dir.mkdir()
+    cfg_dir.joinpath("base.yaml").write_text(
+        (
+            "modules:\n"
+            "  enabled: [llm]\n"
+            "llm:\n"
+            "  primary:\n"
+            "    id: dcModel\n"
+            "    max_output_tokens: 64\n"
+            "  stream_resume:\n"
+            "    detach_grace_s: 0\n"
+        ),
+        encoding="utf-8",
+    )
+    monkeypatch.setenv("MIA_CONFIG_DIR", str(cfg_dir))
+    from core.llm import factory as factory_mod
+    from mia4.api.app import app
+    from mia4.api.routes import generate as generate_route
+
+    prov = _SlowProvider()
+    monkeypatch.setattr(factory_mod, "get_model", lambda *a, **k: prov)
+    monkeypatch.setattr(generate_route, "get_model", lambda *a, **k: prov)
+    reset_listeners_for_tests()
+    seen = []
+    on(lambda n, p: seen.append((n, p)))
+    unused = "client_disconnect_unused_budget_tokens_total{model=dcModel}"
+    before = metrics.snapshot()["counters"].get(unused, 0)
+    body = json.dumps(
+        {"session_id": "sess-dc", "model": "dcModel", "prompt": "hi"}
+    ).encode()
+    asyncio.run(_drive(app, "/generate", body, disconnect_after=4))
+    deadline = time.time() + 2
+    while not prov.closed and time.time() < deadline:
+        time.sleep(0.02)
+    assert prov.closed and prov.produced < 200
+    cancelled = [p for n, p in seen if n == "GenerationCancelled"]
+    assert len(cancelled) == 1
+    assert cancelled[0]["reason"] == "client_disconnect"
+    assert "CancelLatencyMeasured" not in [n for n, _ in seen]
+    assert metrics.snapshot()["counters"].get(unused, 0) > before
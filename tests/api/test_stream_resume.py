@@ -0,0 +1,206 @@
+import asyncio
+import json
+import time
+
+import pytest
+
+from mia4.api import stream_buffer
+from mia4.api.sse import format_event
+from mia4.api.stream_buffer import StreamBuffer
+
+
+def _ids(frames):  # noqa: ANN001
+    return [
+        int(line[4:])
+        for frame in frames
+        for line in frame.splitlines()
+        if line.startswith("id: ")
+    ]
+
+
+async def _collect(buf, last_event_id=None, limit=None):  # noqa: ANN001
+    out = []
+    async for frame in buf.follow(last_event_id):
+        out.append(frame)
+        if limit is not None and len(out) >= limit:
+            break
+    return out
+
+
+def test_buffer_replays_after_last_event_id_and_truncates():  # noqa: D401
+    async def scenario():
+        buf = StreamBuffer("rid-b1", capacity=4)
+        for i in range(6):
+            buf.append(format_event("token", json.dumps({"i": i})))
+        buf.close()
+        tail = await _collect(buf, last_event_id=3)
+        stale = await _collect(buf, last_event_id=0)
+        return tail, stale
+
+    tail, stale = asyncio.run(scenario())
+    assert _ids(tail) == [4, 5]
+    assert tail[0] == 'event: token\ndata: {"i": 4}\nid: 4\n\n'
+    # ids 1 was evicted by the ring: reported, then the retained frames
+    assert '"status": "truncated"' in stale[0] and '"missed": 1' in stale[0]
+    assert _ids(stale[1:]) == [2, 3, 4, 5]
+
+
+def test_live_followers_share_and_abandon_after_grace():  # noqa: D401
+    abandoned = []
+
+    async def scenario():
+        buf = StreamBuffer(
+            "rid-b2",
+            detach_grace_s=0.05,
+            on_abandon=lambda: abandoned.append(1),
+        )
+        viewers = [
+            asyncio.create_task(_collect(buf)),
+            asyncio.create_task(_collect(buf)),
+        ]
+        await asyncio.sleep(0)
+        for i in range(3):
+            buf.append(format_event("token", str(i)))
+            await asyncio.sleep(0.01)
+        buf.close()
+        shared = [await v for v in viewers]
+        # a follower that leaves a running stream starts the grace timer
+        live = StreamBuffer(
+            "rid-b3",
+            detach_grace_s=0.05,
+            on_abandon=lambda: abandoned.append(2),
+        )
+        live.append(format_event("token", "x"))
+        await _collect(live, limit=1)
+        back = asyncio.create_task(_collect(live, last_event_id=0))
+        await asyncio.sleep(0.1)  # reattached in time: not abandoned
+        assert abandoned == []
+        back.cancel()
+        await asyncio.sleep(0.1)
+        return shared
+
+    shared = asyncio.run(scenario())
+    assert [_ids(frames) for frames in shared] == [[0, 1, 2], [0, 1, 2]]
+    assert abandoned == [2]
+
+
+class _SlowProvider:
+    def __init__(self):
+        self.produced = 0
+
+    def info(self):  # noqa: D401
+        from types import SimpleNamespace
+
+        return SimpleNamespace(role="primary", metadata={})
+
+    def stream(self, prompt: str, **kwargs):  # noqa: D401, ANN003
+        for i in range(20):
+            time.sleep(0.01)
+            self.produced += 1
+            yield (
+                "<|start|>assistant<|channel|>analysis<|message|>"
+                f"w{i}<|end|>"
+            )
+
+
+async def _request(app, method, path, body=b"", headers=(), drop_after=None):
+    """Raw ASGI request; the client disconnects after ``drop_after``."""
+    frames = []
+    status = {}
+    gone = asyncio.Event()
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body}
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+        elif message.get("body"):
+            frames.append(message["body"].decode("utf-8"))
+            if drop_after is not None and len(frames) >= drop_after:
+                gone.set()
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), *headers],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+    await asyncio.wait_for(app(scope, receive, send), 10)
+    return status.get("code"), frames
+
+
+@pytest.mark.integration
+@pytest.mark.timeout(20)
+def test_generate_resumes_from_last_event_id(
+    monkeypatch, tmp_path
+):  # noqa: D401
+    cfg_dir = tmp_path / "configs"
+    cfg_dir.mkdir()
+    cfg_dir.joinpath("base.yaml").write_text(
+        (
+            "modules:\n"
+            "  enabled: [llm]\n"
+            "llm:\n"
+            "  primary:\n"
+            "    id: resumeModel\n"
+        ),
+        encoding="utf-8",
+    )
+    monkeypatch.setenv("MIA_CONFIG_DIR", str(cfg_dir))
+    from core.llm import factory as factory_mod
+    from mia4.api.app import app
+    from mia4.api.routes import generate as generate_route
+
+    prov = _SlowProvider()
+    monkeypatch.setattr(factory_mod, "get_model", lambda *a, **k: prov)
+    monkeypatch.setattr(generate_route, "get_model", lambda *a, **k: prov)
+    body = json.dumps(
+        {"session_id": "sess-rs", "model": "resumeModel", "prompt": "hi"}
+    ).encode()
+
+    async def scenario():
+        _, first = await _request(
+            app, "POST", "/generate", body, drop_after=3
+        )
+        rid = json.loads(first[0].split("data: ", 1)[1].split("\n")[0])[
+            "request_id"
+        ]
+        last = _ids(first)[-1]
+        resumed = await _request(
+            app,
+            "GET",
+            f"/generate/{rid}/stream",
+            headers=[(b"last-event-id", str(last).encode())],
+        )
+        replay = await _request(app, "GET", f"/generate/{rid}/stream")
+        missing = await _request(app, "GET", "/generate/nope/stream")
+        return first, last, resumed, replay, missing
+
+    try:
+        first, last, resumed, replay, missing = asyncio.run(scenario())
+    finally:
+        stream_buffer.reset_for_tests()
+    code, frames = resumed
+    assert code == 200
+    ids = _ids(frames)
+    assert ids[0] == last + 1 and ids == list(range(ids[0], ids[-1] + 1))
+    assert frames[-1].startswith("event: end")
+    assert prov.produced == 20  # the drop did not cancel decode
+    code, frames = replay
+    assert code == 200 and _ids(frames) == list(range(ids[-1] + 1))
+    assert missing[0] == 404
@@ -38,6 +38,17 @@ def _isolate_config_env():  # noqa: D401
             os.environ["MIA_CONFIG_DIR"] = prev
 
 
+@pytest.fixture(autouse=True)
+def _stop_decode_workers():  # noqa: D401
+    """Decode scheduler worker threads must not outlive their test."""
+    yield
+    try:
+        from core.llm.scheduler import reset_for_tests
+    except Exception:  # pragma: no cover - test env fallback
+        return
+    reset_for_tests()
+
+
 ROOT = Path(__file__).resolve().parent.parent
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
@@ -0,0 +1,83 @@
+import threading
+import time
+
+from core.events import on, reset_listeners_for_tests
+from core.llm.llama_cpp_provider import LlamaCppProvider
+from core.llm.scheduler import scheduled_stream
+from mia4.api import abort_registry
+
+
+class _FakeLlama:
+    """Checks stopping criteria per token like llama.cpp does."""
+
+    def __init__(self):
+        self.decoded = 0
+
+    def __call__(self, prompt, stream=True, stopping_criteria=None, **kw):
+        for i in range(50):
+            if stopping_criteria is not None and stopping_criteria([], []):
+                return
+            self.decoded += 1
+            yield {"choices": [{"text": f"t{i} "}]}
+
+
+def test_handle_lifecycle_and_callbacks():  # noqa: D401
+    handle = abort_registry.register("rid-h1")
+    fired = []
+    handle.add_callback(lambda: fired.append(1))
+    assert not abort_registry.is_aborted("rid-h1")
+    assert abort_registry.abort("rid-h1") is True
+    assert handle.is_set() and handle.started_at is not None
+    assert abort_registry.is_aborted("rid-h1")
+    assert fired == [1]
+    handle.add_callback(lambda: fired.append(2))  # already cancelled
+    assert fired == [1, 2]
+    abort_registry.clear("rid-h1")
+    assert abort_registry.get("rid-h1") is None
+
+
+def test_stopping_criteria_halts_decode_within_one_token():  # noqa: D401
+    reset_listeners_for_tests()
+    seen = []
+    on(lambda n, p: seen.append((n, p)))
+    prov = LlamaCppProvider(
+        model_path="missing.gguf",
+        model_id="abortfake",
+        role="primary",
+        context_length=2048,
+    )
+    fake = _FakeLlama()
+    prov._state.llama = fake
+    prov._state.loaded = True
+    handle = abort_registry.register("rid-h2")
+    out = []
+    for piece in prov.stream("hi", cancel_event=handle):
+        out.append(piece)
+        if len(out) == 3:
+            handle.cancel()
+    assert fake.decoded == 3
+    done = [p for n, p in seen if n == "GenerationCompleted"]
+    assert done and done[-1]["stop_reason"] == "cancelled"
+    abort_registry.clear("rid-h2")
+
+
+def test_cancel_wakes_consumer_blocked_on_token_queue():  # noqa: D401
+    release = threading.Event()
+
+    class _Stalled:
+        def stream(self, prompt, **kw):
+            yield "first"
+            release.wait(2)  # e.g. long prefill / slow step
+            yield "late"
+
+    handle = abort_registry.register("rid-h3")
+    it = scheduled_stream(
+        _Stalled(), "m", "rid-h3", "p", cancel_event=handle
+    )
+    assert next(it) == "first"
+    threading.Timer(0.05, handle.cancel).start()
+    t0 = time.time()
+    assert list(it) == []
+    assert time.time() - t0 < 0.5
+    release.set()
+    abort_registry.clear("rid-h3")
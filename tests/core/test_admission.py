@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+
+from core import metrics
+from core.llm.admission import AdmissionController, AdmissionRejected
+
+
+def _counter(name):  # noqa: ANN001
+    return metrics.snapshot()["counters"].get(name, 0)
+
+
+def test_fair_round_robin_across_sessions():  # noqa: D401
+    ctrl = AdmissionController("adm-fair", max_concurrent=1, max_queue=8)
+    running = ctrl.admit("a")
+    assert running.granted and running.position == 0
+    # session "a" floods the queue before "b" and "c" arrive
+    a1, a2, a3 = (ctrl.admit("a") for _ in range(3))
+    b1 = ctrl.admit("b")
+    c1 = ctrl.admit("c")
+    assert [t.position for t in (a1, b1, c1, a2, a3)] == [1, 2, 3, 4, 5]
+    order = []
+    current = running
+    for _ in range(5):
+        current.release()
+        current = next(
+            t for t in (a1, a2, a3, b1, c1) if t.granted and not t.released
+        )
+        order.append(current)
+    assert order == [a1, b1, c1, a2, a3]
+    assert ctrl.active == 1 and ctrl.waiting == 0
+
+
+def test_full_queue_rejects_with_retry_after():  # noqa: D401
+    ctrl = AdmissionController(
+        "adm-full", max_concurrent=1, max_queue=1, retry_after_s=3
+    )
+    ctrl.admit("a")
+    ctrl.admit("b")
+    rejected = "admission_rejected_total{model=adm-full,reason=queue_full}"
+    before = _counter(rejected)
+    with pytest.raises(AdmissionRejected) as info:
+        ctrl.admit("c")
+    assert info.value.retry_after_s == 3
+    assert _counter(rejected) == before + 1
+
+
+def test_waiter_woken_on_grant_and_expires_at_budget():  # noqa: D401
+    ctrl = AdmissionController(
+        "adm-wait", max_concurrent=1, max_queue=4, queue_timeout_s=0.2
+    )
+
+    def finish(ticket):  # noqa: ANN001
+        time.sleep(0.05)  # a decode finishing on a worker thread
+        ticket.release()
+
+    async def scenario():
+        running = ctrl.admit("a")
+        waiter = ctrl.admit("b")
+        late = ctrl.admit("c")
+        asyncio.get_running_loop().run_in_executor(None, finish, running)
+        await waiter.changed(1.0)
+        assert waiter.granted and late.position == 1
+        await asyncio.sleep(max(0.0, late.deadline - time.perf_counter()))
+        return ctrl.expire(late), late
+
+    expired, late = asyncio.run(scenario())
+    assert expired is False and not late.granted
+    assert ctrl.waiting == 0
+    late.release()  # withdrawn ticket: no-op
+    assert ctrl.active == 1
@@ -0,0 +1,63 @@
+from core.events import on, reset_listeners_for_tests
+from core.llm import chunk_events
+from core.llm.chunk_events import ChunkEmitter
+
+
+def _run(pieces, **policy):  # noqa: ANN001, ANN003
+    reset_listeners_for_tests()
+    events = []
+    on(
+        lambda n, p: events.append((n, dict(p))),
+        events={"GenerationChunk", "GenerationChunkBatch"},
+    )
+    emitter = ChunkEmitter("r1", "m1", "primary", **policy)
+    for seq, piece in enumerate(pieces):
+        emitter.add(seq, piece)
+    emitter.close()
+    reset_listeners_for_tests()
+    return events
+
+
+def test_batch_mode_coalesces_with_exact_tokens_out():  # noqa: D401
+    pieces = [f"t{i} " for i in range(7)]
+    events = _run(pieces, mode="batch", batch_tokens=3, batch_ms=60_000)
+    assert [n for n, _ in events] == ["GenerationChunkBatch"] * 3
+    ranges = [(p["seq_start"], p["seq_end"], p["tokens"]) for _, p in events]
+    assert ranges == [(0, 2, 3), (3, 5, 3), (6, 6, 1)]
+    assert "".join(p["text"] for _, p in events) == "".join(pieces)
+    assert [p["tokens_out"] for _, p in events] == [3, 6, 7]
+
+    # batch_ms=0: every piece is already "old enough"
+    events = _run(pieces[:2], mode="batch", batch_tokens=16, batch_ms=0)
+    assert [p["tokens_out"] for _, p in events] == [1, 2]
+
+
+def test_sample_off_and_per_token_modes():  # noqa: D401
+    pieces = [f"t{i}" for i in range(7)]
+    sampled = _run(pieces, mode="sample", sample_every=3)
+    assert [(p["seq"], p["tokens_out"]) for _, p in sampled] == [
+        (0, 1),
+        (3, 4),
+        (6, 7),
+    ]
+    tail = _run(pieces[:5], mode="sample", sample_every=3)
+    # the last piece is always reported so the final count is exact
+    assert [(p["seq"], p["tokens_out"]) for _, p in tail] == [
+        (0, 1),
+        (3, 4),
+        (4, 5),
+    ]
+    assert _run(pieces, mode="off") == []
+    per_token = _run(pieces)
+    assert [p["tokens_out"] for _, p in per_token] == list(range(1, 8))
+
+
+def test_emitter_reads_llm_chunk_events_config(monkeypatch):  # noqa: D401
+    monkeypatch.setattr(
+        chunk_events,
+        "chunk_events_config",
+        lambda: {"mode": "batch", "batch_tokens": 4, "batch_ms": 5},
+    )
+    emitter = ChunkEmitter.from_config("r1", "m1", "primary")
+    assert (emitter.mode, emitter.batch_tokens) == ("batch", 4)
+    assert emitter.batch_s == 0.005 and emitter.sample_every == 10
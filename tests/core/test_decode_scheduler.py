@@ -0,0 +1,112 @@
+import threading
+import time
+
+from core.llm.scheduler import DecodeScheduler, scheduled_stream
+
+
+class _Prov:
+    decode_slots = 1
+
+    def __init__(self):
+        self.inflight = 0
+        self.max_inflight = 0
+        self.closed = 0
+        self.lock = threading.Lock()
+
+    def stream(self, prompt: str, **kw):
+        with self.lock:
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+        try:
+            for i in range(5):
+                time.sleep(0.002)
+                yield f"{prompt}{i} "
+        finally:
+            with self.lock:
+                self.inflight -= 1
+                self.closed += 1
+
+
+def test_concurrent_streams_are_serialized_per_provider():  # noqa: D401
+    prov = _Prov()
+    results: dict[str, str] = {}
+
+    def _consume(name: str) -> None:
+        results[name] = "".join(
+            scheduled_stream(prov, "m", name, name)
+        )
+
+    threads = [
+        threading.Thread(target=_consume, args=(n,)) for n in "abcd"
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=5)
+    assert prov.max_inflight == 1
+    assert results["c"] == "c0 c1 c2 c3 c4 "
+
+
+def test_multi_slot_round_robin_interleaves_steps():  # noqa: D401
+    order: list[str] = []
+    sched = DecodeScheduler("m", slots=2)
+    gate = threading.Event()
+
+    def _factory(tag: str):
+        def _gen():
+            gate.wait(1)
+            for i in range(3):
+                order.append(tag)
+                yield i
+        return _gen
+
+    r1 = sched.submit("r1", _factory("x"))
+    r2 = sched.submit("r2", _factory("y"))
+    gate.set()
+    assert list(r1) == [0, 1, 2]
+    assert list(r2) == [0, 1, 2]
+    # Second sequence progresses before the first one finishes
+    last_x = len(order) - 1 - order[::-1].index("x")
+    assert order.index("y") < last_x
+
+
+def test_consumer_close_cancels_decode():  # noqa: D401
+    prov = _Prov()
+    it = scheduled_stream(prov, "m", "r", "z")
+    assert next(it) == "z0 "
+    it.close()
+    deadline = time.time() + 1
+    while prov.closed == 0 and time.time() < deadline:
+        time.sleep(0.005)
+    assert prov.closed == 1
+
+
+def test_shutdown_ends_sequences_and_stops_worker():  # noqa: D401
+    from core.llm import scheduler
+
+    prov = _Prov()
+    gate = threading.Event()
+
+    def _slow(prompt: str, **kw):
+        yield f"{prompt}0 "
+        gate.wait(1)
+        yield f"{prompt}1 "
+
+    prov.stream = _slow
+    active = scheduled_stream(prov, "m", "r1", "a")
+    queued = scheduled_stream(prov, "m", "r2", "b")
+    assert next(active) == "a0 "
+    workers = [
+        t for t in threading.enumerate() if t.name == "decode-m"
+    ]
+    assert workers
+    gate.set()
+    scheduler.shutdown_all(timeout=1)
+    assert not any(t.is_alive() for t in workers)
+    assert list(queued) == []  # ended before its first step
+    assert list(active) in ([], ["a1 "])
+    # the scheduler is reusable after a shutdown
+    prov.stream = _Prov().stream
+    assert "".join(scheduled_stream(prov, "m", "r3", "c")) == (
+        "c0 c1 c2 c3 c4 "
+    )
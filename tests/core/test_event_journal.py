@@ -0,0 +1,140 @@
+import json
+
+import pytest
+
+from core.eventbus import EventBus
+from core.eventbus.journal import (
+    Journal,
+    JournalReader,
+    index_path,
+    latency_breakdown,
+)
+from scripts import event_journal
+
+
+def _emit_request(bus, rid, t0, tokens=3):  # noqa: ANN001
+    bus.emit(
+        "GenerationStarted",
+        {"request_id": rid, "model_id": "m1", "prompt_tokens": 5, "ts": t0},
+    )
+    for i in range(tokens):
+        bus.emit(
+            "GenerationChunk",
+            {
+                "request_id": rid,
+                "seq": i,
+                "text": "x" * 40,
+                "tokens_out": i + 1,
+                "ts": t0 + 0.1 + i * 0.05,
+            },
+        )
+    bus.emit(
+        "GenerationCompleted",
+        {
+            "request_id": rid,
+            "status": "ok",
+            "output_tokens": tokens,
+            "latency_ms": 250,
+            "ts": t0 + 0.25,
+        },
+    )
+
+
+def _journal(tmp_path, **kw):  # noqa: ANN001, ANN003
+    bus = EventBus()
+    bus.configure(mode="sync")
+    journal = Journal(tmp_path / "journal", **kw)
+    journal.start()
+    bus.subscribe_all(journal.record)
+    return bus, journal
+
+
+@pytest.mark.parametrize("encoding", ["jsonl", "lp"])
+def test_journal_rotates_indexes_and_looks_up(
+    tmp_path, encoding
+):  # noqa: D401
+    bus, journal = _journal(
+        tmp_path,
+        encoding=encoding,
+        segment_max_mb=1 / 1024,  # ~1 KiB segments
+        index_every=2,
+    )
+    for n in range(6):
+        _emit_request(bus, f"r{n}", 1000.0 + n)
+    bus.emit("ModelLoaded", {"model_id": "m1", "ts": 1010.0})
+    assert journal.flush(5)
+    journal.close()
+
+    reader = JournalReader(tmp_path / "journal")
+    segments = reader.segments()
+    assert len(segments) > 2
+    assert all(index_path(s).exists() for s in segments)  # all sealed
+    timeline = reader.timeline("r3")
+    assert [e["event"] for e in timeline] == (
+        ["GenerationStarted"] + ["GenerationChunk"] * 3
+        + ["GenerationCompleted"]
+    )
+    assert reader.timeline("missing") == []
+    window = list(reader.between(1002.0, 1003.2))
+    assert {e["payload"]["request_id"] for e in window} == {"r2", "r3"}
+    assert reader.request_ids(since=1004.0) == ["r4", "r5"]
+    assert [e["event"] for e in reader.between(1009.0)] == ["ModelLoaded"]
+
+
+def test_journal_retention_and_live_segment(tmp_path):  # noqa: D401
+    bus, journal = _journal(
+        tmp_path, segment_max_mb=1 / 1024, max_segments=2
+    )
+    for n in range(6):
+        _emit_request(bus, f"r{n}", 1000.0 + n)
+    assert journal.flush(5)
+    reader = JournalReader(tmp_path / "journal")
+    segments = reader.segments()
+    assert len(segments) == 2
+    # the active segment has no sidecar yet: indexed by a scan
+    assert not index_path(segments[-1]).exists()
+    assert reader.timeline("r5")[-1]["event"] == "GenerationCompleted"
+    assert reader.timeline("r0") == []  # rotated away
+    journal.close()
+    assert index_path(segments[-1]).exists()
+
+
+def test_latency_breakdown_and_cli_export(tmp_path, capsys):  # noqa: D401
+    bus, journal = _journal(tmp_path)
+    _emit_request(bus, "r1", 1000.0, tokens=4)
+    bus.emit(
+        "GenerationStarted",
+        {"request_id": "r2", "model_id": "m1", "ts": 1001.0},
+    )
+    bus.emit(
+        "GenerationCancelled",
+        {"request_id": "r2", "reason": "client_disconnect", "ts": 1001.5},
+    )
+    journal.close()
+
+    reader = JournalReader(tmp_path / "journal")
+    row = latency_breakdown(reader.timeline("r1"))
+    assert row["ttft_ms"] == 100.0 and row["decode_ms"] == 150.0
+    assert row["total_ms"] == 250 and row["output_tokens"] == 4
+    assert row["tokens_per_s"] == pytest.approx(26.67, abs=0.01)
+
+    root = str(tmp_path / "journal")
+    capsys.readouterr()
+    assert event_journal.main(["--dir", root, "export"]) == 0
+    lines = capsys.readouterr().out.strip().splitlines()
+    assert lines[0].startswith("request_id,model_id,status")
+    assert lines[1].startswith("r1,m1,ok,")
+    assert lines[2].startswith("r2,m1,cancelled,client_disconnect")
+
+    event_journal.main(
+        ["--dir", root, "export", "--since", "1000.5", "--format", "json"]
+    )
+    exported = json.loads(capsys.readouterr().out)
+    assert [r["request_id"] for r in exported] == ["r2"]
+    event_journal.main(["--dir", root, "timeline", "r2", "--table"])
+    table = capsys.readouterr().out.splitlines()
+    assert table[-1].split() == [
+        "500.0",
+        "GenerationCancelled",
+        "reason=client_disconnect",
+    ]
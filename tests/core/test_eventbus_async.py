@@ -0,0 +1,110 @@
+import threading
+
+from core import metrics
+from core.eventbus import EventBus
+
+
+def _bus(**overrides):  # noqa: ANN003
+    bus = EventBus()
+    bus.configure(
+        **{
+            "mode": "async",
+            "dispatchers": 1,
+            "overflow": "drop",
+            "overflow_by_event": {},
+            **overrides,
+        }
+    )
+    return bus
+
+
+def _dropped(event, policy):  # noqa: ANN001
+    key = f"eventbus_dropped_total{{event={event},policy={policy}}}"
+    return metrics.snapshot()["counters"].get(key, 0)
+
+
+def _stalled(bus, event):  # noqa: ANN001
+    """Subscribe a handler that holds the dispatcher on the first event."""
+    started, release, got = threading.Event(), threading.Event(), []
+
+    def handler(payload):  # noqa: ANN001
+        got.append(payload["i"])
+        started.set()
+        release.wait(5)
+
+    bus.subscribe(event, handler)
+    bus.emit(event, {"i": 0})
+    assert started.wait(5)
+    return release, got
+
+
+def test_async_dispatch_off_thread_keeps_order_and_inline():  # noqa: D401
+    bus = _bus()
+    seen, inline_threads = [], []
+    bus.subscribe(
+        "AsyncEv",
+        lambda p: seen.append((p["i"], threading.current_thread().name)),
+    )
+    bus.subscribe_all(
+        lambda name, p: inline_threads.append(threading.current_thread()),
+        inline=True,
+    )
+    for i in range(50):
+        bus.emit("AsyncEv", {"i": i})
+    assert inline_threads == [threading.current_thread()] * 50
+    assert bus.flush(5)
+    assert [i for i, _ in seen] == list(range(50))
+    assert {name for _, name in seen} == {"eventbus-0"}
+    assert bus.depth == 0
+
+
+def test_async_drop_and_sample_policies():  # noqa: D401
+    bus = _bus(queue_size=2)
+    release, got = _stalled(bus, "DropEv")
+    before = _dropped("DropEv", "drop")
+    for i in range(1, 5):
+        bus.emit("DropEv", {"i": i})
+    release.set()
+    assert bus.flush(5)
+    assert got == [0, 1, 2]
+    assert _dropped("DropEv", "drop") - before == 2
+
+    bus = _bus(
+        queue_size=4,
+        overflow_by_event={"SampleEv": "sample"},
+        sample_every=2,
+        sample_watermark=0.5,
+    )
+    release, got = _stalled(bus, "SampleEv")
+    before = _dropped("SampleEv", "sample")
+    for i in range(1, 9):
+        bus.emit("SampleEv", {"i": i})
+    release.set()
+    assert bus.flush(5)
+    # below the watermark everything passes, above it every 2nd, full: none
+    assert got == [0, 1, 2, 4, 6]
+    assert _dropped("SampleEv", "sample") - before == 4
+
+
+def test_async_block_waits_for_space_then_drops():  # noqa: D401
+    bus = _bus(queue_size=1, overflow="block", block_timeout_ms=5000)
+    release, got = _stalled(bus, "BlockEv")
+    bus.emit("BlockEv", {"i": 1})
+    waiter = threading.Thread(target=bus.emit, args=("BlockEv", {"i": 2}))
+    waiter.start()
+    waiter.join(0.1)
+    assert waiter.is_alive()  # the emitter waits for space
+    release.set()
+    waiter.join(5)
+    assert bus.flush(5)
+    assert got == [0, 1, 2]
+
+    bus = _bus(queue_size=1, overflow="block", block_timeout_ms=10)
+    release, got = _stalled(bus, "BlockEv2")
+    before = _dropped("BlockEv2", "block")
+    bus.emit("BlockEv2", {"i": 1})
+    bus.emit("BlockEv2", {"i": 2})  # times out, dropped
+    release.set()
+    assert bus.flush(5)
+    assert got == [0, 1]
+    assert _dropped("BlockEv2", "block") - before == 1
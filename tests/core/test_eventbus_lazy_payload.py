@@ -0,0 +1,63 @@
+import pytest
+
+from core import metrics
+from core.eventbus import EventBus
+from core.events import GenerationChunk, emit, on, reset_listeners_for_tests
+
+
+def _sync_bus():
+    bus = EventBus()
+    bus.configure(mode="sync")
+    return bus
+
+
+def test_unobserved_event_skips_payload_and_metrics():  # noqa: D401
+    bus = _sync_bus()
+    built = []
+
+    def factory():
+        built.append(1)
+        return {"v": 1}
+
+    before = metrics.snapshot()["counters"]
+    bus.emit("QuietEvent", factory)
+    assert built == [] and not bus.wants("QuietEvent")
+    assert metrics.snapshot()["counters"] == before
+
+    got = []
+    bus.subscribe_all(lambda n, p: got.append(n), events={"LoudEvent"})
+    bus.emit("QuietEvent", factory)
+    assert built == [] and got == []
+    bus.emit("LoudEvent", factory)
+    assert built == [1] and got == ["LoudEvent"]
+
+
+def test_handlers_share_read_only_view():  # noqa: D401
+    bus = _sync_bus()
+    views = []
+    bus.subscribe("ViewEvent", views.append)
+    bus.subscribe_all(lambda n, p: views.append(p))
+    bus.emit("ViewEvent", {"v": 1})
+    assert views[0] is views[1]
+    assert views[0]["v"] == 1 and "ts" in views[0]
+    with pytest.raises(TypeError):
+        views[0]["v"] = 2  # type: ignore[index]
+
+
+def test_legacy_subscriber_event_filter():  # noqa: D401
+    reset_listeners_for_tests()
+    seen = []
+    on(lambda n, p: seen.append((n, p["seq"])), events={"GenerationChunk"})
+    emit(
+        GenerationChunk(
+            request_id="r1",
+            model_id="m1",
+            role="primary",
+            correlation_id="r1",
+            seq=3,
+            text="x",
+            tokens_out=4,
+        )
+    )
+    reset_listeners_for_tests()
+    assert seen == [("GenerationChunk", 3)]
@@ -0,0 +1,142 @@
+import os
+import struct
+from pathlib import Path
+
+import pytest
+
+from core import metrics
+from core.llm.residency import estimate_footprint
+from core.registry import gguf
+from core.registry.gguf import GGUFError, gguf_info, read_gguf
+
+
+def _str(s: str) -> bytes:
+    raw = s.encode("utf-8")
+    return struct.pack("<Q", len(raw)) + raw
+
+
+def _kv(key: str, vtype: int, payload: bytes) -> bytes:
+    return _str(key) + struct.pack("<I", vtype) + payload
+
+
+def _write_gguf(path: Path, *, ctx: int = 4096, pad: int = 0) -> None:
+    tokens = ["<unk>", "<s>", "</s>"] + [f"t{i}" for i in range(61)]
+    kvs = [
+        _kv("general.architecture", 8, _str("llama")),
+        _kv("general.name", 8, _str("tiny")),
+        _kv("general.file_type", 4, struct.pack("<I", 15)),
+        _kv("llama.context_length", 4, struct.pack("<I", ctx)),
+        _kv("llama.block_count", 4, struct.pack("<I", 2)),
+        _kv("llama.embedding_length", 4, struct.pack("<I", 256)),
+        _kv("llama.attention.head_count", 4, struct.pack("<I", 8)),
+        # per-layer array form: the max is kept
+        _kv(
+            "llama.attention.head_count_kv",
+            9,
+            struct.pack("<IQ", 4, 2) + struct.pack("<II", 2, 4),
+        ),
+        _kv("tokenizer.ggml.model", 8, _str("llama")),
+        _kv(
+            "tokenizer.ggml.tokens",
+            9,
+            struct.pack("<IQ", 8, len(tokens))
+            + b"".join(_str(t) for t in tokens),
+        ),
+        _kv(
+            "tokenizer.ggml.scores",
+            9,
+            struct.pack("<IQ", 6, len(tokens))
+            + struct.pack(f"<{len(tokens)}f", *([0.0] * len(tokens))),
+        ),
+        _kv("tokenizer.ggml.bos_token_id", 4, struct.pack("<I", 1)),
+        _kv("tokenizer.ggml.eos_token_id", 4, struct.pack("<I", 2)),
+    ]
+    tensors = [
+        ("token_embd.weight", 12, (256, 64), 0),  # Q4_K
+        ("output_norm.weight", 0, (256,), 9216),  # F32
+    ]
+    body = b"GGUF" + struct.pack("<IQQ", 3, len(tensors), len(kvs))
+    body += b"".join(kvs)
+    for name, ggml_type, shape, offset in tensors:
+        body += _str(name) + struct.pack("<I", len(shape))
+        body += struct.pack(f"<{len(shape)}Q", *shape)
+        body += struct.pack("<IQ", ggml_type, offset)
+    body += b"\0" * (-len(body) % 32)
+    body += b"\xab" * (9216 + 1024 + pad)  # tensor data
+    path.write_bytes(body)
+
+
+def test_reads_header_facts(tmp_path):  # noqa: D401
+    model = tmp_path / "tiny.gguf"
+    _write_gguf(model)
+    info = read_gguf(model)
+    assert info.version == 3
+    assert info.architecture == "llama"
+    assert info.context_length == 4096
+    assert info.block_count == 2
+    assert info.file_type == 15
+    assert info.vocab_size == 64
+    assert info.facts() == {
+        "context_length": 4096,
+        "block_count": 2,
+        "embedding_length": 256,
+        "head_count": 8,
+        "head_count_kv": 4,
+    }
+    assert info.special_tokens == {"bos": (1, "<s>"), "eos": (2, "</s>")}
+    sizes = {t.name: t.nbytes for t in info.tensors}
+    assert sizes == {
+        "token_embd.weight": 256 * 64 // 256 * 144,
+        "output_norm.weight": 1024,
+    }
+    assert info.quant_types() == {
+        "Q4_K": {"tensors": 1, "bytes": 9216},
+        "F32": {"tensors": 1, "bytes": 1024},
+    }
+    assert info.data_offset % 32 == 0
+    summary = info.summary()
+    assert summary["tokenizer"]["special_tokens"]["eos"]["text"] == "</s>"
+    assert summary["head_count_kv"] == 4
+
+
+def test_facts_drive_residency_kv_estimate(tmp_path):  # noqa: D401
+    model = tmp_path / "tiny.gguf"
+    _write_gguf(model)
+    fp = estimate_footprint(model, 128, facts=read_gguf(model).facts())
+    # 2 (K+V) * layers * kv heads * head_dim (256/8) * f16
+    assert fp.source == "metadata"
+    assert fp.kv_bytes == 2 * 2 * 4 * 32 * 2 * 128
+
+
+def test_cache_keyed_by_file_identity(tmp_path):  # noqa: D401
+    gguf.clear_cache()
+    model = tmp_path / "tiny.gguf"
+    _write_gguf(model, ctx=2048)
+
+    def hits():
+        counters = metrics.snapshot()["counters"]
+        return counters.get("gguf_metadata_total{result=hit}", 0)
+
+    first = gguf_info(model)
+    before = hits()
+    assert gguf_info(model) is first and hits() == before + 1
+    # replaced file (new size / mtime): parsed again
+    _write_gguf(model, ctx=8192, pad=7)
+    st = model.stat()
+    os.utime(model, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    second = gguf_info(model)
+    assert second is not first and second.context_length == 8192
+
+
+def test_non_gguf_and_truncated(tmp_path):  # noqa: D401
+    junk = tmp_path / "junk.bin"
+    junk.write_bytes(b"dummy model bytes" * 4)
+    assert gguf_info(junk) is None
+    assert gguf_info(tmp_path / "missing.gguf") is None
+    with pytest.raises(GGUFError):
+        read_gguf(junk)
+    model = tmp_path / "cut.gguf"
+    _write_gguf(model)
+    model.write_bytes(model.read_bytes()[:200])
+    with pytest.raises(GGUFError):
+        read_gguf(model)
@@ -0,0 +1,76 @@
+import gc
+import random
+import tracemalloc
+
+from core.llm.adapters import HarmonyChannelAdapter
+
+STREAM = (
+    "<|start|>assistant<|channel|>analysis<|message|>think  about it"
+    "<|end|>"
+    "<|start|>assistant<|channel|>commentary<|message|>[tool:x] note<|end|>"
+    "<|start|>assistant<|recipient|>functions.calc<|constrain|>json"
+    '<|message|>{"a": 1}<|end|>'
+    "<|start|>assistant<|channel|>final<|message|>The answer is 42.<|return|>"
+)
+
+
+def _run(chunks):
+    adapter = HarmonyChannelAdapter({"model_id": "m"})
+    events = []
+    for c in chunks:
+        events.extend(adapter.process_chunk(c))
+    events.extend(adapter.finalize())
+    return adapter, events
+
+
+def test_events_independent_of_chunking():  # noqa: D401
+    _, whole = _run([STREAM])
+    kinds = [e["type"] for e in whole]
+    assert kinds[:5] == [
+        "analysis", "analysis", "analysis", "commentary", "tool_call"
+    ]
+    assert whole[4]["recipient"] == "functions.calc"
+    assert whole[4]["constrain"] is True
+    assert whole[-1]["final_text"].strip() == "The answer is 42."
+    rnd = random.Random(7)
+    for _ in range(30):
+        chunks, i = [], 0
+        while i < len(STREAM):
+            k = rnd.randint(1, 6)
+            chunks.append(STREAM[i:i + k])
+            i += k
+        assert _run(chunks)[1] == whole
+    # one character at a time splits every marker
+    assert _run(list(STREAM))[1] == whole
+
+
+def _held_after_message(words):  # noqa: ANN001
+    """Bytes an adapter still holds after one analysis message."""
+    adapter = HarmonyChannelAdapter({"model_id": "m"})
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        list(adapter.process_chunk("<|channel|>analysis<|message|>"))
+        for i in range(words):
+            list(adapter.process_chunk(f" w{i}"))
+        list(adapter.process_chunk("<|end|>"))
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0] - base
+    finally:
+        tracemalloc.stop()
+    return adapter, held
+
+
+def test_in_flight_state_stays_bounded():  # noqa: D401
+    _, small = _held_after_message(200)
+    adapter, large = _held_after_message(20000)
+    # completed messages are released: what stays does not grow with them
+    assert large - small < 8 * 1024
+    # a marker split across chunks is held back, not emitted as text
+    assert list(adapter.process_chunk("<|start|>assistant<|chan")) == []
+    events = list(adapter.process_chunk("nel|>final<|message|>ok<|return|>"))
+    assert all("<|" not in str(e.get("text", "")) for e in events)
+    final = list(adapter.finalize())[-1]
+    assert final["final_text"].strip() == "ok"
+    assert final["stats"]["reasoning_tokens"] == 256  # default cap
@@ -0,0 +1,136 @@
+import threading
+
+from core import metrics
+from core.llm.compaction import (
+    HistoryCompactor,
+    HistorySummary,
+    message_digest,
+    unsummarized,
+)
+from core.llm.pipeline.primary import PrimaryPipeline
+from core.llm.scheduler import decode_busy
+from core.llm.types import GenerationResult
+
+
+class _Store:
+    def __init__(self):
+        self.summaries = {}
+
+    def get_summary(self, sid):
+        return self.summaries.get(sid)
+
+    def set_summary(self, sid, summary):
+        self.summaries[sid] = summary
+
+
+class _Summarizer:
+    def __init__(self):
+        self.prompts = []
+        self.release = threading.Event()
+
+    def generate(self, prompt, **kwargs):
+        self.release.wait(5)
+        self.prompts.append(prompt)
+        return GenerationResult.ok(
+            text=f" summary #{len(self.prompts)} ",
+            prompt_tokens=1,
+            completion_tokens=1,
+            total_ms=1,
+            model_id="lw",
+            role="lightweight",
+            request_id="r",
+        )
+
+
+TURNS = [("user", "меня зовут Аня"), ("assistant", "Привет, Аня!"),
+         ("user", "я люблю чай"), ("assistant", "Записал.")]
+
+
+def test_compaction_runs_off_request_path_and_rolls():  # noqa: D401
+    metrics.reset_for_tests()
+    comp, store, lw = HistoryCompactor(), _Store(), _Summarizer()
+    # submit returns immediately although the model is still "busy"
+    assert comp.submit("s", TURNS[:2], store, lambda: lw)
+    assert store.get_summary("s") is None
+    lw.release.set()
+    assert comp.flush(5)
+    first = store.get_summary("s")
+    assert first.text == "summary #1" and first.folded == 2
+    assert first.through == message_digest(*TURNS[1])
+    # nothing new dropped -> no job
+    assert not comp.submit("s", TURNS[:2], store, lambda: lw)
+    # only the newly dropped turns are folded, on top of the old summary
+    assert comp.submit("s", TURNS, store, lambda: lw)
+    assert comp.flush(5)
+    assert "summary #1" in lw.prompts[1] and "я люблю чай" in lw.prompts[1]
+    assert "Аня!" not in lw.prompts[1]
+    assert store.get_summary("s").folded == 4
+    counters = metrics.snapshot()["counters"]
+    assert counters["history_compactions_total{status=ok}"] == 2
+
+
+def test_cached_summary_and_missing_model():  # noqa: D401
+    comp, lw = HistoryCompactor(), _Summarizer()
+    lw.release.set()
+    a, b = _Store(), _Store()
+    comp.submit("a", TURNS, a, lambda: lw)
+    comp.flush(5)
+    comp.submit("b", TURNS, b, lambda: lw)  # same turns: cache hit
+    comp.flush(5)
+    assert len(lw.prompts) == 1 and b.get_summary("b").text == "summary #1"
+    c = _Store()
+    comp.submit("c", TURNS[:1], c, lambda: None)
+    comp.flush(5)
+    assert c.get_summary("c") is None
+    prev = HistorySummary("x", message_digest(*TURNS[1]), 2)
+    assert unsummarized(TURNS, prev) == TURNS[2:]
+
+
+def test_compaction_decodes_through_scheduler():  # noqa: D401
+    comp, store, lw = HistoryCompactor(), _Store(), _Summarizer()
+    comp.submit("s", TURNS, store, lambda: lw)
+    tick = threading.Event()
+    for _ in range(100):  # worker picked the job up and is decoding
+        if decode_busy(lw):
+            break
+        tick.wait(0.01)
+    assert decode_busy(lw)
+    lw.release.set()
+    assert comp.flush(5)
+    assert not decode_busy(lw)
+    assert store.get_summary("s").text == "summary #1"
+
+
+class _Provider:
+    class _Info:
+        id = "compact-model"
+        role = "primary"
+        context_length = 400
+
+    def info(self):
+        return self._Info()
+
+
+def test_prompt_carries_summary_when_turns_drop():  # noqa: D401
+    store = _Store()
+    store.set_summary("sess", HistorySummary("user is Anya", "x", 6))
+    history = [("user", "word " * 150), ("assistant", "ok " * 150)] * 2
+    history.append(("user", "what is my name?"))
+    pipe = PrimaryPipeline()
+    ctx = pipe.prepare(
+        request_id="req-compact",
+        model_id="compact-model",
+        provider=_Provider(),
+        prompt="what is my name?",
+        session_messages=history,
+        reasoning_mode="low",
+        user_sampling={"max_tokens": 64},
+        passport_defaults={},
+        sampling_origin=None,
+        session_id="sess",
+        history_store=store,
+        summarizer=lambda: None,
+    )
+    assert ctx.history_window.dropped
+    assert "# Earlier conversation (summary)\nuser is Anya" in ctx.prompt
+    assert ctx.prompt.endswith("what is my name?<|end|><|start|>assistant")
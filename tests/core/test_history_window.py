@@ -0,0 +1,102 @@
+from core.llm.pipeline.history import build_window, render_message
+
+
+class _Tok:
+    def __init__(self, loaded=True):
+        self.loaded = loaded
+        self.counted: list[str] = []
+
+    def count_tokens(self, text):
+        if not self.loaded:
+            return None
+        self.counted.append(text)
+        return len(text)
+
+
+def _turns(n):
+    return [
+        ("user" if i % 2 == 0 else "assistant", f"message {i:03d}")
+        for i in range(n)
+    ]
+
+
+def test_binary_search_cut_and_dropped():  # noqa: D401
+    msgs = _turns(10)
+    last3 = sum(len(render_message(r, c)) for r, c in msgs[7:])
+    win = build_window(
+        msgs, model_id="hw", provider=_Tok(), budget_tokens=last3 + 5
+    )
+    assert win.kept == 3 and win.tokens == last3
+    assert win.dropped == msgs[:7]
+    assert win.text == "".join(render_message(r, c) for r, c in msgs[7:])
+    # newest message is kept even when it alone exceeds the budget
+    win = build_window(msgs, model_id="hw", provider=_Tok(), budget_tokens=1)
+    assert win.kept == 1 and len(win.dropped) == 9
+
+
+def test_session_cache_renders_only_new_turns():  # noqa: D401
+    tok = _Tok()
+    msgs = _turns(6)
+    build_window(msgs, model_id="hw2", provider=tok, session_id="s1")
+    tok.counted.clear()
+    msgs += _turns(8)[6:]
+    win = build_window(msgs, model_id="hw2", provider=tok, session_id="s1")
+    assert win.kept == 8
+    assert tok.counted == [render_message(r, c) for r, c in msgs[6:]]
+    tok.counted.clear()
+    # store evicts from the front: cache shifts without recounting
+    win = build_window(
+        msgs[3:], model_id="hw2", provider=tok, session_id="s1",
+        budget_tokens=10_000,
+    )
+    assert win.kept == 5 and not win.dropped
+    # edited history invalidates the tail only
+    edited = msgs[3:-1] + [("assistant", "rewritten")]
+    build_window(edited, model_id="hw2", provider=tok, session_id="s1")
+    assert tok.counted == [render_message("assistant", "rewritten")]
+
+
+def test_estimates_recounted_once_tokenizer_loads():  # noqa: D401
+    tok = _Tok(loaded=False)
+    msgs = [("user", "привет " * 20)]
+    first = build_window(msgs, model_id="hw3", provider=tok, session_id="s2")
+    tok.loaded = True
+    second = build_window(msgs, model_id="hw3", provider=tok, session_id="s2")
+    assert second.tokens == len(render_message(*msgs[0])) != first.tokens
+
+
+def test_tokenizing_one_session_does_not_block_others():  # noqa: D401
+    import threading
+
+    entered, release = threading.Event(), threading.Event()
+
+    class _Slow(_Tok):
+        def count_tokens(self, text):
+            entered.set()
+            release.wait(5)
+            return super().count_tokens(text)
+
+    slow = threading.Thread(
+        target=build_window,
+        args=(_turns(2),),
+        kwargs={"model_id": "hw4", "provider": _Slow(), "session_id": "a"},
+    )
+    slow.start()
+    assert entered.wait(5)
+    out = []
+    other = threading.Thread(
+        target=lambda: out.append(
+            build_window(
+                _turns(3), model_id="hw4", provider=_Tok(), session_id="b"
+            )
+        )
+    )
+    try:
+        # session "a" is mid-tokenize; another session is not held up
+        other.start()
+        other.join(2)
+        assert not other.is_alive() and out[0].kept == 3
+    finally:
+        release.set()
+        slow.join(5)
+        other.join(5)
@@ -0,0 +1,161 @@
+from types import SimpleNamespace
+
+from core import metrics
+from core.llm.kv_cache import KVStatePool
+from core.llm.llama_cpp_provider import LlamaCppProvider
+
+
+def _state(tokens, size=100):
+    return SimpleNamespace(
+        input_ids=list(tokens), n_tokens=len(tokens), llama_state_size=size
+    )
+
+
+class _TokenBuffer(list):
+    """numpy-like ``input_ids``: fixed ``n_ctx`` slots, no truth value."""
+
+    def __bool__(self):
+        raise ValueError("truth value of an array is ambiguous")
+
+
+class _FakeLlama:
+    """Single-context fake: counts tokens evaluated beyond reused prefix.
+
+    Like ``llama_cpp.Llama``, ``input_ids`` is a fixed-size buffer of
+    ``n_ctx`` slots and only the first ``n_tokens`` are live.
+    """
+
+    def __init__(self, n_ctx=64):
+        self.input_ids = _TokenBuffer([0] * n_ctx)
+        self.n_tokens = 0
+        self.evaluated = 0
+        self.vocab: dict[str, int] = {}
+
+    @property
+    def ids(self):
+        return list(self.input_ids[: self.n_tokens])
+
+    def _set(self, ids):
+        self.input_ids[: len(ids)] = ids
+        self.n_tokens = len(ids)
+
+    def tokenize(self, data: bytes, add_bos=True, special=True):
+        out = [1] if add_bos else []
+        for w in data.decode("utf-8").split():
+            out.append(self.vocab.setdefault(w, len(self.vocab) + 2))
+        return out
+
+    def save_state(self):
+        return _state(self.ids, size=self.n_tokens * 10)
+
+    def load_state(self, state):
+        self._set(list(state.input_ids)[: state.n_tokens])
+
+    def __call__(self, prompt, stream=True, **kw):
+        toks = self.tokenize(prompt.encode("utf-8"))
+        keep = 0
+        ids = self.ids
+        while keep < min(len(ids), len(toks)) and ids[keep] == toks[keep]:
+            keep += 1
+        self.evaluated += len(toks) - keep
+        self._set(toks + [999])
+        yield {"choices": [{"text": "ok"}]}
+
+
+def _provider(pool):
+    prov = LlamaCppProvider(
+        model_path="missing.gguf",
+        model_id="kvtest",
+        role="primary",
+        context_length=4096,
+    )
+    fake = _FakeLlama()
+    prov._state.llama = fake
+    prov._state.loaded = True
+    prov._state.stub = False
+    prov._kv_pool = pool
+    prov._kv_pool_built = True
+    return prov, fake
+
+
+def test_pool_longest_prefix_and_session_isolation():  # noqa: D401
+    pool = KVStatePool(
+        model_id="m", ram_budget_bytes=10_000, min_prefix_tokens=2
+    )
+    pool.put("s1", _state([1, 2, 3, 4]))
+    pool.put("s2", _state([1, 2, 9, 9, 9]))
+    hit = pool.lookup("s1", [1, 2, 3, 4, 5, 6])
+    assert hit.source == "ram" and hit.prefix_tokens == 4
+    # Unknown session never receives another session's snapshot
+    assert pool.lookup("s3", [1, 2, 3, 4]).source == "miss"
+
+
+def test_pool_ram_eviction_spills_to_disk(tmp_path):  # noqa: D401
+    metrics.reset_for_tests()
+    pool = KVStatePool(
+        model_id="m",
+        ram_budget_bytes=150,
+        disk_dir=tmp_path,
+        disk_budget_bytes=1_000,
+        min_prefix_tokens=2,
+    )
+    pool.put("a", _state([1, 2, 3]))
+    pool.put("b", _state([4, 5, 6]))  # evicts "a" to disk
+    stats = pool.stats()
+    assert stats["ram_entries"] == 1 and stats["disk_entries"] == 1
+    assert list(tmp_path.glob("*.kvstate"))
+    hit = pool.lookup("a", [1, 2, 3, 7])
+    assert hit.source == "disk" and hit.prefix_tokens == 3
+    snap = metrics.snapshot()["counters"]
+    assert snap.get("kv_cache_evictions_total{model=m,tier=ram}", 0) >= 1
+
+
+def test_provider_restores_session_prefix_on_switch():  # noqa: D401
+    metrics.reset_for_tests()
+    pool = KVStatePool(
+        model_id="kvtest", ram_budget_bytes=1 << 20, min_prefix_tokens=2
+    )
+    prov, fake = _provider(pool)
+    hist_a = "system a1 a2 a3 a4 a5"
+    hist_b = "system b1 b2 b3 b4 b5"
+    list(prov.stream(hist_a, session_id="A"))
+    list(prov.stream(hist_b, session_id="B"))
+    before = fake.evaluated
+    # Session A returns: only the new suffix should be evaluated
+    list(prov.stream(hist_a + " ok next", session_id="A"))
+    assert fake.evaluated - before == 2
+    snap = metrics.snapshot()["counters"]
+    assert snap.get("kv_cache_hits_total{model=kvtest,source=ram}") == 1
+    assert snap.get("kv_cache_prefill_tokens_saved_total{model=kvtest}")
+
+
+def test_provider_reuses_live_context_for_same_session():  # noqa: D401
+    metrics.reset_for_tests()
+    pool = KVStatePool(
+        model_id="kvtest", ram_budget_bytes=1 << 20, min_prefix_tokens=2
+    )
+    prov, fake = _provider(pool)
+    hist = "system a1 a2 a3"
+    list(prov.stream(hist, session_id="A"))
+    list(prov.stream(hist + " ok next", session_id="A"))
+    snap = metrics.snapshot()["counters"]
+    assert "kv_cache_errors_total{model=kvtest}" not in snap
+    assert snap.get("kv_cache_hits_total{model=kvtest,source=live}") == 1
+    assert prov._state.kv_owner == "A"
+
+
+def test_sessionless_request_snapshots_owner_first():  # noqa: D401
+    metrics.reset_for_tests()
+    pool = KVStatePool(
+        model_id="kvtest", ram_budget_bytes=1 << 20, min_prefix_tokens=2
+    )
+    prov, fake = _provider(pool)
+    hist = "system a1 a2 a3 a4"
+    list(prov.stream(hist, session_id="A"))
+    list(prov.stream("summarize x1 x2 x3", session_id=None))  # compaction
+    assert prov._state.kv_owner is None
+    before = fake.evaluated
+    list(prov.stream(hist + " ok next", session_id="A"))
+    assert fake.evaluated - before == 2
+    snap = metrics.snapshot()["counters"]
+    assert snap.get("kv_cache_hits_total{model=kvtest,source=ram}") == 1
@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+from core import metrics
+
+
+@pytest.fixture()
+def hist_settings():  # noqa: D401
+    metrics.reset_for_tests()
+    yield metrics.configure_histograms
+    metrics.reset_for_tests()
+
+
+def _exact(vals, q):  # noqa: ANN001
+    return sorted(vals)[min(len(vals) - 1, int(q * len(vals)))]
+
+
+def test_quantiles_within_bucket_error_and_shape(hist_settings):  # noqa: D401
+    hist_settings()
+    rng = random.Random(7)
+    vals = [rng.lognormvariate(3.0, 1.2) for _ in range(20000)] + [0.0]
+    for v in vals:
+        metrics.observe("lat_ms", v, {"path": "x"})
+    entry = metrics.snapshot()["histograms"]["lat_ms{path=x}"]
+    assert {"count", "min", "max", "p50", "last"} <= set(entry)
+    assert entry["count"] == len(vals)
+    assert entry["min"] == 0.0 and entry["max"] == max(vals)
+    assert entry["last"] == 0.0
+    assert entry["sum"] == pytest.approx(sum(vals))
+    for name, q in (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99)):
+        assert entry[name] == pytest.approx(_exact(vals, q), rel=0.035)
+
+
+def test_memory_is_bounded_by_value_range(hist_settings):  # noqa: D401
+    hist_settings(sub_buckets=8)
+    for i in range(100000):
+        metrics.observe("depth", i % 1000 + 1)
+    hist = metrics._HIST[("depth", ())]
+    # 10 powers of two x 8 sub-buckets, regardless of 100k samples
+    assert len(hist.total.counts) <= 10 * 8
+    metrics.observe("signed", -4.0)
+    metrics.observe("signed", 2.0)
+    entry = metrics.snapshot()["histograms"]["signed"]
+    assert entry["p50"] == pytest.approx(2.0, rel=0.07)
+    assert entry["min"] == -4.0
+
+
+def test_sliding_window_forgets_old_slices(
+    hist_settings, monkeypatch
+):  # noqa: D401
+    hist_settings(window_s=10.0, window_slices=5)
+    now = [1000.0]
+    monkeypatch.setattr(metrics, "_clock", lambda: now[0])
+    for v in (100.0, 200.0):
+        metrics.observe("win_ms", v)
+    now[0] += 6.0
+    metrics.observe("win_ms", 10.0)
+    entry = metrics.snapshot()["histograms"]["win_ms"]
+    assert entry["window"]["count"] == 3
+    now[0] += 6.0  # the first two samples left the 10 s window
+    window = metrics.snapshot()["histograms"]["win_ms"]["window"]
+    assert window["count"] == 1 and window["max"] == 10.0
+    assert window["p99"] == pytest.approx(10.0, rel=0.04)
+    now[0] += 20.0
+    entry = metrics.snapshot()["histograms"]["win_ms"]
+    assert entry["window"] is None and entry["count"] == 3
+
+
+def test_observe_never_reads_config(hist_settings, monkeypatch):  # noqa: D401
+    import core.config as config
+
+    def _boom():  # noqa: D401
+        raise AssertionError("observe() must not read config")
+
+    monkeypatch.setattr(config, "get_config", _boom)
+    vals = [2.0 + i * 0.005 for i in range(100)] + [3.9]
+
+    def _p50(name):  # noqa: ANN001
+        for v in vals:
+            metrics.observe(name, v)
+        return metrics.snapshot()["histograms"][name]["p50"]
+
+    assert _p50("defaults") == pytest.approx(2.25, rel=0.035)
+    hist_settings(sub_buckets=1)  # one bucket per power of two
+    assert _p50("coarse") == pytest.approx(3.0)
+    metrics.reset_for_tests()
+    assert _p50("defaults") == pytest.approx(2.25, rel=0.035)
+
+
+def test_non_finite_samples_are_dropped(hist_settings):  # noqa: D401
+    hist_settings()
+    metrics.observe("ratio", 1.0)
+    for bad in (float("nan"), float("inf"), float("-inf")):
+        metrics.observe("ratio", bad)
+    snap = metrics.snapshot()
+    entry = snap["histograms"]["ratio"]
+    assert entry["count"] == 1 and entry["max"] == 1.0
+    key = "metrics_nonfinite_dropped_total{name=ratio}"
+    assert snap["counters"][key] == 3
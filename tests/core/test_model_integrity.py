@@ -0,0 +1,97 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from core import metrics
+from core.llm import ModelLoadError
+from core.registry.integrity import IntegrityVerifier, hash_file, merkle_root
+from core.registry.loader import compute_sha256
+from core.registry.manifest import ModelManifest
+
+CHUNK = 64
+
+
+def _setup(tmp_path: Path, data: bytes):
+    model = tmp_path / "models" / "m.gguf"
+    model.parent.mkdir(parents=True)
+    model.write_bytes(data)
+    manifest = ModelManifest(
+        id="integ",
+        family="fam",
+        role="primary",
+        path="models/m.gguf",
+        context_length=1024,
+        capabilities=["chat"],
+        checksum_sha256=compute_sha256(model),
+    )
+    verifier = IntegrityVerifier(
+        cache_dir=tmp_path / "cache",
+        min_size_bytes=0,
+        chunk_size=CHUNK,
+        sample_chunks=2,
+    )
+    return model, manifest, verifier
+
+
+def _results():
+    counters = metrics.snapshot()["counters"]
+    prefix = "model_integrity_checks_total{model=integ,result="
+    return {
+        k[len(prefix):-1]: v for k, v in counters.items()
+        if k.startswith(prefix)
+    }
+
+
+def test_hash_file_single_pass_matches_full_and_chunks(tmp_path):  # noqa: D401
+    data = os.urandom(CHUNK * 5 + 17)
+    model, manifest, _ = _setup(tmp_path, data)
+    full, chunks = hash_file(model, CHUNK)
+    assert full == manifest.checksum_sha256
+    assert len(chunks) == 6
+    assert merkle_root(chunks) != merkle_root(chunks[::-1])
+
+
+def test_identity_cache_then_sampled_then_background(tmp_path):  # noqa: D401
+    metrics.reset_for_tests()
+    data = os.urandom(CHUNK * 8)
+    model, manifest, verifier = _setup(tmp_path, data)
+    assert verifier.verify(manifest, tmp_path)
+    assert verifier.verify(manifest, tmp_path)
+    assert _results() == {"full": 1, "cached": 1}
+    # touched file: new identity, chunk manifest allows a sampled check
+    st = model.stat()
+    os.utime(model, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert verifier.verify(manifest, tmp_path)
+    verifier.wait_background(5)
+    assert _results()["sampled"] == 1
+    assert verifier.verify(manifest, tmp_path)  # background recorded it
+    assert _results()["cached"] == 2
+
+
+def test_corruption_caught_by_sample_or_background(tmp_path):  # noqa: D401
+    data = bytearray(os.urandom(CHUNK * 8))
+    model, manifest, verifier = _setup(tmp_path, bytes(data))
+    verifier.verify(manifest, tmp_path)
+    data[CHUNK * 4 + 3] ^= 0xFF  # middle chunk, may escape the sample
+    model.write_bytes(bytes(data))
+    try:
+        verifier.verify(manifest, tmp_path)
+    except ModelLoadError:
+        return  # sampled check hit the corrupted chunk
+    verifier.wait_background(5)
+    with pytest.raises(ModelLoadError):
+        verifier.verify(manifest, tmp_path)
+
+
+def test_full_mode_and_manifest_mismatch(tmp_path):  # noqa: D401
+    data = os.urandom(CHUNK * 3)
+    model, manifest, _ = _setup(tmp_path, data)
+    verifier = IntegrityVerifier(
+        cache_dir=tmp_path / "cache", min_size_bytes=0, chunk_size=CHUNK,
+        mode="full",
+    )
+    verifier.verify(manifest, tmp_path)
+    bad = manifest.model_copy(update={"checksum_sha256": "0" * 64})
+    with pytest.raises(ModelLoadError):
+        verifier.verify(bad, tmp_path)  # cached digest still compared
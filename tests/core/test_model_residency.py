@@ -0,0 +1,299 @@
+import threading
+
+from core import metrics
+from core.events import reset_listeners_for_tests, subscribe
+from core.llm import ModelInfo
+from core.llm.alias_provider import AliasedProvider
+from core.llm.scheduler import scheduled_stream
+from core.llm.residency import (
+    Footprint,
+    ResidencyManager,
+    estimate_footprint,
+    kv_bytes_per_token,
+)
+from core.modules import module_manager as mm
+from core.registry.loader import clear_manifest_cache
+
+MB = 1024 * 1024
+
+
+class FakeProvider:
+    """Stub provider reporting a fake footprint."""
+
+    def __init__(self, mid, role, size_mb=0, **kw):  # noqa: ANN001
+        self._id = mid
+        self._role = role
+        self._size = size_mb * MB
+        self.loaded = False
+
+    def load(self):  # noqa: D401
+        self.loaded = True
+
+    def unload(self):  # noqa: D401
+        self.loaded = False
+
+    def stream(self, prompt, **kw):  # noqa: ANN001, ANN003, D401
+        yield f"{prompt}0"
+        kw["gate"].wait(5)  # decode still running until released
+        yield f"{prompt}1"
+
+    def footprint_bytes(self):  # noqa: D401
+        return self._size
+
+    def info(self):  # noqa: D401
+        return ModelInfo(
+            id=self._id,
+            role=self._role,
+            capabilities=("chat",),
+            context_length=128,
+        )
+
+
+def _fp(mb):
+    return Footprint(weights_bytes=mb * MB)
+
+
+def _manager():
+    return ResidencyManager(
+        100 * MB,
+        pinned_roles=("primary",),
+        priorities={"judge": 0, "planner": 0, "lightweight": 1},
+    )
+
+
+def test_evicts_lower_priority_before_lru():  # noqa: D401
+    res = _manager()
+    assert res.admit("p", "primary", _fp(50)) == []
+    assert res.admit("light", "lightweight", _fp(20)) == []
+    assert res.admit("judge", "judge", _fp(20)) == []
+    # judge is newer but lower priority: evicted before lightweight
+    assert res.plan("planner", _fp(20)) == ["judge"]
+    assert res.admit("planner", "planner", _fp(20)) == ["judge"]
+    assert "judge" not in res and res.used_bytes == 90 * MB
+
+
+def test_lru_within_priority_and_primary_pinned():  # noqa: D401
+    res = _manager()
+    res.admit("p", "primary", _fp(60))
+    res.admit("a", "judge", _fp(15))
+    res.admit("b", "judge", _fp(15))
+    res.touch("a")  # b is now least recently used
+    assert res.admit("c", "judge", _fp(15)) == ["b"]
+    before = metrics.snapshot()["counters"].get(
+        "model_residency_over_budget_total{model=big}", 0
+    )
+    # does not fit even alone with the pinned primary: evict all, load
+    assert sorted(res.admit("big", "judge", _fp(80))) == ["a", "c"]
+    snap = res.snapshot()
+    assert [m["id"] for m in snap["models"]] == ["p", "big"]
+    assert snap["models"][0]["pinned"] is True
+    assert snap["free_bytes"] < 0
+    after = metrics.snapshot()["counters"][
+        "model_residency_over_budget_total{model=big}"
+    ]
+    assert after == before + 1
+
+
+def test_recently_handed_out_model_is_not_evicted():  # noqa: D401
+    res = ResidencyManager(100 * MB, handout_grace_s=60)
+    res.admit("p", "primary", _fp(60))
+    res.admit("j", "judge", _fp(30))  # just loaded and handed out
+    key = "model_residency_eviction_skipped_total{model=j,reason=recent}"
+    before = metrics.snapshot()["counters"].get(key, 0)
+    assert res.admit("l", "lightweight", _fp(30)) == []
+    assert "j" in res
+    assert metrics.snapshot()["counters"][key] == before + 1
+    res.handout_grace_s = 0  # grace over: evictable again
+    assert "j" in res.admit("pl", "planner", _fp(30))
+
+
+def test_unlimited_budget_never_evicts():  # noqa: D401
+    res = ResidencyManager(None)
+    for i in range(5):
+        assert res.admit(f"m{i}", "judge", _fp(10_000)) == []
+    assert res.snapshot()["budget_bytes"] is None
+
+
+def test_footprint_from_model_facts(tmp_path):  # noqa: D401
+    model = tmp_path / "m.gguf"
+    model.write_bytes(b"\0" * 4096)
+    facts = {
+        "block_count": 24,
+        "head_count": 32,
+        "head_count_kv": 8,
+        "embedding_length": 4096,
+    }
+    per_token = kv_bytes_per_token(facts, 2)
+    assert per_token == 2 * 24 * 8 * 128 * 2
+    fp = estimate_footprint(model, 1024, facts=facts, overhead_bytes=7)
+    assert fp.weights_bytes == 4096 and fp.source == "metadata"
+    assert fp.kv_bytes == per_token * 1024
+    assert fp.total == 4096 + per_token * 1024 + 7
+    fallback = estimate_footprint(
+        model, 10, default_kv_bytes_per_token=100
+    )
+    assert fallback.kv_bytes == 1000 and fallback.source == "estimate"
+
+
+def test_llm_module_evicts_through_provider_registry():  # noqa: D401
+    reset_listeners_for_tests()
+    events = []
+    unsub = subscribe(lambda n, p: events.append((n, p)))
+    try:
+        mod = mm.LLMModule()
+        mod._residency = _manager()
+        primary = FakeProvider("p", "primary", 60)
+        judge = FakeProvider("j", "judge", 30)
+        mod._providers.update({"p": primary, "j": judge})
+        mod._providers["j-alias"] = AliasedProvider(
+            judge, alias_id="j-alias", alias_role="judge", alias_caps=()
+        )
+        mod._admit_resident("p", "primary", primary)
+        mod._admit_resident("j", "judge", judge)
+        light = FakeProvider("l", "lightweight", 30)
+        assert mod._admit_resident("l", "lightweight", light) == ["j"]
+        loaded = mod.info()["loaded_providers"]
+        assert "j" not in loaded and "j-alias" not in loaded
+        unloaded = [p for n, p in events if n == "ModelUnloaded"]
+        assert [(p["model_id"], p["reason"]) for p in unloaded] == [
+            ("j", "residency")
+        ]
+        state = mod.residency()
+        assert [m["id"] for m in state["models"]] == ["p", "l"]
+        assert state["models"][1]["source"] == "provider"
+    finally:
+        unsub()
+
+
+def test_eviction_skips_provider_with_open_stream():  # noqa: D401
+    mod = mm.LLMModule()
+    mod._residency = _manager()
+    primary = FakeProvider("p", "primary", 60)
+    judge = FakeProvider("j", "judge", 30)
+    mod._providers.update({"p": primary, "j": judge})
+    judge.load()
+    mod._admit_resident("p", "primary", primary)
+    mod._admit_resident("j", "judge", judge)
+    skipped = "model_residency_eviction_skipped_total{model=j,reason=busy}"
+    before = metrics.snapshot()["counters"].get(skipped, 0)
+
+    gate = threading.Event()
+    stream = scheduled_stream(judge, "j", "r1", "x", gate=gate)
+    assert next(stream) == "x0"  # decode in progress
+    light = FakeProvider("l", "lightweight", 30)
+    assert mod._admit_resident("l", "lightweight", light) == []
+    assert judge.loaded and "j" in mod.info()["loaded_providers"]
+    assert metrics.snapshot()["counters"][skipped] == before + 1
+    gate.set()
+    assert list(stream) == ["x1"]  # the stream was not cut
+
+    # idle again: the next admission evicts it
+    planner = FakeProvider("pl", "planner", 30)
+    assert "j" in mod._admit_resident("pl", "planner", planner)
+    assert not judge.loaded
+
+
+def test_eviction_skips_draft_in_use():  # noqa: D401
+    mod = mm.LLMModule()
+    mod._residency = _manager()
+    primary = FakeProvider("p", "primary", 60)
+    draft = FakeProvider("d", "judge", 30)
+    draft.draft_lock = threading.Lock()
+    mod._providers.update({"p": primary, "d": draft})
+    draft.load()
+    mod._admit_resident("p", "primary", primary)
+    mod._admit_resident("d", "judge", draft)
+    with draft.draft_lock:  # speculative proposal running
+        light = FakeProvider("l", "lightweight", 30)
+        assert mod._admit_resident("l", "lightweight", light) == []
+    assert draft.loaded
+
+
+def test_draft_model_reserves_draft_context(monkeypatch):  # noqa: D401
+    class _Estimated(FakeProvider):
+        _model_path = None
+
+        def footprint_bytes(self):  # noqa: D401
+            return None  # estimate from n_ctx
+
+    monkeypatch.setattr(
+        mm,
+        "speculative_config",
+        lambda: {"enabled": True, "draft_model": "d", "draft_context": 64},
+    )
+    mod = mm.LLMModule()
+    mod._residency = ResidencyManager(None)
+    mod._admit_resident("j", "judge", _Estimated("j", "judge"))
+    mod._admit_resident("d", "judge", _Estimated("d", "judge"))
+    kv = {m["id"]: m["kv_bytes"] for m in mod.residency()["models"]}
+    # context_length 128 plus the 64-token draft context
+    assert kv["d"] == kv["j"] * 192 // 128
+
+
+def test_get_provider_registers_footprint(monkeypatch, tmp_path):  # noqa
+    model = tmp_path / "models" / "res.gguf"
+    model.parent.mkdir(parents=True)
+    model.write_bytes(b"GGUF" + b"\0" * (2 * MB))
+    reg = tmp_path / "llm" / "registry"
+    reg.mkdir(parents=True)
+    (reg / "res.yaml").write_text(
+        "id: res-judge\nfamily: fam\nrole: judge\n"
+        "path: models/res.gguf\ncontext_length: 64\n"
+        "capabilities: [chat]\nchecksum_sha256: '0'\n",
+        encoding="utf-8",
+    )
+    clear_manifest_cache()
+
+    def factory(**kw):  # noqa: ANN003
+        return FakeProvider(kw["model_id"], kw["role"], 42)
+
+    monkeypatch.setattr(mm, "LlamaCppProvider", factory)
+    monkeypatch.delenv("MIA_FORCE_STUB", raising=False)
+    mod = mm.LLMModule()
+    mod._residency = _manager()
+    try:
+        mod.get_provider("res-judge", repo_root=tmp_path, skip_checksum=True)
+        entry = mod.residency()["models"][0]
+        assert entry["id"] == "res-judge" and entry["source"] == "provider"
+        assert entry["total_bytes"] == 42 * MB and entry["pinned"] is False
+        assert mod.unload("res-judge") is True
+        assert mod.residency()["models"] == []
+    finally:
+        clear_manifest_cache()
+
+
+def test_failed_load_evicts_nothing(monkeypatch, tmp_path):  # noqa: D401
+    model = tmp_path / "models" / "bad.gguf"
+    model.parent.mkdir(parents=True)
+    model.write_bytes(b"GGUF" + b"\0" * 16)
+    reg = tmp_path / "llm" / "registry"
+    reg.mkdir(parents=True)
+    (reg / "bad.yaml").write_text(
+        "id: bad-judge\nfamily: fam\nrole: judge\n"
+        "path: models/bad.gguf\ncontext_length: 64\n"
+        "capabilities: [chat]\nchecksum_sha256: '0'\n",
+        encoding="utf-8",
+    )
+    clear_manifest_cache()
+
+    class _Broken(FakeProvider):
+        def load(self):  # noqa: D401
+            raise RuntimeError("bad weights")
+
+    def factory(**kw):  # noqa: ANN003
+        return _Broken(kw["model_id"], kw["role"], 60)
+
+    monkeypatch.setattr(mm, "LlamaCppProvider", factory)
+    monkeypatch.delenv("MIA_FORCE_STUB", raising=False)
+    mod = mm.LLMModule()
+    mod._residency = _manager()
+    judge = FakeProvider("j", "judge", 60)
+    judge.load()
+    mod._providers["j"] = judge
+    mod._admit_resident("j", "judge", judge)
+    try:
+        mod.get_provider("bad-judge", repo_root=tmp_path, skip_checksum=True)
+        assert judge.loaded and "j" in mod.info()["loaded_providers"]
+        assert [m["id"] for m in mod.residency()["models"]] == ["j"]
+    finally:
+        clear_manifest_cache()
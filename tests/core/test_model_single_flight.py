@@ -0,0 +1,124 @@
+import threading
+
+from core import metrics
+from core.modules.module_manager import LLMModule
+
+
+class _Slow:
+    """Loader stand-in: blocks until released, counts calls per id."""
+
+    def __init__(self, mod: LLMModule) -> None:
+        self.mod = mod
+        self.calls: dict[str, int] = {}
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.fail: set[str] = set()
+        self.lock = threading.Lock()
+
+    def __call__(self, model_id, repo_root=".", skip_checksum=None):
+        with self.lock:
+            self.calls[model_id] = self.calls.get(model_id, 0) + 1
+        if model_id == "slow":
+            self.started.set()
+            assert self.release.wait(5)
+        if model_id in self.fail:
+            raise RuntimeError(f"boom {model_id}")
+        prov = self.mod._providers.get(model_id) or object()
+        self.mod._providers[model_id] = prov
+        return prov
+
+
+def _run(n, fn):
+    out, errors = [], []
+
+    def worker():
+        try:
+            out.append(fn())
+        except Exception as e:  # noqa: BLE001
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(n)]
+    for t in threads:
+        t.start()
+    return threads, out, errors
+
+
+def _waiters(model_id):
+    key = f"model_load_waiters_total{{model={model_id}}}"
+    return metrics.snapshot()["counters"].get(key, 0)
+
+
+def test_same_id_loads_once_and_shares_result(monkeypatch):  # noqa: D401
+    monkeypatch.delenv("MIA_FORCE_STUB", raising=False)
+    mod = LLMModule()
+    loader = _Slow(mod)
+    monkeypatch.setattr(mod, "_load_provider_once", loader)
+    before = _waiters("slow")
+    threads, out, errors = _run(6, lambda: mod._load_provider("slow"))
+    assert loader.started.wait(5)
+    # another id is not blocked behind the slow load
+    other = mod._load_provider("fast")
+    assert other is mod._load_provider("fast")
+    assert loader.calls == {"slow": 1, "fast": 1}
+    loader.release.set()
+    for t in threads:
+        t.join(5)
+    assert not errors
+    assert len(out) == 6 and all(p is out[0] for p in out)
+    assert loader.calls["slow"] == 1
+    assert _waiters("slow") - before >= 1
+
+
+def test_failure_propagates_to_waiters(monkeypatch):  # noqa: D401
+    monkeypatch.delenv("MIA_FORCE_STUB", raising=False)
+    mod = LLMModule()
+    loader = _Slow(mod)
+    loader.fail.add("slow")
+    monkeypatch.setattr(mod, "_load_provider_once", loader)
+    threads, out, errors = _run(4, lambda: mod._load_provider("slow"))
+    assert loader.started.wait(5)
+    loader.release.set()
+    for t in threads:
+        t.join(5)
+    assert not out and len(errors) == 4
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert loader.calls["slow"] == 1
+    # the failed flight is cleared: the next call retries
+    loader.fail.clear()
+    prov = mod._load_provider("slow")
+    assert prov is mod._load_provider("slow")
+    assert loader.calls["slow"] == 2
+
+
+def test_reentrant_load_runs_inline(monkeypatch):  # noqa: D401
+    monkeypatch.delenv("MIA_FORCE_STUB", raising=False)
+    mod = LLMModule()
+    seen = []
+
+    def once(model_id, repo_root=".", skip_checksum=None):
+        seen.append(model_id)
+        if len(seen) == 1:  # stub fallback path re-enters for the same id
+            with mod._forced_stub():
+                assert mod._force_stub_active()
+                return mod._load_provider(model_id)
+        return "stub"
+
+    monkeypatch.setattr(mod, "_load_provider_once", once)
+    assert mod._load_provider("x") == "stub"
+    assert seen == ["x", "x"]
+    assert not mod._force_stub_active()  # fallback scoped to the load
+
+
+def test_loaded_model_lookup_skips_single_flight(monkeypatch):  # noqa: D401
+    mod = LLMModule()
+    loader = _Slow(mod)
+    monkeypatch.setattr(mod, "_load_provider_once", loader)
+    monkeypatch.delenv("MIA_FORCE_STUB", raising=False)
+    first = mod._load_provider("fast")
+    before = _waiters("fast")
+    threads, out, errors = _run(8, lambda: mod._load_provider("fast"))
+    for t in threads:
+        t.join(5)
+    assert not errors and all(p is first for p in out)
+    assert loader.calls == {"fast": 1}
+    assert _waiters("fast") == before  # ordinary traffic is not a wait
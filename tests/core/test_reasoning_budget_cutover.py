@@ -0,0 +1,143 @@
+import re
+
+from core.llm.llama_cpp_provider import LlamaCppProvider
+from core.llm.pipeline.primary import PrimaryPipeline
+from core.llm.types import ReasoningBudget
+
+SPECIALS = ["<|start|>", "<|channel|>", "<|message|>", "<|end|>",
+            "<|return|>"]
+WORDS = ["assistant", "analysis", "final", " think", " Answer", "."]
+
+
+class _RunawayLlama:
+    """Thinks forever unless the final header is injected."""
+
+    def __init__(self):
+        self.vocab = {p: 1000 + i for i, p in enumerate(SPECIALS + WORDS)}
+        self.by_id = {v: k for k, v in self.vocab.items()}
+        self.calls: list[list[int]] = []
+        self.sampled = 0
+
+    def tokenize(self, text, add_bos=True, special=False):
+        parts = re.split(r"(<\|[a-z]+\|>)", text.decode("utf-8"))
+        ids = [1] if add_bos else []
+        for part in filter(None, parts):
+            if part in self.vocab:
+                ids.append(self.vocab[part])
+            else:
+                ids.extend(ord(c) for c in part)
+        return ids
+
+    def detokenize(self, ids, special=False):
+        return "".join(self.by_id.get(i, "?") for i in ids).encode("utf-8")
+
+    def token_eos(self):
+        return 2
+
+    def generate(self, tokens, temp=0.8, stopping_criteria=None):
+        self.calls.append(list(tokens))
+        v = self.vocab
+        if tokens[-1] == v["<|message|>"] and tokens[-2] == v["final"]:
+            script = [v[" Answer"], v["."], v["<|return|>"]]
+        else:
+            script = [v["<|channel|>"], v["analysis"], v["<|message|>"]]
+            script += [v[" think"]] * 500
+        for tid in script:
+            self.sampled += 1
+            yield tid
+
+
+def _provider():
+    prov = LlamaCppProvider(
+        model_path="missing.gguf",
+        model_id="budgetfake",
+        role="primary",
+        context_length=4096,
+    )
+    llama = _RunawayLlama()
+    prov._state.llama = llama
+    prov._state.loaded = True
+    return prov, llama
+
+
+def test_budget_interrupts_analysis_and_resumes_in_final():  # noqa: D401
+    prov, llama = _provider()
+    budget = ReasoningBudget(max_tokens=5)
+    pairs = list(
+        prov.stream(
+            "hi", with_token_ids=True, max_tokens=200, reasoning_budget=budget
+        )
+    )
+    text = "".join(p for _, p in pairs)
+    assert text == (
+        "<|channel|>analysis<|message|>" + " think" * 5
+        + "<|end|><|start|>assistant<|channel|>final<|message|> Answer."
+        "<|return|>"
+    )
+    assert len(llama.calls) == 2
+    # resumed on prompt + sampled + injected (prefix reused from KV)
+    assert llama.calls[1][: len(llama.calls[0])] == llama.calls[0]
+    assert llama.sampled == 8 + 3  # no runaway analysis decode
+    assert budget.cutover and budget.analysis_tokens == 5
+    assert budget.decode_tokens_unused_budget == 200 - 11
+
+
+def test_pipeline_reports_unused_decode_budget():  # noqa: D401
+    prov, _llama = _provider()
+    pipe = PrimaryPipeline()
+    ctx = pipe.prepare(
+        request_id="req-budget",
+        model_id="budgetfake",
+        provider=prov,
+        prompt="question?",
+        session_messages=None,
+        reasoning_mode="low",
+        user_sampling={"max_tokens": 100},
+        passport_defaults={},
+        sampling_origin="custom",
+        reasoning_max_tokens=4,
+    )
+    events = list(pipe.stream(ctx))
+    analysis = [e for e in events if e["type"] == "analysis"]
+    assert len(analysis) == 4
+    final = events[-1]
+    assert final["final_text"].strip() == "Answer."
+    res = pipe.finalize(ctx)
+    assert res.usage["reasoning_cutover"] is True
+    assert res.usage["decode_tokens_unused_budget"] > 0
+
+
+def test_text_decode_reports_unenforced_hard_budget():  # noqa: D401
+    from core import metrics
+
+    class _TextLlama(_RunawayLlama):
+        def __call__(self, prompt, stream=True, **kw):  # noqa: ANN003
+            yield {"choices": [{"text": "<|channel|>final<|message|>"}]}
+            yield {"choices": [{"text": "Answer.<|return|>"}]}
+
+    prov, _llama = _provider()
+    prov._state.llama = _TextLlama()
+    prov.harmony_vocab = lambda: None  # no token ids: text decode
+    key = (
+        "reasoning_budget_unenforced_total"
+        "{model=budgetfake,reason=text_path}"
+    )
+    before = metrics.snapshot()["counters"].get(key, 0)
+    pipe = PrimaryPipeline()
+    ctx = pipe.prepare(
+        request_id="req-budget-text",
+        model_id="budgetfake",
+        provider=prov,
+        prompt="question?",
+        session_messages=None,
+        reasoning_mode="low",
+        user_sampling={"max_tokens": 100},
+        passport_defaults={},
+        sampling_origin="custom",
+        reasoning_max_tokens=4,
+    )
+    list(pipe.stream(ctx))
+    res = pipe.finalize(ctx)
+    assert res.usage["reasoning_budget_unenforced"] == "text_path"
+    assert "reasoning_cutover" not in res.usage
+    assert metrics.snapshot()["counters"][key] == before + 1
@@ -0,0 +1,77 @@
+import random
+
+from core import metrics
+from core.llm.llama_cpp_provider import LlamaCppProvider
+from core.llm.repetition import RepetitionDetector, build_detector
+from core.llm.types import DecodeOutcome
+
+
+def _feed(det, keys):
+    for i, k in enumerate(keys):
+        if det.feed(k):
+            return i + 1
+    return None
+
+
+def test_periodic_suffix_detected():  # noqa: D401
+    det = RepetitionDetector(min_span_tokens=24)
+    cycle = [11, 12, 13, 14, 15, 16]
+    hit = _feed(det, list(range(100, 140)) + cycle * 10)
+    assert det.kind == "period" and det.period == 6
+    assert hit == 40 + 6 + 24 - 6  # min_span tokens of repetition
+
+
+def test_long_cycle_caught_by_ngram_hash():  # noqa: D401
+    det = RepetitionDetector(max_period=8, ngram=8, ngram_repeats=3)
+    cycle = list(range(200, 230))  # period beyond max_period
+    assert _feed(det, cycle * 5) is not None
+    assert det.kind == "ngram"
+
+
+def test_varied_text_not_flagged():  # noqa: D401
+    det = build_detector(enabled=True)
+    rnd = random.Random(3)
+    keys = [rnd.randrange(50) for _ in range(4000)]
+    # short natural repeats ("the the", runs of spaces) are tolerated
+    keys[100:106] = [7] * 6
+    assert _feed(det, keys) is None
+    assert det.tokens == 4000
+    assert build_detector(enabled=False) is None
+
+
+class _LoopingLlama:
+    def __init__(self):
+        self.sampled = 0
+
+    def __call__(self, prompt, stream=True, **kwargs):
+        yield {"choices": [{"text": "Intro. "}]}
+        for _ in range(kwargs.get("max_tokens", 128)):
+            for piece in ("I", " will", " check", " again", "."):
+                self.sampled += 1
+                yield {"choices": [{"text": piece}]}
+
+
+def test_provider_stops_loop_with_repetition_reason():  # noqa: D401
+    metrics.reset_for_tests()
+    prov = LlamaCppProvider(
+        model_path="missing.gguf",
+        model_id="loopfake",
+        role="primary",
+        context_length=2048,
+    )
+    llama = _LoopingLlama()
+    prov._state.llama = llama
+    prov._state.loaded = True
+    outcome = DecodeOutcome()
+    pieces = list(prov.stream("hi", max_tokens=400, decode_outcome=outcome))
+    assert outcome.stop_reason == "repetition"
+    assert outcome.output_tokens == len(pieces) < 100
+    assert llama.sampled < 100
+    snap = metrics.snapshot()["counters"]
+    stops = [
+        v for k, v in snap.items()
+        if k.startswith("generation_repetition_stops_total{")
+    ]
+    assert stops == [1]
+    unused = snap["repetition_unused_budget_tokens_total{model=loopfake}"]
+    assert unused == 400 - len(pieces)
@@ -0,0 +1,291 @@
+import types
+from threading import Lock
+
+from core import metrics
+from core.llm.llama_cpp_provider import LlamaCppProvider
+from core.llm.speculative import (
+    DraftRecorder,
+    ModelDraft,
+    PromptLookupDraft,
+    build_recorder,
+)
+from core.llm.types import SpeculativeRequest
+
+EOS = 0
+
+
+class _TokenBuffer(list):
+    """numpy-like ``input_ids``: fixed ``n_ctx`` slots, no truth value."""
+
+    def __bool__(self):
+        raise ValueError("truth value of an array is ambiguous")
+
+
+class _Target:
+    """Fake target: fixed continuation, binding-style draft verification.
+
+    Mirrors ``Llama.generate`` with ``draft_model``: one eval per step
+    covers the drafted tokens, which are kept up to the first mismatch
+    plus the token sampled after them. As in the binding, ``input_ids``
+    is an ``n_ctx`` buffer; rejected draft tokens stay past ``n_tokens``.
+    """
+
+    def __init__(self, script, logits_all=True, n_ctx=256):
+        self.script = list(script)
+        self.context_params = types.SimpleNamespace(logits_all=logits_all)
+        self.draft_model = None
+        self.input_ids = _TokenBuffer([0] * n_ctx)
+        self.n_tokens = 0
+        self.evals = 0
+
+    def _write(self, ids):
+        self.input_ids[: len(ids)] = ids
+
+    def tokenize(self, data: bytes, add_bos=True, special=False):
+        return [int(w) for w in data.decode("utf-8").split()]
+
+    def detokenize(self, ids, special=False):
+        return "".join(f"{t} " for t in ids).encode("utf-8")
+
+    def token_eos(self):
+        return EOS
+
+    def n_vocab(self):
+        return 100
+
+    def generate(self, tokens, **kwargs):  # noqa: ANN003
+        ids = list(tokens)
+        pos = 0
+        while pos < len(self.script):
+            draft = []
+            if self.draft_model is not None:
+                draft = [int(t) for t in self.draft_model(list(ids))]
+            self.evals += 1
+            self._write(ids + draft)  # the batch evaluates the proposal
+            kept = 0
+            for tid in draft:
+                if pos + kept >= len(self.script):
+                    break
+                if tid != self.script[pos + kept]:
+                    break
+                kept += 1
+            for tid in self.script[pos:pos + kept + 1]:
+                ids.append(tid)
+                self._write(ids)
+                self.n_tokens = len(ids)
+                yield tid
+            pos += kept + 1
+
+
+def _provider(llama):
+    prov = LlamaCppProvider(
+        model_path="missing.gguf",
+        model_id="spec-test",
+        role="primary",
+        context_length=256,
+    )
+    prov._state.llama = llama
+    prov._state.loaded = True
+    prov._state.stub = False
+    prov._kv_pool, prov._kv_pool_built = None, True
+    return prov
+
+
+def _decode(prov, **kw):  # noqa: ANN003
+    return [
+        tid
+        for tid, _ in prov.stream(
+            "5 6 7 8 5 6", with_token_ids=True, max_tokens=64, **kw
+        )
+    ]
+
+
+def test_prompt_lookup_proposes_latest_match():  # noqa: D401
+    draft = PromptLookupDraft(k=3, ngram_min=1, ngram_max=2)
+    assert draft.propose([1, 2, 3, 4, 9, 1, 2]) == [3, 4, 9]
+    # incremental: the latest occurrence of the tail n-gram wins
+    assert draft.propose([1, 2, 3, 4, 9, 1, 2, 5, 8, 2]) == [5, 8, 2]
+    assert draft.propose([7]) == []  # rewound context: index rebuilt
+    assert draft.propose([7, 7]) == [7]
+
+
+def test_ngram_speculation_keeps_output_and_saves_steps():  # noqa: D401
+    script = [7, 8, 5, 6, 7, 8, 5, 6, 9, EOS]
+    plain = _Target(script)
+    expected = _decode(_provider(plain))
+    assert expected == script[:-1] and plain.evals == len(script)
+    fast = _Target(script)
+    spec = SpeculativeRequest(mode="ngram", k=4)
+    before = metrics.snapshot()["counters"].get(
+        "speculative_accepted_tokens_total{model=spec-test,source=ngram}", 0
+    )
+    assert _decode(_provider(fast), speculative=spec) == expected
+    assert fast.evals < plain.evals
+    assert spec.enabled and spec.source == "ngram"
+    assert 0 < spec.accepted <= spec.proposed
+    assert fast.draft_model is None  # detached after the request
+    after = metrics.snapshot()["counters"][
+        "speculative_accepted_tokens_total{model=spec-test,source=ngram}"
+    ]
+    assert after == before + spec.accepted
+
+
+def test_requires_logits_all_and_falls_back_from_busy_draft():  # noqa
+    assert build_recorder("ngram", _Target([], False), "m") is None
+    busy = types.SimpleNamespace(draft_lock=Lock())
+    busy.draft_lock.acquire()
+    req = SpeculativeRequest(mode="draft", draft_provider=busy)
+    rec = build_recorder(req, _Target([]), "m")
+    assert isinstance(rec.source, PromptLookupDraft)
+    assert req.source == "ngram"
+    counters = metrics.snapshot()["counters"]
+    assert counters["speculative_unavailable_total{model=m,reason=draft_busy}"]
+
+
+class _Draft(_Target):
+    """Draft model with its own (word-offset) vocabulary."""
+
+    def tokenize(self, data: bytes, add_bos=True, special=False):
+        return [int(w) + 50 for w in data.decode("utf-8").split()]
+
+    def detokenize(self, ids, special=False):
+        return "".join(f"{t - 50} " for t in ids).encode("utf-8")
+
+    def generate(self, tokens, **kwargs):  # noqa: ANN003
+        last = tokens[-1]
+        while True:
+            last = 50 + (last - 50 + 1) % 10
+            yield last
+
+
+def test_model_draft_bridges_vocab_and_releases_lock():  # noqa: D401
+    target, draft = _Target([]), _Draft([])
+    model = ModelDraft(target, draft, k=3)
+    assert model.shared_vocab is False
+    # draft continues 3 -> 4 5 6 in its own ids, re-tokenized for target
+    assert model.propose([1, 2, 3]) == [4, 5, 6]
+    provider = types.SimpleNamespace(
+        draft_lock=Lock(), draft_llama=lambda: draft
+    )
+    req = SpeculativeRequest(mode="draft", draft_provider=provider, k=3)
+    rec = build_recorder(req, target, "m")
+    assert req.source == "draft" and provider.draft_lock.locked()
+    assert list(rec([1, 2, 3])) == [4, 5, 6]
+    rec.finish([1, 2, 3, 4, 5, 9])
+    assert (req.proposed, req.accepted) == (3, 2)
+    assert not provider.draft_lock.locked()
+    assert req.summary()["acceptance_rate"] == 0.667
+
+
+def test_detach_scores_only_live_tokens():  # noqa: D401
+    target, draft = _Target([]), _Draft([])
+    provider = types.SimpleNamespace(
+        draft_lock=Lock(), draft_llama=lambda: draft
+    )
+    req = SpeculativeRequest(mode="draft", draft_provider=provider, k=3)
+    rec = build_recorder(req, target, "m")
+    target.draft_model = rec
+    assert list(rec([1, 2, 3])) == [4, 5, 6]
+    target._write([1, 2, 3, 4, 5, 6])  # 6 rejected: left past n_tokens
+    target.n_tokens = 5
+    LlamaCppProvider._detach_draft(target, rec)
+    assert target.draft_model is None
+    assert (req.proposed, req.accepted) == (3, 2)
+    assert not provider.draft_lock.locked()
+
+
+class _Recording(_Draft):
+    """Draft that records what it is asked to tokenize and decode from."""
+
+    def __init__(self, n_ctx=None):
+        super().__init__([])
+        self._n_ctx = n_ctx
+        self.tokenized: list[bytes] = []
+        self.contexts: list[list[int]] = []
+
+    def n_ctx(self):
+        if self._n_ctx is None:
+            raise AttributeError("n_ctx")
+        return self._n_ctx
+
+    def tokenize(self, data: bytes, add_bos=True, special=False):
+        self.tokenized.append(data)
+        return super().tokenize(data, add_bos, special)
+
+    def generate(self, tokens, **kwargs):  # noqa: ANN003
+        self.contexts.append(list(tokens))
+        return super().generate(tokens, **kwargs)
+
+
+def test_model_draft_tokenizes_only_new_text():  # noqa: D401
+    draft = _Recording()
+    model = ModelDraft(_Target([]), draft, k=2)
+    ids = list(range(1, 6))
+    model.propose(ids)
+    model.propose(ids + [6])
+    model.propose(ids + [6, 7])
+    assert draft.tokenized[-2:] == [b"6 ", b"7 "]
+    assert draft.contexts[-1] == [51, 52, 53, 54, 55, 56, 57]
+    model.propose([9])  # rewound context: starts over
+    assert draft.tokenized[-1] == b"9 " and draft.contexts[-1] == [59]
+
+
+def test_model_draft_keeps_to_trailing_window():  # noqa: D401
+    draft = _Recording(n_ctx=10)
+    model = ModelDraft(_Target([]), draft, k=2)
+    assert model.window == 8
+    ids = [1 + i % 9 for i in range(20)]
+    model.propose(ids[:8])
+    assert len(draft.contexts[-1]) == 8
+    # overflow: re-based to the trailing half window ...
+    model.propose(ids[:9])
+    assert draft.contexts[-1] == [t + 50 for t in ids[5:9]]
+    lens = []
+    for n in range(10, 14):
+        model.propose(ids[:n])
+        lens.append(len(draft.contexts[-1]))
+        # ... which then stays put (stable prefix for the draft KV cache)
+        assert draft.contexts[-1][0] == ids[5] + 50
+    assert lens == [5, 6, 7, 8]
+    assert all(len(c) <= model.window for c in draft.contexts)
+
+
+def test_recorder_disables_failing_draft_after_first_error():  # noqa: D401
+    calls = []
+
+    class _Broken:
+        source = "draft"
+
+        def propose(self, ids):  # noqa: ANN001
+            calls.append(ids)
+            raise RuntimeError("draft context overflow")
+
+    released = []
+    req = SpeculativeRequest(mode="draft")
+    rec = DraftRecorder(_Broken(), req, "err-m", lambda: released.append(1))
+    key = "speculative_unavailable_total{model=err-m,reason=draft_error}"
+    before = metrics.snapshot()["counters"].get(key, 0)
+    for n in range(1, 5):
+        assert list(rec(list(range(n)))) == []
+    rec.finish([0, 1, 2, 3, 4])
+    assert len(calls) == 1 and released == [1]
+    assert metrics.snapshot()["counters"][key] == before + 1
+    assert req.proposed == 0
+
+
+def test_generate_rejects_unknown_speculative_mode():  # noqa: D401
+    from fastapi.testclient import TestClient
+
+    from mia4.api.app import create_app
+
+    r = TestClient(create_app()).post(
+        "/generate",
+        json={
+            "session_id": "spec",
+            "model": "any",
+            "prompt": "hi",
+            "overrides": {"speculative": "turbo"},
+        },
+    )
+    assert r.status_code == 400
+    assert r.json()["detail"] == "invalid-speculative-mode"
@@ -0,0 +1,78 @@
+from core.llm.llama_cpp_provider import LlamaCppProvider
+from core.llm.pipeline.primary import PrimaryPipeline
+from core.llm.token_count import TokenCounter
+
+RU = "Привет! Как дела? Расскажи, пожалуйста, про погоду в Москве."
+RU_TOKENS = (len(RU) + 1) // 2
+
+
+class _Tok:
+    """Tokenizer fake: one token per 2 chars, counts calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def count_tokens(self, text):
+        self.calls += 1
+        return (len(text) + 1) // 2
+
+
+def test_exact_counts_cached_per_message():  # noqa: D401
+    counter = TokenCounter(cache_entries=2)
+    tok = _Tok()
+    assert counter.count(RU, model_id="m", provider=tok) == RU_TOKENS
+    assert counter.count(RU, model_id="m", provider=tok) == RU_TOKENS
+    assert tok.calls == 1
+    # cache is per model and LRU bounded
+    counter.count(RU, model_id="other", provider=tok)
+    counter.count("x" * 40, model_id="m", provider=tok)
+    counter.count(RU, model_id="m", provider=tok)
+    assert tok.calls == 4 and len(counter) == 2
+
+
+def test_fallback_estimate_calibrates_per_model():  # noqa: D401
+    counter = TokenCounter()
+    words = len(RU.split())
+    raw = counter.estimate(RU, "m")
+    assert raw > words  # Cyrillic packs fewer chars per token
+    counter.count(RU * 3, model_id="m", provider=_Tok())
+    assert counter.estimate(RU, "m") == RU_TOKENS
+    assert counter.estimate(RU, "unseen") == raw
+    assert counter.count("abc", model_id="m", provider=None) >= 1
+
+
+def test_history_trimmed_by_token_budget():  # noqa: D401
+    pipe = PrimaryPipeline()
+    tok = _Tok()
+    history = [("user", "a" * 400), ("assistant", "b" * 400)] * 3
+    history.append(("user", "latest"))
+    kwargs = dict(
+        system_prompt_text="",
+        dev_block_text="be brief",
+        reasoning_mode="low",
+        session_messages=history,
+        user_prompt="latest",
+        context_length=1024,
+        reserved_output_tokens=256,
+        model_id="trim",
+        provider=tok,
+    )
+    prompt, tokens, _, _ = pipe._build_harmony_prompt(**kwargs)
+    assert tokens <= 1024 - 256
+    assert prompt.endswith("latest<|end|><|start|>assistant")
+    # two ~200-token turns fit next to the system block; oldest dropped
+    assert prompt.count("a" * 400) + prompt.count("b" * 400) == 2
+    assert prompt.index("a" * 400) < prompt.index("b" * 400)
+    first_calls = tok.calls
+    pipe._build_harmony_prompt(**kwargs)
+    assert tok.calls == first_calls  # next turn reuses message counts
+
+
+def test_provider_counts_only_when_loaded():  # noqa: D401
+    prov = LlamaCppProvider(
+        model_path="missing.gguf",
+        model_id="cnt",
+        role="primary",
+        context_length=2048,
+    )
+    assert prov.count_tokens("hello") is None
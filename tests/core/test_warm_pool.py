@@ -0,0 +1,196 @@
+import sys
+import types
+
+from fastapi.testclient import TestClient
+
+from core import metrics
+from core.events import reset_listeners_for_tests, subscribe
+from core.llm.kv_cache import SHARED_KEY, KVStatePool
+from core.llm import llama_cpp_provider
+from core.llm.llama_cpp_provider import (
+    LlamaCppProvider,
+    prefetch_pages,
+    startup_load,
+)
+from core.llm.pipeline.primary import harmony_prefix
+from core.modules import warm_pool
+from core.modules.warm_pool import WarmPool, WarmTarget
+
+
+class _FakeLlama:
+    built: list["_FakeLlama"] = []
+
+    def __init__(self, **kwargs):  # noqa: ANN003
+        self.ids: list[int] = []
+        self.calls: list[tuple] = []
+        _FakeLlama.built.append(self)
+
+    def tokenize(self, data: bytes, add_bos=True, special=True):
+        return ([1] if add_bos else []) + [
+            len(w) + 2 for w in data.decode("utf-8").split()
+        ]
+
+    def reset(self):
+        self.ids = []
+
+    def eval(self, tokens):
+        self.ids.extend(tokens)
+
+    def save_state(self):
+        return types.SimpleNamespace(
+            input_ids=list(self.ids), llama_state_size=len(self.ids)
+        )
+
+    def __call__(self, prompt, **kw):  # noqa: ANN003
+        self.calls.append((prompt, kw))
+        return {"choices": [{"text": "hi"}]}
+
+
+class _Provider:
+    def __init__(self, tokens=7):
+        self.tokens = tokens
+        self.prefixes: list[str] = []
+
+    def prefill_prefix(self, text):
+        self.prefixes.append(text)
+        return self.tokens
+
+
+def _load_phases(weights, model_id="warm-test"):  # noqa: ANN001
+    reset_listeners_for_tests()
+    events = []
+    unsub = subscribe(lambda n, p: events.append((n, p)))
+    try:
+        prov = LlamaCppProvider(
+            model_path=str(weights),
+            model_id=model_id,
+            role="primary",
+            context_length=256,
+        )
+        prov.load()
+    finally:
+        unsub()
+    loaded = [p for n, p in events if n == "ModelLoaded"]
+    assert len(loaded) == 1
+    return prov, set(loaded[0]["phases"])
+
+
+def test_load_phases_in_model_loaded(monkeypatch, tmp_path):  # noqa: D401
+    weights = tmp_path / "w.gguf"
+    weights.write_bytes(b"x" * 5000)
+    assert prefetch_pages(weights) == 5000
+    assert prefetch_pages(tmp_path / "missing.gguf") == 0
+    monkeypatch.setitem(
+        sys.modules, "llama_cpp", types.SimpleNamespace(Llama=_FakeLlama)
+    )
+    with startup_load():
+        _prov, phases = _load_phases(weights)
+    assert phases == {"prefetch", "construct", "warmup"}
+    # warm-up decode ran once, greedy and tiny
+    ((prompt, kw),) = _FakeLlama.built[-1].calls
+    assert kw["max_tokens"] == 4 and kw["temperature"] == 0.0
+
+
+def test_prefetch_only_on_startup_and_not_after_unload(
+    monkeypatch, tmp_path
+):  # noqa: D401
+    weights = tmp_path / "w.gguf"
+    weights.write_bytes(b"x" * 5000)
+    monkeypatch.setitem(
+        sys.modules, "llama_cpp", types.SimpleNamespace(Llama=_FakeLlama)
+    )
+    # an on-demand load (not the warm pool) skips the prefetch
+    prov, phases = _load_phases(weights)
+    assert phases == {"construct", "warmup"}
+    prov.unload()
+    # a startup reload right after an unload: pages are still cached
+    with startup_load():
+        _prov, phases = _load_phases(weights, "warm-reload")
+    assert "prefetch" not in phases
+    counters = metrics.snapshot()["counters"]
+    key = (
+        "model_prefetch_skipped_total"
+        "{model=warm-reload,reason=recent_unload}"
+    )
+    assert counters[key] >= 1
+    monkeypatch.setattr(
+        llama_cpp_provider,
+        "_warmup_config",
+        lambda: {"prefetch": "always", "prefetch_skip_after_unload_s": 0},
+    )
+    _prov, phases = _load_phases(weights, "warm-always")
+    assert "prefetch" in phases
+
+
+def test_prefill_prefix_populates_shared_kv_entry():  # noqa: D401
+    prov = LlamaCppProvider(
+        model_path="missing.gguf",
+        model_id="warm-kv",
+        role="primary",
+        context_length=256,
+    )
+    pool = KVStatePool(model_id="warm-kv", ram_budget_bytes=10_000)
+    fake = _FakeLlama()
+    prov._state.llama = fake
+    prov._state.loaded = True
+    prov._kv_pool, prov._kv_pool_built = pool, True
+    prefix = harmony_prefix("Base prompt", "medium")
+    n = prov.prefill_prefix(prefix)
+    assert n == len(fake.tokenize(prefix.encode()))
+    assert SHARED_KEY in pool.keys()
+    # a new session's prompt starting with the prefix reuses it
+    tokens = fake.tokenize((prefix + " hello").encode())
+    assert pool.lookup("fresh-session", tokens).prefix_tokens == n
+    # stub providers have nothing to prefill
+    prov._state.stub = True
+    assert prov.prefill_prefix(prefix) == 0
+
+
+def test_pool_warms_targets_and_reports_status():  # noqa: D401
+    providers = {"p": _Provider(11), "opt": _Provider(3)}
+    pool = WarmPool(
+        providers.__getitem__,
+        [WarmTarget("p", "primary", required=True), WarmTarget("opt", "x")],
+        prefix="PREFIX",
+    )
+    assert pool.status()["state"] == "pending"
+    assert pool.start().wait(5)
+    status = pool.status()
+    assert status["ready"] is True and status["state"] == "ready"
+    primary = status["models"][0]
+    assert primary["state"] == "ready" and primary["prefix_tokens"] == 11
+    assert set(primary["phases_ms"]) == {"load", "prefill"}
+    assert providers["p"].prefixes == ["PREFIX"]
+
+
+def test_optional_failure_keeps_ready_primary_failure_not():  # noqa: D401
+    def get(mid):
+        if mid == "bad":
+            raise RuntimeError("no weights")
+        return _Provider()
+
+    pool = WarmPool(
+        get,
+        [WarmTarget("p", "primary", required=True), WarmTarget("bad", "x")],
+    )
+    assert pool.start().wait(5)
+    assert pool.ready
+    assert pool.status()["models"][1]["error"] == "no weights"
+    pool = WarmPool(get, [WarmTarget("bad", "primary", required=True)])
+    assert pool.start().wait(5)
+    assert not pool.ready and pool.status()["state"] == "failed"
+
+
+def test_ready_endpoint(monkeypatch):  # noqa: D401
+    from mia4.api.app import create_app
+
+    warm_pool.reset_for_tests()
+    client = TestClient(create_app())  # no lifespan: pool never started
+    r = client.get("/ready")
+    assert r.status_code == 503 and r.json()["state"] == "pending"
+    pool = WarmPool(lambda mid: _Provider(), [WarmTarget("p", "primary")])
+    monkeypatch.setattr(warm_pool, "_POOL", pool)
+    pool.start().wait(5)
+    r = client.get("/ready")
+    assert r.status_code == 200 and r.json()["ready"] is True
+    warm_pool.reset_for_tests()